@@ -0,0 +1,44 @@
+'''Reconstruct many binary signals in one CoSaMP call.
+
+Compares QR-updated least squares on a batch of right-hand sides to
+solving each signal with np.linalg.lstsq.
+'''
+
+import logging
+from time import perf_counter
+
+import numpy as np
+
+from mr_utils.cs import cosamp
+
+logging.basicConfig(
+    format='%(levelname)s: %(message)s', level=logging.INFO)
+
+if __name__ == '__main__':
+    N = 2000  # signal length
+    n = 500  # Number of measurements
+    k = 30  # Number of non-zero elements
+    nb = 50  # Number of signals
+
+    # Generate random measurement matrix (normal), normalize columns
+    A = np.random.randn(n, N)
+    A /= np.sqrt(np.sum(A**2, axis=0))
+
+    # Sparse binary signals x, {+1,-1}, one in each column
+    x = np.zeros((N, nb))
+    for ii in range(nb):
+        x[np.random.permutation(N)[:k], ii] = np.sign(
+            np.random.rand(k) - 0.5)
+    y = np.dot(A, x)
+
+    t0 = perf_counter()
+    x_loop = np.stack([cosamp(A, y[:, ii], k, lstsq='exact')
+                       for ii in range(nb)], axis=1)
+    t1 = perf_counter()
+    x_batch = cosamp(A, y, k)
+    t2 = perf_counter()
+
+    logging.info('loop: %g s, batch: %g s', t1 - t0, t2 - t1)
+    logging.info('max error: %g', np.max(np.abs(x_batch - x)))
+    logging.info(
+        'max diff from loop: %g', np.max(np.abs(x_batch - x_loop)))
@@ -0,0 +1,38 @@
+'''Time UFT ortho transforms with each available FFT backend.
+
+Centered transforms are done by phase modulation with the mask and
+scaling precomputed, compared here to the explicit fftshifts.
+'''
+
+from time import perf_counter
+
+import numpy as np
+
+from mr_utils.cs.models import UFT
+from mr_utils.utils import available_fft_backends
+
+if __name__ == '__main__':
+    N, nt, niter = 256, 16, 20
+    samp = np.random.rand(N, N, nt) < 0.3
+    x = np.random.randn(N, N, nt) + 1j*np.random.randn(N, N, nt)
+    ax = (0, 1)
+
+    t0 = perf_counter()
+    for _ii in range(niter):
+        y = np.fft.fftshift(np.fft.fft2(np.fft.fftshift(
+            x, axes=ax), axes=ax), axes=ax)*samp/np.sqrt(x.size)
+        x0 = np.fft.ifftshift(np.fft.ifft2(np.fft.ifftshift(
+            y, axes=ax), axes=ax), axes=ax)*np.sqrt(x.size)
+    print('fftshift: %.2f s' % (perf_counter() - t0))
+
+    for backend in available_fft_backends():
+        for workers in [1, -1]:
+            uft = UFT(samp, axes=ax, backend=backend, workers=workers)
+            y = uft.forward_ortho(x)
+            t0 = perf_counter()
+            for _ii in range(niter):
+                uft.forward_ortho(x, out=y)
+                x1 = uft.inverse_ortho(y)
+            print('%s (workers=%d): %.2f s (max diff %g)' % (
+                backend, workers, perf_counter() - t0,
+                np.abs(x1 - x0).max()))
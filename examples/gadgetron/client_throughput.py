@@ -0,0 +1,69 @@
+'''Benchmark sending acquisitions to a stand-in Gadgetron server.
+
+Compares sending acquisitions one at a time (read one, send one) with
+the pipelined path the client uses: blocks of acquisitions are read on
+a background thread and coalesced into large scatter-gather sends.
+Everything runs over the loopback interface, no Gadgetron needed.
+'''
+
+import os
+from tempfile import NamedTemporaryFile
+from time import perf_counter
+
+import numpy as np
+import ismrmrd
+
+from mr_utils.gadgetron import gtconnector as gt
+from mr_utils.gadgetron.client import (
+    read_acquisition_blocks, _prefetch)
+from mr_utils.gadgetron.fake_gadgetron import FakeGadgetron
+
+N_ACQ = 5000
+NC, NS = 16, 256
+
+def one_at_a_time(con, dset, _filename):
+    '''How acquisitions used to be sent.'''
+    for idx in range(dset.number_of_acquisitions()):
+        con.send_ismrmrd_acquisition(dset.read_acquisition(idx))
+
+def pipelined(con, dset, filename):
+    '''Prefetch blocks and coalesce sends.'''
+    def _acqs():
+        for block in _prefetch(read_acquisition_blocks(
+                dset, 256, filename=filename), 4):
+            yield from block
+    con.send_ismrmrd_acquisitions(_acqs())
+
+def benchmark(send, dset, filename):
+    '''Time sending the whole dataset.'''
+    server = FakeGadgetron()
+    con = gt.Connector()
+    con.connect(server.host, server.port)
+    t0 = perf_counter()
+    send(con, dset, filename)
+    con.send_gadgetron_close()
+    con.wait()
+    t = perf_counter() - t0
+    server.wait()
+    assert server.num_acquisitions == dset.number_of_acquisitions()
+    return server.num_bytes/t/2**20
+
+if __name__ == '__main__':
+
+    filename = NamedTemporaryFile(suffix='.h5').name
+    dset = ismrmrd.Dataset(filename, 'dataset', True)
+    acq = ismrmrd.Acquisition()
+    acq.resize(NS, NC)
+    acq.data[:] = np.random.normal(size=acq.data.shape)
+    for ii in range(N_ACQ):
+        acq.scan_counter = ii
+        dset.append_acquisition(acq)
+
+    print('%d acquisitions, %d coils x %d samples' % (N_ACQ, NC, NS))
+    print('One at a time: %.0f MB/s' % benchmark(
+        one_at_a_time, dset, filename))
+    print('Pipelined:     %.0f MB/s' % benchmark(
+        pipelined, dset, filename))
+
+    dset.close()
+    os.remove(filename)
@@ -0,0 +1,84 @@
+'''Benchmark reading images off of a socket.
+
+A stand-in server on the loopback interface sends a series of images
+the way Gadgetron would (image header followed by image data) and we
+time how fast they can be read two ways: the old way, receiving in
+4096 byte chunks, joining them, and copying into the image, and with
+gtconnector.readsock_into, which receives straight into the image's
+data.  Try different socket receive buffer sizes with RECV_BUFSIZES.
+'''
+
+import socket
+import threading
+from time import perf_counter
+
+import numpy as np
+import ismrmrd
+
+from mr_utils.gadgetron import gtconnector as gt
+
+N_IMAGES = 50
+SHAPE = (8, 16, 256, 256) # (coils, z, y, x)
+RECV_BUFSIZES = [None, 2**20, 2**23]
+
+def serve(server, payload):
+    '''Send all the images to whoever connects.'''
+    conn, _addr = server.accept()
+    for _ii in range(N_IMAGES):
+        conn.sendall(payload)
+    conn.close()
+
+def read_chunked(sock):
+    '''How images used to be read.'''
+    serialized_header = gt.readsock(
+        sock, ismrmrd.hdf5.image_header_dtype.itemsize)
+    img = ismrmrd.Image(serialized_header)
+    dtype = img.data.dtype
+    data_bytes = len(img.data.flat)*dtype.itemsize
+    chunks = []
+    curcount = 0
+    while curcount < data_bytes:
+        chunk = sock.recv(min(data_bytes - curcount, 4096))
+        chunks.append(chunk)
+        curcount += len(chunk)
+    img.data.ravel()[:] = np.frombuffer(b''.join(chunks), dtype=dtype)
+    return img
+
+def read_into(sock, reader=gt.ImageMessageReader(None, None)):
+    '''Receive straight into the image.'''
+    return reader.read_image(sock)
+
+def benchmark(read, payload, recv_bufsize):
+    '''Time reading all the images sent by the stand-in server.'''
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(1)
+    thread = threading.Thread(target=serve, args=(server, payload))
+    thread.start()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if recv_bufsize is not None:
+        sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, recv_bufsize)
+    sock.connect(server.getsockname())
+    t0 = perf_counter()
+    for _ii in range(N_IMAGES):
+        read(sock)
+    t = perf_counter() - t0
+    thread.join()
+    sock.close()
+    server.close()
+    return N_IMAGES*len(payload)/t/2**20
+
+if __name__ == '__main__':
+
+    data = np.random.normal(size=SHAPE).astype(np.complex64)
+    img = ismrmrd.Image.from_array(data)
+    payload = bytes(img.getHead()) + data.tobytes()
+    print('%d images, %g MB each' % (N_IMAGES, len(payload)/2**20))
+
+    for recv_bufsize in RECV_BUFSIZES:
+        chunked = benchmark(read_chunked, payload, recv_bufsize)
+        into = benchmark(read_into, payload, recv_bufsize)
+        print(('SO_RCVBUF %s: chunked %.0f MB/s, '
+               'recv_into %.0f MB/s') % (recv_bufsize, chunked, into))
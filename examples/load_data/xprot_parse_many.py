@@ -0,0 +1,87 @@
+'''Benchmark parsing lots of XProtocol headers.
+
+The parser tables are built the first time a header is parsed (or
+loaded from the cache directory if a previous run already made them)
+and every header after that only pays for lexing and parsing.  Run
+this twice to see the effect of the table cache on the first header.
+'''
+
+from time import perf_counter
+
+from mr_utils.load_data.xprot_parser import XProtParser
+from mr_utils.definitions import CACHE_DIR
+
+# A small, but complete, XProtocol header
+SAMPLE = '''<XProtocol>
+{
+  <Name> "PhoenixMetaProtocol"
+  <ID> 1000002
+  <Userversion> 2.0
+
+  <EVAStringTable>
+  {
+    34
+    400 "Multiple series"
+  }
+
+  <ParamMap."">
+  {
+    <ParamLong."NoOfFourierLines">
+    {
+      256
+    }
+    <ParamString."Sequence">
+    {
+      "trufi"
+    }
+    <ParamDouble."TR">
+    {
+      <Precision> 16
+      3.5
+    }
+  }
+
+  <ParamCardLayout."Inline Compose">
+  {
+    <Repr> "LAYOUT_10X2_WIDE_CONTROLS"
+    <Control>
+    {
+      <Param> "MultiStep.IsInlineCompose"
+      <Pos> 77 18
+    }
+  }
+
+  <Dependency."Value_FALSE">
+  {
+    "MultiStep.IsInlineCompose"
+    <Dll> "MrParc"
+    <Context> "ONLINE"
+  }
+
+  <ProtocolComposer."Inline_Composing">
+  {
+    <InFile> "InlineComposer.evp"
+    <Dll> "MrParc"
+  }
+}
+'''
+
+if __name__ == '__main__':
+
+    N = 1000
+    parser = XProtParser()
+
+    # First header builds (or loads) the parser tables
+    t0 = perf_counter()
+    parser.parse(SAMPLE)
+    t_first = perf_counter() - t0
+
+    # Everything else reuses them
+    t0 = perf_counter()
+    structures = parser.parse_many([SAMPLE]*N)
+    t_many = perf_counter() - t0
+
+    assert len(structures) == N
+    print('Parser tables cached in %s' % CACHE_DIR)
+    print('First header: %g ms' % (t_first*1e3))
+    print('Per header:   %g ms (%d headers)' % (t_many/N*1e3, N))
@@ -0,0 +1,56 @@
+'''Benchmark latency of small MATLAB requests.
+
+Starts the threaded MATLAB server on loopback with the stub standing
+in for MATLAB and times lots of small run requests three ways: a new
+connection for every request (client_run), one MatlabSession waiting
+for every reply, and one MatlabSession pipelining the requests.
+'''
+
+import logging
+import threading
+from time import perf_counter
+
+from mr_utils.matlab import client_run, MatlabSession
+from mr_utils.matlab.server import MATLAB, MATLABServer
+from mr_utils.matlab.stub import stub_cmd
+
+N = 500
+
+if __name__ == '__main__':
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    matlab = MATLAB(cmd=stub_cmd())
+    server = MATLABServer(('127.0.0.1', 0), matlab)
+    host, port = server.server_address
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+
+    try:
+        t0 = perf_counter()
+        for ii in range(N):
+            client_run('x = %d' % ii, host, port, 1024)
+        t_connect = (perf_counter() - t0)/N
+
+        with MatlabSession(host, port, 1024) as session:
+            t0 = perf_counter()
+            for ii in range(N):
+                session.run('x = %d' % ii)
+            t_session = (perf_counter() - t0)/N
+
+            t0 = perf_counter()
+            replies = [session.run('x = %d' % ii, wait=False)
+                       for ii in range(N)]
+            for reply in replies:
+                reply.result()
+            t_pipelined = (perf_counter() - t0)/N
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+        matlab.exit()
+
+    print('%d requests' % N)
+    print('Connection per request: %.3f ms' % (t_connect*1e3))
+    print('Session:                %.3f ms' % (t_session*1e3))
+    print('Session, pipelined:     %.3f ms' % (t_pipelined*1e3))
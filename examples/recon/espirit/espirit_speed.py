@@ -0,0 +1,36 @@
+'''Time ESPIRiT sensitivity estimation on 256x256, 32 coil data.
+
+Sensitivities are estimated at full resolution (pad_before_espirit=1)
+with the batched eigen-decomposition and with power iterations.
+'''
+
+from time import perf_counter
+
+import numpy as np
+
+from mr_utils.recon.espirit import espirit_2d
+
+if __name__ == '__main__':
+
+    N, nc = 256, 32
+    X, Y = np.meshgrid(*[np.linspace(-1, 1, N)]*2, indexing='ij')
+    angles = np.linspace(0, 2*np.pi, nc, endpoint=False)
+    sens = np.stack([np.exp(
+        -((X - np.cos(a))**2 + (Y - np.sin(a))**2)/1.5 + 1j*a)
+                     for a in angles], axis=-1)
+    sens /= np.linalg.norm(sens, axis=-1, keepdims=True)
+    im = (X**2 + Y**2 < .8).astype(float)
+    coils = sens*im[..., None]
+    kspace = np.fft.fftshift(np.fft.fft2(np.fft.ifftshift(
+        coils, axes=(0, 1)), axes=(0, 1)), axes=(0, 1))
+    xcrop = kspace[N//2-12:N//2+12, N//2-12:N//2+12]
+
+    for eig in ['eigh', 'power']:
+        t0 = perf_counter()
+        Vim, sim = espirit_2d(
+            xcrop, coils.shape, pad_before_espirit=1, eig=eig)
+        t = perf_counter() - t0
+        inner = np.abs(np.sum(Vim.conj()*sens, axis=-1))
+        err = 1 - inner[im > 0].min()
+        print('eig=%s: %.2f s (worst 1 - |<Vim, sens>| = %g)' % (
+            eig, t, err))
@@ -0,0 +1,38 @@
+'''Time batched GRAPPA on multi-slice, 32 channel data.
+
+Coil images are a Shepp-Logan phantom weighted by smooth complex coil
+maps.  All slices share calibration data from the middle slice.
+'''
+
+from time import perf_counter
+
+import numpy as np
+
+from mr_utils.test_data.phantom import modified_shepp_logan
+from mr_utils.recon.grappa import grappa
+
+if __name__ == '__main__':
+
+    N, nc, nslices, R = 128, 32, 16, 3
+    X, Y = np.meshgrid(*[np.linspace(-1, 1, N)]*2, indexing='ij')
+    angles = np.linspace(0, 2*np.pi, nc, endpoint=False)
+    sens = np.stack([np.exp(
+        -((X - np.cos(a))**2 + (Y - np.sin(a))**2)/1.5 + 1j*a)
+                     for a in angles])
+    im = modified_shepp_logan((N, N, nslices + 8))[..., 4:-4]
+    coils = sens[None, ...]*im.transpose((2, 0, 1))[:, None, ...]
+    kspace = np.fft.fftshift(np.fft.fft2(np.fft.ifftshift(
+        coils, axes=(-2, -1))), axes=(-2, -1))
+
+    mask = np.zeros((N, N), dtype=bool)
+    mask[:, ::R] = True
+    calib = kspace[nslices//2, :, N//2-12:N//2+12, N//2-12:N//2+12]
+
+    for n_jobs in [1, 2, 4]:
+        t0 = perf_counter()
+        recon = grappa(kspace*mask, calib, kernel_size=(5, 2*R + 1),
+                       lamda=1e-4, n_jobs=n_jobs)
+        t = perf_counter() - t0
+        err = np.linalg.norm(recon - kspace)/np.linalg.norm(kspace)
+        print('%d slices, %d coils, R=%d, n_jobs=%d: %.2f s '
+              '(rel err %g)' % (nslices, nc, R, n_jobs, t, err))
@@ -0,0 +1,36 @@
+'''Time vectorized ROF denoising against the per-pixel loop.
+
+The loop is run on a small image, the vectorized solvers are run on a
+256x256 phantom with and without pixel reordering.
+'''
+
+from time import perf_counter
+
+import numpy as np
+
+from mr_utils.recon.reordering import (
+    update_all_for_loop, update_all, rof_primal_dual,
+    reordering_neighbors)
+from mr_utils.test_data.phantom import modified_shepp_logan
+
+if __name__ == '__main__':
+
+    np.random.seed(0)
+    u0 = np.random.rand(16, 16)
+    t0 = perf_counter()
+    u_loop = update_all_for_loop(u0, 1e-3, 1, .1, 10)
+    t1 = perf_counter()
+    u = update_all(u0, 1e-3, 1, .1, 10, history=True)
+    t2 = perf_counter()
+    print('16x16, 10 iters: loop %.2f s, vectorized %.4f s '
+          '(diff %g)' % (t1 - t0, t2 - t1, np.abs(u_loop - u).max()))
+
+    im = modified_shepp_logan((256, 256, 16))[..., 8]
+    f = im + .05*np.random.randn(*im.shape)
+    print('noisy: %g' % np.linalg.norm(f - im))
+    reordered = reordering_neighbors(im, patch_size=(3, 3))
+    for name, nbrs in [('grid', None), ('reordered', reordered)]:
+        t0 = perf_counter()
+        u = rof_primal_dual(f, .05, niters=200, nbrs=nbrs)
+        print('%s primal-dual, 200 iters: %.2f s, error %g' % (
+            name, perf_counter() - t0, np.linalg.norm(u - im)))
@@ -0,0 +1,27 @@
+''' Time batched TV-L1 denoising against looping over slices.
+'''
+
+from time import perf_counter
+
+import numpy as np
+from skimage.data import camera
+
+from mr_utils.recon.tv_denoising import (
+    tv_l1_denoise, tv_l1_denoise_batch)
+
+if __name__ == '__main__':
+    nslices = 32
+    im = camera().astype(np.float64)[::2, ::2]
+    ims = im + 10*np.random.normal(0, 1, (nslices,) + im.shape)
+
+    t0 = perf_counter()
+    ref = np.stack([tv_l1_denoise(x, 1, niter=100) for x in ims])
+    t1 = perf_counter()
+    print('loop: %.2f s' % (t1 - t0))
+
+    for n_jobs in [1, 4]:
+        t0 = perf_counter()
+        out = tv_l1_denoise_batch(ims, 1, niter=100, n_jobs=n_jobs)
+        t1 = perf_counter()
+        print('batch (n_jobs=%d): %.2f s (max diff %g)' % (
+            n_jobs, t1 - t0, np.abs(ref - out).max()))
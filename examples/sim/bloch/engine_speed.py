@@ -0,0 +1,41 @@
+'''Compare finite difference and exact operator Bloch simulations.
+
+Simulates a spoiled GRE sequence over a random 3D phantom using
+gre() (forward Euler) and gre_exact() (exact operators, float64 and
+float32).
+'''
+
+from time import perf_counter
+
+import numpy as np
+
+from mr_utils.sim.bloch import gre, gre_exact
+
+if __name__ == '__main__':
+
+    dims = (32, 32, 32)
+    T1 = np.random.uniform(.5, 2, dims)
+    T2 = np.random.uniform(.05, .5, dims)
+    M0 = np.ones(dims)
+    RF = (np.pi/2, np.pi/6, 0)
+    TR, TE, h, num_TRs = 10e-3, 5e-3, 1e-4, 100
+
+    t0 = perf_counter()
+    spins0 = gre(T1, T2, M0, num_TRs*TR/h, h, *RF, TR, TE, Bz=0)
+    t_fd = perf_counter() - t0
+
+    t0 = perf_counter()
+    spins1 = gre_exact(T1, T2, M0, *RF, TR, TE, num_TRs, Bz=0)
+    t_exact = perf_counter() - t0
+
+    t0 = perf_counter()
+    spins2 = gre_exact(
+        T1, T2, M0, *RF, TR, TE, num_TRs, Bz=0, dtype=np.float32)
+    t_single = perf_counter() - t0
+
+    print('%d voxels, %d TRs' % (T1.size, num_TRs))
+    print('Finite difference: %.2f s' % t_fd)
+    print('Exact:             %.2f s (max diff %g)' % (
+        t_exact, np.abs(spins0 - spins1).max()))
+    print('Exact, float32:    %.2f s (max diff %g)' % (
+        t_single, np.abs(spins1 - spins2).max()))
@@ -0,0 +1,40 @@
+'''Compare speed of GRE steady-state simulations.
+
+gre_sim_loop() loops over voxels, gre_sim() iterates over all voxels
+at once, and gre_sim(closed_form=True) solves for the steady state
+directly.
+'''
+
+from time import perf_counter
+
+import numpy as np
+
+from mr_utils.test_data.phantom import cylinder_2d
+from mr_utils.sim.gre import gre_sim, gre_sim_loop
+
+if __name__ == '__main__':
+
+    T1s, T2s, PD = cylinder_2d(dims=(64, 64))
+    field_map = np.random.uniform(-100, 100, T1s.shape)
+    args = dict(TR=12e-3, TE=6e-3, alpha=np.pi/3, field_map=field_map,
+                dphi=np.pi, M0=PD)
+    maxiter = 200
+
+    t0 = perf_counter()
+    im0 = gre_sim_loop(T1s, T2s, maxiter=maxiter, **args)
+    t_loop = perf_counter() - t0
+
+    t0 = perf_counter()
+    im1 = gre_sim(T1s, T2s, maxiter=maxiter-1, **args)
+    t_vec = perf_counter() - t0
+
+    t0 = perf_counter()
+    im2 = gre_sim(T1s, T2s, closed_form=True, **args)
+    t_closed = perf_counter() - t0
+
+    print('%d voxels, %d excitations' % (T1s.size, maxiter))
+    print('gre_sim_loop:                %.2f s' % t_loop)
+    print('gre_sim:                     %.3f s (max diff %g)' % (
+        t_vec, np.abs(im0 - im1).max()))
+    print('gre_sim(closed_form=True):   %.3f s (max diff %g)' % (
+        t_closed, np.abs(im0 - im2).max()))
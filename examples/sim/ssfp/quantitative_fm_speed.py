@@ -0,0 +1,60 @@
+'''Time vectorized quantitative field mapping against per-pixel loop.
+
+A 256x256 field map is found from smooth T1, T2, PD maps with and
+without quantizing the maps first.  The per-pixel solution is timed on
+a few pixels and extrapolated to the whole map.
+'''
+
+from time import perf_counter
+
+import numpy as np
+
+from mr_utils.sim.ssfp import ssfp
+from mr_utils.sim.ssfp import quantitative_fm
+from mr_utils.sim.ssfp import quantitative_fm_scalar
+from mr_utils.sim.ssfp import ResponseCache
+
+if __name__ == '__main__':
+
+    TR = 6e-3
+    alpha = np.deg2rad(10)
+    phase_cyc = 0
+    dfs = np.arange(-1/TR, 1/TR, 1)
+
+    N = 256
+    x = np.linspace(-1, 1, N)
+    X, Y = np.meshgrid(x, x)
+    mask = X**2 + Y**2 < .9
+    T1s = (1 + .5*X)*mask
+    T2s = (.5 + .2*Y)*mask
+    PDs = (1 + .1*X*Y)*mask
+    fm_true = dfs[np.round(150*X*Y - dfs[0]).astype(int)]
+    Mxys = ssfp(T1s, T2s, TR, alpha, fm_true, phase_cyc=phase_cyc,
+                M0=PDs)*mask
+
+    cache = ResponseCache()
+    t0 = perf_counter()
+    fm = quantitative_fm(
+        Mxys, dfs, T1s, T2s, PDs, TR, alpha, phase_cyc, mask=mask,
+        cache=cache)
+    t_vec = perf_counter() - t0
+
+    t0 = perf_counter()
+    fm_grid = quantitative_fm(
+        Mxys, dfs, T1s, T2s, PDs, TR, alpha, phase_cyc, mask=mask,
+        grid=(1e-2, 1e-2, 1e-2), cache=cache)
+    t_grid = perf_counter() - t0
+
+    idx = np.argwhere(mask)[::500]
+    t0 = perf_counter()
+    for ii, jj in idx:
+        quantitative_fm_scalar(
+            Mxys[ii, jj], dfs, T1s[ii, jj], T2s[ii, jj], PDs[ii, jj],
+            TR, alpha, phase_cyc)
+    t_loop = (perf_counter() - t0)*np.sum(mask)/idx.shape[0]
+
+    print('256x256: per-pixel ~%.1f s, vectorized %.2f s, grid %.2f s'
+          % (t_loop, t_vec, t_grid))
+    print('Max error: vectorized %g Hz, grid %g Hz' % (
+        np.abs(fm - fm_true)[mask].max(),
+        np.abs(fm_grid - fm_true)[mask].max()))
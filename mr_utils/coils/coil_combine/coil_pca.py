@@ -63,6 +63,11 @@ def coil_pca(
     expl_var : array_like, optional
         complex valued 1D vector representing explained variance.  Is
         returned if `give_explained_var=True`
+
+    Notes
+    -----
+    For complex-valued compression of data that doesn't fit in memory,
+    see CoilCompressor.
     '''
 
     # Every day I'm logging...
@@ -120,5 +125,248 @@ def coil_pca(
     # else...
     return coil_ims_pca
 
+class CoilCompressor(object):
+    '''Complex coil compression fit and applied a chunk at a time.
+
+    Parameters
+    ----------
+    n_components : int or float, optional
+        Number of virtual coils to keep.  If between 0 and 1, keep
+        enough to explain this fraction of the variance.  All coils
+        are kept by default.
+    coil_dim : int, optional
+        Coil axis of data.
+    readout_dim : int, optional
+        Fully sampled k-space readout axis.  If given, geometric coil
+        compression is done: a compression matrix is found for every
+        position along the readout and matrices are aligned so virtual
+        coils vary smoothly.
+
+    Attributes
+    ----------
+    cov : array_like
+        Accumulated coil covariance, sum of x x^H over samples,
+        (ncoils, ncoils) or (nx, ncoils, ncoils) for geometric coil
+        compression.
+    n_samples : int
+        Number of samples that went into cov.
+
+    Notes
+    -----
+    The covariance is only ever held for the coils, never the data, so
+    datasets too large for memory can be fit with partial_fit() as
+    they are read in, e.g., chunks of a np.memmap.  The compression
+    matrix is the leading eigenvectors of the covariance [1]_ and is
+    applied with transform() or lazily with transform_iter().
+    Geometric coil compression follows [2]_: hybrid space data
+    (inverse Fourier transformed along the readout) is compressed
+    position by position.
+
+    References
+    ----------
+    .. [1] Huang, Feng, et al. "A software channel compression
+           technique for faster reconstruction with many channels."
+           Magnetic resonance imaging 26.1 (2008): 133-141.
+    .. [2] Zhang, Tao, et al. "Coil compression for accelerated
+           imaging with Cartesian sampling." Magnetic resonance in
+           medicine 69.2 (2013): 571-582.
+    '''
+
+    def __init__(self, n_components=None, coil_dim=-1,
+                 readout_dim=None):
+        self.n_components = n_components
+        self.coil_dim = coil_dim
+        self.readout_dim = readout_dim
+        self.cov = None
+        self.n_samples = 0
+        self._matrix = None
+
+    def _axes(self, ndim):
+        '''Nonnegative coil and readout axes.'''
+        coil_dim = self.coil_dim % ndim
+        if self.readout_dim is None:
+            return(coil_dim, None)
+        return(coil_dim, self.readout_dim % ndim)
+
+    def _hybrid(self, data):
+        '''Coils last, readout first and in image space.'''
+        coil_dim, readout_dim = self._axes(data.ndim)
+        if readout_dim is None:
+            return np.moveaxis(data, coil_dim, -1)
+        x = np.moveaxis(data, (readout_dim, coil_dim), (0, -1))
+        return np.fft.fftshift(np.fft.ifft(np.fft.ifftshift(
+            x, axes=0), axis=0), axes=0)
+
+    def _chunks(self, shape, chunk_size):
+        '''Slices along the first axis that isn't coil or readout.'''
+        axes = self._axes(len(shape))
+        free = [ii for ii in range(len(shape)) if ii not in axes]
+        if chunk_size is None or not free:
+            yield (slice(None),)
+            return
+        ax = free[0]
+        for start in range(0, shape[ax], chunk_size):
+            idx = [slice(None)]*len(shape)
+            idx[ax] = slice(start, start + chunk_size)
+            yield tuple(idx)
+
+    def partial_fit(self, data):
+        '''Add a chunk of data to the coil covariance.
+
+        Parameters
+        ----------
+        data : array_like
+            Coil images or k-space, any chunk of the full dataset that
+            includes all coils (and the full readout for geometric
+            coil compression).
+
+        Returns
+        -------
+        self : CoilCompressor
+            Updated compressor.
+        '''
+        x = self._hybrid(np.asarray(data))
+        nc = x.shape[-1]
+        if self.readout_dim is None:
+            X = x.reshape((-1, nc))
+            cov = np.dot(X.T, X.conj())
+        else:
+            X = x.reshape((x.shape[0], -1, nc))
+            cov = np.matmul(X.transpose((0, 2, 1)), X.conj())
+
+        if self.cov is None:
+            self.cov = cov
+        else:
+            self.cov += cov
+        self.n_samples += X.shape[-2]
+        self._matrix = None
+        return self
+
+    def fit(self, data, chunk_size=None):
+        '''Find coil covariance from all data.
+
+        Parameters
+        ----------
+        data : array_like
+            Coil images or k-space.
+        chunk_size : int, optional
+            Read this many entries along the first axis that isn't
+            coil or readout at a time.  All at once by default.
+
+        Returns
+        -------
+        self : CoilCompressor
+            Fit compressor.
+        '''
+        self.cov = None
+        self.n_samples = 0
+        for idx in self._chunks(data.shape, chunk_size):
+            self.partial_fit(data[idx])
+        return self
+
+    def _eig(self):
+        '''Eigenvalues and vectors of covariance, largest first.'''
+        if self.cov is None:
+            raise ValueError('CoilCompressor must be fit first!')
+        w, U = np.linalg.eigh(self.cov)
+        return(w[..., ::-1], U[..., ::-1])
+
+    @property
+    def explained_variance_ratio_(self):
+        '''Fraction of variance explained by each virtual coil.'''
+        w = self._eig()[0]
+        if w.ndim > 1:
+            w = np.sum(w, axis=0)
+        return w/np.sum(w)
+
+    @property
+    def n_components_(self):
+        '''Number of virtual coils kept.'''
+        nc = self.cov.shape[-1] if self.cov is not None else None
+        if self.n_components is None:
+            return nc
+        if 0 < self.n_components < 1:
+            ratio = np.cumsum(self.explained_variance_ratio_)
+            return int(np.searchsorted(ratio, self.n_components) + 1)
+        return int(self.n_components)
+
+    @property
+    def matrix(self):
+        '''Compression matrix, virtual coils = matrix.dot(coils).
+
+        (n_components, ncoils), or (nx, n_components, ncoils) for
+        geometric coil compression.
+        '''
+        if self._matrix is None:
+            A = self._eig()[1][..., :self.n_components_]
+            if A.ndim > 2:
+                # Rotate each position to best match its neighbor
+                for ii in range(1, A.shape[0]):
+                    u, _s, vh = np.linalg.svd(
+                        np.dot(A[ii].conj().T, A[ii-1]))
+                    A[ii] = A[ii].dot(u.dot(vh))
+            self._matrix = np.conj(np.swapaxes(A, -1, -2))
+        return self._matrix
+
+    def _compress(self, data):
+        '''Compress a single chunk of data.'''
+        x = self._hybrid(np.asarray(data))
+        M = self.matrix
+        if self.readout_dim is None:
+            y = np.dot(x, M.T)
+            return np.moveaxis(y, -1, self._axes(data.ndim)[0])
+
+        y = np.matmul(x.reshape((x.shape[0], -1, x.shape[-1])),
+                      M.transpose((0, 2, 1)))
+        y = y.reshape(x.shape[:-1] + (M.shape[1],))
+        y = np.fft.fftshift(np.fft.fft(np.fft.ifftshift(
+            y, axes=0), axis=0), axes=0)
+        return np.moveaxis(y, (0, -1), self._axes(data.ndim)[::-1])
+
+    def transform(self, data, out=None, chunk_size=None):
+        '''Compress data.
+
+        Parameters
+        ----------
+        data : array_like
+            Coil images or k-space, same layout as was fit.
+        out : array_like, optional
+            Where to put compressed data, e.g., a np.memmap.  Must
+            have n_components along the coil axis.
+        chunk_size : int, optional
+            Compress this many entries along the first axis that isn't
+            coil or readout at a time.
+
+        Returns
+        -------
+        out : array_like
+            Compressed data, coil axis has n_components virtual coils.
+        '''
+        shape = list(data.shape)
+        shape[self._axes(data.ndim)[0]] = self.n_components_
+        if out is None:
+            out = np.empty(shape, dtype=np.result_type(data, 1j))
+        elif out.shape != tuple(shape):
+            raise ValueError('out should have shape %s!' % str(shape))
+        for idx in self._chunks(data.shape, chunk_size):
+            out[idx] = self._compress(data[idx])
+        return out
+
+    def transform_iter(self, chunks):
+        '''Lazily compress chunks of data as they come.
+
+        Parameters
+        ----------
+        chunks : iterable
+            Chunks of coil images or k-space.
+
+        Returns
+        -------
+        compressed : generator
+            Compressed chunks.
+        '''
+        for chunk in chunks:
+            yield self._compress(chunk)
+
 if __name__ == '__main__':
     pass
@@ -17,9 +17,108 @@ References
 '''
 
 import numpy as np
-from scipy.linalg import eigh
+from scipy.ndimage import uniform_filter1d
 
-def walsh(img, noise_ims=None, coil_axis=0):
+def _covariance(img, kernel_size=None):
+    '''Sample covariance matrices at every pixel.
+
+    Parameters
+    ----------
+    img : array_like
+        Coil images, coils along first axis.
+    kernel_size : int or tuple, optional
+        Size of box filter to smooth covariances with.  If None, no
+        smoothing is done and the diagonal is set to 1.
+
+    Returns
+    -------
+    R : array_like
+        Covariance matrices, (..., ncoils, ncoils).
+    '''
+    x = np.moveaxis(img, 0, -1)
+    R = x[..., :, None]*np.conj(x[..., None, :])
+    if kernel_size is None:
+        # Autocorrelation has 1s along diagonal
+        idx = np.arange(R.shape[-1])
+        R[..., idx, idx] = 1
+    else:
+        # Box filter over spatial dimensions only
+        size = np.broadcast_to(kernel_size, (x.ndim - 1,))
+        for axis, k in enumerate(size):
+            R = uniform_filter1d(R, k, axis=axis, mode='constant')
+    return R
+
+def _tiles(shape, kernel_size, tile_size):
+    '''Split first spatial axis into overlapping tiles for filtering.
+
+    Yields slices for the tile with halo, the rows it is responsible
+    for, and where those rows are within the tile.
+    '''
+    halo = 0
+    if kernel_size is not None:
+        halo = np.broadcast_to(kernel_size, (len(shape),))[0]//2 + 1
+    nrows = max(1, tile_size//int(np.prod(shape[1:])))
+    for start in range(0, shape[0], nrows):
+        stop = min(start + nrows, shape[0])
+        lo, hi = max(start - halo, 0), min(stop + halo, shape[0])
+        yield (slice(lo, hi), slice(start, stop),
+               slice(start - lo, stop - lo))
+
+def _dominant_eigvec(R, method='eigh', UPLO='L', niter=10):
+    '''Most significant eigenvector of stacked Hermitian matrices.
+
+    Parameters
+    ----------
+    R : array_like
+        Matrices, (..., n, n), only triangle UPLO is used.
+    method : {'eigh', 'power'}, optional
+        Batched np.linalg.eigh or power iteration.
+    UPLO : {'L', 'U'}, optional
+        Triangle of R to use.
+    niter : int, optional
+        Number of power iterations.
+
+    Returns
+    -------
+    v : array_like
+        Unit norm eigenvectors, (..., n), last component real and
+        nonnegative.
+    '''
+    if method == 'eigh':
+        _w, v = np.linalg.eigh(R, UPLO=UPLO)
+        v = v[..., -1]
+    elif method == 'power':
+        # Fill in Hermitian matrix from the requested triangle
+        tri = np.tril if UPLO == 'L' else np.triu
+        H = tri(R)
+        H = H + np.conj(np.swapaxes(
+            tri(R, -1 if UPLO == 'L' else 1), -1, -2))
+
+        # Shift by a lower bound on the spectrum (Gershgorin) so the
+        # largest eigenvalue, not the largest magnitude, dominates;
+        # start from the column with the most energy
+        idx = np.arange(H.shape[-1])
+        diag = H[..., idx, idx].real
+        radius = np.abs(H).sum(axis=-1) - np.abs(diag)
+        shift = np.maximum(0, -np.min(diag - radius, axis=-1))
+        H[..., idx, idx] += shift[..., None]
+        col = np.argmax(np.abs(H).sum(axis=-2), axis=-1)
+        v = np.take_along_axis(
+            H, col[..., None, None], axis=-1)[..., 0]
+        for _ii in range(niter):
+            v /= np.linalg.norm(v, axis=-1, keepdims=True) + 1e-30
+            v = np.matmul(H, v[..., None])[..., 0]
+        v /= np.linalg.norm(v, axis=-1, keepdims=True) + 1e-30
+    else:
+        raise ValueError('method must be "eigh" or "power"!')
+
+    # Eigenvectors are only unique up to phase
+    ph = v[..., -1]/(np.abs(v[..., -1]) + 1e-30)
+    ph = np.where(np.abs(v[..., -1]) > 0, np.conj(ph), 1)
+    return v*ph[..., None]
+
+def walsh(img, noise_ims=None, coil_axis=0, kernel_size=None,
+          method='eigh', niter=10, tile_size=2**13):
     '''Stochastic matched filter coil combine.
 
     Parameters
@@ -30,14 +129,32 @@ def walsh(img, noise_ims=None, coil_axis=0):
         Noise acquisitons (same size as img).
     coil_axis : int, optional
         Dimension that has coils.
+    kernel_size : int or tuple, optional
+        Size of box filter to smooth covariance matrices with.  If
+        None, pointwise covariances with unit diagonal are used.
+    method : {'eigh', 'power'}, optional
+        Find eigenvectors with batched eigh or power iteration.
+    niter : int, optional
+        Number of power iterations.
+    tile_size : int, optional
+        Approximate number of pixels to hold covariances for at once.
+
+    Returns
+    -------
+    csm : array_like
+        Coil sensitivity maps.
 
     Notes
     -----
+    Covariance matrices are formed for a tile of pixels at a time, so
+    memory use is bounded by tile_size*ncoils**2 instead of growing
+    with the image.  All pixels of a tile are solved with one stacked
+    eigendecomposition (or power iteration).  Eigenvectors are made
+    unique by choosing the last coil to have zero phase.
     '''
 
     if (noise_ims is None) or (
             np.allclose(noise_ims, np.zeros_like(noise_ims))):
-        noise_ims = np.zeros(img.shape)
         no_noise = True
     else:
         no_noise = False
@@ -45,55 +162,34 @@ def walsh(img, noise_ims=None, coil_axis=0):
     # Move coil axis to be first
     if coil_axis != 0:
         img = np.moveaxis(img, coil_axis, 0)
+        if not no_noise:
+            noise_ims = np.moveaxis(noise_ims, coil_axis, 0)
 
-    # Get some sizes
-    ncoils, ny, nx = img.shape[:]
-
-    # Compute the sample autocovariances pointwise, will be Hermitian
-    # symmetric, only need lower triangular matrix
-    Rs = np.zeros((ncoils, ncoils, ny, nx), dtype=img.dtype)
-    Rn = np.zeros((ncoils, ncoils, ny, nx), dtype=noise_ims.dtype)
-    for p in range(ncoils):
-        # # Autocorrelation has 1s along diagonal:
-        Rn[p, p, ...] = 1
-        Rs[p, p, ...] = 1
-        for q in range(p):
-            # Fill in Rn
-            val = noise_ims[p, ...]*np.conj(noise_ims[q, ...])
-            Rn[p, q, ...] = val
-            Rn[q, p, ...] = val.conj()
-
-            # Fill in Rs
-            val = img[p, ...]*np.conj(img[q, ...])
-            Rs[p, q, ...] = val
-            Rs[q, p, ...] = val.conj()
-
-    # Get most significant eigenvector for each pixel
+    # Get most significant eigenvector for each pixel, a tile at a
+    # time
     csm = np.zeros(img.shape, dtype=img.dtype)
-    for idx in np.ndindex((nx, ny)):
-        xx, yy = idx[:]
+    tiles = _tiles(img.shape[1:], kernel_size, tile_size)
+    for src, dst, crop in tiles:
+        Rs = _covariance(img[:, src], kernel_size)[crop]
 
         # If no noise, assume identity
         if no_noise:
-            Rni = np.eye(ncoils)
+            P = Rs
         else:
-            Rni = np.linalg.inv(Rn[..., yy, xx])
-
-        # Construct P and find most significant eigenvector
-        P = np.dot(Rni, Rs[..., yy, xx])
-
-        # # To be really accurate:
-        # w, v = np.linalg.eig(P)
-        # idx = np.argmax(np.abs(w))
-        # v = v[:, idx][:, None]
+            Rn = _covariance(noise_ims[:, src], kernel_size)[crop]
+            Rni = np.linalg.inv(Rn)
 
-        # P is approximately Hermitian, so we can do this:
-        _w, v = eigh(P, lower=False, eigvals=(ncoils-1, ncoils-1))
+            # Construct P, approximately Hermitian, so use upper
+            # triangle
+            P = np.matmul(Rni, Rs)
+        v = _dominant_eigvec(P, method=method, UPLO='U', niter=niter)
 
         # Normalize to get approximately uniform noise variance
-        alpha = np.sqrt((v.T.conj().dot(Rni).dot(v))[0, 0])
-        v /= alpha
-        csm[:, yy, xx] = v.squeeze()
+        if not no_noise:
+            Rniv = np.matmul(Rni, v[..., None])[..., 0]
+            alpha = np.sqrt(np.sum(v.conj()*Rniv, axis=-1))
+            v = v/alpha[..., None]
+        csm[:, dst] = np.moveaxis(v, -1, 0)
 
     # Move the coil axis to correct place
     if coil_axis != 0:
@@ -101,8 +197,39 @@ def walsh(img, noise_ims=None, coil_axis=0):
 
     return csm
 
-def walsh_gs(img, coil_axis=0, pc_axis=-1, avg_method='z'):
-    '''Walsh tailored for bSSFP GS recon.'''
+def walsh_gs(img, coil_axis=0, pc_axis=-1, avg_method='z',
+             kernel_size=None, method='eigh', niter=10,
+             tile_size=2**13):
+    '''Walsh tailored for bSSFP GS recon.
+
+    Parameters
+    ----------
+    img : array_like
+        Phase-cycled coil images.
+    coil_axis : int, optional
+        Dimension that has coils.
+    pc_axis : int, optional
+        Dimension that has phase-cycles.
+    avg_method : {'cov', 'pc'}, optional
+        Average covariances across phase-cycles, 'pc' first removes
+        the phase-cycle dependent phase.
+    kernel_size : int or tuple, optional
+        Size of box filter to smooth covariance matrices with.
+    method : {'eigh', 'power'}, optional
+        Find eigenvectors with batched eigh or power iteration.
+    niter : int, optional
+        Number of power iterations.
+    tile_size : int, optional
+        Approximate number of pixels to hold covariances for at once.
+
+    Returns
+    -------
+    csm : array_like
+        Coil sensitivity maps.
+    '''
+
+    if avg_method not in ('cov', 'pc'):
+        raise NotImplementedError()
 
     # Move coil axis to be first
     if coil_axis != 0:
@@ -110,43 +237,24 @@ def walsh_gs(img, coil_axis=0, pc_axis=-1, avg_method='z'):
 
     # Move phase-cycle axis to be last
     img = np.moveaxis(img, pc_axis, -1)
-
-    # Get some sizes
-    ncoils, ny, nx, npcs = img.shape[:]
+    npcs = img.shape[-1]
 
     # Apply phase correction
     if avg_method == 'pc':
         pcs = np.linspace(0, 2*np.pi, npcs, endpoint=False)
-        comp = np.exp(-1j*pcs/2)
-        img = img*np.tile(
-            comp[None, None, None, :], (ncoils, ny, nx, 1))
-
-    # Compute the sample autocovariance for each phase-cycle
-    Rs = np.zeros((ncoils, ncoils, ny, nx, npcs), dtype=img.dtype)
-    for ii in range(npcs):
-        for p in range(ncoils):
-            Rs[p, p, ...] = 1
-            for q in range(p):
-                # Autocorrelation
-                Rs[p, q, ..., ii] = img[
-                    p, ..., ii]*np.conj(img[q, ..., ii])
-
-    # Combine the autocorrelation matrices
-    if avg_method == 'cov':
-        Rs = np.mean(Rs, axis=-1)
-    elif avg_method == 'pc':
-        Rs = np.mean(Rs, axis=-1)
-    else:
-        raise NotImplementedError()
+        img = img*np.exp(-1j*pcs/2)
 
-    # Get most significant eigenvector for each pixel
+    # Average the autocorrelation matrices over phase-cycles and get
+    # the most significant eigenvector for each pixel, a tile at a
+    # time
     csm = np.zeros(img.shape[:-1], dtype=img.dtype)
-    for idx in np.ndindex((nx, ny)):
-        xx, yy = idx[:]
-        _w, v = eigh(
-            Rs[..., yy, xx], lower=True, eigvals=(ncoils-1, ncoils-1))
-        v /= np.linalg.norm(v) # assuming Rn = I
-        csm[:, yy, xx] = v.squeeze()
+    tiles = _tiles(img.shape[1:-1], kernel_size, tile_size)
+    for src, dst, crop in tiles:
+        Rs = np.mean([
+            _covariance(img[:, src, ..., ii], kernel_size)[crop]
+            for ii in range(npcs)], axis=0)
+        v = _dominant_eigvec(Rs, method=method, UPLO='L', niter=niter)
+        csm[:, dst] = np.moveaxis(v, -1, 0) # assuming Rn = I
 
     # Move the coil axis to correct place
     if coil_axis != 0:
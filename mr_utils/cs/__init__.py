@@ -9,6 +9,7 @@ from .convex.gd_tv import *
 from .convex.proximal_gd import proximal_GD
 from .greedy.cosamp import *
 from .ordinator import ordinator1d
+from .operators import LinearOperator
 from .convex.temporal_gd_tv.temporal_gd_tv import GD_temporal_TV
 from .relaxed_ordinator import relaxed_ordinator
 from .convex.split_bregman import SpatioTemporalTVSB
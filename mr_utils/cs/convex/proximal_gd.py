@@ -35,7 +35,9 @@ def proximal_GD(
         ignore_ssim=True,
         disp=False,
         maxiter=200,
-        strikes=0):
+        strikes=0,
+        fista=False,
+        metrics_every=1):
     r'''Proximal gradient descent for generic encoding/sparsity model.
 
     Parameters
@@ -78,6 +80,10 @@ def proximal_GD(
         Maximum number of iterations.
     strikes : int, optional
         Number of ending conditions tolerated before giving up.
+    fista : bool, optional
+        Whether or not to use FISTA momentum.
+    metrics_every : int, optional
+        Compute MSE/SSIM for display every this many iterations.
 
     Returns
     -------
@@ -95,6 +101,19 @@ def proximal_GD(
     If `x=None`, then MSE will not be calculated. You probably want
     `mode='soft'`.  For the other options, see docs for
     pywt.threshold. `selective=None` will not throw away any updates.
+
+    Gradient steps, reordering, real soft/hard thresholding, and the
+    residual are done in preallocated buffers.  Reordering indices are
+    only converted when reorder_fun returns a new index array.  With
+    `fista=True`, gradients are taken at an extrapolation of the last
+    two estimates as in [1]_.
+
+    References
+    ----------
+    .. [1] Beck, Amir, and Marc Teboulle. "A fast iterative
+           shrinkage-thresholding algorithm for linear inverse
+           problems." SIAM journal on imaging sciences 2.1 (2009):
+           183-202.
     '''
 
     # Make sure compare_mse, compare_ssim is defined
@@ -142,6 +161,24 @@ def proximal_GD(
     else:
         alpha0 = alpha_start
 
+    # Work buffers, allocated the first time they're needed
+    bufs = {}
+    def buf(name, shape, dtype):
+        key = (name, tuple(shape), np.dtype(dtype))
+        if key not in bufs:
+            bufs[key] = np.empty(shape, dtype=dtype)
+        return bufs[key]
+
+    # Flat reordering indices are only recomputed if reorder_fun gives
+    # us something new
+    reorder_idx = None
+    reorder_idx_r, reorder_idx_i = None, None
+
+    # Momentum: gradients are taken at z, which is just x_hat for
+    # plain proximal gradient descent
+    z = x_hat
+    t = 1
+
     # Do the thing
     strike_count = 0
     for ii in range_fun(int(maxiter)):
@@ -162,71 +199,70 @@ def proximal_GD(
         prev_stop_criteria = stop_criteria
 
         # Compute gradient descent step in prep for reordering
-        grad_step = x_hat - inverse_fun(r)
+        tmp = inverse_fun(r)
+        grad_step = buf('grad', tmp.shape, np.result_type(z, tmp))
+        np.subtract(z, tmp, out=grad_step)
 
         # Do reordering if we asked for it
         if reorder_fun is not None:
-            reorder_idx = reorder_fun(grad_step)
-            reorder_idx_r = reorder_idx.real.astype(int)
-            reorder_idx_i = reorder_idx.imag.astype(int)
-
-            # unreorder_idx_r = inverse_permutation(reorder_idx_r)
-            # unreorder_idx_i = inverse_permutation(reorder_idx_i)
-            # unreorder_idx_r = np.arange(
-            #     reorder_idx_r.size).astype(int)
-            # unreorder_idx_r[reorder_idx_r] = reorder_idx_r
-            # unreorder_idx_i = np.arange(
-            #     reorder_idx_i.size).astype(int)
-            # unreorder_idx_i[reorder_idx_i] = reorder_idx_i
-
-            grad_step = (
-                grad_step.real[np.unravel_index(
-                    reorder_idx_r, y.shape)] \
-                + 1j*grad_step.imag[np.unravel_index(
-                    reorder_idx_i, y.shape)]).reshape(y.shape)
+            idx = reorder_fun(grad_step)
+            if idx is not reorder_idx:
+                reorder_idx = idx
+                reorder_idx_r = np.asarray(
+                    idx.real, dtype=int).ravel()
+                reorder_idx_i = np.asarray(
+                    idx.imag, dtype=int).ravel()
+
+            reordered = buf('reordered', (y.size,), complex)
+            np.take(grad_step.real, reorder_idx_r, out=reordered.real)
+            np.take(grad_step.imag, reorder_idx_i, out=reordered.imag)
+            grad_step = reordered.reshape(y.shape)
 
         # Take the step, we would normally assign x_hat directly, but
         # because we might be reordering and selectively updating,
         # we'll store it in a temporary variable...
         if thresh_sep:
             tmp = sparsify(grad_step)
+            if not np.iscomplexobj(tmp):
+                tmp = tmp.astype(complex)
             # Take a half step in each real/imag after talk with Ed
-            tmp_r = threshold(tmp.real, value=alpha0/2, mode=mode)
-            tmp_i = threshold(tmp.imag, value=alpha0/2, mode=mode)
-            update = unsparsify(tmp_r + 1j*tmp_i)
+            real, imag = tmp.real, tmp.imag
+            tmp_r = _threshold(real, alpha0/2, mode, buf)
+            tmp_i = _threshold(imag, alpha0/2, mode, buf)
+            if tmp_r is not real or tmp_i is not imag:
+                tmp = tmp_r + 1j*tmp_i
+            update = unsparsify(tmp)
         else:
             update = unsparsify(
-                threshold(
-                    sparsify(grad_step), value=alpha0, mode=mode))
+                _threshold(sparsify(grad_step), alpha0, mode, buf))
 
         # Undo the reordering if we did it
         if reorder_fun is not None:
-            # update = (
-            #     update.real[np.unravel_index(
-            #         unreorder_idx_r, y.shape)] \
-            #     + 1j*update.imag[np.unravel_index(
-            #         unreorder_idx_i, y.shape)]).reshape(y.shape)
-
-            update_r = np.zeros(y.shape)
-            update_r[np.unravel_index(
-                reorder_idx_r, y.shape)] = update.real.flatten()
-            update_i = np.zeros(y.shape)
-            update_i[np.unravel_index(
-                reorder_idx_i, y.shape)] = update.imag.flatten()
-            update = update_r + 1j*update_i
+            unreordered = buf('unreordered', (y.size,), complex)
+            unreordered.fill(0)
+            np.put(unreordered.real, reorder_idx_r, update.real)
+            np.put(unreordered.imag, reorder_idx_i, update.imag)
+            update = unreordered.reshape(y.shape)
 
         # Look at where we want to take the step - tread carefully...
         if selective is not None:
             selective_idx = selective(x_hat, update, ii)
 
+        # Keep the last estimate around for momentum
+        if fista:
+            x_prev = buf('x_prev', x_hat.shape, x_hat.dtype)
+            np.copyto(x_prev, x_hat)
+
         # Update image estimae
         if selective is not None:
             x_hat[selective_idx] = update[selective_idx]
         else:
-            x_hat = update
+            if x_hat.dtype != np.result_type(x_hat, update):
+                x_hat = x_hat.astype(np.result_type(x_hat, update))
+            np.copyto(x_hat, update)
 
         # Tell the user what happened
-        if disp:
+        if disp and ii % metrics_every == 0:
             curxabs = np.abs(x_hat)
             cur_mse = compare_mse(curxabs, xabs)
             cur_ssim = compare_ssim(curxabs, xabs)
@@ -260,11 +296,57 @@ def proximal_GD(
                 strike_count += 1
         prev_ssim = cur_ssim
 
+        # Extrapolate from the last two estimates
+        if fista:
+            t_next = (1 + np.sqrt(1 + 4*t**2))/2
+            z = buf('z', x_hat.shape, x_hat.dtype)
+            np.subtract(x_hat, x_prev, out=z)
+            z *= (t - 1)/t_next
+            z += x_hat
+            t = t_next
+        else:
+            z = x_hat
+
         # Compute residual
-        r = forward_fun(x_hat) - y
+        tmp = forward_fun(z)
+        r = buf('r', tmp.shape, np.result_type(tmp, y))
+        np.subtract(tmp, y, out=r)
 
         # Get next step size
         if callable(alpha):
             alpha0 = alpha(alpha0, ii)
 
     return x_hat
+
+def _threshold(data, value, mode, buf):
+    '''pywt.threshold, done in place for real soft/hard thresholding.
+
+    Parameters
+    ----------
+    data : array_like
+        Coefficients to threshold.
+    value : float
+        Threshold value.
+    mode : str
+        Thresholding mode, see pywt.threshold.
+    buf : callable
+        Returns work buffers, buf(name, shape, dtype).
+
+    Returns
+    -------
+    array_like
+        Thresholded coefficients, data itself if done in place.
+    '''
+    if np.iscomplexobj(data) or mode not in ('soft', 'hard') or \
+            not data.flags.writeable:
+        return threshold(data, value=value, mode=mode)
+
+    tmp = buf('threshold', data.shape, data.dtype)
+    if mode == 'soft':
+        # sign(x)*max(|x| - value, 0) == x - clip(x, -value, value)
+        np.clip(data, -value, value, out=tmp)
+        data -= tmp
+    else:
+        np.abs(data, out=tmp)
+        np.copyto(data, 0, where=tmp < value)
+    return data
@@ -14,6 +14,8 @@ import numpy as np
 from tqdm import trange, tqdm
 from skimage.measure import compare_mse
 
+from mr_utils.utils.fft_backend import FFTBackend, CenteredFFT
+
 def SpatioTemporalTVSB(
         mask, y, betaxy=1, betat=1, mu=1, lam=1, gamma=None,
         nInner=1, niter=100, x=None):
@@ -103,9 +105,18 @@ def SpatioTemporalTVSB(
     uBest = u.copy()
     errBest = np.inf
 
-    # RHS of the linear system
+    # Shifted encoding transforms and the 3D solve share one backend
     scale = np.sqrt(rows*cols)
-    murf = np.fft.fftshift(np.fft.ifft2(np.fft.fftshift(mu*y, axes=(0, 1)), axes=(0, 1)), axes=(0, 1))*scale
+    fft = FFTBackend()
+    forward = CenteredFFT(
+        (0, 1), 'fftshift', 'fftshift', weight=mask/scale,
+        backend=fft)
+    inverse = CenteredFFT(
+        (0, 1), 'fftshift', 'fftshift', inverse=True, weight=scale,
+        backend=fft)
+
+    # RHS of the linear system
+    murf = inverse(mu*y)
 
     if x is not None:
         err = np.zeros((niter, numTime))
@@ -127,7 +138,7 @@ def SpatioTemporalTVSB(
     uker[0, -1, 0] = -1
     uker[0, 0, 1] = -1
     uker[0, 0, -1] = -1
-    uker = lam*np.fft.fftn(uker) + gamma + mu*mask
+    uker = lam*fft.fftn(uker) + gamma + mu*mask
 
     #  Do the reconstruction
     for outer in trange(niter, leave=False):
@@ -138,7 +149,9 @@ def SpatioTemporalTVSB(
                 Dxt(xx - bx) + Dyt(yy - by) + Dtt(t - bt)) + gamma*u
 
             # Reconstructed image solving the equation in 3D
-            u = np.fft.ifftn(np.fft.fftn(rhs)/uker)
+            u = fft.fftn(rhs, overwrite_x=True)
+            u /= uker
+            u = fft.ifftn(u, overwrite_x=True)
 
             # update x and y
             dx = Dx(u)
@@ -152,9 +165,9 @@ def SpatioTemporalTVSB(
             by += dy - yy
             bt += dt - t
 
-        fForw = mask*np.fft.fftshift(np.fft.fft2(np.fft.fftshift(u, axes=(0, 1)), axes=(0, 1)), axes=(0, 1))/scale
+        fForw = forward(u)
         y += f0All - fForw
-        murf = np.fft.fftshift(np.fft.ifft2(np.fft.fftshift(mu*y, axes=(0, 1)), axes=(0, 1)), axes=(0, 1))*scale
+        murf = inverse(mu*y)
 
         if x is not None:
             # Compute the error
@@ -1,21 +1,102 @@
-'''Compressive sampling matching pursuit (CoSaMP) algorithm.
-
-This implementation currently does not handle complex signals.
-'''
+'''Compressive sampling matching pursuit (CoSaMP) algorithm.'''
 
 import logging
 
 import numpy as np
+from scipy.linalg import qr, qr_delete, qr_insert, solve_triangular
 
 from mr_utils.utils.printtable import Table
+from mr_utils.cs.operators import as_operator, top_k
 
 logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
 
+class SupportLstsq(object):
+    '''Least squares on a changing support, QR updated as it changes.
+
+    Attributes
+    ----------
+    columns : callable
+        Returns columns of the measurement matrix, columns(idx).
+    y : array_like
+        Measurement vector.
+    support : array_like
+        Indices of the columns in the current factorization, in order.
+    '''
+
+    def __init__(self, columns, y):
+        '''Start with an empty support.
+
+        Parameters
+        ----------
+        columns : callable
+            Returns columns of the measurement matrix, columns(idx).
+        y : array_like
+            Measurement vector.
+        '''
+        self.columns = columns
+        self.y = y
+        self.support = np.zeros(0, dtype=int)
+        self.Q, self.R = None, None
+
+    def __call__(self, T):
+        '''Solve min_z || y - A[:, T] z ||_2.
+
+        Parameters
+        ----------
+        T : array_like
+            Sorted support indices.
+
+        Returns
+        -------
+        z : array_like
+            Least squares coefficients, one for each index in T.
+
+        Notes
+        -----
+        Columns that leave the support are deleted from the QR
+        factorization and new columns are inserted, so only the
+        columns that changed are touched.  If there are more columns
+        than measurements, the minimum norm solution from
+        np.linalg.lstsq is returned instead.
+        '''
+        T = np.asarray(T, dtype=int)
+        if T.size > self.y.size:
+            self.support = np.zeros(0, dtype=int)
+            self.Q, self.R = None, None
+            return np.linalg.lstsq(
+                self.columns(T), self.y, rcond=None)[0]
+
+        # Remove columns that left the support, last first
+        keep = np.isin(self.support, T)
+        if not np.any(keep):
+            self.Q, self.R = None, None
+        else:
+            for pos in np.nonzero(~keep)[0][::-1]:
+                self.Q, self.R = qr_delete(
+                    self.Q, self.R, pos, which='col')
+        self.support = self.support[keep]
+
+        # Add the new ones at the end
+        new = np.setdiff1d(T, self.support)
+        if new.size:
+            cols = self.columns(new)
+            cols = cols.astype(np.result_type(cols, self.y))
+            if self.Q is None:
+                self.Q, self.R = qr(cols, mode='economic')
+            else:
+                self.Q, self.R = qr_insert(
+                    self.Q, self.R, cols, self.support.size,
+                    which='col')
+            self.support = np.concatenate((self.support, new))
+
+        z = solve_triangular(self.R, self.Q.conj().T.dot(self.y))
+        return z[np.argsort(self.support)]
+
 def cosamp(
         A,
         y,
         k,
-        lstsq='exact',
+        lstsq='qr',
         tol=1e-8,
         maxiter=500,
         x=None,
@@ -24,13 +105,14 @@ def cosamp(
 
     Parameters
     ==========
-    A : array_like
-        Measurement matrix.
+    A : array_like or LinearOperator
+        Measurement matrix or matrix-free operator.
     y : array_like
-        Measurements (i.e., y = Ax).
+        Measurements (i.e., y = Ax).  If A is a matrix, each column of
+        a 2D y is reconstructed independently.
     k : int
         Number of expected nonzero coefficients.
-    lstsq : {'exact', 'lm', 'gd'}, optional
+    lstsq : {'qr', 'exact', 'lm', 'gd'}, optional
         How to solve intermediate least squares problem.
     tol : float, optional
         Stopping criteria.
@@ -49,10 +131,15 @@ def cosamp(
     Notes
     =====
     lstsq function
+    - 'qr' updates a QR factorization of the support's columns.
     - 'exact' solves it using numpy's linalg.lstsq method.
     - 'lm' uses solves with the Levenberg-Marquardt algorithm.
     - 'gd' uses 3 iterations of a gradient descent solver.
 
+    Columns of A are only formed (by encoding unit vectors if A is an
+    operator) when they join a support.  The stopping criteria is
+    computed over all signals of a batch.
+
     Implements Algorithm 8.7 from [1]_.
 
     References
@@ -61,22 +148,44 @@ def cosamp(
            theory and applications. Cambridge University Press, 2012.
     '''
 
-    # length of measurement vector and original signal
-    _n, N = A.shape[:]
-
-    # Initializations
-    x_hat = np.zeros(N, dtype=y.dtype)
+    # Shape of original signal comes from the adjoint
+    A = as_operator(A, y)
+    x0 = A.adjoint(y)
+    shape = x0.shape
+    sig_shape = shape[:-1] if A.batched else shape
+    nb = shape[-1] if A.batched else 1
+    N = int(np.prod(sig_shape))
+    k2 = min(2*k, N)
+
+    # Initializations, signals are columns of x_hat
+    x_hat = np.zeros((N, nb), dtype=np.result_type(y, x0))
     r = y.copy()
     ynorm = np.linalg.norm(y)
+    Y = y.reshape((-1, nb))
 
     if x is None:
-        x = np.zeros(x_hat.shape, dtype=y.dtype)
+        x = np.zeros(shape, dtype=y.dtype)
     elif x.size < x_hat.size:
         x = np.hstack(([0], x))
 
+    # Columns of A are only formed when they join a support, keep them
+    # around in case they come back
+    cache = {}
+    def columns(idx):
+        new = [jj for jj in idx if jj not in cache]
+        if new:
+            for jj, col in zip(new, A.columns(new, sig_shape).T):
+                cache[jj] = col
+        return np.stack([cache[jj] for jj in idx], axis=1)
+
     # Decide how we want to solve the intermediate least squares problem
-    if lstsq == 'exact':
-        lstsq_fun = lambda A0, y: np.linalg.lstsq(A0, y, rcond=None)[0]
+    if lstsq == 'qr':
+        lstsq_fun = [
+            SupportLstsq(columns, Y[:, jj]) for jj in range(nb)]
+    elif lstsq == 'exact':
+        lstsq_fun = [
+            lambda T, y0=Y[:, jj]: np.linalg.lstsq(
+                columns(T), y0, rcond=None)[0] for jj in range(nb)]
     elif lstsq == 'lm':
         # # This also doesn't work very well currently....
         # from scipy.optimize import least_squares
@@ -108,20 +217,23 @@ def cosamp(
     for ii in range(maxiter):
 
         # Get step direction
-        g = np.dot(A.conj().T, r)
+        g = np.abs(A.adjoint(r)).reshape((-1, nb))
 
-        # Add 2*k largest elements of g to support set
-        Tn = np.union1d(x_hat.nonzero()[0], np.argsort(np.abs(g))[-(2*k):])
+        xn = np.zeros((N, nb), dtype=x_hat.dtype)
+        for jj in range(nb):
+            # Add 2*k largest elements of g to support set
+            Tn = np.union1d(
+                x_hat[:, jj].nonzero()[0],
+                np.argpartition(g[:, jj], N - k2)[-k2:])
 
-        # Solve the least squares problem
-        xn = np.zeros(N, dtype=y.dtype)
-        xn[Tn] = lstsq_fun(A[:, Tn], y)
+            # Solve the least squares problem
+            xn[Tn, jj] = lstsq_fun[jj](Tn)
 
-        xn[np.argsort(np.abs(xn))[:-k]] = 0
-        x_hat = xn.copy()
+        xn[~top_k(xn, k, batched=True)] = 0
+        x_hat = xn
 
         # Compute new residual
-        r = y - np.dot(A, x_hat)
+        r = y - A.forward(x_hat.reshape(shape))
 
         # Compute stopping criteria
         stop_criteria = np.linalg.norm(r)/ynorm
@@ -130,10 +242,11 @@ def cosamp(
         if disp:
             logging.info(
                 table.row(
-                    [ii, stop_criteria, np.mean((np.abs(x - x_hat)**2))]))
+                    [ii, stop_criteria, np.mean((np.abs(
+                        x - x_hat.reshape(shape))**2))]))
 
         # Check stopping criteria
         if stop_criteria < tol:
             break
 
-    return x_hat
+    return x_hat.reshape(shape)
@@ -8,10 +8,26 @@ provides methods to go into k-space and get back out assuming we
 undersample according to some mask.
 
 forward_ortho, inverse_ortho are probably the ones you want.
+
+Transforms are done with an FFTBackend, shifts by phase modulation
+(see CenteredFFT), and the sampling mask and scaling are folded into
+the phases once for each input shape.
 '''
 
 import numpy as np
 
+from mr_utils.utils.fft_backend import FFTBackend, CenteredFFT
+
+# Shifts and inverse of each kind of transform
+_KINDS = {
+    'forward': (None, None, False),
+    'forward_s': (None, 'fftshift', False),
+    'forward_ortho': ('fftshift', 'fftshift', False),
+    'inverse': (None, None, True),
+    'inverse_s': (None, 'ifftshift', True),
+    'inverse_ortho': ('ifftshift', 'ifftshift', True),
+}
+
 class UFT(object):
     '''Undersampled Fourier Transform (UFT) data acquisiton model.
 
@@ -23,9 +39,12 @@ class UFT(object):
         Axes to perform FFT over.
     scale : bool
         Whether or not to scale ortho transforms.
+    fft : FFTBackend
+        Does the Fourier transforms.
     '''
 
-    def __init__(self, samp, axes=None, scale=True):
+    def __init__(self, samp, axes=None, scale=True, backend=None,
+                 workers=None):
         '''Initialize with binary sampling pattern.
 
         Parameters
@@ -36,6 +55,10 @@ class UFT(object):
             Axes to perform FFT over.
         scale : bool, optional
             Whether or not to scale ortho transforms.
+        backend : {None, 'pyfftw', 'scipy', 'numpy'}, optional
+            FFT library, see FFTBackend.
+        workers : int, optional
+            Number of threads for FFTs.
         '''
         self.samp = samp
 
@@ -45,8 +68,33 @@ class UFT(object):
             self.axes = axes
 
         self.scale = scale
+        self.fft = FFTBackend(backend, workers)
+        self._plans = {}
 
-    def forward(self, x, axes=None):
+    def _transform(self, kind, x, axes, out):
+        '''Apply one kind of transform, planning it the first time.'''
+        pre_shift, post_shift, inverse = _KINDS[kind]
+        if axes is None:
+            axes = self.axes
+        axes = None if axes is None else tuple(axes)
+
+        key = (kind, x.shape, axes)
+        if key not in self._plans:
+            # Mask and scale go right into the output phases
+            weight = None
+            if kind in ('forward', 'forward_s'):
+                weight = self.samp
+            if self.scale:
+                if kind in ('forward', 'forward_ortho'):
+                    weight = self.samp/np.sqrt(x.size)
+                elif kind in ('inverse', 'inverse_ortho'):
+                    weight = np.sqrt(x.size)
+            self._plans[key] = CenteredFFT(
+                axes, pre_shift, post_shift, inverse, weight,
+                backend=self.fft)
+        return self._plans[key](x, out=out)
+
+    def forward(self, x, axes=None, out=None):
         '''Fourier encoding with binary undersampling pattern applied.
 
         Parameters
@@ -55,6 +103,8 @@ class UFT(object):
             Matrix to be transformed.
         axes : tuple
             Dimensions to Fourier transform if x is not 2d.
+        out : array_like, optional
+            Array to put the result in.
 
         Returns
         -------
@@ -64,22 +114,22 @@ class UFT(object):
 
         Notes
         -----
-        This forward transform has no fftshift applied.
+        This forward transform has no fftshift applied.  The mask is
+        applied once, scaled if `scale=True`.
         '''
-        if axes is None:
-            axes = self.axes
-        tmp = np.fft.fftn(x, axes=axes)*self.samp
-        if self.scale:
-            tmp *= self.samp/np.sqrt(tmp.size)
-        return tmp
+        return self._transform('forward', x, axes, out)
 
-    def forward_s(self, x):
+    def forward_s(self, x, axes=None, out=None):
         '''Fourier encoding with binary undersampling pattern applied.
 
         Parameters
         ----------
         x : array_like
             Matrix to be transformed.
+        axes : tuple, optional
+            Dimensions to Fourier transform, all by default.
+        out : array_like, optional
+            Array to put the result in.
 
         Returns
         -------
@@ -91,18 +141,19 @@ class UFT(object):
         -----
         This forward transform applies fftshift before masking.
         '''
-        return np.fft.fftshift(np.fft.fft2(
-            x, axes=self.axes), axes=self.axes)*self.samp
+        return self._transform('forward_s', x, axes, out)
 
-    def forward_ortho(self, x, axes=None):
+    def forward_ortho(self, x, axes=None, out=None):
         '''Normalized Fourier encoding with binary undersampling.
 
         Parameters
         ----------
         x : array_like
             Matrix to be transformed.
-        axes: tuple, optional
-            Dimensions to perform FFT2 over.
+        axes : tuple, optional
+            Dimensions to Fourier transform, all by default.
+        out : array_like, optional
+            Array to put the result in.
 
         Returns
         -------
@@ -112,17 +163,12 @@ class UFT(object):
 
         Notes
         -----
-        This forward transform applied fftshift before FFT and after.
+        This forward transform applies fftshift before FFT and after.
+        Scaling and mask are only applied if `scale=True`.
         '''
-        if axes is None:
-            axes = self.axes
-        tmp = np.fft.fftshift(np.fft.fft2(np.fft.fftshift(
-            x, axes=axes), axes=axes), axes=axes)
-        if self.scale:
-            tmp *= self.samp/np.sqrt(tmp.size)
-        return tmp
+        return self._transform('forward_ortho', x, axes, out)
 
-    def inverse(self, x, axes=None):
+    def inverse(self, x, axes=None, out=None):
         '''Inverse fourier encoding.
 
         Parameters
@@ -131,26 +177,27 @@ class UFT(object):
             Matrix to be transformed.
         axes : tuple
             Dimensions to Fourier transform if x is not 2d.
+        out : array_like, optional
+            Array to put the result in.
 
         Returns
         -------
         array_like
             Inverse fourier transform of `x`.
         '''
-        if axes is None:
-            axes = self.axes
-        tmp = np.fft.ifftn(x, axes=axes)
-        if self.scale:
-            tmp *= np.sqrt(x.size)
-        return tmp
+        return self._transform('inverse', x, axes, out)
 
-    def inverse_s(self, x):
+    def inverse_s(self, x, axes=None, out=None):
         '''Inverse fourier encoding with fftshift.
 
         Parameters
         ----------
         x : array_like
             Matrix to be transformed.
+        axes : tuple, optional
+            Dimensions to Fourier transform, all by default.
+        out : array_like, optional
+            Array to put the result in.
 
         Returns
         -------
@@ -161,10 +208,9 @@ class UFT(object):
         -----
         This inverse transform applies fftshift.
         '''
-        return np.fft.ifftshift(np.fft.ifft2(
-            x, axes=self.axes), axes=self.axes)
+        return self._transform('inverse_s', x, axes, out)
 
-    def inverse_ortho(self, x, axes=None):
+    def inverse_ortho(self, x, axes=None, out=None):
         '''Inverse Normalized Fourier encoding.
 
         Parameters
@@ -172,7 +218,9 @@ class UFT(object):
         x : array_like
             Matrix to be transformed.
         axes : tuple, optional
-            Dimensions to Fourier transform if x is not 2d.
+            Dimensions to Fourier transform, all by default.
+        out : array_like, optional
+            Array to put the result in.
 
         Returns
         -------
@@ -184,10 +232,4 @@ class UFT(object):
         -----
         This transform applied ifftshift before and after ifft2.
         '''
-        if axes is None:
-            axes = self.axes
-        tmp = np.fft.ifftshift(np.fft.ifft2(np.fft.ifftshift(
-            x, axes=axes), axes=axes), axes=axes)
-        if self.scale:
-            tmp *= np.sqrt(x.size)
-        return tmp
+        return self._transform('inverse_ortho', x, axes, out)
@@ -0,0 +1,165 @@
+'''Matrix-free measurement operators for sparse recovery solvers.
+
+IHT, nIHT, IST, and cosamp all accept either an explicit measurement
+matrix or a LinearOperator that only knows how to apply the forward
+and adjoint encoding, e.g., UFT or wavelet transforms.
+'''
+
+import numpy as np
+
+class LinearOperator(object):
+    '''Linear measurement operator given by forward and adjoint.
+
+    Attributes
+    ----------
+    forward : callable
+        Forward encoding, y = forward(x).
+    adjoint : callable
+        Adjoint of forward encoding, x = adjoint(y).
+    batched : bool
+        Whether the last axis of x and y indexes independent signals.
+    matrix : array_like or None
+        Explicit matrix, if the operator was made from one.
+
+    Examples
+    --------
+    Undersampled Fourier encoding of images::
+
+        uft = UFT(samp)
+        A = LinearOperator(uft.forward_ortho, uft.inverse_ortho)
+
+    or of a stack of images, each its own sparse recovery problem::
+
+        fwd = lambda x: np.fft.fft2(
+            x, axes=(0, 1), norm='ortho')*samp[..., None]
+        adj = lambda y: np.fft.ifft2(
+            y*samp[..., None], axes=(0, 1), norm='ortho')
+        A = LinearOperator(fwd, adj, batched=True)
+    '''
+
+    def __init__(self, forward, adjoint, batched=False, matrix=None):
+        '''Initialize with forward and adjoint functions.
+
+        Parameters
+        ----------
+        forward : callable
+            Forward encoding, y = forward(x).
+        adjoint : callable
+            Adjoint of forward encoding, x = adjoint(y).
+        batched : bool, optional
+            Whether the last axis of x and y indexes independent
+            signals.  forward and adjoint must then accept any number
+            of signals.
+        matrix : array_like, optional
+            Explicit matrix, if there is one.
+        '''
+        self.forward = forward
+        self.adjoint = adjoint
+        self.batched = batched
+        self.matrix = matrix
+
+    def columns(self, idx, shape):
+        '''Columns of the equivalent measurement matrix.
+
+        Parameters
+        ----------
+        idx : array_like
+            Flat indices into a single signal.
+        shape : tuple
+            Shape of a single signal (no batch axis).
+
+        Returns
+        -------
+        array_like
+            (n, len(idx)) matrix, the encodings of unit vectors.
+        '''
+        idx = np.asarray(idx, dtype=int)
+        if self.matrix is not None:
+            return self.matrix[:, idx]
+
+        if self.batched:
+            # Encode all the unit vectors at once as a batch
+            E = np.zeros((int(np.prod(shape)), idx.size))
+            E[idx, np.arange(idx.size)] = 1
+            cols = self.forward(E.reshape(tuple(shape) + (idx.size,)))
+            return cols.reshape((-1, idx.size))
+
+        cols = []
+        for ii in idx:
+            e = np.zeros(int(np.prod(shape)))
+            e[ii] = 1
+            cols.append(np.ravel(self.forward(e.reshape(shape))))
+        return np.stack(cols, axis=1)
+
+def as_operator(A, y):
+    '''Wrap measurement matrix A as a LinearOperator.
+
+    Parameters
+    ----------
+    A : array_like or LinearOperator
+        Measurement matrix or operator.
+    y : array_like
+        Measurements, columns of y are independent problems if A is a
+        matrix and y is 2D.
+
+    Returns
+    -------
+    LinearOperator
+        A itself if it is already an operator.
+    '''
+    if isinstance(A, LinearOperator):
+        return A
+    A = np.asarray(A)
+    AH = A.conj().T
+    return LinearOperator(A.dot, AH.dot, batched=y.ndim > 1, matrix=A)
+
+def top_k(x, k, batched=False):
+    '''Mask of the k largest magnitude coefficients of each signal.
+
+    Parameters
+    ----------
+    x : array_like
+        Coefficients.
+    k : int
+        Number of coefficients to keep.
+    batched : bool, optional
+        Whether the last axis of x indexes independent signals.
+
+    Returns
+    -------
+    array_like
+        Boolean mask, same shape as x.
+
+    Notes
+    -----
+    Uses np.argpartition, so there is no full sort of the
+    coefficients.
+    '''
+    nb = x.shape[-1] if batched else 1
+    a = np.abs(x).reshape((-1, nb))
+    mask = np.zeros(a.shape, dtype=bool)
+    if k >= a.shape[0]:
+        mask[:] = True
+    elif k > 0:
+        idx = np.argpartition(a, a.shape[0] - k, axis=0)[-k:]
+        np.put_along_axis(mask, idx, True, axis=0)
+    return mask.reshape(x.shape)
+
+def signal_norm(x, batched=False):
+    '''l2 norm of each signal.
+
+    Parameters
+    ----------
+    x : array_like
+        Signals.
+    batched : bool, optional
+        Whether the last axis of x indexes independent signals.
+
+    Returns
+    -------
+    float or array_like
+        Norm, one for each signal if batched.
+    '''
+    if batched:
+        return np.linalg.norm(x.reshape((-1, x.shape[-1])), axis=0)
+    return np.linalg.norm(x)
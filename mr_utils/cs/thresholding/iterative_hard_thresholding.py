@@ -6,6 +6,7 @@ import numpy as np
 # import matplotlib.pyplot as plt
 
 from mr_utils.utils.printtable import Table
+from mr_utils.cs.operators import as_operator, top_k
 
 logging.basicConfig(
     format='%(levelname)s: %(message)s', level=logging.DEBUG)
@@ -15,10 +16,11 @@ def IHT(A, y, k, mu=1, maxiter=500, tol=1e-8, x=None, disp=False):
 
     Parameters
     ----------
-    A : array_like
-        Measurement matrix.
+    A : array_like or LinearOperator
+        Measurement matrix or matrix-free operator.
     y : array_like
-        Measurements (i.e., y = Ax).
+        Measurements (i.e., y = Ax).  If A is a matrix, each column of
+        a 2D y is reconstructed independently.
     k : int
         Number of expected nonzero coefficients.
     mu : float, optional
@@ -46,6 +48,7 @@ def IHT(A, y, k, mu=1, maxiter=500, tol=1e-8, x=None, disp=False):
         \min_x || y - Ax ||^2_2 \text{ s.t. } ||x||_0 \leq k
 
     If `disp=True`, then MSE will be calculated using provided x.
+    The stopping criteria is computed over all signals of a batch.
     `mu=1` seems to satisfy Theorem 8.4 often, but might need to be
     adjusted (usually < 1). See normalized IHT for adaptive step size.
 
@@ -58,13 +61,14 @@ def IHT(A, y, k, mu=1, maxiter=500, tol=1e-8, x=None, disp=False):
            Press, 2012.
     '''
 
-    # length of measurement vector and original signal
-    _n, N = A.shape[:]
+    # Shape of original signal comes from the adjoint
+    A = as_operator(A, y)
+    x0 = A.adjoint(y)
 
     # Make sure we have everything we need for disp
     if disp and x is None:
         logging.warning('No true x provided, using x=0 for MSE calc.')
-        x = np.zeros(N)
+        x = np.zeros(x0.shape)
 
     # Some fancy, asthetic touches...
     if disp:
@@ -77,7 +81,7 @@ def IHT(A, y, k, mu=1, maxiter=500, tol=1e-8, x=None, disp=False):
         range_fun = lambda x: trange(x, leave=False, desc='IHT')
 
     # Initial estimate of x, x_hat
-    x_hat = np.zeros(N, dtype=y.dtype)
+    x_hat = np.zeros(x0.shape, dtype=np.result_type(y, x0))
 
     # Get initial residue
     r = y.copy()
@@ -92,10 +96,10 @@ def IHT(A, y, k, mu=1, maxiter=500, tol=1e-8, x=None, disp=False):
     tt = 0
     for tt in range_fun(int(maxiter)):
         # Update estimate using residual scaled by step size
-        x_hat += mu*np.dot(A.conj().T, r)
+        x_hat += mu*A.adjoint(r)
 
         # Leave only k coefficients nonzero (hard threshold)
-        x_hat[np.argsort(np.abs(x_hat))[:-k]] = 0
+        x_hat[~top_k(x_hat, k, A.batched)] = 0
 
         stop_criteria = np.linalg.norm(r)/np.linalg.norm(y)
 
@@ -105,7 +109,7 @@ def IHT(A, y, k, mu=1, maxiter=500, tol=1e-8, x=None, disp=False):
                 [tt, stop_criteria, np.mean((np.abs(x - x_hat)**2))]))
 
         # update the residual
-        r = y - np.dot(A, x_hat)
+        r = y - A.forward(x_hat)
 
         # Check stopping criteria
         if stop_criteria < tol:
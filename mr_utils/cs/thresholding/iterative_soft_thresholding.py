@@ -7,6 +7,7 @@ from skimage.measure import compare_mse
 # import matplotlib.pyplot as plt
 
 from mr_utils.utils.printtable import Table
+from mr_utils.cs.operators import as_operator
 
 logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
 
@@ -16,10 +17,11 @@ def IST(A, y, mu=0.8, theta0=None, k=None, maxiter=500, tol=1e-8, x=None,
 
     Parameters
     ==========
-    A : array_like
-        Measurement matrix.
+    A : array_like or LinearOperator
+        Measurement matrix or matrix-free operator.
     y : array_like
-        Measurements (i.e., y = Ax).
+        Measurements (i.e., y = Ax).  If A is a matrix, each column of
+        a 2D y is reconstructed independently.
     mu : float, optional
         Step size (theta contraction factor, 0 < mu <= 1).
     theta0 : float, optional
@@ -50,7 +52,8 @@ def IST(A, y, mu=0.8, theta0=None, k=None, maxiter=500, tol=1e-8, x=None,
 
     If `disp=True`, then MSE will be calculated using provided x. If
     `theta0=None`, the initial threshold of the IHT will be used as the
-    starting theta.
+    starting theta (one for each signal of a batch).  The stopping
+    criteria is computed over all signals of a batch.
 
     Implements Equations [22-23] from [1]_
 
@@ -64,13 +67,14 @@ def IST(A, y, mu=0.8, theta0=None, k=None, maxiter=500, tol=1e-8, x=None,
     # Check to make sure we have good mu
     assert 0 < mu <= 1, 'mu should be 0 < mu <= 1!'
 
-    # length of measurement vector and original signal
-    _n, N = A.shape[:]
+    # Shape of original signal comes from the adjoint
+    A = as_operator(A, y)
+    x0 = A.adjoint(y)
 
     # Make sure we have everything we need for disp
     if disp and x is None:
         logging.warning('No true x provided, using x=0 for MSE calc.')
-        x = np.zeros(N)
+        x = np.zeros(x0.shape)
 
     # Some fancy, asthetic touches...
     if disp:
@@ -84,7 +88,7 @@ def IST(A, y, mu=0.8, theta0=None, k=None, maxiter=500, tol=1e-8, x=None,
         range_fun = lambda x: trange(x, leave=False, desc='IST')
 
     # Initial estimate of x, x_hat
-    x_hat = np.zeros(N)
+    x_hat = np.zeros(x0.shape, dtype=np.result_type(y, x0))
 
     # Get initial residue
     r = y.copy()
@@ -93,7 +97,11 @@ def IST(A, y, mu=0.8, theta0=None, k=None, maxiter=500, tol=1e-8, x=None,
     if theta0 is None:
         assert k is not None, ('k (measure of sparsity) required to compute '
                                'initial threshold!')
-        theta = -np.sort(-np.abs(np.dot(A.T, r)))[k-1]
+        nb = x0.shape[-1] if A.batched else 1
+        a = np.abs(x0).reshape((-1, nb))
+        theta = np.partition(a, a.shape[0] - k, axis=0)[-k]
+        if not A.batched:
+            theta = theta[0]
     else:
         assert theta0 > 0, 'Threshold must be positive!'
         theta = theta0
@@ -108,16 +116,15 @@ def IST(A, y, mu=0.8, theta0=None, k=None, maxiter=500, tol=1e-8, x=None,
     tt = 0
     for tt in range_fun(maxiter):
         # Update estimate using residual
-        x_hat += np.dot(A.T, r)
+        x_hat += A.adjoint(r)
 
         # Just like IHT, but use soft thresholding operator
         # It is unclear to me what sign function needs to be used:
         # count 0 as 0?
-        x_hat = np.maximum(
-            np.abs(x_hat) - theta, np.zeros(x_hat.shape))*np.sign(x_hat)
+        x_hat = np.maximum(np.abs(x_hat) - theta, 0)*np.sign(x_hat)
 
         # update the residual
-        r = y - np.dot(A, x_hat)
+        r = y - A.forward(x_hat)
 
         # Check stopping criteria
         stop_criteria = np.linalg.norm(r)/np.linalg.norm(y)
@@ -126,8 +133,9 @@ def IST(A, y, mu=0.8, theta0=None, k=None, maxiter=500, tol=1e-8, x=None,
 
         # Show MSE at current iteration if we wanted it
         if disp:
-            logging.info(table.row(
-                [tt, stop_criteria, theta, compare_mse(x, x_hat)]))
+            logging.info(table.row([
+                tt, stop_criteria, np.max(theta),
+                compare_mse(x, x_hat)]))
 
         # Contract theta before we go back around the horn
         theta *= mu
@@ -6,6 +6,7 @@ import numpy as np
 from skimage.measure import compare_mse
 
 from mr_utils.utils.printtable import Table
+from mr_utils.cs.operators import as_operator, top_k, signal_norm
 
 logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
 
@@ -15,10 +16,11 @@ def nIHT(A, y, k, c=0.1, kappa=None, x=None, maxiter=200, tol=1e-8,
 
     Parameters
     ==========
-    A : array_like
-        Measurement matrix
+    A : array_like or LinearOperator
+        Measurement matrix or matrix-free operator.
     y : array_like
-        Measurements (i.e., y = Ax)
+        Measurements (i.e., y = Ax).  If A is a matrix, each column of
+        a 2D y is reconstructed independently.
     k : int
         Number of nonzero coefficients preserved after thresholding.
     c : float, optional
@@ -41,6 +43,9 @@ def nIHT(A, y, k, c=0.1, kappa=None, x=None, maxiter=200, tol=1e-8,
 
     Notes
     =====
+    Step sizes are chosen for each signal of a batch, the stopping
+    criteria is computed over all signals.
+
     Implements Algorithm 8.6 from [1]_.
 
     References
@@ -52,13 +57,14 @@ def nIHT(A, y, k, c=0.1, kappa=None, x=None, maxiter=200, tol=1e-8,
     # Basic checks
     assert 0 < c < 1, 'c must be in (0,1)'
 
-    # length of measurement vector and original signal
-    _n, N = A.shape[:]
+    # Shape of original signal comes from the adjoint
+    A = as_operator(A, y)
+    val = A.adjoint(y)
 
     # Make sure we have everything we need for disp
     if disp and x is None:
         logging.warning('No true x provided, using x=0 for MSE calc.')
-        x = np.zeros(N)
+        x = np.zeros(val.shape)
 
     if disp:
         table = Table(
@@ -69,13 +75,10 @@ def nIHT(A, y, k, c=0.1, kappa=None, x=None, maxiter=200, tol=1e-8,
             logging.info(line)
 
     # Initializations
-    x_hat = np.zeros(N)
+    x_hat = np.zeros(val.shape, dtype=np.result_type(y, val))
 
     # Inital calculation of support
-    val = A.T.dot(y)
-    thresh = -np.sort(-np.abs(val))[k-1]
-    val[np.abs(val) < thresh] = 0
-    T = np.nonzero(val)
+    T = top_k(val, k, A.batched)
 
     # Find suitable kappa if the user didn't give us one
     if kappa is None:
@@ -84,12 +87,16 @@ def nIHT(A, y, k, c=0.1, kappa=None, x=None, maxiter=200, tol=1e-8,
     else:
         assert kappa > 1/(1 - c), 'kappa must be > 1/(1 - c)'
 
+    # Step sizes and conditions are per signal for batches
+    nb = val.shape[-1] if A.batched else 1
+    norm = lambda v: signal_norm(v, A.batched)
+
     # Do the iterative part of the thresholding...
     ii = 0
     for ii in range(int(maxiter)):
 
         # Compute residual
-        r = y - np.dot(A, x_hat)
+        r = y - A.forward(x_hat)
 
         # Check stopping criteria
         stop_criteria = np.linalg.norm(r)/np.linalg.norm(y)
@@ -102,35 +109,34 @@ def nIHT(A, y, k, c=0.1, kappa=None, x=None, maxiter=200, tol=1e-8,
                 [ii, stop_criteria, compare_mse(x, x_hat)]))
 
         # Compute step size
-        g = np.dot(A.T, r)
-        mu = np.linalg.norm(g)**2/np.linalg.norm(np.dot(A, g))**2
+        g = A.adjoint(r)
+        mu = norm(g)**2/norm(A.forward(g))**2
 
         # Hard thresholding
         xn = x_hat + mu*g
-        xn[np.argsort(np.abs(xn))[:-k]] = 0
-
-        # Compute support of xn
-        Tn = np.nonzero(xn)
-
-        # Decide what to do
-        if np.array_equal(Tn, T):
+        Tn = top_k(xn, k, A.batched)
+        xn[~Tn] = 0
+
+        # Decide what to do, signals whose support didn't change are
+        # done
+        same = np.all((Tn == T).reshape((-1, nb)), axis=0)
+        if not A.batched:
+            same = same[0]
+        if np.all(same):
             x_hat = xn
         else:
-            cond = (1 - c)*np.linalg.norm(xn - x_hat)**2/np.linalg.norm(
-                np.dot(A, xn - x_hat))**2
-            if mu <= cond:
-                x_hat = xn
-            else:
-                while mu > cond:
-                    mu /= kappa*(1 - c)
-                    xn = x_hat + mu*g
-                    thresh = -np.sort(-np.abs(xn))[k-1]
-                    xn[np.abs(xn) < thresh] = 0
-                    cond = (1 - c)*np.linalg.norm(
-                        xn - x_hat)**2/np.linalg.norm(np.dot(A, xn - x_hat))**2
-
-                Tn = np.nonzero(xn)
-                x_hat = xn
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cond = (1 - c)*norm(xn - x_hat)**2/norm(
+                    A.forward(xn - x_hat))**2
+            cond = np.where(same, np.inf, cond)
+            while np.any(mu > cond):
+                mu = np.where(mu > cond, mu/(kappa*(1 - c)), mu)
+                xn = x_hat + mu*g
+                xn[~top_k(xn, k, A.batched)] = 0
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    cond = np.where(same, np.inf, (1 - c)*norm(
+                        xn - x_hat)**2/norm(A.forward(xn - x_hat))**2)
+            x_hat = xn
 
     # Regroup and debrief...
     if ii == (maxiter-1):
@@ -21,3 +21,9 @@ except KeyError:
 # Check for siemens_to_ismrmrd
 SIEMENS_TO_ISMRMRD_INSTALLED = find_executable(
     'siemens_to_ismrmrd') is not None
+
+# Where to keep things we only want to compute once, e.g., parser
+# tables
+CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'mr_utils')
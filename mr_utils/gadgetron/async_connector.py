@@ -0,0 +1,304 @@
+'''Gadgetron connector running on an asyncio event loop.
+
+Speaks the same protocol as gtconnector.Connector, but many sessions
+can share one event loop and images come back through an async
+iterator while acquisitions are still being sent:
+
+    async with AsyncConnector() as con:
+        await con.connect(address, port)
+        await con.send_gadgetron_configuration_file('default.xml')
+        await con.send_gadgetron_parameters(xml)
+        sender = asyncio.ensure_future(
+            con.send_ismrmrd_acquisitions(acqs))
+        async for img in con:
+            ...
+'''
+
+import asyncio
+import warnings
+with warnings.catch_warnings():
+    warnings.filterwarnings('ignore', category=FutureWarning)
+    import ismrmrd
+
+import numpy as np
+
+from . import gtconnector as gt
+
+IMAGE_MESSAGES = [
+    gt.GADGET_MESSAGE_ISMRMRD_IMAGE_REAL_USHORT,
+    gt.GADGET_MESSAGE_ISMRMRD_IMAGE_REAL_FLOAT,
+    gt.GADGET_MESSAGE_ISMRMRD_IMAGE_CPLX_FLOAT,
+    gt.GADGET_MESSAGE_ISMRMRD_IMAGE]
+IMAGE_ATTRIB_MESSAGES = [
+    gt.GADGET_MESSAGE_ISMRMRD_IMAGEWITHATTRIB_REAL_USHORT,
+    gt.GADGET_MESSAGE_ISMRMRD_IMAGEWITHATTRIB_REAL_FLOAT,
+    gt.GADGET_MESSAGE_ISMRMRD_IMAGEWITHATTRIB_CPLX_FLOAT]
+
+class AsyncConnector(object):
+    '''One Gadgetron session on an asyncio event loop.
+
+    Parameters
+    ==========
+    max_images : int, optional
+        Images held before we stop reading from the server, 0 for no
+        limit.
+    batch_bytes : int, optional
+        Wait for the socket to drain every time this many bytes are
+        queued.
+
+    Notes
+    =====
+    Sends wait for the transport's write buffer to drain, so a slow
+    server slows down the sender instead of piling up data in memory.
+    Received images are delivered by iterating over the connector with
+    `async for`.  Iteration ends when the server closes the session.
+    DICOM blobs (and their attributes) are kept in the blobs
+    dictionary by name.
+    '''
+
+    def __init__(self, max_images=0, batch_bytes=gt.SEND_BATCH_BYTES):
+        self.max_images = max_images
+        self.batch_bytes = batch_bytes
+        self.reader = None
+        self.writer = None
+        self.images = None
+        self.blobs = {}
+        self.read_task = None
+        self._done = object()
+
+    async def connect(self, hostname, port):
+        '''Open the connection and start reading what comes back.'''
+        self.hostname = hostname
+        self.port = port
+        self.reader, self.writer = await asyncio.open_connection(
+            hostname, port)
+        self.images = asyncio.Queue(maxsize=self.max_images)
+        self.read_task = asyncio.ensure_future(self._read())
+
+    async def _read(self):
+        try:
+            while True:
+                msg = await self.reader.readexactly(
+                    gt.SIZEOF_GADGET_MESSAGE_IDENTIFIER)
+                kind = gt.GadgetMessageIdentifier.unpack(msg)[0]
+
+                if kind == gt.GADGET_MESSAGE_CLOSE:
+                    break
+                elif kind in IMAGE_MESSAGES:
+                    img = await self._read_image(False)
+                    await self.images.put(img)
+                elif kind in IMAGE_ATTRIB_MESSAGES:
+                    img = await self._read_image(True)
+                    await self.images.put(img)
+                elif kind == gt.GADGET_MESSAGE_DICOM:
+                    name = 'dicom_%06d.dcm' % len(self.blobs)
+                    self.blobs[name] = await self._read_blob()
+                elif kind == gt.GADGET_MESSAGE_DICOM_WITHNAME:
+                    name, blob, attribs = \
+                        await self._read_blob_attrib()
+                    self.blobs['%s.dcm' % name] = blob
+                    self.blobs['%s_attrib.xml' % name] = attribs
+                else:
+                    # Unlike the blocking connector, we can't skip
+                    # what we don't understand and stay in sync with
+                    # the stream
+                    raise ValueError(
+                        'Unhandled message ID: %d' % kind)
+        except Exception as e:
+            await self.images.put(e)
+        await self.images.put(self._done)
+
+    async def _read_image(self, attribs):
+        header = await self.reader.readexactly(
+            ismrmrd.hdf5.image_header_dtype.itemsize)
+        if attribs:
+            msg = await self.reader.readexactly(
+                gt.SIZEOF_GADGET_MESSAGE_ATTRIB_LENGTH)
+            attrib_len = gt.GadgetMessageAttribLength.unpack(msg)[0]
+            img = ismrmrd.Image(
+                header, await self.reader.readexactly(attrib_len))
+        else:
+            img = ismrmrd.Image(header)
+        data = await self.reader.readexactly(img.data.nbytes)
+        img.data.ravel()[:] = np.frombuffer(
+            data, dtype=img.data.dtype)
+        return img
+
+    async def _read_blob(self):
+        msg = await self.reader.readexactly(
+            gt.SIZEOF_GADGET_MESSAGE_BLOB_SIZE)
+        nbytes = gt.GadgetMessageBlobSize.unpack(msg)[0]
+        return await self.reader.readexactly(nbytes)
+
+    async def _read_blob_attrib(self):
+        # Same as BlobAttribMessageReader: blob, filename, attributes
+        blob = await self._read_blob()
+        msg = await self.reader.readexactly(
+            gt.SIZEOF_GADGET_MESSAGE_BLOB_FILENAME)
+        filename_len = gt.GadgetMessageBlobFilename.unpack(msg)[0]
+        filename = await self.reader.readexactly(filename_len)
+        msg = await self.reader.readexactly(
+            gt.SIZEOF_GADGET_MESSAGE_ATTRIB_LENGTH)
+        attrib_len = gt.GadgetMessageAttribLength.unpack(msg)[0]
+        attribs = await self.reader.readexactly(attrib_len)
+        return filename.rstrip(b'\0').decode('utf-8'), blob, attribs
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        img = await self.images.get()
+        if img is self._done:
+            # Let anyone else iterating know we're done, too
+            await self.images.put(self._done)
+            raise StopAsyncIteration
+        if isinstance(img, Exception):
+            raise img
+        return img
+
+    async def send_gadgetron_configuration_script(self, contents):
+        self.writer.write(gt.GadgetMessageIdentifier.pack(
+            gt.GADGET_MESSAGE_CONFIG_SCRIPT))
+        self.writer.write(
+            gt.GadgetMessageScript.pack(len(contents) + 1))
+        self.writer.write(('%s\0' % contents).encode('utf-8'))
+        await self.writer.drain()
+
+    async def send_gadgetron_configuration_file(self, filename):
+        self.writer.write(gt.GadgetMessageIdentifier.pack(
+            gt.GADGET_MESSAGE_CONFIG_FILE))
+        self.writer.write(gt.GadgetMessageConfigurationFile.pack(
+            filename.encode('utf-8')))
+        await self.writer.drain()
+
+    async def send_gadgetron_parameters(self, xml):
+        self.writer.write(gt.GadgetMessageIdentifier.pack(
+            gt.GADGET_MESSAGE_PARAMETER_SCRIPT))
+        self.writer.write(gt.GadgetMessageScript.pack(len(xml) + 1))
+        self.writer.write(b'%s\0' % xml)
+        await self.writer.drain()
+
+    async def send_gadgetron_close(self):
+        self.writer.write(gt.GadgetMessageIdentifier.pack(
+            gt.GADGET_MESSAGE_CLOSE))
+        await self.writer.drain()
+
+    async def send_ismrmrd_acquisition(self, acq):
+        await self.send_ismrmrd_acquisitions(
+            [(bytes(acq.getHead()), acq.traj, acq.data)])
+
+    async def send_ismrmrd_acquisitions(self, acqs):
+        '''Send many acquisitions, draining every batch_bytes.
+
+        acqs -- Iterable or async iterable of (head, traj, data)
+                buffers.
+
+        Returns the number of acquisitions sent.
+        '''
+        if not hasattr(acqs, '__aiter__'):
+            acqs = _aiter(acqs)
+
+        nbytes, count = 0, 0
+        async for head, traj, data in acqs:
+            for buf in gt.acquisition_buffers(head, traj, data):
+                buf = memoryview(buf)
+                if buf.nbytes:
+                    self.writer.write(buf.cast('B'))
+                    nbytes += buf.nbytes
+            count += 1
+            if nbytes >= self.batch_bytes:
+                await self.writer.drain()
+                nbytes = 0
+        await self.writer.drain()
+        return count
+
+    async def wait(self):
+        '''Wait until the server closes the session.'''
+        await self.read_task
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            if hasattr(self.writer, 'wait_closed'):
+                try:
+                    await self.writer.wait_closed()
+                except ConnectionError:
+                    pass
+            self.writer = None
+        if self.read_task is not None and not self.read_task.done():
+            self.read_task.cancel()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+async def _aiter(iterable):
+    for item in iterable:
+        yield item
+
+async def session(
+        acqs, address, port, xml, config='default.xml',
+        config_local=None, max_images=0, blobs=None):
+    '''Run a whole Gadgetron session, sending and receiving at once.
+
+    Parameters
+    ==========
+    acqs : iterable or async iterable
+        (head, traj, data) buffers of each acquisition.
+    address : str
+        Hostname of Gadgetron.
+    port : int
+        Port to connect to.
+    xml : bytes
+        ISMRMRD XML header.
+    config : str, optional
+        Remote configuration file.
+    config_local : str, optional
+        Local configuration file contents, sent instead of config.
+    max_images : int, optional
+        Received images held before we stop reading from the server.
+    blobs : dict, optional
+        DICOM blobs sent back by Gadgetron are put in here by name.
+
+    Returns
+    =======
+    images : list
+        Images sent back by Gadgetron.
+
+    Notes
+    =====
+    Many sessions can be run on the same event loop, e.g.,
+    asyncio.gather(*[session(...) for ...]).
+    '''
+
+    async with AsyncConnector(max_images=max_images) as con:
+        await con.connect(address, port)
+        if config_local:
+            await con.send_gadgetron_configuration_script(
+                config_local)
+        else:
+            await con.send_gadgetron_configuration_file(config)
+        await con.send_gadgetron_parameters(xml)
+
+        async def _send():
+            await con.send_ismrmrd_acquisitions(acqs)
+            await con.send_gadgetron_close()
+        sender = asyncio.ensure_future(_send())
+
+        try:
+            images = [img async for img in con]
+            await sender
+        finally:
+            # Don't leave the sender writing to a closed connection
+            # if reading failed
+            if not sender.done():
+                sender.cancel()
+                try:
+                    await sender
+                except asyncio.CancelledError:
+                    pass
+        if blobs is not None:
+            blobs.update(con.blobs)
+    return images
@@ -7,20 +7,112 @@ Keeps same command line interface, but allows for import into scripts.
 import pathlib
 import argparse
 import datetime
-from tempfile import NamedTemporaryFile
 import socket
 import logging
 import warnings
+import threading
+import queue
 with warnings.catch_warnings():
     warnings.filterwarnings("ignore", category=FutureWarning)
     import ismrmrd
-    import h5py
 
-from tqdm import trange
+import numpy as np
+import h5py
+from tqdm import tqdm
 
 from mr_utils.load_data import load_raw
 from . import gtconnector as gt
 
+def read_acquisition_blocks(dset, block_size=256, filename=None,
+                            group='/dataset'):
+    '''Read raw acquisitions from ISMRMRD dataset a block at a time.
+
+    Parameters
+    ==========
+    dset : ismrmrd.Dataset
+        Dataset containing acquisitions.
+    block_size : int, optional
+        Number of acquisitions to read at once.
+    filename : str, optional
+        HDF5 file dset was opened from.  If given, acquisitions
+        are read from its group/data dataset with h5py a block at a
+        time.
+    group : str, optional
+        Group of the dataset in filename.
+
+    Yields
+    ======
+    block : list
+        (head, traj, data) buffers of each acquisition, ready to send.
+
+    Notes
+    =====
+    Without filename, acquisitions are read one at a time using
+    dset.read_acquisition().
+    '''
+    if filename is not None:
+        with h5py.File(filename, 'r') as f:
+            acqs = f[group]['data']
+            for ii in range(0, acqs.shape[0], block_size):
+                block = acqs[ii:ii+block_size]
+                heads = np.ascontiguousarray(
+                    block['head']).view(np.uint8).reshape(
+                        (block.size, -1))
+                yield list(zip(heads, block['traj'], block['data']))
+        return
+
+    nacq = dset.number_of_acquisitions()
+    for ii in range(0, nacq, block_size):
+        block = []
+        for jj in range(ii, min(ii + block_size, nacq)):
+            acq = dset.read_acquisition(jj)
+            block.append((bytes(acq.getHead()), acq.traj, acq.data))
+        yield block
+
+def _prefetch(iterable, depth, stop=None):
+    '''Pull items out of iterable on a background thread.
+
+    The producer gives up as soon as the consumer stops, i.e., when
+    the generator is closed or stop (a threading.Event) is set.
+    '''
+    q = queue.Queue(maxsize=depth)
+    done = object()
+    if stop is None:
+        stop = threading.Event()
+
+    def _put(item):
+        # Don't block forever if nobody is taking items anymore
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce():
+        try:
+            for item in iterable:
+                if not _put((item, None)):
+                    return
+        except Exception as e:
+            _put((None, e))
+            return
+        _put((done, None))
+
+    threading.Thread(
+        name='_prefetch', target=_produce, daemon=True).start()
+    try:
+        while True:
+            item, err = q.get()
+            if err is not None:
+                raise err
+            if item is done:
+                return
+            yield item
+    finally:
+        stop.set()
+
 def client(
         data,
         address=None,
@@ -33,7 +125,10 @@ def client(
         script=None,
         existing_modules=['numpy', 'scipy', 'h5py'],
         script_dir=None,
-        verbose=False):
+        verbose=False,
+        block_size=256,
+        prefetch=4,
+        all_series=False):
     '''Send acquisitions to Gadgetron.
 
     This client allows you to connect to a Gadgetron server and process data.
@@ -64,13 +159,21 @@ def client(
         Directory to send script on remote machine.
     verbose : bool, optional
         Verbose mode.
+    block_size : int, optional
+        Number of acquisitions read from the dataset at once.
+    prefetch : int, optional
+        Number of blocks to read ahead while sending.
+    all_series : bool, optional
+        Return every image series instead of only the first one.
 
     Returns
     =======
-    data : array_like
-        Image from Gadgetron
-    header : xml
-        Header from Gadgetron
+    data : array_like or dict
+        Image from Gadgetron, {image_series_index: image} if
+        all_series.
+    header : array_like or dict
+        Header from Gadgetron, {image_series_index: header} if
+        all_series.
 
     Raises
     ======
@@ -78,10 +181,14 @@ def client(
         `script` bundling is not currently implemented.
     Exception
         `data` is not provided in the correct format.
+    RuntimeError
+        Gadgetron didn't send back any images.
 
     Notes
     =====
-    out_group=None will use the current date as the group name.
+    Images are collected in memory, nothing touches the disk unless
+    outfile is provided.  out_group=None will use the current date as
+    the group name.
     '''
 
     # Make sure we have an out_group label
@@ -108,13 +215,15 @@ def client(
     con = gt.Connector()
 
     ## Register all the readers we need:
-    # The readers need to know where to output the data that gadgetron sends
-    # back.  The output is an hdf5 file, but if we don't want that file and
-    # only care about the numpy array, then we'll create a temporary file to
-    # store the output in and then kill it when we're done.
-    if outfile is None:
-        outfile = NamedTemporaryFile().name
-    logging.debug('Writing to filename: %s', outfile)
+    # The readers need to know where to output the data that gadgetron
+    # sends back.  We keep everything in memory and only write an hdf5
+    # file (and DICOM files) if an outfile was asked for.
+    memory = gt.MemorySink()
+    sink = memory
+    if outfile is not None:
+        logging.debug('Writing to filename: %s', outfile)
+        sink = gt.TeeSink(
+            memory, gt.HDF5Sink(outfile, out_group), gt.FileSink())
 
     # Image message readers
     for im_id in [
@@ -122,7 +231,7 @@ def client(
             gt.GADGET_MESSAGE_ISMRMRD_IMAGE_REAL_FLOAT,
             gt.GADGET_MESSAGE_ISMRMRD_IMAGE_CPLX_FLOAT,
             gt.GADGET_MESSAGE_ISMRMRD_IMAGE]:
-        con.register_reader(im_id, gt.ImageMessageReader(outfile, out_group))
+        con.register_reader(im_id, gt.ImageMessageReader(sink=sink))
 
     # Images with attributes
     for im_id in [
@@ -130,13 +239,14 @@ def client(
             gt.GADGET_MESSAGE_ISMRMRD_IMAGEWITHATTRIB_REAL_FLOAT,
             gt.GADGET_MESSAGE_ISMRMRD_IMAGEWITHATTRIB_CPLX_FLOAT]:
         con.register_reader(
-            im_id, gt.ImageAttribMessageReader(outfile, out_group))
+            im_id, gt.ImageAttribMessageReader(sink=sink))
 
     # DICOM
     con.register_reader(
-        gt.GADGET_MESSAGE_DICOM, gt.BlobMessageReader(out_group, 'dcm'))
+        gt.GADGET_MESSAGE_DICOM,
+        gt.BlobMessageReader(out_group, 'dcm', sink))
     con.register_reader(gt.GADGET_MESSAGE_DICOM_WITHNAME,
-                        gt.BlobAttribMessageReader('', 'dcm'))
+                        gt.BlobAttribMessageReader('', 'dcm', sink))
 
     # Connect to Gadgetron - if no host, port were supplied then look at the
     # active profile to get the values
@@ -160,7 +270,9 @@ def client(
         con.send_gadgetron_configuration_file(config)
 
 
-    # Decide what the input was
+    # Decide what the input was, h5file is the file to read
+    # acquisitions from if we know it
+    h5file = None
     if isinstance(data, ismrmrd.Dataset):
         # User has already given us the ismrmrd dataset that gadgetron expects
         dset = data
@@ -175,6 +287,7 @@ def client(
         if ext == '.h5':
             # Load the dataset from hdf5 file
             dset = ismrmrd.Dataset(data, in_group, False)
+            h5file = data
         elif ext == '.dat':
             # Load the dataset from raw
             dset = load_raw(data, use='s2i', as_ismrmrd=True)
@@ -189,28 +302,40 @@ def client(
     xml_config = dset.read_xml_header()
     con.send_gadgetron_parameters(xml_config)
 
-    # Next, send each acquisition to gadgetron
-    for idx in trange(dset.number_of_acquisitions(), desc='Send', leave=False):
-        acq = dset.read_acquisition(idx)
-        try:
-            con.send_ismrmrd_acquisition(acq)
-        except socket.error as msg:
-            logging.error('Failed to send acquisition %d', idx)
-            print(msg)
-            return None
+    # Next, send the acquisitions to gadgetron.  Blocks are read from
+    # the dataset on a background thread while the previous ones are
+    # sent.
+    pbar = tqdm(total=dset.number_of_acquisitions(), desc='Send',
+                leave=False)
+    blocks = _prefetch(read_acquisition_blocks(
+        dset, block_size, filename=h5file, group=in_group), prefetch)
+    def _acqs():
+        for block in blocks:
+            yield from block
+            pbar.update(len(block))
+    try:
+        con.send_ismrmrd_acquisitions(_acqs())
+    except socket.error as msg:
+        logging.error('Failed to send acquisitions')
+        print(msg)
+        return None
+    finally:
+        # Stops the reader thread if we didn't get through everything
+        blocks.close()
+        pbar.close()
 
     logging.debug('Sending close message to Gadgetron')
     con.send_gadgetron_close()
     con.wait()
 
-    # Convert the hdf5 file into something we can use and send it back
-    with h5py.File(outfile, 'r') as f:
-        # Group might not be image_0
-        data = f[out_group][list(f[out_group].keys())[0]]['data'][:]
-        header = f[out_group][list(f[out_group].keys())[0]]['header'][:]
-        # data = f[out_group]['image_0']['data'][:]
-        # header = f[out_group]['image_0']['header'][:]
-    return(data, header)
+    # Send back what we collected
+    series = memory.series()
+    if not series:
+        raise RuntimeError('Gadgetron did not send back any images!')
+    if all_series:
+        return({s: memory.data(s) for s in series},
+               {s: memory.header(s) for s in series})
+    return(memory.data(series[0]), memory.header(series[0]))
 
 if __name__ == '__main__':
 
@@ -0,0 +1,139 @@
+'''Stand-in for a Gadgetron server on the loopback interface.
+
+Speaks just enough of the Gadgetron protocol to take everything a
+client sends and answer with an image, so throughput of the client can
+be measured offline.
+'''
+
+import socket
+import threading
+from time import perf_counter
+import warnings
+with warnings.catch_warnings():
+    warnings.filterwarnings('ignore', category=FutureWarning)
+    import ismrmrd
+
+import numpy as np
+
+from . import gtconnector as gt
+
+class FakeGadgetron(object):
+    '''Accept one connection and swallow what the client sends.
+
+    Parameters
+    ==========
+    host : str, optional
+        Address to listen on.
+    port : int, optional
+        Port to listen on, 0 picks a free one (see self.port).
+    recv_bufsize : int, optional
+        Socket receive buffer size (SO_RCVBUF).
+    blobs : list, optional
+        (filename, blob, attribs) sent back as DICOM_WITHNAME messages
+        before the image.
+
+    Notes
+    =====
+    The server answers the close message with the data of the last
+    acquisition it received as an image and then closes the
+    connection.
+    num_acquisitions, num_bytes, and elapsed (seconds from the first
+    message to the close message) are available after wait().
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0, recv_bufsize=None,
+                 blobs=()):
+        self.server = socket.socket(
+            socket.AF_INET, socket.SOCK_STREAM)
+        if recv_bufsize is not None:
+            self.server.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, recv_bufsize)
+        self.server.bind((host, port))
+        self.server.listen(1)
+        self.host, self.port = self.server.getsockname()
+
+        self.config = None
+        self.parameters = None
+        self.num_acquisitions = 0
+        self.num_bytes = 0
+        self.elapsed = None
+        self.last = np.zeros((1, 0), dtype=np.complex64)
+        self.blobs = blobs
+
+        self.thread = threading.Thread(
+            name='FakeGadgetron serve', target=self.serve,
+            daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        '''Handle messages until the client says it's done.'''
+        conn, _addr = self.server.accept()
+        msg = bytearray(gt.SIZEOF_GADGET_MESSAGE_IDENTIFIER)
+        head_dtype = ismrmrd.hdf5.acquisition_header_dtype
+        head = bytearray(head_dtype.itemsize)
+        scratch = bytearray()
+        t0 = None
+        while True:
+            gt.readsock_into(conn, msg)
+            if t0 is None:
+                t0 = perf_counter()
+            kind = gt.GadgetMessageIdentifier.unpack(msg)[0]
+
+            if kind == gt.GADGET_MESSAGE_ISMRMRD_ACQUISITION:
+                gt.readsock_into(conn, head)
+                hdr = np.frombuffer(
+                    head, dtype=head_dtype)[0]
+                ns = int(hdr['number_of_samples'])
+                nc = int(hdr['active_channels'])
+                ntraj = ns*int(hdr['trajectory_dimensions'])*4
+                ndata = ns*nc*8
+                if len(scratch) < ntraj + ndata:
+                    scratch = bytearray(ntraj + ndata)
+                gt.readsock_into(
+                    conn, memoryview(scratch)[:ntraj+ndata])
+                self.last = np.frombuffer(
+                    scratch, dtype=np.complex64, count=ns*nc,
+                    offset=ntraj).reshape((nc, ns)).copy()
+                self.num_acquisitions += 1
+                self.num_bytes += len(head) + ntraj + ndata
+            elif kind == gt.GADGET_MESSAGE_CONFIG_FILE:
+                self.config = gt.readsock(
+                    conn, gt.GadgetMessageConfigurationFile.size)
+            elif kind in [gt.GADGET_MESSAGE_CONFIG_SCRIPT,
+                          gt.GADGET_MESSAGE_PARAMETER_SCRIPT]:
+                nbytes = gt.GadgetMessageScript.unpack(gt.readsock(
+                    conn, gt.GadgetMessageScript.size))[0]
+                script = gt.readsock(conn, nbytes)
+                if kind == gt.GADGET_MESSAGE_PARAMETER_SCRIPT:
+                    self.parameters = script
+                else:
+                    self.config = script
+            elif kind == gt.GADGET_MESSAGE_CLOSE:
+                self.elapsed = perf_counter() - t0
+                break
+            else:
+                raise ValueError('Unexpected message ID: %d' % kind)
+
+        # Send back blobs, an image, and hang up
+        for filename, blob, attribs in self.blobs:
+            conn.sendall(b''.join([
+                gt.GadgetMessageIdentifier.pack(
+                    gt.GADGET_MESSAGE_DICOM_WITHNAME),
+                gt.GadgetMessageBlobSize.pack(len(blob)), blob,
+                gt.GadgetMessageBlobFilename.pack(len(filename)),
+                filename,
+                gt.GadgetMessageAttribLength.pack(len(attribs)),
+                attribs]))
+        img = ismrmrd.Image.from_array(self.last)
+        gt.sendmsg_all(conn, [
+            gt.GadgetMessageIdentifier.pack(
+                gt.GADGET_MESSAGE_ISMRMRD_IMAGE),
+            bytes(img.getHead()), img.data])
+        conn.sendall(gt.GadgetMessageIdentifier.pack(
+            gt.GADGET_MESSAGE_CLOSE))
+        conn.close()
+
+    def wait(self):
+        '''Wait for the client to finish and stop listening.'''
+        self.thread.join()
+        self.server.close()
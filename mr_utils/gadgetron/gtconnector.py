@@ -2,6 +2,7 @@ import warnings
 with warnings.catch_warnings():
     warnings.filterwarnings("ignore", category=FutureWarning)
     import ismrmrd
+import os
 import struct
 import socket
 import threading
@@ -59,107 +60,248 @@ GadgetMessageBlobFilename = struct.Struct('<Q')
 SIZEOF_GADGET_MESSAGE_BLOB_FILENAME = len(GadgetMessageBlobFilename.pack(0))
 
 
-def readsock(sock, bytecount):
-    """Reads a specific number of bytes from a socket"""
-    chunks = []
+# Socket receive buffer size (SO_RCVBUF) in bytes, None for the OS
+# default
+RECV_BUFSIZE = None
+
+def readsock_into(sock, buf):
+    """Fills a writable buffer (bytearray, memoryview, ndarray)
+
+    Bytes are received from sock directly into buf, no intermediate
+    copies are made.
+    """
+    if memoryview(buf).nbytes == 0:
+        return buf
+    view = memoryview(buf).cast('B')
+    bytecount = view.nbytes
     curcount = 0
     while curcount < bytecount:
-        chunk = sock.recv(min(bytecount - curcount, 4096))
-        if chunk == '':
+        nbytes = sock.recv_into(view[curcount:], bytecount - curcount)
+        if nbytes == 0:
             raise RuntimeError("socket connection closed")
-        chunks.append(chunk)
-        curcount += len(chunk)
-    return b''.join(chunks)
+        curcount += nbytes
+    return buf
+
+def readsock(sock, bytecount):
+    """Reads a specific number of bytes from a socket"""
+    return bytes(readsock_into(sock, bytearray(bytecount)))
+
+# Acquisition messages are coalesced into sends of about this many
+# bytes
+SEND_BATCH_BYTES = 4*2**20
+
+# Most buffers we can hand to a single sendmsg call
+try:
+    IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 1024
+
+def sendmsg_all(sock, buffers):
+    """Sends buffers with scatter-gather, retrying partial sends"""
+    buffers = [memoryview(b) for b in buffers]
+    buffers = [b.cast('B') for b in buffers if b.nbytes]
+    if not hasattr(sock, 'sendmsg'):
+        # No scatter-gather (e.g., Windows), one big send will have to
+        # do
+        sock.sendall(b''.join(buffers))
+        return
+
+    while buffers:
+        nbytes = sock.sendmsg(buffers[:IOV_MAX])
+
+        # Drop what made it, keep the rest of a partially sent buffer
+        ii = 0
+        while ii < len(buffers) and nbytes >= buffers[ii].nbytes:
+            nbytes -= buffers[ii].nbytes
+            ii += 1
+        buffers = buffers[ii:]
+        if buffers and nbytes:
+            buffers[0] = buffers[0][nbytes:]
+
+def acquisition_buffers(head, traj, data):
+    """Buffers making up an acquisition message, nothing is copied"""
+    return [GadgetMessageIdentifier.pack(
+        GADGET_MESSAGE_ISMRMRD_ACQUISITION), head, traj, data]
 
 
 class MessageReader(object):
     def read(self, sock):
         raise NotImplementedError("Must implement in derived class")
 
-class ImageMessageReader(MessageReader):
+class ResultSink(object):
+    """Where readers put what Gadgetron sends back, ignored here"""
+    def append_image(self, img):
+        pass
+
+    def append_blob(self, name, blob):
+        pass
+
+class MemorySink(ResultSink):
+    """Collects images in memory, grouped by image_series_index
+
+    Images of each series are copied into a preallocated array (and
+    their headers into a structured array) that doubles in size when
+    full.
+    Blobs are kept in a dictionary by name.
+    """
+    def __init__(self, capacity=16):
+        self.capacity = capacity
+        self._data = {}
+        self._header = {}
+        self._count = {}
+        self.blobs = {}
+        self.lock = threading.Lock()
+
+    def append_image(self, img):
+        series = img.image_series_index
+        with self.lock:
+            n = self._count.get(series, 0)
+            if n == 0:
+                self._data[series] = np.empty(
+                    (self.capacity,) + img.data.shape,
+                    dtype=img.data.dtype)
+                self._header[series] = np.empty(
+                    self.capacity,
+                    dtype=ismrmrd.hdf5.image_header_dtype)
+            elif self._data[series].shape[1:] != img.data.shape:
+                raise ValueError(
+                    'Images of series %d have different shapes' % (
+                        series))
+            elif n == self._data[series].shape[0]:
+                self._data[series] = np.concatenate(
+                    (self._data[series],
+                     np.empty_like(self._data[series])))
+                self._header[series] = np.concatenate(
+                    (self._header[series], np.empty_like(
+                        self._header[series])))
+
+            self._data[series][n] = img.data
+            self._header[series][n] = np.frombuffer(
+                bytes(img.getHead()),
+                dtype=ismrmrd.hdf5.image_header_dtype)[0]
+            self._count[series] = n + 1
+
+    def append_blob(self, name, blob):
+        with self.lock:
+            self.blobs[name] = blob
+
+    def series(self):
+        """Image series indices received so far"""
+        return sorted(self._count)
+
+    def data(self, series):
+        """(images, channels, z, y, x) array of a series"""
+        return self._data[series][:self._count[series]]
+
+    def header(self, series):
+        """Image headers of a series"""
+        return self._header[series][:self._count[series]]
+
+class HDF5Sink(ResultSink):
+    """Appends images to an ISMRMRD dataset, one group per series"""
     def __init__(self, filename, groupname):
         self.filename = filename
         self.groupname = groupname
         self.dataset = None
 
-    def read(self, sock):
-        # read image header
-        serialized_header = readsock(
-            sock, ismrmrd.hdf5.image_header_dtype.itemsize)
-        img = ismrmrd.Image(serialized_header)
-
-        # now the image's data should be a valid NumPy array of zeros
-        dtype = img.data.dtype
-        data_bytes = len(img.data.flat) * dtype.itemsize
-        serialized_data = readsock(sock, data_bytes)
-        img.data.ravel()[:] = np.frombuffer(serialized_data, dtype=dtype)
-
+    def append_image(self, img):
         if not self.dataset:
             # open dataset
-            self.dataset = ismrmrd.Dataset(self.filename, self.groupname)
+            self.dataset = ismrmrd.Dataset(
+                self.filename, self.groupname)
 
-        self.dataset.append_image("image_%d" % img.image_series_index, img)
+        self.dataset.append_image(
+            "image_%d" % img.image_series_index, img)
 
+class FileSink(ResultSink):
+    """Writes blobs to files named after the blob"""
+    def append_blob(self, name, blob):
+        with open(name, 'wb') as f:
+            f.write(blob)
 
-class ImageAttribMessageReader(ImageMessageReader):
-    def read(self, sock):
-        # read image header
-        serialized_header = readsock(
-            sock, ismrmrd.hdf5.image_header_dtype.itemsize)
-        # read meta attributes
-        msg = readsock(self.sock, SIZEOF_GADGET_MESSAGE_ATTRIB_LENGTH)
-        attrib_len = GadgetMessageAttribLength.unpack(msg)[0]
-        attribs = readsock(self.sock, attrib_len)
+class TeeSink(ResultSink):
+    """Hands results to several sinks"""
+    def __init__(self, *sinks):
+        self.sinks = sinks
 
-        # make a new image
-        img = ismrmrd.Image(serialized_header, attribs)
+    def append_image(self, img):
+        for sink in self.sinks:
+            sink.append_image(img)
 
-        # now the image's data should be a valid NumPy array of zeros
-        dtype = img.data.dtype
-        data_bytes = len(img.data.flat) * dtype.itemsize
-        serialized_data = readsock(sock, data_bytes)
-        img.data.ravel()[:] = np.fromstring(serialized_data, dtype=dtype)
+    def append_blob(self, name, blob):
+        for sink in self.sinks:
+            sink.append_blob(name, blob)
 
-        if not self.dataset:
-            # open dataset
-            self.dataset = ismrmrd.Dataset(self.filename, self.groupname)
+class ImageMessageReader(MessageReader):
+    def __init__(self, filename=None, groupname=None, sink=None):
+        if sink is None:
+            sink = HDF5Sink(filename, groupname)
+        self.sink = sink
+        self.header = bytearray(
+            ismrmrd.hdf5.image_header_dtype.itemsize)
+
+    def read_image(self, sock, attribs=False):
+        # read image header, it's copied out of our buffer by Image
+        readsock_into(sock, self.header)
 
-        self.dataset.append_image("image_%d" % img.image_series_index, img)
+        # read meta attributes
+        if attribs:
+            msg = readsock(sock, SIZEOF_GADGET_MESSAGE_ATTRIB_LENGTH)
+            attrib_len = GadgetMessageAttribLength.unpack(msg)[0]
+            img = ismrmrd.Image(
+                self.header, readsock(sock, attrib_len))
+        else:
+            img = ismrmrd.Image(self.header)
+
+        # now the image's data should be a valid NumPy array, so the
+        # data can go straight in
+        readsock_into(sock, img.data)
+        return img
+
+    def read(self, sock):
+        self.sink.append_image(self.read_image(sock))
+
+
+class ImageAttribMessageReader(ImageMessageReader):
+    def read(self, sock):
+        self.sink.append_image(self.read_image(sock, attribs=True))
 
 class BlobMessageReader(MessageReader):
-    def __init__(self, prefix, suffix):
+    def __init__(self, prefix, suffix, sink=None):
         self.prefix = prefix
         self.suffix = suffix
         self.num_calls = 0
+        if sink is None:
+            sink = FileSink()
+        self.sink = sink
 
     def read(self, sock):
         # read sizeof blob data and blob data itself
-        msg = readsock(self.sock, SIZEOF_GADGET_MESSAGE_BLOB_SIZE)
+        msg = readsock(sock, SIZEOF_GADGET_MESSAGE_BLOB_SIZE)
         nbytes = GadgetMessageBlobSize.unpack(msg)[0]
-        blob = readsock(self.sock, nbytes)
+        blob = readsock(sock, nbytes)
 
         filename = '%s_%06d.%s' % (self.prefix, self.num_calls, self.suffix)
-        with open(filename, 'wb') as f:
-            f.write(blob)
+        self.sink.append_blob(filename, blob)
 
         self.num_calls += 1
 
 class BlobAttribMessageReader(BlobMessageReader):
     def read(self, sock):
         # read blob data
-        msg = readsock(self.sock, SIZEOF_GADGET_MESSAGE_BLOB_SIZE)
+        msg = readsock(sock, SIZEOF_GADGET_MESSAGE_BLOB_SIZE)
         nbytes = GadgetMessageBlobSize.unpack(msg)[0]
-        blob = readsock(self.sock, nbytes)
+        blob = readsock(sock, nbytes)
 
         # read filename
-        msg = readsock(self.sock, SIZEOF_GADGET_MESSAGE_BLOB_FILENAME)
+        msg = readsock(sock, SIZEOF_GADGET_MESSAGE_BLOB_FILENAME)
         filename_len = GadgetMessageBlobFilename.unpack(msg)[0]
-        filename = readsock(self.sock, filename_len)
+        filename = readsock(sock, filename_len)
 
         # read meta attributes
-        msg = readsock(self.sock, SIZEOF_GADGET_MESSAGE_ATTRIB_LENGTH)
+        msg = readsock(sock, SIZEOF_GADGET_MESSAGE_ATTRIB_LENGTH)
         attrib_len = GadgetMessageAttribLength.unpack(msg)[0]
-        attribs = readsock(self.sock, attrib_len)
+        attribs = readsock(sock, attrib_len)
 
         # save files
         filename_image = '%s.%s' % (filename, self.suffix)
@@ -168,22 +310,25 @@ class BlobAttribMessageReader(BlobMessageReader):
             filename_image = '%s_%s' % (self.prefix, filename_image)
             filename_attrib = '%s_%s' % (self.prefix, filename_attrib)
 
-        with open(filename_image, 'wb') as f:
-            f.write(blob)
-
-        with open(filename_attrib, 'wb') as f:
-            f.write(attribs)
+        self.sink.append_blob(filename_image, blob)
+        self.sink.append_blob(filename_attrib, attribs)
 
         self.num_calls += 1
 
 class Connector(object):
-    def __init__(self, hostname=None, port=None):
-        if hostname and port:
-            self.connect(hostname, port)
+    def __init__(self, hostname=None, port=None,
+                 recv_bufsize=RECV_BUFSIZE):
         self.readers = {}
         self.writers = {}
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if recv_bufsize is not None:
+            # Has to be set before connecting to affect the TCP window
+            self.sock.setsockopt(
+                socket.SOL_SOCKET, socket.SO_RCVBUF, recv_bufsize)
         self.reader_thread = None
+        self.error = None
+        if hostname and port:
+            self.connect(hostname, port)
 
     def connect(self, hostname, port):
         self.hostname = hostname
@@ -194,8 +339,16 @@ class Connector(object):
         self.reader_thread.start()
 
     def read_task(self):
+        # Anything going wrong in here is raised again by wait()
+        try:
+            self._read_messages()
+        except Exception as e:
+            self.error = e
+
+    def _read_messages(self):
+        msg = bytearray(SIZEOF_GADGET_MESSAGE_IDENTIFIER)
         while True:
-            msg = readsock(self.sock, SIZEOF_GADGET_MESSAGE_IDENTIFIER)
+            readsock_into(self.sock, msg)
             kind = GadgetMessageIdentifier.unpack(msg)[0]
 
             # TODO: Figure out why we're getting invalid message ids...
@@ -211,6 +364,8 @@ class Connector(object):
 
     def wait(self):
         self.reader_thread.join()
+        if self.error is not None:
+            raise self.error
 
     def register_reader(self, kind, reader):
         self.readers[kind] = reader
@@ -245,12 +400,30 @@ class Connector(object):
         self.sock.send(msg)
 
     def send_ismrmrd_acquisition(self, acq):
-        msg = GadgetMessageIdentifier.pack(GADGET_MESSAGE_ISMRMRD_ACQUISITION)
-
-        self.sock.send(msg)
-        self.sock.send(b'%s' % acq.getHead())
-        self.sock.send(acq.traj.tobytes())
-        self.sock.send(acq.data.tobytes())
+        sendmsg_all(self.sock, acquisition_buffers(
+            bytes(acq.getHead()), acq.traj, acq.data))
+
+    def send_ismrmrd_acquisitions(
+            self, acqs, batch_bytes=SEND_BATCH_BYTES):
+        """Sends many acquisitions, coalescing them into large sends
+
+        acqs -- Iterable of (head, traj, data) buffers.
+        batch_bytes -- Send once this many bytes have accumulated.
+
+        Returns the number of acquisitions sent.
+        """
+        buffers, nbytes, count = [], 0, 0
+        for head, traj, data in acqs:
+            bufs = acquisition_buffers(head, traj, data)
+            buffers += bufs
+            nbytes += sum(memoryview(b).nbytes for b in bufs)
+            count += 1
+            if nbytes >= batch_bytes:
+                sendmsg_all(self.sock, buffers)
+                buffers, nbytes = [], 0
+        if buffers:
+            sendmsg_all(self.sock, buffers)
+        return count
 
     def __del__(self):
         if self.sock:
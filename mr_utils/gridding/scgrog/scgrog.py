@@ -4,11 +4,10 @@ Based on the MATLAB GROG implementation found here:
 https://github.com/edibella/Reconstruction
 '''
 
-from multiprocessing import Pool
-from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
-from tqdm import tqdm, trange
+from tqdm import tqdm
 from scipy.linalg import fractional_matrix_power
 
 def fracpowers(idx, Gx, Gy, dkxs, dkys):
@@ -43,85 +42,135 @@ def fracpowers(idx, Gx, Gy, dkxs, dkys):
     Gyf = fractional_matrix_power(Gy, dkys[ii, jj])
     return(ii, jj, Gxf, Gyf)
 
-def grog_interp(kspace, Gx, Gy, traj, cartdims):
-    '''Moves radial k-space points onto a cartesian grid via the GROG method.
+class GrogKernel(object):
+    '''Fractional powers of a GRAPPA kernel, eigendecomposed once.
 
     Parameters
     ==========
-    kspace : array_like
-        A 3D (sx, sor, soc) slice of k-space
-    Gx : array_like
-        The unit horizontal cartesian GRAPPA kernel
-    Gy : array_like
-        Unit vertical cartesian GRAPPA kernel
-    traj : array_like
-        k-space trajectory
-    cartdims : tuple
-        (nrows, ncols), size of Cartesian grid
+    G : array_like
+        Unit GRAPPA kernel, (nc, nc).
+    step : float, optional
+        Quantize fractional powers to multiples of step.  Powers are
+        exact if None.
 
-    Returns
-    =======
-    array_like
-        Interpolated cartesian kspace.
+    Notes
+    =====
+    With G = V diag(w) V^-1, G^d = V diag(w^d) V^-1, so applying any
+    fractional power to a sample only needs elementwise powers of the
+    eigenvalues in the eigenbasis of G.  When step is given, w^d is
+    looked up from a table computed once.
     '''
 
+    def __init__(self, G, step=None):
+        self.w, self.V = np.linalg.eig(np.asarray(G, dtype='complex'))
+        self.Vinv = np.linalg.inv(self.V)
+        self.step = step
+        self._table = {}
+
+    def eigpowers(self, d):
+        '''Eigenvalues raised to powers d, (len(d), nc).'''
+        if self.step is None:
+            return np.exp(d[:, None]*np.log(self.w)[None, :])
+
+        # Look up powers from table of quantized powers, computing any
+        # we haven't seen yet
+        q, inv = np.unique(
+            np.round(d/self.step).astype(int), return_inverse=True)
+        for qq in q:
+            if qq not in self._table:
+                self._table[qq] = np.exp(qq*self.step*np.log(self.w))
+        table = np.stack([self._table[qq] for qq in q])
+        return table[inv.reshape(-1)]
+
+    def power(self, d):
+        '''Fractional matrix power G^d.'''
+        return self.V.dot(
+            self.eigpowers(np.atleast_1d(d))[0][:, None]*self.Vinv)
+
+def _grog_interp(kspace, Kx, Ky, traj, cartdims, batch_size=2**14):
+    '''Grid one slice of k-space given kernel eigendecompositions.'''
+
     sx, nor, noc = kspace.shape[:]
     nrows, ncols = cartdims[0:2]
 
-    kxs = np.real(traj)*nrows
-    kys = np.imag(traj)*ncols
-
-    # Pre-allocate kspace_out with an extra row,col
-    kspace_out = np.zeros((nrows+1, ncols+1, noc), dtype='complex')
-    countMatrix = np.zeros((nrows+1, ncols+1), dtype='int')
+    kxs = (np.real(traj)*nrows).reshape(-1)
+    kys = (np.imag(traj)*ncols).reshape(-1)
+    kspace = kspace.reshape((sx*nor, noc))
 
-    # Find nearest integer coordinates
+    # Find nearest integer coordinates and distance to them, these
+    # will be Gx,Gy powers
     kxs_round = np.round(kxs)
     kys_round = np.round(kys)
-
-    # Find distance between kxys and rounded kxys, these will be Gx,Gy powers
     dkxs = kxs_round - kxs
     dkys = kys_round - kys
 
-    # Compute fractional matrix powers - this part takes a long time
-    # Let's parallelize this since it doesn't matter what order we do it in and
-    # elements don't depend on previous elements. Notice that order is not
-    # preserved here -- instead we just keep track of indices at each compute.
-    fracpowers_partial = partial(
-        fracpowers, Gx=Gx, Gy=Gy, dkxs=dkxs, dkys=dkys)
-    tot = len(list(np.ndindex((sx, nor))))
-    with Pool() as pool:
-        res = list(tqdm(pool.imap_unordered(
-            fracpowers_partial, np.ndindex((sx, nor)), chunksize=100),
-                        total=tot, leave=False,
-                        desc='Frac mat pwr'))
-
-    # Now we need to stick the results where they belong and get a density
-    # estimation
-    for r in res:
-        # Look up the indices associated with this result
-        ii, jj = r[0], r[1]
-
-        # Find matrix indices corresponding to kspace coordinates while we're
-        # at it:
-        xx = int(kxs_round[ii, jj] + nrows/2)
-        yy = int(kys_round[ii, jj] + ncols/2)
-
-        # Load result into output matrix and bump the counter
-        kspace_out[xx, yy, :] += np.linalg.multi_dot(
-            [r[2], r[3], kspace[ii, jj, :]])
-        countMatrix[xx, yy] += 1
-
+    # Flat index into output matrix that has an extra row,col
+    xx = (kxs_round + nrows/2).astype(int)
+    yy = (kys_round + ncols/2).astype(int)
+    idx = xx*(ncols + 1) + yy
+
+    # Apply Gx^dkx Gy^dky to each sample in the kernel eigenbases:
+    #     Vx diag(wx^dkx) Vx^-1 Vy diag(wy^dky) Vy^-1 k
+    VxiVy = Kx.Vinv.dot(Ky.V)
+    shifted = np.empty(kspace.shape, dtype='complex')
+    for start in range(0, kspace.shape[0], batch_size):
+        sl = slice(start, start + batch_size)
+        tmp = kspace[sl].dot(Ky.Vinv.T)*Ky.eigpowers(dkys[sl])
+        tmp = tmp.dot(VxiVy.T)*Kx.eigpowers(dkxs[sl])
+        shifted[sl] = tmp.dot(Kx.V.T)
+
+    # Accumulate samples onto grid and get a density estimation
+    size = (nrows + 1)*(ncols + 1)
+    kspace_out = np.zeros((size, noc), dtype='complex')
+    for cc in range(noc):
+        kspace_out[:, cc] = np.bincount(
+            idx, weights=shifted[:, cc].real, minlength=size)
+        kspace_out[:, cc] += 1j*np.bincount(
+            idx, weights=shifted[:, cc].imag, minlength=size)
+    countMatrix = np.bincount(idx, minlength=size)
 
     # Lastly, use point-wise division of kspace_out by weightMatrix to average
     nonZeroCount = countMatrix > 0
-    countMatrixMasked = countMatrix[nonZeroCount]
-    kspace_out[nonZeroCount] /= np.tile(countMatrixMasked[:, None], noc)
+    kspace_out[nonZeroCount] /= countMatrix[nonZeroCount, None]
+    kspace_out = kspace_out.reshape((nrows + 1, ncols + 1, noc))
 
     # Regridding results in +1 size increase so drop first row,col arbitrarily
     return kspace_out[1:, 1:]
 
-def scgrog(kspace, traj, Gx, Gy, cartdims=None):
+def grog_interp(kspace, Gx, Gy, traj, cartdims, step=None):
+    '''Moves radial k-space points onto a cartesian grid via GROG.
+
+    Parameters
+    ==========
+    kspace : array_like
+        A 3D (sx, sor, soc) slice of k-space
+    Gx : array_like
+        The unit horizontal cartesian GRAPPA kernel
+    Gy : array_like
+        Unit vertical cartesian GRAPPA kernel
+    traj : array_like
+        k-space trajectory
+    cartdims : tuple
+        (nrows, ncols), size of Cartesian grid
+    step : float, optional
+        Quantize fractional shifts to multiples of step.
+
+    Returns
+    =======
+    array_like
+        Interpolated cartesian kspace.
+
+    Notes
+    =====
+    Fractional powers of Gx, Gy are never formed.  Each kernel is
+    diagonalized once and shifts are applied to batches of samples in
+    the eigenbases, see GrogKernel.  Samples are accumulated onto the
+    grid with np.bincount.
+    '''
+    Kx, Ky = GrogKernel(Gx, step), GrogKernel(Gy, step)
+    return _grog_interp(kspace, Kx, Ky, traj, cartdims)
+
+def scgrog(kspace, traj, Gx, Gy, cartdims=None, step=None, n_jobs=1):
     '''Self calibrating GROG interpolation.
 
     Parameters
@@ -136,6 +185,10 @@ def scgrog(kspace, traj, Gx, Gy, cartdims=None):
         Unit vertical cartesian GRAPPA kernel
     cartdims : tuple
          Size of Cartesian grid.
+    step : float, optional
+        Quantize fractional shifts to multiples of step.
+    n_jobs : int, optional
+        Number of threads to grid time frames with.
 
     Returns
     =======
@@ -148,6 +201,9 @@ def scgrog(kspace, traj, Gx, Gy, cartdims=None):
     =====
     If cartdims=None, we'll guess the Cartesian dimensions are
     (kspace.shape[0], kspace.shape[0], kspace.shape[2], kspace.shape[3]).
+
+    Gx, Gy are diagonalized once and the same thread pool grids every
+    time frame.
     '''
 
     # If the user didn't give us the desired cartesian dimensions, guess
@@ -162,13 +218,18 @@ def scgrog(kspace, traj, Gx, Gy, cartdims=None):
         tmp[2], tmp[3] = tmp[3], tmp[2]
         cartdims = tuple(tmp)
 
-    # Interpolate frame-by-frame
+    # Interpolate frame-by-frame, sharing kernels and worker pool
+    Kx, Ky = GrogKernel(Gx, step), GrogKernel(Gy, step)
     kspace_cart = np.zeros(cartdims, dtype='complex')
-    for ii in trange(kspace.shape[-1], desc='Frame', leave=False):
-        time_frame = kspace[:, :, :, ii]
-        traj_frame = traj[:, :, ii]
-        kspace_cart[:, :, :, ii] = grog_interp(
-            time_frame, Gx, Gy, traj_frame, cartdims)
+
+    def _frame(ii):
+        '''Grid a single time frame.'''
+        kspace_cart[:, :, :, ii] = _grog_interp(
+            kspace[:, :, :, ii], Kx, Ky, traj[:, :, ii], cartdims)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        list(tqdm(executor.map(_frame, range(kspace.shape[-1])),
+                  total=kspace.shape[-1], desc='Frame', leave=False))
 
     # Permute back if needed
     if kspace_cart.ndim == 4:
@@ -1,4 +1,4 @@
 from .raw import *
 from .mat import *
-from .pyport import pyport
+from .pyport import pyport, pyport_scans
 from .ismrmrd_loader import load_ismrmrd
@@ -56,13 +56,124 @@ from mr_utils.load_data.s2i import (
     defs, sScanHeader, fill_ismrmrd_header, readParcFileEntries,
     readScanHeader, readMeasurementHeaderBuffers, parseXML,
     readChannelHeaders, getAcquisition, xml_fun, readXmlConfig,
-    readSyncdata)
+    readSyncdata, indexScans, scanData, ChannelHeaderAndData)
+
+def _read_preamble(siemens_dat, measNum):
+    '''Read everything in front of the first scan of a measurement.
+
+    Parameters
+    ==========
+    siemens_dat : file
+        Siemens raw data file opened in binary mode.
+    measNum : int
+        Measurement number.
+
+    Returns
+    =======
+    VBFILE : bool
+        Whether this is a VB line file.
+    ParcRaidHead : dict
+        Raid file header.
+    ParcFileEntries : list
+        Raid file entries, one for each measurement.
+    num_buffers : int
+        Number of measurement header buffers.
+    buffers : list
+        Measurement header buffers.
+
+    Notes
+    =====
+    On return, siemens_dat is positioned at the first scan header.
+    '''
+
+    VBFILE = False
+    ParcRaidHead = {}
+    ParcRaidHead['hdSize_'], ParcRaidHead['count_'] = np.fromfile(
+        siemens_dat, dtype=c_uint32, count=2)
+
+    if ParcRaidHead['hdSize_'] > 32:
+        VBFILE = True
+        # Rewind, we have no raid file header.
+        siemens_dat.seek(0, os.SEEK_CUR)
+        ParcRaidHead['hdSize_'] = ParcRaidHead['count_']
+        ParcRaidHead['count_'] = 1
+
+    elif ParcRaidHead['hdSize_'] != 0:
+        # This is a VB line data file
+        msg = ('Only VD line files with MrParcRaidFileHeader.'
+               'hdSize_ == 0 (MR_PARC_RAID_ALLDATA) supported.')
+        raise NotImplementedError(msg)
+
+    if (not VBFILE) and (measNum > ParcRaidHead['count_']):
+        logging.error(('The file you are trying to convert has only '
+                       '%d measurements.', ParcRaidHead['count_']))
+        logging.error(
+            'You are trying to convert measurement number: %d',
+            measNum)
+        raise ValueError()
+
+    # if it is a VB scan
+    if (VBFILE and (measNum != 1)):
+        logging.error(('The file you are trying to convert is a VB '
+                       'file and it has only one measurement.'))
+        logging.error('You tried to convert measurement number: %d',
+                      measNum)
+        raise ValueError()
+
+
+    logging.info('This file contains %d measurement(s). ',
+                 ParcRaidHead['count_'])
+
+    ParcFileEntries = readParcFileEntries(
+        siemens_dat, ParcRaidHead, VBFILE)
+
+    # find the beginning of the desired measurement
+    siemens_dat.seek(
+        ParcFileEntries[measNum - 1]['off_'], os.SEEK_SET)
+
+    _dma_length, num_buffers = np.fromfile(
+        siemens_dat, dtype=c_uint32, count=2)
+
+    buffers = readMeasurementHeaderBuffers(siemens_dat, num_buffers)
+
+    # We need to be on a 32 byte boundary after reading the buffers
+    position_in_meas = siemens_dat.tell() - ParcFileEntries[
+        measNum-1]['off_']
+    if np.mod(position_in_meas, 32) != 0:
+        siemens_dat.seek(
+            int(32 - np.mod(position_in_meas, 32)), os.SEEK_CUR)
+
+    return(
+        VBFILE, ParcRaidHead, ParcFileEntries, num_buffers, buffers)
+
+def _fill_header_from_scan(
+        header, scanhead, study_date_user_supplied):
+    '''Fill in ISMRMRD header fields that come from the first scan.'''
+
+    time_stamp = scanhead['ulTimeStamp']
+
+    # convert to acqusition date and time
+    timeInSeconds = time_stamp*2.5/1e3
+    mins, secs = divmod(timeInSeconds, 60)
+    hours, mins = divmod(mins, 60)
+    study_time = '%d:%02d:%02d' % (hours, mins, secs)
+    print('STUDY TIME IS:', study_time)
+
+    # If some of the ismrmrd header fields are not filled, here
+    # is a place to take some further actions
+    tmp = fill_ismrmrd_header(
+        header, study_date_user_supplied, study_time)
+    if tmp is False:
+        logging.error('Failed to further fill XML header')
+        return header
+    return tmp
 
 def pyport(version=False, list_embed=False, extract=None, user_stylesheet=None,
            file=None, pMapStyle=None, measNum=1, pMap=None, user_map=None,
            debug=False, header_only=False, output='output.h5',
            flash_pat_ref_scan=False, append_buffers=False,
-           study_date_user_supplied=''):
+           study_date_user_supplied='', use_mmap=False,
+           ismrmrd_file='tmp.h5'):
     '''Run the program with arguments.
 
     Parameters
@@ -97,6 +208,11 @@ def pyport(version=False, list_embed=False, extract=None, user_stylesheet=None,
         Append protocol buffers
     study_date_user_supplied : str, optional
         User can supply study date, in the format of yyyy-mm-dd
+    use_mmap : bool, optional
+        Memory-map the file and index all scans up front instead of
+        reading them one at a time.
+    ismrmrd_file : str, optional
+        Where to write the converted ISMRMRD dataset.
 
     Returns
     =======
@@ -205,64 +321,12 @@ def pyport(version=False, list_embed=False, extract=None, user_stylesheet=None,
     # Now let's get to the dirty work...
     with open(file, 'br') as siemens_dat:
 
-        VBFILE = False
-        ParcRaidHead = {}
-        ParcRaidHead['hdSize_'], ParcRaidHead['count_'] = np.fromfile(
-            siemens_dat, dtype=c_uint32, count=2)
-
-        if ParcRaidHead['hdSize_'] > 32:
-            VBFILE = True
-            # Rewind, we have no raid file header.
-            siemens_dat.seek(0, os.SEEK_CUR)
-            ParcRaidHead['hdSize_'] = ParcRaidHead['count_']
-            ParcRaidHead['count_'] = 1
-
-        elif ParcRaidHead['hdSize_'] != 0:
-            # This is a VB line data file
-            msg = ('Only VD line files with MrParcRaidFileHeader.'
-                   'hdSize_ == 0 (MR_PARC_RAID_ALLDATA) supported.')
-            raise NotImplementedError(msg)
-
-        if (not VBFILE) and (measNum > ParcRaidHead['count_']):
-            logging.error(('The file you are trying to convert has only %d'
-                           'measurements.', ParcRaidHead['count_']))
-            logging.error('You are trying to convert measurement number: %d',
-                          measNum)
-            raise ValueError()
-
-        # if it is a VB scan
-        if (VBFILE and (measNum != 1)):
-            logging.error(('The file you are trying to convert is a VB file'
-                           ' and it has only one measurement.'))
-            logging.error('You tried to convert measurement number: %d',
-                          measNum)
-            raise ValueError()
-
+        (VBFILE, ParcRaidHead, ParcFileEntries, num_buffers,
+         buffers) = _read_preamble(siemens_dat, measNum)
 
         parammap_file_content = xml_fun.getparammap_file_content(
             pMap, user_map, VBFILE)
 
-        logging.info('This file contains %d measurement(s). ',
-                     ParcRaidHead['count_'])
-
-        ParcFileEntries = readParcFileEntries(
-            siemens_dat, ParcRaidHead, VBFILE)
-
-        # find the beginning of the desired measurement
-        siemens_dat.seek(ParcFileEntries[measNum - 1]['off_'], os.SEEK_SET)
-
-        dma_length, num_buffers = np.fromfile(
-            siemens_dat, dtype=c_uint32, count=2)
-
-        buffers = readMeasurementHeaderBuffers(siemens_dat, num_buffers)
-
-        # We need to be on a 32 byte boundary after reading the buffers
-        position_in_meas = siemens_dat.tell() - ParcFileEntries[
-            measNum-1]['off_']
-        if np.mod(position_in_meas, 32) != 0:
-            siemens_dat.seek(
-                int(32 - np.mod(position_in_meas, 32)), os.SEEK_CUR)
-
         # Measurement header done!
         # Now we should have the measurement headers, so let's use the Meas
         # header to create the XML parametersstd::string xml_config;
@@ -323,11 +387,12 @@ def pyport(version=False, list_embed=False, extract=None, user_stylesheet=None,
 
         # For debugging purposes, let's go ahead and kill it first instead of
         # appending - that led to some weirdness...
-        if os.path.isfile('tmp.h5'):
+        if os.path.isfile(ismrmrd_file):
             msg = 'TMP file already exists!  Removing and creating anew!'
             logging.warning(msg)
-            os.remove('tmp.h5')
-        ismrmrd_dataset = Dataset('tmp.h5', 'dataset', create_if_needed=True)
+            os.remove(ismrmrd_file)
+        ismrmrd_dataset = Dataset(
+            ismrmrd_file, 'dataset', create_if_needed=True)
         # # If this is a spiral acquisition, we will calculate the trajectory
         # # and add it to the individual profilesISMRMRD::NDArray<float> traj;
         # auto traj = getTrajectory(wip_double, trajectory, dwell_time_0,
@@ -344,116 +409,162 @@ def pyport(version=False, list_embed=False, extract=None, user_stylesheet=None,
         # acqend
         pfe = ParcFileEntries[measNum-1]
         sScanSize = sScanHeader.itemsize
-        while (not last_mask & 1) and (((pfe['off_'] + pfe['len_']) \
-                - siemens_dat.tell()) > sScanSize):
-
-
-            position_in_meas = siemens_dat.tell()
-            scanhead, _mdh = readScanHeader(siemens_dat, VBFILE)
-            # mdh.display()
-
-            if not siemens_dat:
-                logging.error(
-                    'Error reading header at acquisition %d.', acquisitions)
-                break
-
-
-            dma_length = \
-                scanhead['ulFlagsAndDMALength'] & defs.MDH_DMA_LENGTH_MASK
-            _mdh_enable_flags = \
-                scanhead['ulFlagsAndDMALength'] & defs.MDH_ENABLE_FLAGS_MASK
-
-            # Check if this is sync data, if so, it must be handled differently
-            if scanhead['aulEvalInfoMask'][0] & (1 << 5):
-                print('dma_length = %d' % dma_length)
-                print('sync_data_packets = %d' % sync_data_packets)
-
-                # raise NotImplementedError()
-                last_scan_counter = acquisitions - 1
-
-                # TODO:
-
-                waveforms = readSyncdata(
-                    siemens_dat, VBFILE, acquisitions, dma_length,
-                    scanhead, header, last_scan_counter)
-                # for (auto& w : waveforms)
-                #     ismrmrd_dataset->appendWaveform(w);
-                sync_data_packets += 1
-                continue
-
-            if first_call:
-                time_stamp = scanhead['ulTimeStamp']
-
-                # convert to acqusition date and time
-                timeInSeconds = time_stamp*2.5/1e3
-                mins, secs = divmod(timeInSeconds, 60)
-                hours, mins = divmod(mins, 60)
-                study_time = '%d:%02d:%02d' % (hours, mins, secs)
-                print('STUDY TIME IS:', study_time)
-
-                # If some of the ismrmrd header fields are not filled, here
-                # is a place to take some further actions
-                tmp = fill_ismrmrd_header(
-                    header, study_date_user_supplied, study_time)
-                if tmp is False:
-                    logging.error('Failed to further fill XML header')
-                else:
-                    header = tmp
-
-                # std::stringstream sstream;
-                # ISMRMRD::serialize(header,sstream);
-                # xml_config = sstream.str();
-                # if xml_file_is_valid(
-                #     xml_config, schema_file_name_content) <= 0:
-                #     msg = ('Generated XML is not valid according to the
-                #            'ISMRMRD schema')
-                #     raise ValueError(msg)
-
-                if debug:
-                    with open('processed.xml', 'w') as f:
-                        f.write(xmltodict.unparse(dict_config, pretty=True))
-
-                # This means we should only create XML header and exit
-                if header_only:
-                    with open(output, 'w') as f:
-                        f.write(xmltodict.unparse(dict_config, pretty=True))
-                    return None
-                ## Create an ISMRMRD dataset
+        if use_mmap:
+            # Find all the scans up front and read channel data
+            # straight out of the memory map
+            dat = np.memmap(file, dtype=np.uint8, mode='r')
+            offsets, scanheads, end = indexScans(
+                dat, siemens_dat.tell(), pfe['off_'] + pfe['len_'],
+                VBFILE)
+            siemens_dat.seek(end, os.SEEK_SET)
+
+            if scanheads.size:
+                header = _fill_header_from_scan(
+                    header, scanheads[0], study_date_user_supplied)
+
+            if debug:
+                with open('processed.xml', 'w') as f:
+                    f.write(xmltodict.unparse(
+                        dict_config, pretty=True))
+
+            # This means we should only create XML header and exit
+            if header_only:
+                with open(output, 'w') as f:
+                    f.write(xmltodict.unparse(
+                        dict_config, pretty=True))
+                return None
 
             # This check only makes sense in VD line files.
-            # print(scanhead['lMeasUID'], pfe['measId_'])
-            if not VBFILE and (scanhead['lMeasUID'] != pfe['measId_']):
-                # Something must have gone terribly wrong. Bail out.
+            if not VBFILE and np.any(
+                    scanheads['lMeasUID'] != pfe['measId_']):
+                msg = ('Corrupted or retro-recon dataset detected '
+                       '(scanhead.lMeasUID != '
+                       'ParcFileEntries[%d].measId_. Fix the '
+                       'scanhead.lMeasUID...' % (measNum-1))
+                logging.error(msg)
+                scanheads['lMeasUID'] = pfe['measId_']
+
+            for offset, scanhead in zip(offsets, scanheads):
+                data = scanData(dat, offset, scanhead, VBFILE)
+                channels = np.empty(data.shape[0], dtype=object)
+                for c in range(data.shape[0]):
+                    channels[c] = ChannelHeaderAndData()
+                    channels[c].data = data[c, :]
+
+                ismrmrd_dataset.append_acquisition(getAcquisition(
+                    flash_pat_ref_scan, trajectory, dwell_time_0,
+                    max_channels, isAdjustCoilSens,
+                    isAdjQuietCoilSens, isVB, traj, scanhead,
+                    channels))
+
+        else:
+            end = pfe['off_'] + pfe['len_']
+            while (not last_mask & 1) and (
+                    end - siemens_dat.tell() > sScanSize):
+
+
+                position_in_meas = siemens_dat.tell()
+                scanhead, _mdh = readScanHeader(siemens_dat, VBFILE)
+                # mdh.display()
+
+                if not siemens_dat:
+                    logging.error(
+                        'Error reading header at acquisition %d.',
+                        acquisitions)
+                    break
+
+
+                flags = scanhead['ulFlagsAndDMALength']
+                dma_length = flags & defs.MDH_DMA_LENGTH_MASK
+                _mdh_enable_flags = flags & defs.MDH_ENABLE_FLAGS_MASK
+
+                # Check if this is sync data, if so, it must be
+                # handled differently
+                if scanhead['aulEvalInfoMask'][0] & (1 << 5):
+                    print('dma_length = %d' % dma_length)
+                    print('sync_data_packets = %d' % (
+                        sync_data_packets))
+
+                    # raise NotImplementedError()
+                    last_scan_counter = acquisitions - 1
+
+                    # TODO:
+
+                    waveforms = readSyncdata(
+                        siemens_dat, VBFILE, acquisitions, dma_length,
+                        scanhead, header, last_scan_counter)
+                    # for (auto& w : waveforms)
+                    #     ismrmrd_dataset->appendWaveform(w);
+                    sync_data_packets += 1
+                    continue
+
                 if first_call:
-                    msg = ('Corrupted or retro-recon dataset detected '
-                           '(scanhead.lMeasUID != ParcFileEntries[%d].measId_'
-                           '. Fix the scanhead.lMeasUID...' % (measNum-1))
-                    logging.error(msg)
-                scanhead['lMeasUID'] = pfe['measId_']
+                    header = _fill_header_from_scan(
+                        header, scanhead, study_date_user_supplied)
+
+                    # std::stringstream sstream;
+                    # ISMRMRD::serialize(header,sstream);
+                    # xml_config = sstream.str();
+                    # if xml_file_is_valid(
+                    #     xml_config, schema_file_name_content) <= 0:
+                    #     msg = ('Generated XML is not valid '
+                    #            'according to the ISMRMRD schema')
+                    #     raise ValueError(msg)
+
+                    if debug:
+                        with open('processed.xml', 'w') as f:
+                            f.write(xmltodict.unparse(
+                                dict_config, pretty=True))
+
+                    # This means we should only create XML header and
+                    # exit
+                    if header_only:
+                        with open(output, 'w') as f:
+                            f.write(xmltodict.unparse(
+                                dict_config, pretty=True))
+                        return None
+                    ## Create an ISMRMRD dataset
+
+                # This check only makes sense in VD line files.
+                # print(scanhead['lMeasUID'], pfe['measId_'])
+                if not VBFILE and (
+                        scanhead['lMeasUID'] != pfe['measId_']):
+                    # Something must have gone terribly wrong.  Bail
+                    # out.
+                    if first_call:
+                        msg = ('Corrupted or retro-recon dataset '
+                               'detected (scanhead.lMeasUID != '
+                               'ParcFileEntries[%d].measId_. Fix the '
+                               'scanhead.lMeasUID...' % (measNum-1))
+                        logging.error(msg)
+                    scanhead['lMeasUID'] = pfe['measId_']
 
-            if first_call:
-                first_call = False
+                if first_call:
+                    first_call = False
 
-            # Allocate data for channels
-            channels = readChannelHeaders(siemens_dat, VBFILE, scanhead)
+                # Allocate data for channels
+                channels = readChannelHeaders(
+                    siemens_dat, VBFILE, scanhead)
 
-            if not siemens_dat:
-                msg = 'Error reading data at acqusition %s' % acquisitions
-                logging.error(msg)
-                break
+                if not siemens_dat:
+                    msg = 'Error reading data at acqusition %s' % (
+                        acquisitions)
+                    logging.error(msg)
+                    break
 
-            acquisitions += 1
-            last_mask = scanhead['aulEvalInfoMask'][0]
-            if last_mask & 1:
-                logging.info('Last scan reached...')
-                break
+                acquisitions += 1
+                last_mask = scanhead['aulEvalInfoMask'][0]
+                if last_mask & 1:
+                    logging.info('Last scan reached...')
+                    break
 
 
-            # dataset.append(channels)
-            ismrmrd_dataset.append_acquisition(getAcquisition(
-                flash_pat_ref_scan, trajectory, dwell_time_0, max_channels,
-                isAdjustCoilSens, isAdjQuietCoilSens, isVB, traj, scanhead,
-                channels))
+                # dataset.append(channels)
+                ismrmrd_dataset.append_acquisition(getAcquisition(
+                    flash_pat_ref_scan, trajectory, dwell_time_0,
+                    max_channels, isAdjustCoilSens,
+                    isAdjQuietCoilSens, isVB, traj, scanhead,
+                    channels))
 
         # End of the while loop
 
@@ -505,6 +616,53 @@ def pyport(version=False, list_embed=False, extract=None, user_stylesheet=None,
 
         return ismrmrd_dataset
 
+def pyport_scans(file, measNum=1):
+    '''Iterate over the scans of a Siemens raw data file.
+
+    Parameters
+    ==========
+    file : str
+        SIEMENS dat file
+    measNum : int, optional
+        Measurement number
+
+    Yields
+    ======
+    scanhead : array_like
+        sScanHeader of the scan.
+    data : array_like
+        (channels, samples) complex64 k-space of the scan.
+
+    Raises
+    ======
+    IOError
+        When .dat file does not exist
+
+    Notes
+    =====
+    The file is memory-mapped and all scan headers are indexed in one
+    pass, so data is a read-only view into the file, not a copy.  The
+    XML header is not converted and no ISMRMRD dataset is written.
+    Sync data and the ACQEND scan are skipped, same as pyport().
+    '''
+
+    if not os.path.isfile(file):
+        msg = ('Provided Siemens file (%s) can not be opened or does '
+               'not exist' % file)
+        raise IOError(msg)
+
+    with open(file, 'br') as siemens_dat:
+        VBFILE, _ParcRaidHead, ParcFileEntries, _nbufs, _bufs = \
+            _read_preamble(siemens_dat, measNum)
+        start = siemens_dat.tell()
+
+    pfe = ParcFileEntries[measNum-1]
+    dat = np.memmap(file, dtype=np.uint8, mode='r')
+    offsets, scanheads, _end = indexScans(
+        dat, start, pfe['off_'] + pfe['len_'], VBFILE)
+    for offset, scanhead in zip(offsets, scanheads):
+        yield(scanhead, scanData(dat, offset, scanhead, VBFILE))
+
 
 if __name__ == '__main__':
 
@@ -5,6 +5,85 @@ import numpy as np
 from mr_utils.definitions import (
     BART_PATH, SIEMENS_TO_ISMRMRD_INSTALLED)
 
+def _assemble_s2i(filename, shape, eNx, rNx, s2i_ROS):
+    '''Fill k-space array with all acquisitions of an ISMRMRD dataset.
+
+    Parameters
+    ----------
+    filename : str
+        ISMRMRD HDF5 file written by siemens_to_ismrmrd.
+    shape : tuple
+        (navgs, ncontrasts, nslices, ncoils, eNz, eNy, nx), nx is rNx
+        if s2i_ROS else eNx.
+    eNx : int
+        Encoded readout size.
+    rNx : int
+        Recon readout size.
+    s2i_ROS : bool
+        Remove oversampling in readout.
+
+    Returns
+    -------
+    all_data : array_like
+        Acquisitions sorted into shape.
+
+    Notes
+    -----
+    Acquisition headers and data blocks are read from the HDF5 file in
+    bulk, oversampling is removed from all readouts with a single FFT,
+    and the readouts are put into place with one fancy-index
+    assignment.
+    Noise scans at the beginning of the dataset are skipped.
+    '''
+    import h5py
+    import warnings
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", category=FutureWarning)
+        from ismrmrd import ACQ_IS_NOISE_MEASUREMENT
+
+    with h5py.File(filename, 'r') as f:
+        acqs = f['dataset']['data']
+        heads = acqs['head'][:].squeeze()
+        blocks = acqs['data'][:]
+
+    # In case there are noise scans in the actual dataset,
+    # we will skip them.
+    noise_bit = 1 << (ACQ_IS_NOISE_MEASUREMENT - 1)
+    noise = (heads['flags'] & noise_bit) > 0
+    firstacq = np.argmin(noise) if not np.all(noise) else noise.size
+    if firstacq:
+        print('Found %d noise scans' % firstacq)
+    print("Imaging acquisition starts acq ", firstacq)
+    heads = heads[firstacq:]
+
+    # All imaging acquisitions better be the same size for this to
+    # work
+    nc = int(heads['active_channels'][0])
+    ns = int(heads['number_of_samples'][0])
+    kspace = np.concatenate(blocks[firstacq:]).view(
+        np.complex64).reshape((heads.size, nc, ns))
+
+    # Remove oversampling if needed
+    if s2i_ROS and (eNx != rNx):
+        xline = np.fft.fftshift(np.fft.ifft(
+            np.fft.ifftshift(kspace, axes=-1), axis=-1), axes=-1)
+        xline *= np.sqrt(ns)
+
+        x0 = int((eNx - rNx) / 2)
+        x1 = int((eNx - rNx) / 2 + rNx)
+        xline = xline[..., x0:x1]
+        kspace = np.fft.fftshift(np.fft.fft(np.fft.ifftshift(
+            xline, axes=-1), axis=-1), axes=-1)
+        kspace /= np.sqrt(xline.shape[-1])
+
+    # Stuff into the buffer
+    idx = heads['idx']
+    all_data = np.zeros(shape, dtype=np.complex64)
+    all_data[idx['average'], idx['contrast'], idx['slice'], :,
+             idx['kspace_encode_step_2'], idx['kspace_encode_step_1'],
+             :] = kspace
+    return all_data
+
 def load_raw(
         filename,
         use='bart',
@@ -87,7 +166,6 @@ def load_raw(
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore", category=FutureWarning)
             import ismrmrd
-        from tqdm import trange
 
         tmp_name = NamedTemporaryFile().name
 
@@ -159,77 +237,14 @@ def load_raw(
             else:
                 ncontrasts = 1
 
-            # In case there are noise scans in the actual dataset,
-            # we will skip them.
-            firstacq = 0
-            for acqnum in range(dset.number_of_acquisitions()):
-                acq = dset.read_acquisition(acqnum)
-
-                if acq.isFlagSet(ismrmrd.ACQ_IS_NOISE_MEASUREMENT):
-                    print("Found noise scan at acq ", acqnum)
-                    continue
-                else:
-                    firstacq = acqnum
-                    print("Imaging acquisition starts acq ", acqnum)
-                    break
-
-            #Calculate prewhiterner taking BWs into consideration
-            #a = dset.read_acquisition(firstacq)
-            #data_dwell_time = a.sample_time_us
-            #noise_receiver_bw_ratio = 0.79
-            # dmtx = coils.calculate_prewhitening(noise,scale_factor=(
-            #    data_dwell_time/noise_dwell_time)*
-            # noise_receiver_bw_ratio)
-
-            # Process the actual data
-            all_data = np.zeros(
-                (navgs, ncontrasts, nslices, ncoils, eNz, eNy, rNx),
-                dtype=np.complex64)
-
-            # Loop through the rest of the acquisitions and stuff
-            for acqnum in trange(
-                    firstacq, dset.number_of_acquisitions(),
-                    leave=False, desc='Acqs'):
-                acq = dset.read_acquisition(acqnum)
-
-                #coils.apply_prewhitening(acq.data,dmtx)
-                acq_data_prw = acq.data
-
-                # Remove oversampling if needed
-                if s2i_ROS and (eNx != rNx):
-                    xline = np.fft.fftshift(np.fft.ifft(
-                        np.fft.ifftshift(acq_data_prw, axes=(1)),
-                        axis=(1)), axes=(1))
-                    xline *= np.sqrt(
-                        np.prod(np.take(xline.shape, (1))))
-
-                    x0 = int((eNx - rNx) / 2)
-                    x1 = int((eNx - rNx) / 2 + rNx)
-                    xline = xline[:, x0:x1]
-                    acq.resize(
-                        rNx, acq.active_channels,
-                        acq.trajectory_dimensions)
-                    acq.center_sample = int(rNx/2)
-                    # need to use the [:] notation here to fill the
-                    # data
-                    k = np.fft.fftshift(np.fft.fft(np.fft.ifftshift(
-                        xline, axes=(1)), axis=(1)), axes=(1))
-                    k /= np.sqrt(np.prod(np.take(k.shape, (1))))
-                    acq.data[:] = k
-
-                # Stuff into the buffer
-                avg = acq.idx.average
-                contrast = acq.idx.contrast
-                slise = acq.idx.slice
-                y = acq.idx.kspace_encode_step_1
-                z = acq.idx.kspace_encode_step_2
-
-                try:
-                    all_data[
-                        avg, contrast, slise, :, z, y, :] = acq.data
-                except:
-                    all_data = None
-                    all_data = acq.data
+            # Read all the headers and data in one go, we don't need
+            # the ismrmrd.Dataset anymore
+            dset.close()
+            nx = rNx if s2i_ROS else eNx
+            all_data = _assemble_s2i(
+                tmp_name,
+                (navgs, ncontrasts, nslices, ncoils, eNz, eNy, nx),
+                eNx, rNx, s2i_ROS)
 
             try:
                 data = all_data.astype('complex64').transpose(
@@ -1,4 +1,4 @@
-from .xprot_parser_strsearch import xprot_get_val
+from .xprot_parser_strsearch import xprot_get_val, XProtIndex
 from .channel_header import sChannelHeader
 from .channel_header_and_data import ChannelHeaderAndData
 from .mdh import *
@@ -14,3 +14,4 @@ from .parse_xml import parseXML
 from .fill_ismrmrd_header import fill_ismrmrd_header
 from .read_sync_data import readSyncdata
 from .pmu_type import PMU_Type, PMU_Type_inverse
+from .index_scans import indexScans, scanData, channelHeaders
@@ -0,0 +1,179 @@
+'''Index scans of a memory-mapped Siemens raw data file.
+
+Instead of reading the file one header at a time with np.fromfile,
+we walk the measurement once to find where each scan starts, then
+pull all the scan headers out in a single vectorized gather and hand
+back the channel data as views into the memory map.
+'''
+
+import logging
+import struct
+
+import numpy as np
+
+from mr_utils.load_data.s2i import (
+    sScanHeader, sChannelHeader, sMDH, defs)
+
+def _field_offset(dtype, name):
+    '''Byte offset of a field inside a structured dtype.'''
+    return dtype.fields[name][1]
+
+def indexScans(buf, start, stop, VBFILE):
+    '''Find the offsets and headers of all scans in a measurement.
+
+    Parameters
+    ==========
+    buf : array_like
+        Memory-mapped raw data file (e.g., uint8 np.memmap).
+    start : int
+        Byte offset of the first scan header.
+    stop : int
+        Byte offset of the end of the measurement.
+    VBFILE : bool
+        Whether this is a VB line file.
+
+    Returns
+    =======
+    offsets : array_like
+        Byte offsets of the scan headers of imaging scans.
+    scanheads : array_like
+        Structured array of sScanHeader, one for each offset.
+    end : int
+        Byte offset just after the last scan that was read.
+
+    Notes
+    =====
+    Sync data packets are skipped and the ACQEND scan is not included
+    in the index, matching what pyport writes to the ISMRMRD dataset.
+    '''
+
+    hdr_dtype = sMDH if VBFILE else sScanHeader
+    hdr_size = hdr_dtype.itemsize
+    ch_size = sMDH.itemsize if VBFILE else sChannelHeader.itemsize
+
+    # We only need a few fields to figure out how long each scan is
+    off_flags = _field_offset(hdr_dtype, 'ulFlagsAndDMALength')
+    off_mask = _field_offset(hdr_dtype, 'aulEvalInfoMask')
+    off_samples = _field_offset(hdr_dtype, 'ushSamplesInScan')
+
+    offsets = []
+    sync_data_packets = 0
+    pos = start
+    while stop - pos > sScanHeader.itemsize:
+        flags, = struct.unpack_from('<I', buf, pos + off_flags)
+        mask, = struct.unpack_from('<I', buf, pos + off_mask)
+        nsamples, nchannels = struct.unpack_from(
+            '<HH', buf, pos + off_samples)
+
+        # Sync data is DMA length long, header included
+        if mask & (1 << 5):
+            pos += flags & defs.MDH_DMA_LENGTH_MASK
+            sync_data_packets += 1
+            continue
+
+        # VB files have an MDH in front of every channel, including
+        # the first (that's the scan header), VD files have a scan
+        # header followed by a channel header for every channel
+        if VBFILE:
+            scan_len = nchannels*(hdr_size + 8*nsamples)
+        else:
+            scan_len = hdr_size + nchannels*(ch_size + 8*nsamples)
+
+        if mask & 1:
+            logging.info('Last scan reached...')
+            pos += scan_len
+            break
+
+        offsets.append(pos)
+        pos += scan_len
+
+    if sync_data_packets:
+        logging.info(
+            'Skipped %d sync data packets', sync_data_packets)
+
+    # Gather all the headers in one go
+    offsets = np.array(offsets, dtype=np.int64)
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    idx = offsets[:, None] + np.arange(hdr_size)[None, :]
+    heads = np.ascontiguousarray(raw[idx]).view(hdr_dtype).ravel()
+
+    if not VBFILE:
+        return(offsets, heads, pos)
+
+    # MDH and sScanHeader are incredibly similar, but sScanHeader has
+    # some extra fields that we need to fill in if we only have MDH
+    scanheads = np.zeros(heads.size, dtype=sScanHeader)
+    for name in ['ulFlagsAndDMALength', 'lMeasUID', 'ulScanCounter',
+                 'ulTimeStamp', 'ulPMUTimeStamp', 'aulEvalInfoMask',
+                 'ushSamplesInScan', 'ushUsedChannels', 'sLC',
+                 'sCutOff', 'ushKSpaceCentreColumn', 'ushCoilSelect',
+                 'fReadOutOffcentre', 'ulTimeSinceLastRF',
+                 'ushKSpaceCentreLineNo',
+                 'ushKSpaceCentrePartitionNo', 'sSliceData']:
+        scanheads[name] = heads[name]
+    #TODO: Modify calculation
+    scanheads['lPTABPosZ'] = heads['ushPTABPosNeg']
+    scanheads['aushIceProgramPara'][:, :4] = heads[
+        'aushIceProgramPara']
+    scanheads['aushIceProgramPara'][:, 4:8] = heads['aushFreePara']
+    return(offsets, scanheads, pos)
+
+def scanData(buf, offset, scanhead, VBFILE):
+    '''Zero-copy view of the channel data of a single scan.
+
+    Parameters
+    ==========
+    buf : array_like
+        Memory-mapped raw data file.
+    offset : int
+        Byte offset of the scan header.
+    scanhead : array_like
+        sScanHeader of the scan.
+    VBFILE : bool
+        Whether this is a VB line file.
+
+    Returns
+    =======
+    data : array_like
+        (nchannels, nsamples) complex64 view into buf.
+    '''
+    nchannels = int(scanhead['ushUsedChannels'])
+    nsamples = int(scanhead['ushSamplesInScan'])
+    if VBFILE:
+        first = offset + sMDH.itemsize
+        stride = sMDH.itemsize + 8*nsamples
+    else:
+        first = offset + sScanHeader.itemsize + \
+            sChannelHeader.itemsize
+        stride = sChannelHeader.itemsize + 8*nsamples
+    return np.ndarray(
+        (nchannels, nsamples), dtype=np.complex64, buffer=buf,
+        offset=first, strides=(stride, 8))
+
+def channelHeaders(buf, offset, scanhead):
+    '''Zero-copy view of the channel headers of a single VD scan.
+
+    Parameters
+    ==========
+    buf : array_like
+        Memory-mapped raw data file.
+    offset : int
+        Byte offset of the scan header.
+    scanhead : array_like
+        sScanHeader of the scan.
+
+    Returns
+    =======
+    headers : array_like
+        (nchannels,) sChannelHeader view into buf.
+
+    Notes
+    =====
+    VB files don't have channel headers, see readChannelHeaders.
+    '''
+    nchannels = int(scanhead['ushUsedChannels'])
+    nsamples = int(scanhead['ushSamplesInScan'])
+    return np.ndarray(
+        (nchannels,), dtype=sChannelHeader, buffer=buf,
+        offset=offset + sScanHeader.itemsize,
+        strides=(sChannelHeader.itemsize + 8*nsamples,))
@@ -9,10 +9,14 @@ import numpy as np
 import xmltodict
 from tqdm import tqdm
 
-from mr_utils.load_data.s2i import xprot_get_val
+from mr_utils.load_data.s2i import xprot_get_val, XProtIndex
 
-def ProcessParameterMap(config_buffer, parammap_file_content):
-    '''Fill in the headers of all parammap_file's fields.'''
+def ProcessParameterMap(config_buffer, parammap_file_content,
+                        xprot_index=None):
+    '''Fill in the headers of all parammap_file's fields.
+
+    xprot_index -- XProtIndex of config_buffer, built if not given.
+    '''
 
     # Output document
     out_doc = {'siemens': {}}
@@ -24,8 +28,10 @@ def ProcessParameterMap(config_buffer, parammap_file_content):
         msg = 'Malformed parameter map (parameters section not found)'
         raise ValueError(msg)
 
-    lookup = {}
-    do_lookup = False # Let's not do it for now
+    # Index the buffer once instead of searching it for every
+    # parameter
+    if xprot_index is None:
+        xprot_index = XProtIndex(config_buffer)
     for p in tqdm(doc['siemens']['parameters']['p'], leave=False):
 
         if ('s' not in p) or ('d' not in p):
@@ -48,7 +54,7 @@ def ProcessParameterMap(config_buffer, parammap_file_content):
         # Go get the parameters!
         try:
             parameters = xprot_get_val(
-                config_buffer, source, lookup, do_lookup)
+                config_buffer, source, xprot_index)
 
             # We can't serialize numpy arrays, so make 'em into lists
             if isinstance(parameters, np.ndarray):
@@ -2,7 +2,8 @@
 
 import logging
 
-from mr_utils.load_data.s2i import xprot_get_val, ProcessParameterMap
+from mr_utils.load_data.s2i import (
+    xprot_get_val, XProtIndex, ProcessParameterMap)
 
 def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
                   wip_double, trajectory, dwell_time_0, max_channels,
@@ -33,10 +34,14 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
                 with open('config_buffer.xprot', 'w') as f:
                     f.write(config_buffer)
 
+            # Tokenize the header once, all lookups use the index
+            xprot_index = XProtIndex(config_buffer)
+
             # Get some parameters - wip long
             try:
                 wip_long = xprot_get_val(
-                    config_buffer, 'MEAS.sWiPMemBlock.alFree')
+                    config_buffer, 'MEAS.sWiPMemBlock.alFree',
+                    xprot_index)
                 if wip_long.size == 0:
                     # If we found it but have no entries, then something is
                     # wrong
@@ -48,7 +53,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
             # Get some parameters - wip double
             try:
                 wip_double = xprot_get_val(
-                    config_buffer, 'MEAS.sWiPMemBlock.adFree')
+                    config_buffer, 'MEAS.sWiPMemBlock.adFree',
+                    xprot_index)
                 if wip_double.size == 0:
                     raise RuntimeError('Failed to find WIP double parameters')
             except KeyError:
@@ -58,7 +64,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
             # Get some parameters - dwell times
             try:
                 dwell_time_0 = xprot_get_val(
-                    config_buffer, 'MEAS.sRXSPEC.alDwellTime')
+                    config_buffer, 'MEAS.sRXSPEC.alDwellTime',
+                    xprot_index)
                 if dwell_time_0.size == 0:
                     raise RuntimeError('Failed to find dwell times')
                 dwell_time_0 = dwell_time_0[0]
@@ -69,7 +76,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
             # Get some parameters - trajectory
             try:
                 traj = xprot_get_val(
-                    config_buffer, 'MEAS.sKSpace.ucTrajectory')
+                    config_buffer, 'MEAS.sKSpace.ucTrajectory',
+                    xprot_index)
                 if traj.size != 1:
                     raise RuntimeError(
                         'Failed to find appropriate trajectory array')
@@ -88,7 +96,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
             # Get some parameters - max channels
             try:
                 max_channels = xprot_get_val(
-                    config_buffer, 'YAPS.iMaxNoOfRxChannels')
+                    config_buffer, 'YAPS.iMaxNoOfRxChannels',
+                    xprot_index)
                 if max_channels.size == 0:
                     raise RuntimeError(
                         'Failed to find YAPS.iMaxNoOfRxChannels array')
@@ -99,8 +108,9 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
 
             # Get some parameters - cartesian encoding bits
             try:
-                tmp = xprot_get_val(config_buffer,
-                                    'MEAS.sKSpace.lPhaseEncodingLines')
+                tmp = xprot_get_val(
+                    config_buffer,
+                    'MEAS.sKSpace.lPhaseEncodingLines', xprot_index)
                 if tmp.size == 0:
                     msg = 'Failed to find MEAS.sKSpace.lPhaseEncodingLines'
                     raise RuntimeError(msg)
@@ -111,7 +121,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
 
             try:
                 iNoOfFourierLines = xprot_get_val(
-                    config_buffer, 'YAPS.iNoOfFourierLines')
+                    config_buffer, 'YAPS.iNoOfFourierLines',
+                    xprot_index)
                 if iNoOfFourierLines.size == 0:
                     msg = 'Failed to find YAPS.iNoOfFourierLines array'
                     raise RuntimeError(msg)
@@ -123,7 +134,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
             has_FirstFourierLine = False
             try:
                 lFirstFourierLine = xprot_get_val(
-                    config_buffer, 'YAPS.lFirstFourierLine')
+                    config_buffer, 'YAPS.lFirstFourierLine',
+                    xprot_index)
                 if lFirstFourierLine.size == 0:
                     msg = 'Failed to find YAPS.lFirstFourierLine array'
                     logging.warning(msg)
@@ -138,7 +150,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
             # get the center partition parameters
             try:
                 lPartitions = xprot_get_val(
-                    config_buffer, 'MEAS.sKSpace.lPartitions')
+                    config_buffer, 'MEAS.sKSpace.lPartitions',
+                    xprot_index)
                 if lPartitions.size == 0:
                     msg = 'Failed to find MEAS.sKSpace.lPartitions array'
                     raise RuntimeError(msg)
@@ -150,7 +163,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
             # Note: iNoOfFourierPartitions is sometimes absent for 2D sequences
             try:
                 iNoOfFourierPartitions = xprot_get_val(
-                    config_buffer, 'YAPS.iNoOfFourierPartitions')
+                    config_buffer, 'YAPS.iNoOfFourierPartitions',
+                    xprot_index)
                 if iNoOfFourierPartitions.size == 0:
                     iNoOfFourierPartitions = 1
                 else:
@@ -161,7 +175,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
             has_FirstFourierPartition = False
             try:
                 lFirstFourierPartition = xprot_get_val(
-                    config_buffer, 'YAPS.lFirstFourierPartition')
+                    config_buffer, 'YAPS.lFirstFourierPartition',
+                    xprot_index)
                 if lFirstFourierPartition.size == 0:
                     msg = 'Failed to find encYAPS.lFirstFourierPartition array'
                     logging.warning(msg)
@@ -203,7 +218,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
             # Get some parameters - radial views
             try:
                 radial_views = xprot_get_val(
-                    config_buffer, 'MEAS.sKSpace.lRadialViews')
+                    config_buffer, 'MEAS.sKSpace.lRadialViews',
+                    xprot_index)
                 if radial_views.size == 0:
                     msg = 'Failed to find MEAS.sKSpace.lRadialViews array'
                     raise RuntimeError(msg)
@@ -215,7 +231,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
             # Get some parameters - protocol name
             try:
                 protocol_name = xprot_get_val(
-                    config_buffer, 'HEADER.tProtocolName')
+                    config_buffer, 'HEADER.tProtocolName',
+                    xprot_index)
                 if not protocol_name:
                     msg = 'Failed to find HEADER.tProtocolName'
                     raise RuntimeError(msg)
@@ -226,14 +243,17 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
             # Get some parameters - base line
             try:
                 baseLineString = xprot_get_val(
-                    config_buffer, 'MEAS.sProtConsistencyInfo.tBaselineString')
+                    config_buffer,
+                    'MEAS.sProtConsistencyInfo.tBaselineString',
+                    xprot_index)
                 if not baseLineString:
                     raise KeyError()
             except KeyError:
                 try:
                     baseLineString = xprot_get_val(
                         config_buffer,
-                        'MEAS.sProtConsistencyInfo.tBaselineString')
+                        'MEAS.sProtConsistencyInfo.tBaselineString',
+                        xprot_index)
                     if not baseLineString:
                         raise KeyError()
                 except KeyError:
@@ -242,7 +262,8 @@ def readXmlConfig(debug_xml, parammap_file_content, num_buffers, buffers,
                            'tMeasuredBaselineString')
                     logging.warning(msg)
 
-            return(ProcessParameterMap(config_buffer, parammap_file_content),
+            return(ProcessParameterMap(
+                config_buffer, parammap_file_content, xprot_index),
                    protocol_name, baseLineString)
 
     # We'll never hit this, here for linting
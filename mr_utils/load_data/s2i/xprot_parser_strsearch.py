@@ -9,15 +9,15 @@ to work properly.  Currently it's supressing a lot of fields that don't exist,
 it's just not letting us display the warning that it doesn't exist.
 '''
 
+import re
 from itertools import islice
 
 import numpy as np
 
-def findp(p, config):
-    '''Decode the tag and return index.
+def findtag(p):
+    '''Decode the tag of a path node.
 
     p -- Current path node.
-    config -- The current header portion we're searching in.
 
     All of these tag assignments are ad hoc -- just to get something to work.
     '''
@@ -40,7 +40,15 @@ def findp(p, config):
     else:
         msg = '"%s" is not handled yet!' % p
         raise NotImplementedError(msg)
+    return tag
 
+def findp(p, config):
+    '''Decode the tag and return index.
+
+    p -- Current path node.
+    config -- The current header portion we're searching in.
+    '''
+    tag = findtag(p)
     idx0 = config.find('<' + tag + '."' + p + '">')
     idx0 -= len('<' + tag + '."')
     return(idx0, tag)
@@ -74,15 +82,133 @@ def find_matching_braces(s, lsym='{', rsym='}', qlsym='"', qrsym='"'):
     return matches
 
 
+class _XProtNode(object):
+    '''A tagged, braced region of the XProtocol buffer.'''
+
+    __slots__ = ('start', 'end', 'first')
+
+    def __init__(self, start):
+        self.start = start
+        self.end = None
+
+        # (tag, name) -> first node with that tag and name inside this
+        # one
+        self.first = {}
+
+class XProtIndex(object):
+    '''Index of all the tagged regions of an XProtocol buffer.
+
+    config_buffer -- String containing the XProtocol innards.
+
+    The buffer is tokenized once: every <Tag."name"> { ... } region
+    gets its start and end (the indices of its braces) recorded, and
+    registers itself with all the regions it's nested in.  Looking up
+    a dotted path is then a dictionary hit for every path element, and
+    the answer is remembered, so repeat lookups are O(1).
+
+    Like xprot_get_val, each path element is the first region with a
+    matching tag and name anywhere inside the previous one and numeric
+    path elements are skipped.
+
+    Can be passed to xprot_get_val() as the p_to_buf_table argument.
+    '''
+
+    _tokens = re.compile(r'<(\w+)\."([^"]*)">|"[^"]*"|[{}]')
+
+    def __init__(self, config_buffer):
+        self.config_buffer = config_buffer
+
+        # dotted path -> (start, end, tag)
+        self.table = {}
+
+        self.root = _XProtNode(0)
+        self.root.end = len(config_buffer)
+        stack = [self.root]
+        nodes = [self.root]
+        pending = None
+        for m in self._tokens.finditer(config_buffer):
+            if m.group(1) is not None:
+                # Tag, wait for its opening brace
+                pending = (m.group(1), m.group(2))
+                continue
+
+            c = m.group(0)
+            if c == '{':
+                node = None
+                if pending is not None:
+                    node = _XProtNode(m.start())
+                    for parent in nodes:
+                        parent.first.setdefault(pending, node)
+                    nodes.append(node)
+                    pending = None
+                stack.append(node)
+            elif c == '}':
+                if len(stack) == 1:
+                    raise IndexError(
+                        'No matching closing parens at: ' + str(
+                            m.start()))
+                node = stack.pop()
+                if node is not None:
+                    node.end = m.start()
+                    nodes.pop()
+            # else quoted string, braces in there don't count
+
+        if len(stack) > 1:
+            raise IndexError('No matching opening parens')
+
+    def lookup(self, val):
+        '''Find region of the buffer for dot separated path val.
+
+        Returns (start, end, tag), the indices of the opening and
+        closing braces of the region and the tag of the last path
+        element.  Raises KeyError if any element of the path is not
+        found.
+        '''
+
+        try:
+            entry = self.table[val]
+        except KeyError:
+            entry = self._find(val)
+            self.table[val] = entry
+        if entry is None:
+            raise KeyError('%s not found!' % val)
+        return entry
+
+    def _find(self, val):
+        node, tag = self.root, None
+        for p in val.split('.'):
+            # Same as xprot_get_val, we don't know how to deal with
+            # indices
+            if p.isnumeric():
+                continue
+            tag = findtag(p)
+            node = node.first.get((tag, p))
+            if node is None:
+                return None
+        if tag is None:
+            return None
+        return(node.start, node.end, tag)
+
+
 def xprot_get_val(config_buffer, val, p_to_buf_table=None, return_table=False):
     '''Get value from config buffer.
 
     config_buffer -- String containing the XProtocol innards.
     val -- Dot separated path to search for.
-    p_to_buf_table --
-    return_table --
+    p_to_buf_table -- Lookup table from previous calls or XProtIndex.
+    return_table -- Return the lookup table along with the value.
+
+    Passing an XProtIndex as p_to_buf_table skips the string search
+    entirely.
     '''
 
+    if isinstance(p_to_buf_table, XProtIndex):
+        start, end, tag = p_to_buf_table.lookup(val)
+        val = _cast(p_to_buf_table.config_buffer[start:end+1], tag)
+        if return_table:
+            return val, p_to_buf_table
+        return val
+
     if p_to_buf_table is None:
         p_to_buf_table = dict()
     else:
@@ -154,6 +280,16 @@ def xprot_get_val(config_buffer, val, p_to_buf_table=None, return_table=False):
         cur_buf = cur_buf[idx2:matches[idx2]+1]
 
 
+    val = _cast(cur_buf, tag)
+
+    if return_table:
+        # print('VAL:', val)
+        return val, p_to_buf_table
+    return val
+
+def _cast(cur_buf, tag):
+    '''Cast braced region of the buffer to the correct value.'''
+
     # Chop off front and end braces and then cast to correct value
     cur_buf = cur_buf[1:-1]
     if tag == 'ParamLong':
@@ -168,10 +304,6 @@ def xprot_get_val(config_buffer, val, p_to_buf_table=None, return_table=False):
         idx1 = cur_buf.rfind('"')
         cur_buf = cur_buf[idx0+1:idx1]
         val = cur_buf.strip()
-
-    if return_table:
-        # print('VAL:', val)
-        return val, p_to_buf_table
     return val
 
 if __name__ == '__main__':
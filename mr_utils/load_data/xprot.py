@@ -1,7 +1,8 @@
 import ply.lex as lex
-import ply.yacc as yacc
 import xml.etree.ElementTree as ET
 
+from mr_utils.load_data.xprot_parser import cached_yacc
+
 class XProtLex(object):
     # List of token names
     tokens = (
@@ -110,197 +111,55 @@ class XProtLex(object):
     lexer = lex.lex()
 
 
+class _Node:
+    def __init__(self):
+        self.tag = ''
+        self.attr = dict()
+
+    def makeAttrs(self):
+        innards = ''
+        for key,val in self.attr.items():
+            innards += ' ' + key + '=' + val
+        return(innards)
+
+    def openString(self):
+        return('<' + self.tag + self.makeAttrs() + '>')
+
+    def closeString(self):
+        return('</' + self.tag + '>')
+
+# escape invalid xml entities
+def _xml_clean(string):
+    return(string.replace('&', '&amp;').replace(
+        '<', '&lt;').replace('>', '&gt;'))
+
 class XProtParser(object):
 
-    # make a stack of the brace state
-    brace_state = []
+    tokens = XProtLex.tokens
+    start = 'document'
+
+    def __init__(self):
+        self.reset()
 
-    xml = ''
-    node_label = ''
-    name = ''
-    mod = ''
+    def reset(self):
+        # make a stack of the brace state
+        self.brace_state = []
+
+        self.xml = ''
+        self.node_label = ''
+        self.name = ''
+        self.mod = ''
 
     def raw2xml(self,xprot):
-        class Node:
-            def __init__(self):
-                self.tag = ''
-                self.attr = dict()
-
-            def makeAttrs(self):
-                innards = ''
-                for key,val in self.attr.items():
-                    innards += ' ' + key + '=' + val
-                return(innards)
-
-            def openString(self):
-                return('<' + self.tag + self.makeAttrs() + '>')
-
-            def closeString(self):
-                return('</' + self.tag + '>')
-
-        # escape invalid xml entities
-        def xml_clean(string):
-            return(string.replace('&','&amp;').replace('<','&lt;').replace('>','&gt;'))
-
-
-        def p_document(p):
-            '''document : document line
-                                | line'''
-
-        def p_modifier(p):
-            '''modifier : DEFAULT
-                        | CLASS
-                        | PRECISION
-                        | MINSIZE
-                        | MAXSIZE
-                        | LABEL
-                        | TOOLTIP
-                        | LIMRANGE
-                        | LIMIT
-                        | REPR
-                        | POS
-                        | PARAM
-                        | CONTROL
-                        | LINE
-                        | DLL
-                        | CONTEXT
-                        | NAME
-                        | ID
-                        | USERVERSION
-                        | INFILE
-                        | VISIBLE
-                        | COM
-                        | UNIT
-
-                        | DICOM
-                        | MEAS
-                        | MEASYAPS
-                        | PHOENIX
-                        | SPICE'''
-
-            self.mod = '"' + p[1] + '"'
-
-        def p_line(p):
-            '''line : tag LBRACE
-
-                    | LANGLE modifier RANGLE tag LBRACE
-                    | LANGLE modifier RANGLE LBRACE
-                    | LBRACE
-                    | RBRACE
-
-                    | STRING
-                    | INTEGER
-                    | FLOAT
-
-                    | LANGLE modifier RANGLE STRING
-                    | LANGLE modifier RANGLE INTEGER
-                    | LANGLE modifier RANGLE FLOAT
-
-                    | LEFTHAND
-                    | LANGLE modifier RANGLE LEFTHAND
-                    | HEX
-                    | SCINOT'''
-
-            if len(p) is 3:
-                # This means we have an open brace
-                self.brace_state.append((p[2],self.node_label))
-
-                n = Node()
-                n.tag = self.node_label
-
-                if self.name != '':
-                    n.attr['name'] = self.name
-                    self.name = ''
-                if self.mod != '':
-                    n.attr['mod'] = self.mod
-                    self.mod = ''
-                self.xml += n.openString()
 
-            else:
-                # This means we might have close brace
-                if p[1] == '}':
-                    try:
-                        tag_name = self.brace_state.pop()
-                        n = Node()
-                        n.tag = tag_name[1]
-                        self.xml += n.closeString()
-                    except:
-                        pass
-
-                elif p[1] == '{':
-                    # we got another open brace
-                    self.brace_state.append((p[1],'InducedBrace'))
-
-                    n = Node()
-                    n.tag = 'InducedBrace'
-                    self.xml += n.openString()
-                else:
-                    # This is the value of the tag
-                    n = Node()
-                    n.tag = 'value'
-
-                    if p[1] == '<':
-                        n.attr['mod'] = self.mod
-                        self.mod = ''
-
-                        if p[4] is None:
-                            n.tag = self.node_label
-                            self.brace_state.append((p[5],self.node_label))
-                            self.xml += n.openString()
-                        else:
-                            self.xml += n.openString() + xml_clean(p[4]) + n.closeString()
-                            # self.xml += n.openString() + p[4] + n.closeString()
-                    else:
-                        self.xml += n.openString() + xml_clean(p[1]) + n.closeString()
-                        # self.xml += n.openString() + p[1] + n.closeString()
-
-
-        def p_tag(p):
-            '''tag : LANGLE tagtype PERIOD STRING RANGLE
-                    | LANGLE tagtype RANGLE'''
-
-            if len(p) > 4:
-                if self.node_label != '':
-                    self.name = p[4]
-
-
-        def p_tagtype(p):
-            '''tagtype : PMAP
-                    | PSTR
-                    | PLNG
-                    | PDBL
-                    | PBOOL
-                    | PARRAY
-                    | PFUNCT
-                    | PCHOICE
-                    | PCARDLAYOUT
-                    | PIPE
-                    | PIPESERVICE
-                    | EVENT
-                    | CONN
-                    | METHOD
-                    | DEPEND
-                    | PROTCOMP
-                    | EVASTRTAB
-                    | XPROT'''
-
-            self.node_label = p[1]
-
-        # Error rule for syntax errors
-        def p_error(p):
-            print('Syntax error in input!')
-            print(p)
-
-        # get the lexer and token mappings to pass to yacc
-        xprotLex = XProtLex()
-        lexer = xprotLex.lexer
-        tokens = xprotLex.tokens
-
-        # Build the parser
-        parser = yacc.yacc()
+        # Start from scratch, the parser itself is only built once
+        self.reset()
+        parser = cached_yacc(self, 'xprot')
+        lexer = XProtLex.lexer.clone()
+        lexer.lineno = 1
 
         # load in the data
-        result = parser.parse(xprot)
+        result = parser.parse(xprot, lexer=lexer)
 
         # Check to make sure all our braces matched up
         if len(self.brace_state) > 0:
@@ -309,14 +168,158 @@ class XProtParser(object):
         # Give xml document a common parent
         self.xml = '<doc_root>' + self.xml + '</doc_root>'
 
-
-        # print('Found Version', self.xml.find('Version'))
-        # print(self.xml.find('sWipMemBlock'))
-
         # Parse the string to make sure XML is well formed
-        # try:
-        # print(self.xml)
         root = ET.fromstring(self.xml)
         return(root)
-        # except:
-            # return(-1)
+
+    def parse_many(self,xprots):
+        return([ self.raw2xml(xprot) for xprot in xprots ])
+
+    def p_document(self, p):
+        '''document : document line
+                            | line'''
+
+    def p_modifier(self, p):
+        '''modifier : DEFAULT
+                    | CLASS
+                    | PRECISION
+                    | MINSIZE
+                    | MAXSIZE
+                    | LABEL
+                    | TOOLTIP
+                    | LIMRANGE
+                    | LIMIT
+                    | REPR
+                    | POS
+                    | PARAM
+                    | CONTROL
+                    | LINE
+                    | DLL
+                    | CONTEXT
+                    | NAME
+                    | ID
+                    | USERVERSION
+                    | INFILE
+                    | VISIBLE
+                    | COM
+                    | UNIT
+
+                    | DICOM
+                    | MEAS
+                    | MEASYAPS
+                    | PHOENIX
+                    | SPICE'''
+
+        self.mod = '"' + p[1] + '"'
+
+    def p_line(self, p):
+        '''line : tag LBRACE
+
+                | LANGLE modifier RANGLE tag LBRACE
+                | LANGLE modifier RANGLE LBRACE
+                | LBRACE
+                | RBRACE
+
+                | STRING
+                | INTEGER
+                | FLOAT
+
+                | LANGLE modifier RANGLE STRING
+                | LANGLE modifier RANGLE INTEGER
+                | LANGLE modifier RANGLE FLOAT
+
+                | LEFTHAND
+                | LANGLE modifier RANGLE LEFTHAND
+                | HEX
+                | SCINOT'''
+
+        if len(p) == 3:
+            # This means we have an open brace
+            self.brace_state.append((p[2],self.node_label))
+
+            n = _Node()
+            n.tag = self.node_label
+
+            if self.name != '':
+                n.attr['name'] = self.name
+                self.name = ''
+            if self.mod != '':
+                n.attr['mod'] = self.mod
+                self.mod = ''
+            self.xml += n.openString()
+
+        else:
+            # This means we might have close brace
+            if p[1] == '}':
+                try:
+                    tag_name = self.brace_state.pop()
+                    n = _Node()
+                    n.tag = tag_name[1]
+                    self.xml += n.closeString()
+                except:
+                    pass
+
+            elif p[1] == '{':
+                # we got another open brace
+                self.brace_state.append((p[1],'InducedBrace'))
+
+                n = _Node()
+                n.tag = 'InducedBrace'
+                self.xml += n.openString()
+            else:
+                # This is the value of the tag
+                n = _Node()
+                n.tag = 'value'
+
+                if p[1] == '<':
+                    n.attr['mod'] = self.mod
+                    self.mod = ''
+
+                    if p[4] is None:
+                        n.tag = self.node_label
+                        self.brace_state.append(
+                            (p[5], self.node_label))
+                        self.xml += n.openString()
+                    else:
+                        self.xml += n.openString() + \
+                            _xml_clean(p[4]) + n.closeString()
+                else:
+                    self.xml += n.openString() + _xml_clean(p[1]) + \
+                        n.closeString()
+
+
+    def p_tag(self, p):
+        '''tag : LANGLE tagtype PERIOD STRING RANGLE
+                | LANGLE tagtype RANGLE'''
+
+        if len(p) > 4:
+            if self.node_label != '':
+                self.name = p[4]
+
+
+    def p_tagtype(self, p):
+        '''tagtype : PMAP
+                | PSTR
+                | PLNG
+                | PDBL
+                | PBOOL
+                | PARRAY
+                | PFUNCT
+                | PCHOICE
+                | PCARDLAYOUT
+                | PIPE
+                | PIPESERVICE
+                | EVENT
+                | CONN
+                | METHOD
+                | DEPEND
+                | PROTCOMP
+                | EVASTRTAB
+                | XPROT'''
+
+        self.node_label = p[1]
+
+    # Error rule for syntax errors
+    def p_error(self, p):
+        print('Syntax error in input!')
+        print(p)
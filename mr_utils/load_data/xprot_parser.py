@@ -1,12 +1,64 @@
 '''Parse XProtocol Siemens' proprietary format.'''
 
 # import json
+import os
 import operator
 from functools import reduce
 
 import ply.lex as lex
 import ply.yacc as yacc
 
+from mr_utils.definitions import CACHE_DIR
+
+# Parsers we've already built this process, keyed by name
+_PARSERS = {}
+
+def cached_yacc(rules, name):
+    '''Get a parser for a grammar, only building it once.
+
+    Parameters
+    ==========
+    rules : object
+        Instance with tokens and the p_* grammar rules as methods.
+    name : str
+        Name of the parser, used as the cache key and table file name.
+
+    Returns
+    =======
+    parser : ply.yacc.LRParser
+        Parser with the grammar rules bound to rules.
+
+    Notes
+    =====
+    yacc.yacc() regenerates the LALR tables every time it's called,
+    which is by far the most expensive part of parsing a header.  The
+    tables are pickled to CACHE_DIR and reused across runs for as long
+    as the grammar stays the same.  Within a process, the parser is
+    built once and the rules are rebound to the instance on every
+    call.
+    '''
+
+    parser = _PARSERS.get(name)
+    if parser is None:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            picklefile = os.path.join(
+                CACHE_DIR, '%s_tables.pickle' % name)
+        except OSError:
+            # No place to put tables, we'll just have to build them
+            picklefile = None
+        parser = yacc.yacc(
+            module=rules, picklefile=picklefile, debug=False,
+            write_tables=picklefile is not None)
+        _PARSERS[name] = parser
+    else:
+        pdict = {key: getattr(rules, key) for key in dir(rules) if \
+            key.startswith('p_')}
+        for prod in parser.productions:
+            prod.bind(pdict)
+        parser.errorfunc = rules.p_error
+    return parser
+
 class XProtLexer(object):
     '''Define tokens and rules.'''
 
@@ -102,9 +154,20 @@ class XProtLexer(object):
 
 
 class XProtParser(object):
-    '''Parse the XProtocol.  Just do it.'''
+    '''Parse the XProtocol.  Just do it.
+
+    The grammar lives in the p_* methods.  See cached_yacc() for how
+    the parser tables are reused between headers.
+    '''
+
+    tokens = XProtLexer.tokens
+    start = 'document'
 
     def __init__(self):
+        self.reset()
+
+    def reset(self):
+        '''Clear out everything from previous parses.'''
         self.structure = {}
         self.structure['XProtocol'] = {}
         self.structure['XProtocol']['EVAStringTable'] = []
@@ -135,243 +198,286 @@ class XProtParser(object):
         self.stack = ['Params']
         self.xml = ''
 
-    def parse(self,xprot):
-
-        def p_document(p):
-            '''document : LANGLE XPROT RANGLE LBRACE xprotocol RBRACE'''
-
-        def p_xprotocol(p):
-            '''xprotocol : name id userversion evastringtable param paramcardlayout dependencies protocolcomposers'''
-            # self.structure['XProtocol']['Params'] = self.param_data
-
-        def p_name(p):
-            '''name : LANGLE NAME RANGLE QUOTED_STRING'''
-            self.structure['XProtocol']['Name'] = p[4]
-
-        def p_id(p):
-            '''id : LANGLE ID RANGLE INTEGER'''
-            self.structure['XProtocol']['ID'] = p[4]
-
-        def p_userversion(p):
-            '''userversion : LANGLE USERVERSION RANGLE FLOAT'''
-            self.structure['XProtocol']['Userversion'] = p[4]
+    def parse(self, xprot):
+        '''Parse a single XProtocol header.
 
-        def p_evastringtable(p):
-            '''evastringtable : LANGLE EVASTRTAB RANGLE LBRACE evastrtablecontents RBRACE'''
+        Parameters
+        ==========
+        xprot : str
+            XProtocol header.
 
-        def p_evastrtablecontents(p):
-            '''evastrtablecontents : evastrtableline evastrtablecontents
-            | empty'''
+        Returns
+        =======
+        structure : dict
+            Parsed header, also available as self.structure.
+        '''
 
-        def p_evastrtableline(p):
-            '''evastrtableline : INTEGER QUOTED_STRING
-            | INTEGER'''
-            if len(p) == 3:
-                self.structure['XProtocol']['EVAStringTable'].append({p[1]: p[2]})
-            elif len(p) == 2:
-                self.structure['XProtocol']['EVAStringTable'].append({p[1]: None})
+        # Get the parser and a fresh lexer so line numbers start over
+        parser = cached_yacc(self, 'xprot_parser')
+        lexer = XProtLexer.lexer.clone()
+        lexer.lineno = 1
 
-        def p_paramcardlayout(p):
-            '''paramcardlayout : LANGLE PARAMCARDLAYOUT PERIOD QUOTED_STRING RANGLE LBRACE paramcardlayoutcontents RBRACE'''
-            # Make the QUOTED_STRING the parent so we can look it up easily
-            self.structure['XProtocol']['ParamCardLayout'] = {p[4]: self.structure['XProtocol']['ParamCardLayout']}
-
-        def p_paramcardlayoutcontents(p):
-            '''paramcardlayoutcontents : paramcardlayoutline paramcardlayoutcontents
-            | empty'''
-
-        def p_paramcardlayoutline(p):
-            '''paramcardlayoutline : LANGLE REPR RANGLE QUOTED_STRING
-            | LANGLE CONTROL RANGLE LBRACE controlinnards RBRACE'''
-
-            if self.control is not None:
-                self.structure['XProtocol']['ParamCardLayout'].append(self.control)
-                self.control = None
-            else:
-                self.structure['XProtocol']['ParamCardLayout'].append({'Repr': p[4]})
+        # load in the data
+        _result = parser.parse(xprot, lexer=lexer)
+        return self.structure
+
+    def parse_many(self, xprots):
+        '''Parse a list of XProtocol headers.
+
+        Parameters
+        ==========
+        xprots : list of str
+            XProtocol headers.
+
+        Returns
+        =======
+        structures : list of dict
+            Parsed headers, in the same order as xprots.
+        '''
+        structures = []
+        for xprot in xprots:
+            self.reset()
+            structures.append(self.parse(xprot))
+        return structures
+
+
+    def p_document(self, p):
+        '''document : LANGLE XPROT RANGLE LBRACE xprotocol RBRACE'''
+
+    def p_xprotocol(self, p):
+        # pylint: disable=C0301
+        '''xprotocol : name id userversion evastringtable param paramcardlayout dependencies protocolcomposers'''
+        # self.structure['XProtocol']['Params'] = self.param_data
+
+    def p_name(self, p):
+        '''name : LANGLE NAME RANGLE QUOTED_STRING'''
+        self.structure['XProtocol']['Name'] = p[4]
+
+    def p_id(self, p):
+        '''id : LANGLE ID RANGLE INTEGER'''
+        self.structure['XProtocol']['ID'] = p[4]
+
+    def p_userversion(self, p):
+        '''userversion : LANGLE USERVERSION RANGLE FLOAT'''
+        self.structure['XProtocol']['Userversion'] = p[4]
+
+    def p_evastringtable(self, p):
+        # pylint: disable=C0301
+        '''evastringtable : LANGLE EVASTRTAB RANGLE LBRACE evastrtablecontents RBRACE'''
+
+    def p_evastrtablecontents(self, p):
+        '''evastrtablecontents : evastrtableline evastrtablecontents
+        | empty'''
+
+    def p_evastrtableline(self, p):
+        '''evastrtableline : INTEGER QUOTED_STRING
+        | INTEGER'''
+        table = self.structure['XProtocol']['EVAStringTable']
+        if len(p) == 3:
+            table.append({p[1]: p[2]})
+        elif len(p) == 2:
+            table.append({p[1]: None})
+
+    def p_paramcardlayout(self, p):
+        # pylint: disable=C0301
+        '''paramcardlayout : LANGLE PARAMCARDLAYOUT PERIOD QUOTED_STRING RANGLE LBRACE paramcardlayoutcontents RBRACE'''
+        # Make the QUOTED_STRING the parent so we can look it up
+        # easily
+        xprot = self.structure['XProtocol']
+        xprot['ParamCardLayout'] = {p[4]: xprot['ParamCardLayout']}
+
+    def p_paramcardlayoutcontents(self, p):
+        # pylint: disable=C0301
+        '''paramcardlayoutcontents : paramcardlayoutline paramcardlayoutcontents
+        | empty'''
+
+    def p_paramcardlayoutline(self, p):
+        '''paramcardlayoutline : LANGLE REPR RANGLE QUOTED_STRING
+        | LANGLE CONTROL RANGLE LBRACE controlinnards RBRACE'''
+
+        layout = self.structure['XProtocol']['ParamCardLayout']
+        if self.control is not None:
+            layout.append(self.control)
+            self.control = None
+        else:
+            layout.append({'Repr': p[4]})
+
+    def p_controlinnards(self, p):
+        # pylint: disable=C0301
+        '''controlinnards : LANGLE PARAM RANGLE QUOTED_STRING LANGLE POS RANGLE INTEGER INTEGER LANGLE REPR RANGLE QUOTED_STRING
+        | LANGLE PARAM RANGLE QUOTED_STRING LANGLE POS RANGLE INTEGER INTEGER'''
+        if len(p) == 14:
+            self.control = ('Control', {
+                'Param': p[4], 'Pos': (p[8], p[9]), 'Repr': p[13]})
+        else:
+            self.control = (
+                'Control', {'Param': p[4], 'Pos': (p[8], p[9])})
+
+    def p_dependencies(self, p):
+        '''dependencies : dependencies dependency
+        | empty'''
+        if len(p) == 3:
+            self.structure['XProtocol']['Dependency'][
+                self.dependency_key] = self.dependency
+            self.dependency_key = None
+            self.dependency = None
+            self.stringlist = []
+
+    def p_dependency(self, p):
+        # pylint: disable=C0301
+        '''dependency : LANGLE DEPENDENCY PERIOD QUOTED_STRING RANGLE LBRACE dependencyinnards RBRACE'''
+        self.dependency_key = p[4]
+
+    def p_dependencyinnards(self, p):
+        # pylint: disable=C0301
+        '''dependencyinnards : listofquotedstrings LANGLE DLL RANGLE QUOTED_STRING LANGLE CONTEXT RANGLE QUOTED_STRING LANGLE CONTEXT RANGLE QUOTED_STRING
+        | listofquotedstrings LANGLE DLL RANGLE QUOTED_STRING LANGLE CONTEXT RANGLE QUOTED_STRING
+        | listofquotedstrings LANGLE DLL RANGLE QUOTED_STRING
+        | listofquotedstrings LANGLE CONTEXT RANGLE QUOTED_STRING
+        | listofquotedstrings LANGLE VISIBLE RANGLE QUOTED_STRING
+        | listofquotedstrings'''
+        if len(p) > 10:
+            ## TODO: Seems like there could be multiple of each...
+            self.dependency = {
+                'string_list': self.stringlist, 'Dll': p[5],
+                'Context': (p[9], p[13])}
+        elif len(p) == 10:
+            self.dependency = {
+                'string_list': self.stringlist, 'Dll': p[5],
+                'Context': p[9]}
+        elif len(p) == 6:
+            # Either Context, DLL, or Visible, singly
+            self.dependency = {
+                'string_list': self.stringlist, p[3]: p[5]}
+
+    def p_listofquotedstrings(self, p):
+        '''listofquotedstrings : QUOTED_STRING listofquotedstrings
+        | empty'''
+        if len(p) == 3:
+            self.stringlist.append(p[1])
+
+    def p_protocolcomposers(self, p):
+        '''protocolcomposers : protocolcomposer protocolcomposers
+        | empty'''
+
+    def p_protocolcomposer(self, p):
+        # pylint: disable=C0301
+        '''protocolcomposer : LANGLE PROTOCOLCOMPOSER PERIOD QUOTED_STRING RANGLE LBRACE protocolcomposercontents RBRACE'''
+        self.structure['XProtocol']['ProtocolComposer'][
+            p[4]] = self.protcomposers
+        self.protcomposers = []
 
-        def p_controlinnards(p):
-            '''controlinnards : LANGLE PARAM RANGLE QUOTED_STRING LANGLE POS RANGLE INTEGER INTEGER LANGLE REPR RANGLE QUOTED_STRING
-            | LANGLE PARAM RANGLE QUOTED_STRING LANGLE POS RANGLE INTEGER INTEGER'''
-            if len(p) == 14:
-                self.control = ('Control', {'Param': p[4], 'Pos': (p[8], p[9]), 'Repr': p[13]})
-            else:
-                self.control = ('Control', {'Param': p[4], 'Pos': (p[8], p[9])})
-
-        def p_dependencies(p):
-            '''dependencies : dependencies dependency
-            | empty'''
-            if len(p) == 3:
-                self.structure['XProtocol']['Dependency'][self.dependency_key] = self.dependency
-                self.dependency_key = None
-                self.dependency = None
-                self.stringlist = []
-
-        def p_dependency(p):
-            '''dependency : LANGLE DEPENDENCY PERIOD QUOTED_STRING RANGLE LBRACE dependencyinnards RBRACE'''
-            self.dependency_key = p[4]
-
-        def p_dependencyinnards(p):
-            '''dependencyinnards : listofquotedstrings LANGLE DLL RANGLE QUOTED_STRING LANGLE CONTEXT RANGLE QUOTED_STRING LANGLE CONTEXT RANGLE QUOTED_STRING
-            | listofquotedstrings LANGLE DLL RANGLE QUOTED_STRING LANGLE CONTEXT RANGLE QUOTED_STRING
-            | listofquotedstrings LANGLE DLL RANGLE QUOTED_STRING
-            | listofquotedstrings LANGLE CONTEXT RANGLE QUOTED_STRING
-            | listofquotedstrings LANGLE VISIBLE RANGLE QUOTED_STRING
-            | listofquotedstrings'''
-            if len(p) > 10:
-                ## TODO: Seems like there could be multiple of each...
-                self.dependency = {'string_list': self.stringlist, 'Dll': p[5], 'Context': (p[9], p[13])}
-            elif len(p) == 10:
-                self.dependency = {'string_list': self.stringlist, 'Dll': p[5], 'Context': p[9]}
-            elif len(p) == 6:
-                # Either Context, DLL, or Visible, singly
-                self.dependency = {'string_list': self.stringlist, p[3]: p[5]}
-
-        def p_listofquotedstrings(p):
-            '''listofquotedstrings : QUOTED_STRING listofquotedstrings
-            | empty'''
-            if len(p) == 3:
-                self.stringlist.append(p[1])
-
-        def p_protocolcomposers(p):
-            '''protocolcomposers : protocolcomposer protocolcomposers
-            | empty'''
-
-        def p_protocolcomposer(p):
-            '''protocolcomposer : LANGLE PROTOCOLCOMPOSER PERIOD QUOTED_STRING RANGLE LBRACE protocolcomposercontents RBRACE'''
-            self.structure['XProtocol']['ProtocolComposer'][p[4]] = self.protcomposers
-            self.protcomposers = []
-
-        def p_protocolcomposercontents(p):
-            '''protocolcomposercontents : protocolcomposercontents LANGLE INFILE RANGLE QUOTED_STRING
-            | protocolcomposercontents LANGLE DLL RANGLE QUOTED_STRING
-            | empty'''
-            if len(p) == 6:
-                self.protcomposers.append({p[3]: p[5]})
-
-        def p_paramsorvalues(p):
-            '''paramsorvalues : tag param paramsorvalues
-            | param paramsorvalues
-            | value paramsorvalues
-            | empty'''
-
-        def p_param(p):
-            '''param : open close
-            | LBRACE paramsorvalues RBRACE'''
-
-        def p_open(p):
-            '''open : LANGLE PARAMMAP PERIOD QUOTED_STRING
-            | LANGLE PARAMSTRING PERIOD QUOTED_STRING
-            | LANGLE PARAMLONG PERIOD QUOTED_STRING
-            | LANGLE PARAMBOOL PERIOD QUOTED_STRING
-            | LANGLE PARAMCHOICE PERIOD QUOTED_STRING
-            | LANGLE PARAMDOUBLE PERIOD QUOTED_STRING
-            | LANGLE PARAMARRAY PERIOD QUOTED_STRING
-            | LANGLE PIPE PERIOD QUOTED_STRING
-            | LANGLE PIPESERVICE PERIOD QUOTED_STRING
-            | LANGLE PARAMFUNCTOR PERIOD QUOTED_STRING
-            | LANGLE EVENT PERIOD QUOTED_STRING
-            | LANGLE METHOD PERIOD QUOTED_STRING
-            | LANGLE CONNECTION PERIOD QUOTED_STRING'''
-            # print('open',p[4])
-            key = p[4].replace('\"', '')
-
-            # Use the stack to generate multilevel key to the param dictionary
-            d = reduce(operator.getitem, self.stack, self.structure['XProtocol'])
-            if key in d:
-                raise ValueError('Key already exists!')
-            d[key] = {}
-            self.stack.append(key)
-
-        def p_close(p):
-            '''close : RANGLE LBRACE paramsorvalues RBRACE'''
-            # print('I have opened and closed')
-            if len(self.values):
-                d = reduce(operator.getitem, self.stack[:-1], self.structure['XProtocol'])[self.stack[-1]]
-
-                # If we have a definition of defaults and then followed by
-                # braces giving the values:
-                if d:
-                    new_key = '%s_vals' % self.stack[-1]
-                    d[new_key] = self.values
-                    self.stack[-1] = new_key
-                    # print('*'*80)
-                    # print(d)
-                    # print('*'*80)
-                else:
-                    d = self.values
-                # print(self.stack,self.values)
-            # print('values',self.values)
-            _popped = self.stack.pop()
-            # print('close',popped)
-            self.values = []
-
-        def p_value(p):
-            '''value : tag_empty INTEGER
-            | tag_empty QUOTED_STRING
-            | tag_empty LBRACE listofquotedstrings RBRACE
-            | tag_empty FLOAT'''
-
-            self.is_param = False
-
-            if len(p) == 3 and self.tag_value is not None:
-                self.values.append({self.tag_value: p[2]})
-                self.tag_value = None
-            elif len(p) == 3:
-                self.values.append(p[2])
+    def p_protocolcomposercontents(self, p):
+        # pylint: disable=C0301
+        '''protocolcomposercontents : protocolcomposercontents LANGLE INFILE RANGLE QUOTED_STRING
+        | protocolcomposercontents LANGLE DLL RANGLE QUOTED_STRING
+        | empty'''
+        if len(p) == 6:
+            self.protcomposers.append({p[3]: p[5]})
+
+    def p_paramsorvalues(self, p):
+        '''paramsorvalues : tag param paramsorvalues
+        | param paramsorvalues
+        | value paramsorvalues
+        | empty'''
+
+    def p_param(self, p):
+        '''param : open close
+        | LBRACE paramsorvalues RBRACE'''
+
+    def p_open(self, p):
+        '''open : LANGLE PARAMMAP PERIOD QUOTED_STRING
+        | LANGLE PARAMSTRING PERIOD QUOTED_STRING
+        | LANGLE PARAMLONG PERIOD QUOTED_STRING
+        | LANGLE PARAMBOOL PERIOD QUOTED_STRING
+        | LANGLE PARAMCHOICE PERIOD QUOTED_STRING
+        | LANGLE PARAMDOUBLE PERIOD QUOTED_STRING
+        | LANGLE PARAMARRAY PERIOD QUOTED_STRING
+        | LANGLE PIPE PERIOD QUOTED_STRING
+        | LANGLE PIPESERVICE PERIOD QUOTED_STRING
+        | LANGLE PARAMFUNCTOR PERIOD QUOTED_STRING
+        | LANGLE EVENT PERIOD QUOTED_STRING
+        | LANGLE METHOD PERIOD QUOTED_STRING
+        | LANGLE CONNECTION PERIOD QUOTED_STRING'''
+        # print('open',p[4])
+        key = p[4].replace('\"', '')
+
+        # Use the stack to generate multilevel key to the param
+        # dictionary
+        d = reduce(
+            operator.getitem, self.stack, self.structure['XProtocol'])
+        if key in d:
+            raise ValueError('Key already exists!')
+        d[key] = {}
+        self.stack.append(key)
+
+    def p_close(self, p):
+        '''close : RANGLE LBRACE paramsorvalues RBRACE'''
+        # print('I have opened and closed')
+        if len(self.values):
+            d = reduce(
+                operator.getitem, self.stack[:-1],
+                self.structure['XProtocol'])[self.stack[-1]]
+
+            # If we have a definition of defaults and then followed by
+            # braces giving the values:
+            if d:
+                new_key = '%s_vals' % self.stack[-1]
+                d[new_key] = self.values
+                self.stack[-1] = new_key
+                # print('*'*80)
+                # print(d)
+                # print('*'*80)
             else:
-                self.values.append(self.stringlist)
-                self.stringlist = []
-
-        def p_tag(p):
-            '''tag : LANGLE DEFAULT RANGLE
-            | LANGLE LIMITRANGE RANGLE
-            | LANGLE MINSIZE RANGLE
-            | LANGLE MAXSIZE RANGLE
-            | LANGLE LIMIT RANGLE
-            | LANGLE PRECISION RANGLE
-            | LANGLE UNIT RANGLE
-            | LANGLE CLASS RANGLE
-            | LANGLE LABEL RANGLE
-            | LANGLE VISIBLE RANGLE
-            | LANGLE COMMENTTAG RANGLE
-            | LANGLE TOOLTIP RANGLE'''
-            self.tag_value = p[2]
-
-        def p_tag_empty(p):
-            '''tag_empty : tag
-            | empty'''
-
-
-        def p_empty(p):
-            '''empty : '''
-            pass
-
-        # Error rule for syntax errors
-        def p_error(p):
-            print('Syntax error in input!')
-            print(p)
-
-        # get the lexer and token mappings to pass to yacc
-        xprotLex = XProtLexer()
-        lexer = xprotLex.lexer  #pylint: disable=W0612
-        tokens = xprotLex.tokens  #pylint: disable=W0612
-
-        # Build the parser
-        parser = yacc.yacc()
+                d = self.values
+            # print(self.stack,self.values)
+        # print('values',self.values)
+        _popped = self.stack.pop()
+        # print('close',popped)
+        self.values = []
 
-        # load in the data
-        _result = parser.parse(xprot)
-        # print(json.dumps(self.structure,indent=2))
-        # print(json.dumps(self.structure['XProtocol']['ParamRoot'],indent=2))
-        # print(json.dumps(self.param_data,indent=2))
-        # print('Num overwrites:',self.overwrites)
-
-        # # Now get result for ParamArray section using parser from rdi
-        # infoLex = InfoLex()
-        # lexer = infoLex.lexer
-        # tokens = infoLex.tokens
-        #
-        # rdiparser = InfoParser()
-        # xml = rdiparser.raw2xml(xprot)
-        # print(xml)
+    def p_value(self, p):
+        '''value : tag_empty INTEGER
+        | tag_empty QUOTED_STRING
+        | tag_empty LBRACE listofquotedstrings RBRACE
+        | tag_empty FLOAT'''
+
+        self.is_param = False
+
+        if len(p) == 3 and self.tag_value is not None:
+            self.values.append({self.tag_value: p[2]})
+            self.tag_value = None
+        elif len(p) == 3:
+            self.values.append(p[2])
+        else:
+            self.values.append(self.stringlist)
+            self.stringlist = []
+
+    def p_tag(self, p):
+        '''tag : LANGLE DEFAULT RANGLE
+        | LANGLE LIMITRANGE RANGLE
+        | LANGLE MINSIZE RANGLE
+        | LANGLE MAXSIZE RANGLE
+        | LANGLE LIMIT RANGLE
+        | LANGLE PRECISION RANGLE
+        | LANGLE UNIT RANGLE
+        | LANGLE CLASS RANGLE
+        | LANGLE LABEL RANGLE
+        | LANGLE VISIBLE RANGLE
+        | LANGLE COMMENTTAG RANGLE
+        | LANGLE TOOLTIP RANGLE'''
+        self.tag_value = p[2]
+
+    def p_tag_empty(self, p):
+        '''tag_empty : tag
+        | empty'''
+
+
+    def p_empty(self, p):
+        '''empty : '''
+        pass
+
+    # Error rule for syntax errors
+    def p_error(self, p):
+        print('Syntax error in input!')
+        print(p)
@@ -7,14 +7,11 @@ the gadgetron client.
 
 import socket
 import logging
-from tempfile import NamedTemporaryFile
-from functools import partial
-
-from scipy.io import savemat
+from collections import deque
 
 from mr_utils.config import ProfileConfig
-from mr_utils.matlab.contract import done_token, RUN, GET, PUT
-from mr_utils.load_data import load_mat
+from mr_utils.matlab.contract import (
+    done_token, RUN, GET, PUT, BUFSIZE, write_vars, read_vars)
 
 logging.basicConfig(format='%(levelname)s: %(message)s',
                     level=logging.DEBUG)
@@ -46,22 +43,176 @@ def get_socket(host, port, bufsize):
     -----
     If values are not provided (i.e., None) the values for
     host, port, bufsize will be taken from the active profile in
-    profiles.config.
+    profiles.config.  Variables are transfered using buffers of at
+    least contract.BUFSIZE bytes.
     '''
 
     # Find host,port from profiles.config
-    profile = ProfileConfig()
-    if host is None:
-        host = profile.get_config_val('matlab.host')
-    if port is None:
-        port = profile.get_config_val('matlab.port')
-    if bufsize is None:
-        bufsize = profile.get_config_val('matlab.bufsize')
+    if None in [host, port, bufsize]:
+        profile = ProfileConfig()
+        if host is None:
+            host = profile.get_config_val('matlab.host')
+        if port is None:
+            port = profile.get_config_val('matlab.port')
+        if bufsize is None:
+            bufsize = profile.get_config_val('matlab.bufsize')
 
     # Create a socket (SOCK_STREAM means a TCP socket)
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     return(sock, host, port, bufsize)
 
+class MatlabReply(object):
+    '''Reply to a request sent in a MatlabSession, read on demand.'''
+
+    def __init__(self, session, read):
+        self.session = session
+        self.read = read
+        self.done = False
+        self.value = None
+
+    def result(self):
+        '''Wait for and return the reply.'''
+        while not self.done:
+            self.session.read_reply()
+        return self.value
+
+class MatlabSession(object):
+    '''Persistent connection to the MATLAB server.
+
+    Parameters
+    ----------
+    host : str, optional
+        host/ip-address of server running MATLAB.
+    port : int, optional
+        port of host to connect to.
+    bufsize : int, optional
+        Number of bytes to buffer.
+    max_pending : int, optional
+        Most replies we let pile up before we start reading them.
+
+    Notes
+    -----
+    Requests are pipelined: with wait=False, run(), get(), and put()
+    send the request and return a MatlabReply right away, and replies
+    are read in order as they're needed.  Requests are buffered until
+    a reply is needed or flush() is called.  put() reads all
+    outstanding replies before sending variables, so a large reply
+    can't stall a large request.
+
+    Examples
+    --------
+    .. code-block:: python
+
+        with MatlabSession() as session:
+            session.put({'A': A}, wait=False)
+            replies = [
+                session.run('B%d = A*%d;' % (ii, ii), wait=False)
+                for ii in range(10)]
+            B = session.get(['B%d' % ii for ii in range(10)])
+    '''
+
+    def __init__(self, host=None, port=None, bufsize=None,
+                 max_pending=64):
+        self.sock, self.host, self.port, self.bufsize = get_socket(
+            host, port, bufsize)
+        self.sock.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.connect((self.host, self.port))
+        self.rfile = self.sock.makefile(
+            'rb', buffering=max(self.bufsize, BUFSIZE))
+        self.wfile = self.sock.makefile(
+            'wb', buffering=max(self.bufsize, BUFSIZE))
+        self.max_pending = max_pending
+        self.pending = deque()
+
+    def _request(self, lines, read, variables=None):
+        if len(self.pending) >= self.max_pending:
+            self.read_reply()
+
+        # The server won't read the body while it's still writing
+        # replies nobody is reading, so catch up on them first
+        if variables is not None:
+            while self.pending:
+                self.read_reply()
+        for line in lines:
+            self.wfile.write(('%s\n' % line).encode())
+        if variables is not None:
+            write_vars(self.wfile, variables)
+        reply = MatlabReply(self, read)
+        self.pending.append(reply)
+        return reply
+
+    def read_reply(self):
+        '''Read reply to the oldest request still waiting for one.'''
+        self.flush()
+        reply = self.pending.popleft()
+        reply.value = reply.read()
+        reply.done = True
+
+    def _read_output(self):
+        lines = []
+        for line in self.rfile:
+            line = line.decode().rstrip()
+            if done_token in line:
+                break
+            lines.append(line)
+        else:
+            raise EOFError(
+                'Connection closed before MATLAB finished!')
+        return '\n'.join(lines)
+
+    def flush(self):
+        '''Send all buffered requests.'''
+        self.wfile.flush()
+
+    def run(self, cmd, wait=True):
+        '''Run command in MATLAB, returns console output.'''
+        reply = self._request([RUN, cmd], self._read_output)
+        if wait:
+            return reply.result()
+        return reply
+
+    def get(self, varnames, wait=True):
+        '''Get variables from MATLAB workspace, returns dict.'''
+        varnames = list(varnames)
+
+        def _read():
+            data = read_vars(self.rfile)
+            if not set(varnames) <= set(data):
+                raise ValueError((
+                    'Was not able to read MATLAB workspace '
+                    'variables.'))
+            return {key: data[key] for key in varnames}
+
+        reply = self._request([GET, ' '.join(varnames)], _read)
+        if wait:
+            return reply.result()
+        return reply
+
+    def put(self, variables, wait=True):
+        '''Put variables into MATLAB workspace.'''
+        reply = self._request([PUT], self._read_output, variables)
+        if wait:
+            return reply.result()
+        return reply
+
+    def close(self):
+        '''Read outstanding replies and hang up.'''
+        try:
+            while self.pending:
+                self.read_reply()
+            self.flush()
+        finally:
+            self.rfile.close()
+            self.wfile.close()
+            self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
 def client_run(cmd, host=None, port=None, bufsize=None):
     '''Run command on MATLAB server.
 
@@ -87,27 +238,8 @@ def client_run(cmd, host=None, port=None, bufsize=None):
     profiles.config.
     '''
 
-    sock, host, port, bufsize = get_socket(host, port, bufsize)
-
-    # Connect to server and send data
-    received_all = b''
-    try:
-        sock.connect((host, port))
-        sock.sendall(('%s\n' % RUN).encode())
-        sock.sendall((cmd + '\n').encode())
-
-        # Receive data from the server and shut down
-        while True:
-            received = sock.recv(1024)
-            received_all += b'\n' + received
-            if done_token in received.decode():
-                # Remove done token from received_all
-                received_all = received_all[:-len(done_token)]
-                break
-    finally:
-        sock.close()
-
-    logging.info(received_all.decode())
+    with MatlabSession(host, port, bufsize) as session:
+        logging.info(session.run(cmd))
 
 def client_get(varnames, host=None, port=None, bufsize=None):
     '''Get variables from remote MATLAB workspace into python.
@@ -131,7 +263,7 @@ def client_get(varnames, host=None, port=None, bufsize=None):
     Raises
     ------
     ValueError
-        When transfered matlab workspace file cannot be read.
+        When not all variables could be read from MATLAB's workspace.
         When `varnames` is not a list type.
 
     Notes
@@ -146,39 +278,8 @@ def client_get(varnames, host=None, port=None, bufsize=None):
             raise ValueError(
                 'varnames should be a list of variable names!')
 
-    sock, host, port, bufsize = get_socket(host, port, bufsize)
-
-    # Connect to server and send data
-    try:
-        sock.connect((host, port))
-        # tell host what we want to do
-        sock.sendall(('%s\n' % GET).encode())
-        sock.sendall(('%d\n' % bufsize).encode()) # tell host bufsize
-
-        # make varnames a space separated list, then send
-        sock.sendall((' '.join(varnames) + '\n').encode())
-
-        # Get ready to recieve file
-        tmp_filename = NamedTemporaryFile().name
-        with open(tmp_filename, 'wb') as f:
-            done = False
-            while not done:
-                received = sock.recv(bufsize)
-                if bytes(done_token, 'utf-8') in received:
-                    received = received[:-len(done_token)]
-                    done = True
-                f.write(received)
-
-        # Now load transfered MAT file into memory
-        try:
-            data = load_mat(tmp_filename)
-            vals = {key: data[key] for key in varnames}
-        except:
-            raise ValueError(
-                'Was not able to read MATLAB workspace variables.')
-
-    finally:
-        sock.close()
+    with MatlabSession(host, port, bufsize) as session:
+        vals = session.get(varnames)
 
     logging.info('Received variables!')
     return vals
@@ -205,6 +306,7 @@ def client_put(varnames, host=None, port=None, bufsize=None):
     ------
     ValueError
         When `varnames` is not a dictionary object.
+        When a variable can't be represented as a numpy array.
 
     Notes
     -----
@@ -216,26 +318,7 @@ def client_put(varnames, host=None, port=None, bufsize=None):
         raise ValueError(
             'varnames should be a dictionary of python variables!')
 
-    sock, host, port, bufsize = get_socket(host, port, bufsize)
-
-    # Connect to server and send data
-    try:
-        sock.connect((host, port))
-        # tell host what we want to do
-        sock.sendall(('%s\n' % PUT).encode())
-        sock.sendall(('%d\n' % bufsize).encode()) # tell host bufsize
-
-        # Write the variables to mat file
-        tmp_filename = NamedTemporaryFile(suffix='.mat').name
-        savemat(tmp_filename, varnames)
-
-        # Send binary file over socket
-        with open(tmp_filename, 'rb') as f:
-            for chunk in iter(partial(f.read, bufsize), b''):
-                sock.send(chunk)
-        sock.send(done_token.encode())
-
-    finally:
-        sock.close()
+    with MatlabSession(host, port, bufsize) as session:
+        session.put(varnames)
 
     logging.info('Transfered variables!')
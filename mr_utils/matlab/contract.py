@@ -1,9 +1,115 @@
 '''Define communication tokens for communication with MATLAB server.
+
+Variables (GET and PUT) are sent as length-prefixed binary frames:
+
+    number of variables (uint32)
+    for each variable:
+        name length (uint16), name (utf-8)
+        dtype length (uint8), dtype (numpy dtype string, e.g., '<f8')
+        ndim (uint8), shape (ndim x uint64)
+        data (C order)
+
+The receiving end always knows how many bytes are coming, so arrays
+are read straight into place and nothing has to be scanned for a
+token.
 '''
 
+import struct
+
+import numpy as np
+
 done_token = '__mr_utils_done__'
 
 # client modes:
 RUN = 'RUN'
 GET = 'GET'
 PUT = 'PUT'
+
+# Buffer size for socket files, payloads larger than this bypass the
+# buffer
+BUFSIZE = 2**20
+
+NVARS = struct.Struct('<I')
+NAME_LEN = struct.Struct('<H')
+DTYPE_LEN = struct.Struct('<B')
+NDIM = struct.Struct('<B')
+
+def write_vars(f, variables):
+    '''Write variables to a binary file-like object.
+
+    Parameters
+    ==========
+    f : file-like
+        Binary stream to write to, e.g., socket.makefile('wb').
+    variables : dict
+        Names and values of variables to send.
+
+    Raises
+    ======
+    ValueError
+        When a value can't be represented as a plain numpy array.
+    '''
+
+    f.write(NVARS.pack(len(variables)))
+    for name, val in variables.items():
+        val = np.asarray(val, order='C')
+        if val.dtype.hasobject:
+            raise ValueError((
+                '%s cannot be sent, object arrays are not '
+                'supported!') % name)
+        name = name.encode('utf-8')
+        dtype = val.dtype.str.encode('utf-8')
+        f.write(NAME_LEN.pack(len(name)) + name)
+        f.write(DTYPE_LEN.pack(len(dtype)) + dtype)
+        f.write(NDIM.pack(val.ndim) + struct.pack(
+            '<%dQ' % val.ndim, *val.shape))
+        if val.nbytes:
+            f.write(val.reshape(-1).view(np.uint8))
+    f.flush()
+
+def read_into(f, buf):
+    '''Fill buf from binary file-like object f.'''
+
+    view = memoryview(buf)
+    if view.nbytes == 0:
+        return buf
+    view = view.cast('B')
+    count = 0
+    while count < view.nbytes:
+        nbytes = f.readinto(view[count:])
+        if not nbytes:
+            raise EOFError('Connection closed during transfer!')
+        count += nbytes
+    return buf
+
+def read_exactly(f, nbytes):
+    '''Read exactly nbytes from binary file-like object f.'''
+    return bytes(read_into(f, bytearray(nbytes)))
+
+def read_vars(f):
+    '''Read variables written by write_vars from a binary file object.
+
+    Parameters
+    ==========
+    f : file-like
+        Binary stream to read from, e.g., socket.makefile('rb').
+
+    Returns
+    =======
+    variables : dict
+        Names and values of variables received.
+    '''
+
+    variables = {}
+    nvars = NVARS.unpack(read_exactly(f, NVARS.size))[0]
+    for _ii in range(nvars):
+        nbytes = NAME_LEN.unpack(read_exactly(f, NAME_LEN.size))[0]
+        name = read_exactly(f, nbytes).decode('utf-8')
+        nbytes = DTYPE_LEN.unpack(read_exactly(f, DTYPE_LEN.size))[0]
+        dtype = np.dtype(read_exactly(f, nbytes).decode('utf-8'))
+        ndim = NDIM.unpack(read_exactly(f, NDIM.size))[0]
+        shape = struct.unpack('<%dQ' % ndim, read_exactly(f, 8*ndim))
+        val = np.empty(shape, dtype=dtype)
+        read_into(f, val.reshape(-1).view(np.uint8))
+        variables[name] = val
+    return variables
@@ -4,14 +4,19 @@ Must be running for client to be able to connect.  Obviously, alongside this
 server, MATLAB should also be running.
 '''
 
+import os
 import socketserver
 from subprocess import Popen, PIPE
 from tempfile import NamedTemporaryFile
 import logging
-from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+
+from scipy.io import savemat
 
 from mr_utils.config import ProfileConfig
-from mr_utils.matlab.contract import done_token, RUN, GET, PUT
+from mr_utils.matlab.contract import (
+    done_token, RUN, GET, PUT, BUFSIZE, write_vars, read_vars)
+from mr_utils.load_data import load_mat
 
 logging.basicConfig(format='%(levelname)s: %(message)s', level=logging.DEBUG)
 
@@ -24,17 +29,24 @@ class MATLAB(object):
         Sequence of symbols to let us know MATLAB is done communicating.
     process : subprocess
         Process that runs MATLAB and stays open.
+
+    Parameters
+    ==========
+    cmd : str or list, optional
+        Command that starts MATLAB (e.g., stub.stub_cmd() for
+        testing).
     '''
 
-    def __init__(self):
+    def __init__(self, cmd='matlab -nodesktop -nosplash'):
 
         # When we run a command we need to know when we're done...
         self.done_token = done_token
 
         # start instance of matlab of host
-        cmd = 'matlab -nodesktop -nosplash'
+        if isinstance(cmd, str):
+            cmd = cmd.split()
         self.process = Popen(
-            cmd.split(),
+            cmd,
             stdin=PIPE, stdout=PIPE, bufsize=1, universal_newlines=True)
         self.process.stdin.write("fprintf('%s\\n')\n" % self.done_token)
 
@@ -151,64 +163,118 @@ class MyTCPHandler(socketserver.StreamRequestHandler):
         The command to be run in the MATLAB console.
     rfile : stream
         Stream from TCP socket that we are reading from.
+
+    Notes
+    =====
+    Variables are sent and received as binary frames (see contract),
+    only MATLAB itself sees a MAT file.  Requests are handled until
+    the client hangs up, so a client can keep the connection open and
+    send many.
     '''
 
+    rbufsize = BUFSIZE
+    wbufsize = BUFSIZE
+    disable_nagle_algorithm = True
+
     def handle(self):
 
         # Incoming connection...
         logging.info('%s connected', self.client_address[0])
 
         # See what they want to do
-        self.what = self.rfile.readline().strip().decode()
-        if self.what == RUN:
-
-            # The command will be coming next
-            self.cmd = self.rfile.readline().strip()
-            # logging.info('cmd issued: %s' % self.cmd.decode())
-            self.server.matlab.run(
-                self.cmd.decode(),
-                log_func=lambda x: self.wfile.write(x.encode()))
-
-        elif self.what == GET:
-
-            # Client will say what the bufsize is:
-            bufsize = int(self.rfile.readline().strip().decode())
-            logging.info('bufsize for %s is %d', GET, bufsize)
-
-            # The list of varnames to get from the workspace will be next
-            varnames = self.rfile.readline().strip().decode()
-            tmp_filename = self.server.matlab.get(varnames.split())
-
-            # Send binary file over socket
-            with open(tmp_filename, 'rb') as f:
-                for chunk in iter(partial(f.read, bufsize), b''):
-                    self.wfile.write(chunk)
-            self.wfile.write(done_token.encode())
-
-        elif self.what == PUT:
-
-            # Client will say what the bufsize is:
-            bufsize = int(self.rfile.readline().strip().decode())
-            logging.info('bufsize for %s is %d', PUT, bufsize)
-
-            # Get ready to recieve file
-            tmp_filename = NamedTemporaryFile().name
-            with open(tmp_filename, 'wb') as f:
-                done = False
-                while not done:
-                    received = self.rfile.read(bufsize)
-                    if bytes(done_token, 'utf-8') in received:
-                        received = received[:-len(done_token)]
-                        done = True
-                    f.write(received)
-
-            self.server.matlab.put(tmp_filename)
+        while True:
+            self.what = self.rfile.readline()
+            if not self.what:
+                break
+            self.what = self.what.strip().decode()
+            if self.what == RUN:
+
+                # The command will be coming next
+                self.cmd = self.rfile.readline().strip()
+                # logging.info('cmd issued: %s' % self.cmd.decode())
+                self.call(self.server.matlab.run, self.cmd.decode(),
+                          log_func=self.log_func)
+
+            elif self.what == GET:
+
+                # The list of varnames to get from the workspace will
+                # be next
+                varnames = self.rfile.readline().strip().decode(
+                    ).split()
+                tmp_filename = self.call(
+                    self.server.matlab.get, varnames)
+                data = load_mat(tmp_filename)
+                os.remove(tmp_filename)
+
+                # Send the ones we found back
+                write_vars(self.wfile, {
+                    key: data[key] for key in varnames
+                    if key in data})
+
+            elif self.what == PUT:
+
+                # Variables come in as binary frames, MATLAB wants a
+                # MAT file
+                variables = read_vars(self.rfile)
+                tmp_filename = NamedTemporaryFile(suffix='.mat').name
+                savemat(tmp_filename, variables)
+                self.call(self.server.matlab.put, tmp_filename)
+                os.remove(tmp_filename)
+
+                # Let the client know the variables are in the
+                # workspace
+                self.log_func(done_token)
+
+            else:
+                msg = 'Not quite sure what you want me to do, \
+                    %s is not a valid identifier.' % self.what
+                self.wfile.write(msg.encode())
+                logging.info(msg)
+
+                # No telling where the next request starts
+                break
 
-        else:
-            msg = 'Not quite sure what you want me to do, \
-                %s is not a valid identifier.' % self.what
-            self.wfile.write(msg.encode())
-            logging.info(msg)
+        logging.info('%s disconnected', self.client_address[0])
+
+    def call(self, fun, *args, **kwargs):
+        '''Run fun on the server's MATLAB queue if it has one.'''
+        executor = getattr(self.server, 'executor', None)
+        if executor is None:
+            return fun(*args, **kwargs)
+        return executor.submit(fun, *args, **kwargs).result()
+
+    def log_func(self, line):
+        '''Send MATLAB console output to the client as it comes.'''
+        self.wfile.write(('%s\n' % line).encode())
+        self.wfile.flush()
+
+class MATLABServer(socketserver.ThreadingTCPServer):
+    '''Threaded server sharing one MATLAB instance.
+
+    Parameters
+    ==========
+    server_address : tuple
+        (host, port) to listen on.
+    matlab : MATLAB
+        MATLAB instance (or anything with run, get, and put methods).
+
+    Notes
+    =====
+    Every client connection gets its own thread, but there's only one
+    MATLAB, so requests are queued and run one at a time.
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, server_address, matlab, handler=MyTCPHandler):
+        super().__init__(server_address, handler)
+        self.matlab = matlab
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown()
 
 def start_server():
     '''Start the server so the client can connect.
@@ -235,8 +301,7 @@ def start_server():
     # Start an instance of MATLAB
     try:
         matlab = MATLAB()
-        server = socketserver.TCPServer((host, port), MyTCPHandler)
-        server.matlab = matlab
+        server = MATLABServer((host, port), matlab)
 
         # Activate the server; this will keep running until you
         # interrupt the program with Ctrl-C
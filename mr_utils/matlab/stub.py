@@ -0,0 +1,85 @@
+'''Stand-in for the MATLAB console, for testing and benchmarking.
+
+Reads commands from stdin like `matlab -nodesktop` would and
+understands just enough of them for the server: fprintf, save, load,
+clear, exit, and simple `name = expression` statements (evaluated with
+numpy).  Run it instead of MATLAB with:
+
+    matlab = MATLAB(cmd=stub_cmd())
+'''
+
+import os
+import re
+import sys
+
+import numpy as np
+from scipy.io import savemat, loadmat
+
+def stub_cmd():
+    '''Command that starts the stub MATLAB process.'''
+    return [sys.executable, os.path.abspath(__file__)]
+
+def run_statement(stmt, workspace):
+    '''Run a single statement, return output for the console.'''
+
+    stmt = stmt.strip()
+    if not stmt:
+        return None
+
+    m = re.match(r"fprintf\('(.*)'\)$", stmt)
+    if m:
+        return m.group(1).replace('\\n', '')
+
+    m = re.match(r"save\('([^']*)'(.*)\)$", stmt)
+    if m:
+        varnames = re.findall(r"'(\w+)'", m.group(2))
+        savemat(m.group(1), {
+            key: workspace[key] for key in varnames
+            if key in workspace})
+        return None
+
+    m = re.match(r"load\('([^']*)'.*\)$", stmt)
+    if m:
+        workspace.update({
+            key: val for key, val in loadmat(m.group(1)).items()
+            if not key.startswith('__')})
+        return None
+
+    if stmt == 'clear':
+        workspace.clear()
+        return None
+
+    m = re.match(r'(\w+)\s*=\s*(.+)$', stmt)
+    if m:
+        try:
+            workspace[m.group(1)] = np.atleast_2d(
+                eval(m.group(2), {'np': np}, workspace))
+        except Exception as e:
+            return 'Error: %s' % e
+        return None
+
+    return "Undefined function or variable '%s'." % stmt
+
+def main():
+    '''Read-eval-print until stdin closes or we're told to exit.'''
+
+    workspace = {}
+    for line in sys.stdin:
+        line = line.strip()
+        if line == 'exit':
+            break
+
+        # Console commands (fprintf, save, load) take up the whole
+        # line, anything else might be a few statements separated by
+        # semicolons
+        if re.match(r'(fprintf|save|load)\(', line):
+            stmts = [line]
+        else:
+            stmts = line.split(';')
+        for stmt in stmts:
+            out = run_statement(stmt, workspace)
+            if out is not None:
+                print(out, flush=True)
+
+if __name__ == '__main__':
+    main()
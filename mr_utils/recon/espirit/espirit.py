@@ -4,9 +4,11 @@ import numpy as np
 import scipy
 import scipy.signal as ss
 
+from mr_utils.utils.fft_backend import CenteredFFT
+
 def hamming2d( a, b ):
     # build 2d window
-    w2d = np.outer(ss.hamming(a), ss.hamming(b))
+    w2d = np.outer(ss.windows.hamming(a), ss.windows.hamming(b))
     return np.sqrt(w2d)
 
 # the first half dimentions are window dimentions,
@@ -31,29 +33,111 @@ def hankelnd_r( a, win_shape, win_strides = None ):
     return np.lib.stride_tricks.as_strided(a, shape=bh_shape, strides=bh_strides)
 
 
+def padnd( data, shape ):
+    '''
+    zero pad the first len(shape) dimentions of data, keeping the
+    center
+    '''
+
+    datsize = data.shape
+    ndata = np.zeros(
+        tuple(shape) + datsize[len(shape):], dtype = data.dtype)
+    idx = tuple(
+        slice(int(n/2) - int(d/2), int(n/2) - int(d/2) + d)
+        for n, d in zip(shape, datsize))
+    ndata[idx] = data
+    return ndata
+
 def pad2d( data, nx, ny ):
     '''
     zero pad the 2d k-space in kx and ky dimentions
     '''
+    return padnd(data, (nx, ny))
 
-    #create undersampling mask
-    datsize    = data.shape
-    padsize    = np.array(datsize)
-    padsize[0] = nx
-    padsize[1] = ny
-    ndata = np.zeros(tuple(padsize),dtype = data.dtype)
-
-    # center k-space index range
-    datrx = np.int(datsize[0]/2)
-    datry = np.int(datsize[1]/2)
-    cx = np.int(nx/2)
-    cy = np.int(ny/2)
-    cxr = np.arange(round(cx-datrx),round(cx-datrx+datsize[0]))
-    cyr = np.arange(round(cy-datry),round(cy-datry+datsize[1]))
-    # print(cxr,cyr)
-    # print(map(int,cxr))
-    ndata[np.ix_(list(map(int,cxr)),list(map(int,cyr)))] = data
-    return ndata
+def hammingnd( shape ):
+    # build nd window, like hamming2d for any number of dimentions
+    w = np.ones(())
+    for n in shape:
+        w = np.multiply.outer(w, ss.windows.hamming(n))
+    return np.sqrt(w)
+
+def randomized_svd( A, k, n_oversamples = 10, n_iter = 4,
+                    random_state = None ):
+    '''
+    truncated svd of (complex) A using a randomized range finder, see
+    Halko, Martinsson, Tropp, SIAM Review 53(2), 2011
+
+    returns U, s, V like np.linalg.svd(A, full_matrices=False), but
+    only the k largest singular values/vectors
+    '''
+
+    rng = np.random.RandomState(random_state)
+    k = min(k, *A.shape)
+    l = min(k + n_oversamples, *A.shape)
+    omega = rng.standard_normal((A.shape[1], l))
+    if np.iscomplexobj(A):
+        omega = omega + 1j*rng.standard_normal((A.shape[1], l))
+
+    # power iterations sharpen the spectrum, qr keeps them stable
+    Q, _ = np.linalg.qr(A.dot(omega))
+    for _ii in range(n_iter):
+        Q, _ = np.linalg.qr(A.conj().T.dot(Q))
+        Q, _ = np.linalg.qr(A.dot(Q))
+    U, s, V = np.linalg.svd(Q.conj().T.dot(A), full_matrices=False)
+    return Q.dot(U[:, :k]), s[:k], V[:k, :]
+
+def dominant_eig( vpix, method = 'eigh', niter = 30,
+                  chunk_size = 2**14 ):
+    '''
+    largest eigenvalue and eigenvector of vvH = vpix.T vpix^* at every
+    pixel
+
+    vpix is (..., nsingularv, ncoil), the per-pixel matrix of
+    espirit.  All pixels are decomposed at once with a batched
+    np.linalg.eigh, or with method = 'power' a batched power iteration
+    finds just the dominant eigenvector.  Pixels are done chunk_size
+    at a time to bound memory.  Eigenvectors are rotated so the first
+    coil has zero phase.
+
+    returns s (...) and V (..., ncoil)
+    '''
+
+    if method not in ('eigh', 'power'):
+        raise ValueError('method must be "eigh" or "power"!')
+
+    shape = vpix.shape[:-2]
+    nc = vpix.shape[-1]
+    vpix = vpix.reshape((-1,) + vpix.shape[-2:])
+    s = np.zeros(vpix.shape[0])
+    V = np.zeros((vpix.shape[0], nc), dtype = np.complex128)
+    for start in range(0, vpix.shape[0], chunk_size):
+        idx = slice(start, start + chunk_size)
+        vvH = np.matmul(
+            vpix[idx].transpose((0, 2, 1)), vpix[idx].conj())
+        if method == 'eigh':
+            w, U = np.linalg.eigh(vvH)
+            s[idx] = w[:, -1]
+            V[idx] = U[:, :, -1]
+        else:
+            # start from the column with the most energy
+            diag = np.real(np.diagonal(vvH, axis1 = 1, axis2 = 2))
+            v = vvH[np.arange(vvH.shape[0]), :,
+                    np.argmax(diag, axis = 1)]
+            for _ii in range(niter):
+                v = v/(1e-30 + np.linalg.norm(
+                    v, axis = 1, keepdims = True))
+                v = np.matmul(vvH, v[..., None])[..., 0]
+            v = v/(1e-30 + np.linalg.norm(
+                v, axis = 1, keepdims = True))
+            Av = np.matmul(vvH, v[..., None])[..., 0]
+            s[idx] = np.real(np.sum(v.conj()*Av, axis = 1))
+            V[idx] = v
+
+    # eigenvectors are only defined up to a phase, make the first coil
+    # real so maps are smooth and can be interpolated
+    ph = V[:, 0]/(1e-30 + np.abs(V[:, 0]))
+    V *= np.where(np.abs(V[:, 0]) > 0, ph.conj(), 1)[:, None]
+    return s.reshape(shape), V.reshape(shape + (nc,))
 
 class FFT2d:
     '''
@@ -69,22 +153,19 @@ class FFT2d:
     def __init__( self, axes = (0,1)):
         #self.mask = mask #save the k-space mask
         self.axes = axes
+        # shifts are done by phase modulation, see CenteredFFT
+        self._forward = CenteredFFT(axes, 'fftshift', 'ifftshift')
+        self._backward = CenteredFFT(
+            axes, 'fftshift', 'ifftshift', inverse = True)
     # let's call k-space <- image as forward
     def forward( self, im ):
-        im = np.fft.fftshift(im,self.axes)
-        ksp = np.fft.fft2(im,s=None,axes=self.axes)
-        ksp = np.fft.ifftshift(ksp,self.axes)
-        return ksp
+        return self._forward(im)
 
     # let's call image <- k-space as backward
     def backward( self, ksp ):
-        ksp = np.fft.fftshift(ksp,self.axes)
-        #im = np.fft.ifft2(ksp,s=None,axes=(0,1))#noted that numpy.fft by default applies to last two dims
-        im = np.fft.ifft2(ksp,s=None,axes=self.axes)
-        im = np.fft.ifftshift(im,self.axes)
-        return im
+        return self._backward(ksp)
 
-def espirit_2d(
+def espirit_nd(
         xcrop,
         x_shape,
         nsingularv=150,
@@ -92,102 +173,157 @@ def espirit_2d(
         pad_before_espirit=0,
         pad_fact=1,
         sigv_th=0.01,
-        nsigv_th=0.2):
+        nsigv_th=0.2,
+        svd='full',
+        eig='eigh',
+        random_state=None,
+        chunk_size=2**24):
     '''
-    2d espirit
+    nd espirit, the number of spatial dimentions is len(hkwin_shape)
 
     Inputs
-    xcrop is 3d matrix with first two dimentions as nx,ny and third one as coil
-    nsingularv = 150, number of truncated singular vectors
+    xcrop is matrix with the first len(hkwin_shape) dimentions spatial
+    and the last one as coil
+    nsingularv = 150, number of truncated singular vectors, the rank
+    of the randomized svd
+    svd = 'full' or 'randomized' decomposition of the calibration
+    matrix
+    eig = 'eigh' or 'power', see dominant_eig()
+    chunk_size, number of image space singular vector samples held at
+    once
 
     outputs
     Vim the sensitivity map
     sim the singular value map
     '''
 
-    ft = FFT2d()#2d fft operator
-    # ft = FFTW2d()#2d fft operator
-    #timing = utc.timing()
+    ndim = len(hkwin_shape)
+    ft = FFT2d(axes = tuple(range(ndim)))#nd fft operator
     #multidimention tensor as the block hankel matrix
-    #first 2 are x, y dims with rolling window size of hkwin_shape
+    #first ndim are spatial dims with rolling window of hkwin_shape
     #last 1 is coil dimension, with stride of 1
-    #timing.start()
-    h = hankelnd_r(xcrop, (hkwin_shape[0], hkwin_shape[1], 1))
-    #timing.stop().display('Create Hankel ').start()
+    h = hankelnd_r(xcrop, tuple(hkwin_shape) + (1,))
     dimh = h.shape
-    #flatten the tensor to create a matrix= [flatten(fist3 dims), flatten(last3 dims)]
-    #the second dim of hmtx contain coil information, i.e. dimh[2]=1, dimh[5]=N_coils
-    hmtx = h.reshape(( dimh[0]* dimh[1]* dimh[2], dimh[3], dimh[4], dimh[5])).\
-             reshape(( dimh[0]* dimh[1]* dimh[2], dimh[3]* dimh[4]* dimh[5]))
-    #timing.stop().display('Reshape Hankel ').start()
-    #svd, could try other approaches
+    #flatten the tensor to create a matrix=
+    #[flatten(first half dims), flatten(last half dims)]
+    #the second dim of hmtx contain coil information, dimh[-1]=N_coils
+    hmtx = h.reshape(
+        (int(np.prod(dimh[:ndim+1])), int(np.prod(dimh[ndim+1:]))))
     # V has the coil information since the second dim of hmtx has coil data
-    U, s, V = np.linalg.svd(hmtx, full_matrices=False)
-    #U, s, V = scipy.sparse.linalg.svds(hmtx, nsingularv )
-    #U, s, V = scipy.sparse.linalg.svds(hmtx, nsingularv )
-    #timing.stop().display('SVD ')
-    for k in range(len(s)):
-        # if s[k] > s[0]*nsing_th:
-        if s[k] > s[0]*nsigv_th:
-            nsingularv = k
+    if svd == 'full':
+        U, s, V = np.linalg.svd(hmtx, full_matrices=False)
+    elif svd == 'randomized':
+        U, s, V = randomized_svd(
+            hmtx, nsingularv, random_state=random_state)
+    else:
+        raise ValueError('svd must be "full" or "randomized"!')
+    nsingularv = np.nonzero(s > s[0]*nsigv_th)[0][-1]
     print('exctract %g out of %g singular vectors:' % (nsingularv, len(s)))
-    #S = np.diag(s)
-    #ut.plotim1(np.absolute(V[:,0:150]).T)#plot V singular vectors
-    #ut.plot(s)#plot singular values
-    #invh = np.zeros(x.shape,complex)
-    #print h.shape
-    #hk.invhankelnd(h,invh,(2,3,1))
 
     #reshape vn to generate k-space vn tensor
-    vn = V[0:nsingularv,:].reshape((nsingularv,dimh[3],dimh[4],dimh[5])).transpose((1,2,0,3))
+    #dims of vn: kernel dims,nsingularv,ncoil
+    vn = np.moveaxis(V[0:nsingularv,:].reshape(
+        (nsingularv,) + dimh[ndim+1:]), 0, -2)
 
-    #zero pad vn, vn matrix of reshaped singular vectors,
-    #dims of vn: nx,ny,nsingularv,ncoil
-    #nx = x_shape[0]
-    #ny = x_shape[1]
     # do pading before espirit
-    if pad_before_espirit is 0:
-        nx = min(pad_fact * xcrop.shape[0], x_shape[0])
-        ny = min(pad_fact * xcrop.shape[1], x_shape[1])
+    if pad_before_espirit == 0:
+        nxyz = [min(pad_fact * xcrop.shape[ii], x_shape[ii])
+                for ii in range(ndim)]
     else:
-        nx = x_shape[0]
-        ny = x_shape[1]
+        nxyz = x_shape[:ndim]
     # coil dim
-    nc   = x_shape[2]
+    nc   = x_shape[-1]
     # filter
-    hwin = hamming2d(vn.shape[0],vn.shape[1])
+    hwin = hammingnd(vn.shape[:ndim])
     # apply hamming window
-    vn   = np.multiply(vn, hwin[:,:,np.newaxis,np.newaxis])
-    vn   = pad2d(vn,nx,ny)
-    #plot first singular vecctor Vn[0]
-    imvn = ft.backward(vn)
-    #ut.plotim3(np.absolute(imvn[:,:,0,:].squeeze()))#spatial feature of V[:,1] singular vector
-    sim  = np.zeros((nx,ny), dtype = np.complex128)
-    Vim  = np.zeros((nx,ny,nc), dtype = np.complex128)
-    for ix in range(nx):
-        for iy in range(ny):
-            vpix         = imvn[ix,iy,:,:].squeeze()
-            vpix         = np.matrix(vpix).transpose()
-            vvH          = vpix.dot(vpix.getH())
-            U, s, V      = np.linalg.svd(vvH, full_matrices=False)
-            sim[ix,iy]   = s[0]
-            Vim[ix,iy,:] = V[0,:].squeeze()
-
-
-    Vim = np.conj(Vim)
-    if pad_before_espirit is 0:
-        Vim = ft.backward(pad2d(ft.forward(Vim),x_shape[0],x_shape[1]))
-        sim = ft.backward(pad2d(ft.forward(sim),x_shape[0],x_shape[1]))
-    #plot first eigen vector, eigen value
-    #ut.plotim3(np.absolute(Vim))
-    #ut.plotim1(np.absolute(sim))
-    #Vim_dims_name = ['x', 'y', 'coil']
-    #sim_dims_name = ['x', 'y']
-    Vimnorm = np.linalg.norm(Vim, axis = 2)
-    Vim = np.divide(Vim, 1e-6 + Vimnorm[:,:,np.newaxis])
+    vn   = np.multiply(vn, hwin[..., np.newaxis, np.newaxis])
+
+    # zero padding then ifft is a small dft matrix along each
+    # dimention, so images of the singular vectors are made a block of
+    # rows at a time
+    # instead of holding all of them at full resolution
+    F = [FFT2d(axes = (0,)).backward(padnd(np.eye(k), (n,)))
+         for k, n in zip(vn.shape[:ndim], nxyz)]
+    nrows = max(1, chunk_size//(
+        int(np.prod(nxyz[1:]))*vn.shape[-2]*vn.shape[-1]))
+    sim = np.zeros(nxyz, dtype = np.complex128)
+    Vim = np.zeros(tuple(nxyz) + (nc,), dtype = np.complex128)
+    for start in range(0, nxyz[0], nrows):
+        idx = slice(start, start + nrows)
+        imvn = vn
+        for ii, Fii in enumerate(F):
+            Fii = Fii[idx] if ii == 0 else Fii
+            imvn = np.moveaxis(
+                np.tensordot(Fii, imvn, axes = (1, ii)), 0, ii)
+        # dominant eigenvector of vvH for all pixels of the block at
+        # once
+        sim[idx], Vim[idx] = dominant_eig(imvn, method = eig)
+
+    if pad_before_espirit == 0:
+        Vim = ft.backward(padnd(ft.forward(Vim),x_shape[:ndim]))
+        sim = ft.backward(padnd(ft.forward(sim),x_shape[:ndim]))
+    Vimnorm = np.linalg.norm(Vim, axis = -1)
+    Vim = np.divide(Vim, 1e-6 + Vimnorm[..., np.newaxis])
     sim = sim/np.max(sim.flatten())
-    for ix in range(x_shape[0]):
-        for iy in range(x_shape[1]):
-                if sim[ix,iy] < sigv_th:
-                    Vim[ix,iy,:] = np.zeros(nc)
-    return Vim, np.absolute(sim) #, Vim_dims_name, sim_dims_name
+    Vim[sim < sigv_th] = np.zeros(nc)
+    return Vim, np.absolute(sim)
+
+def espirit_2d(
+        xcrop,
+        x_shape,
+        nsingularv=150,
+        hkwin_shape=(16,16),
+        pad_before_espirit=0,
+        pad_fact=1,
+        sigv_th=0.01,
+        nsigv_th=0.2,
+        svd='full',
+        eig='eigh',
+        random_state=None):
+    '''
+    2d espirit
+
+    Inputs
+    xcrop is 3d matrix with first two dimentions as nx,ny and third
+    one as coil
+    nsingularv = 150, number of truncated singular vectors
+
+    outputs
+    Vim the sensitivity map
+    sim the singular value map
+
+    see espirit_nd() for svd and eig
+    '''
+    return espirit_nd(
+        xcrop, x_shape, nsingularv, hkwin_shape, pad_before_espirit,
+        pad_fact, sigv_th, nsigv_th, svd, eig, random_state)
+
+def espirit_3d(
+        xcrop,
+        x_shape,
+        nsingularv=150,
+        hkwin_shape=(16,16,16),
+        pad_before_espirit=0,
+        pad_fact=1,
+        sigv_th=0.01,
+        nsigv_th=0.2,
+        svd='randomized',
+        eig='eigh',
+        random_state=None):
+    '''
+    3d espirit
+
+    Inputs
+    xcrop is 4d matrix with first three dimentions as nx,ny,nz and
+    fourth one as coil
+    nsingularv = 150, number of truncated singular vectors
+
+    outputs
+    Vim the sensitivity map
+    sim the singular value map
+
+    see espirit_nd() for svd and eig
+    '''
+    return espirit_nd(
+        xcrop, x_shape, nsingularv, hkwin_shape, pad_before_espirit,
+        pad_fact, sigv_th, nsigv_th, svd, eig, random_state)
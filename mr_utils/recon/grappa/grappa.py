@@ -4,6 +4,7 @@ Please use Gadgetron's implementation if you need to use GRAPPA for real.
 '''
 
 import warnings # We know skimage will complain about importing imp...
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 with warnings.catch_warnings():
@@ -86,6 +87,220 @@ def grappa2d(coil_ims, sens, acs, Rx, Ry, kernel_size=(3, 3)):
         kspace_d), axes=(1, 2)))
     return recon
 
+def _sampling_patterns(mask, kernel_size):
+    '''Find the kernel geometry around every unsampled point.
+
+    Parameters
+    ==========
+    mask : array_like
+        Boolean sampling pattern.
+    kernel_size : tuple
+        Size of kernel, one odd entry for each dimension of mask.
+
+    Returns
+    =======
+    missing : array_like
+        Coordinates of unsampled points, (npts, mask.ndim).
+    patterns : array_like
+        Unique kernel geometries, (npatterns, prod(kernel_size))
+        boolean, True where a neighbor was sampled.
+    inverse : array_like
+        Index into patterns for each unsampled point.
+    '''
+
+    # Pack sampled neighbors into bits so every point has a short code
+    half = [k//2 for k in kernel_size]
+    mask_pad = np.pad(mask, [(h, h) for h in half], mode='constant')
+    K = int(np.prod(kernel_size))
+    codes = np.zeros(mask.shape + ((K + 7)//8,), dtype=np.uint8)
+    for k, offset in enumerate(np.ndindex(*kernel_size)):
+        sl = tuple(
+            slice(o, o + n) for o, n in zip(offset, mask.shape))
+        codes[..., k//8] |= mask_pad[sl].astype(np.uint8) << (k % 8)
+
+    missing = np.argwhere(~mask)
+    patterns, inverse = np.unique(
+        codes[~mask], axis=0, return_inverse=True)
+    patterns = np.unpackbits(
+        patterns, axis=1, bitorder='little')[:, :K].astype(bool)
+    return(missing, patterns, inverse.reshape(-1))
+
+def _calib_gram(calib, kernel_size):
+    '''Gram matrix of all kernel-sized patches of calibration data.
+
+    Rows of the full source matrix are patches (all coils, all kernel
+    points), so any source/target submatrix product is a block of
+    this.
+    '''
+    nc = calib.shape[0]
+    K = int(np.prod(kernel_size))
+    windows = view_as_windows(
+        np.ascontiguousarray(calib), (nc,) + tuple(kernel_size))[0]
+    G = np.zeros((nc*K, nc*K), dtype=np.result_type(calib, 1j))
+    for ii in range(windows.shape[0]):
+        A = windows[ii].reshape((-1, nc*K))
+        G += np.dot(A.conj().T, A)
+    return G
+
+def _grappa_weights(G, pattern, nc, lamda):
+    '''Solve Tikhonov-regularized normal equations for one geometry.
+
+    Parameters
+    ==========
+    G : array_like
+        Gram matrix from _calib_gram().
+    pattern : array_like
+        Boolean kernel geometry, True where source points are.
+    nc : int
+        Number of coils.
+    lamda : float
+        Regularization, relative to the scale of the normal equations.
+
+    Returns
+    =======
+    W : array_like
+        Weights, (nc*sources, nc), mapping sources to the kernel
+        center.
+    '''
+    K = pattern.size
+    src = (np.arange(nc)[:, None]*K
+           + np.nonzero(pattern)[0]).reshape(-1)
+    trg = np.arange(nc)*K + K//2
+    ShS = G[np.ix_(src, src)]
+    ShT = G[np.ix_(src, trg)]
+    lamda0 = lamda*np.linalg.norm(ShS)/ShS.shape[0]
+    if lamda0 == 0:
+        # Nothing to calibrate from
+        return np.zeros(ShT.shape, dtype=ShT.dtype)
+    return np.linalg.solve(ShS + lamda0*np.eye(src.size), ShT)
+
+def grappa(kspace, calib, kernel_size=(5, 5), lamda=0.01, mask=None,
+           n_jobs=1):
+    '''GRAPPA for arbitrary kernels and sampling patterns in 2D or 3D.
+
+    Parameters
+    ==========
+    kspace : array_like
+        Undersampled k-space, (..., coil, kx, ky[, kz]), zeros where
+        not sampled.  Leading dimensions are slices/frames sharing a
+        sampling pattern.
+    calib : array_like
+        Fully sampled calibration region, (coil, cx, cy[, cz]) to use
+        for all slices or (..., coil, cx, cy[, cz]) for each slice.
+    kernel_size : tuple, optional
+        Size of kernel in k-space points, one odd entry for each
+        spatial dimension.  Should span the undersampling, e.g.,
+        (5, 2*R + 1).
+    lamda : float, optional
+        Tikhonov regularization for kernel calibration.
+    mask : array_like, optional
+        Boolean sampling pattern, (kx, ky[, kz]).  Nonzero points of
+        kspace by default.
+    n_jobs : int, optional
+        Number of threads to reconstruct slices with.
+
+    Returns
+    =======
+    recon : array_like
+        k-space with unsampled points filled in.
+
+    Raises
+    ======
+    ValueError
+        If kernel_size is not odd.
+
+    Notes
+    =====
+    Every unsampled point is filled from the sampled points inside the
+    kernel centered on it.  Points are grouped by which neighbors are
+    sampled, so any acceleration geometry works, including CAIPI
+    patterns.  Weights are calibrated once for each group.  The Gram
+    matrix of all calibration patches is formed once, and each group's
+    normal equations are a block of it.  Weights are then applied to
+    all slices and points of a group with a single batched matrix
+    product.
+    '''
+
+    kernel_size = tuple(kernel_size)
+    if any(k % 2 == 0 for k in kernel_size):
+        raise ValueError('kernel_size must be odd!')
+    ndim = len(kernel_size)
+    spatial = kspace.shape[-ndim:]
+    nc = kspace.shape[-ndim-1]
+    orig_shape = kspace.shape
+    kspace = kspace.reshape((-1, nc) + spatial)
+    shared = calib.ndim == ndim + 1
+    calib = calib.reshape((-1, nc) + calib.shape[-ndim:])
+
+    if mask is None:
+        mask = np.abs(kspace).sum(axis=(0, 1)) > 0
+    missing, patterns, inverse = _sampling_patterns(mask, kernel_size)
+
+    # Source and destination indices of each group of missing points
+    half = [k//2 for k in kernel_size]
+    padded = tuple(n + 2*h for n, h in zip(spatial, half))
+    groups = []
+    for ii, pattern in enumerate(patterns):
+        coords = missing[inverse == ii]
+        offsets = np.argwhere(pattern.reshape(kernel_size))
+        neighbors = coords[:, None, :] + offsets[None, ...]
+        src = np.ravel_multi_index(
+            np.moveaxis(neighbors, -1, 0), padded)
+        dst = np.ravel_multi_index(coords.T, spatial)
+        groups.append((src, dst))
+
+    kpad = np.pad(
+        kspace, [(0, 0), (0, 0)] + [(h, h) for h in half],
+        mode='constant')
+    recon = np.array(
+        kspace, dtype=np.result_type(kspace, 1j), order='C')
+
+    def _kernels(idx):
+        '''Calibrate weights for every group of missing points.'''
+        G = _calib_gram(calib[idx], kernel_size)
+        return [_grappa_weights(G, pattern, nc, lamda)
+                if pattern.any() else None for pattern in patterns]
+
+    def _fill(start, stop, weights):
+        '''Fill in missing points of slices start:stop.'''
+        nslices = stop - start
+        kflat = kpad[start:stop].reshape((nslices, nc, -1))
+        rflat = recon[start:stop].reshape((nslices, nc, -1))
+        for (src, dst), W in zip(groups, weights):
+            if W is None:
+                continue
+            chunk = max(1, 2**22//(nslices*W.shape[0]))
+            for ii in range(0, dst.size, chunk):
+                S = kflat[:, :, src[ii:ii+chunk]].transpose(
+                    (0, 2, 1, 3))
+                S = S.reshape(S.shape[:2] + (-1,))
+                rflat[:, :, dst[ii:ii+chunk]] = np.matmul(
+                    S, W).transpose((0, 2, 1))
+
+    # Split slices between threads, calibrating once or for each slice
+    if shared:
+        weights = _kernels(0)
+        step = -(-kspace.shape[0]//max(n_jobs, 1))
+        jobs = range(0, kspace.shape[0], step)
+
+        def work(start):
+            '''Fill a block of slices with shared weights.'''
+            _fill(start, min(start + step, kspace.shape[0]), weights)
+    else:
+        jobs = range(kspace.shape[0])
+
+        def work(idx):
+            '''Calibrate and fill a single slice.'''
+            _fill(idx, idx + 1, _kernels(idx))
+
+    if n_jobs > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(work, jobs))
+    else:
+        for job in jobs:
+            work(job)
+    return recon.reshape(orig_shape)
+
 # def grappa_gfactor_2d_jvc2(
 #     kspace_sampled,
 #     kspace_acs,
@@ -1,6 +1,10 @@
 import numpy as np
 import matplotlib.pyplot as plt
 
+from mr_utils.recon.reordering.patch_reordering import get_patches
+from mr_utils.recon.reordering.scr_reordering_adluru import \
+    sort_real_imag_parts_space
+
 def minmod(a,b):
     '''Flux limiter to make FD solutions total variation diminishing.'''
     val = ((np.sign(a) + np.sign(b))/2)*np.min((np.abs(a),np.abs(b)))
@@ -36,11 +40,16 @@ def getbounds(ii,jj,u0):
 
     return(xxhigh,xxlow,yyhigh,yylow)
 
-def update_all_for_loop(u0,dt,h,sigma,niters):
+def update_all_for_loop(u0,dt,h,sigma,niters,eps=1e-12):
+    '''Explicit ROF time marching, one pixel at a time.
+
+    Slow reference implementation of update_all(), eps keeps the
+    gradient magnitudes in denominators nonzero.
+    '''
 
     assert check_stability(dt,h),'Step size is unstable!'
 
-    u = np.zeros((u0.shape[0],u0.shape[1],niters))
+    u = np.zeros((u0.shape[0],u0.shape[1],niters+1))
     u[:,:,0] = u0
     for nn in range(niters):
         for ii in range(u0.shape[0]):
@@ -50,12 +59,22 @@ def update_all_for_loop(u0,dt,h,sigma,niters):
                 xxhigh,xxlow,yyhigh,yylow = getbounds(ii,jj,u0)
 
                 # Total Variation terms from dx,dy
-                dxterm0 = (u[xxhigh,jj,nn] - u[ii,jj,nn])/np.sqrt( (u[xxhigh,jj,nn] - u[ii,jj,nn])**2 + (minmod( (u[ii,yyhigh,nn] - u[ii,jj,nn]),(u[ii,jj,nn] - u[ii,yylow,nn]) ))**2 )
-                dxterm1 = (u[ii,jj,nn] - u[xxlow,jj,nn])/np.sqrt( (u[ii,jj,nn] - u[xxlow,jj,nn])**2 + (minmod( (u[xxlow,yyhigh,nn] - u[xxlow,jj,nn]),(u[xxlow,jj,nn] - u[xxlow,yylow,nn]) ))**2 )
+                dxp = u[xxhigh,jj,nn] - u[ii,jj,nn]
+                dxm = u[ii,jj,nn] - u[xxlow,jj,nn]
+                dyp = u[ii,yyhigh,nn] - u[ii,jj,nn]
+                dym = u[ii,jj,nn] - u[ii,yylow,nn]
+                dxterm0 = dxp/np.sqrt(
+                    eps + dxp**2 + minmod(dyp,dym)**2)
+                dxterm1 = dxm/np.sqrt(eps + dxm**2 + minmod(
+                    u[xxlow,yyhigh,nn] - u[xxlow,jj,nn],
+                    u[xxlow,jj,nn] - u[xxlow,yylow,nn])**2)
                 dxterm = dxterm0 - dxterm1
 
-                dyterm0 = (u[ii,yyhigh,nn] - u[ii,jj,nn])/np.sqrt( (u[ii,yyhigh,nn] - u[ii,jj,nn])**2 + (minmod( (u[xxhigh,jj,nn] - u[ii,jj,nn]),(u[xxlow,jj,nn] - u[ii,jj,nn]) ))**2 )
-                dyterm1 = (u[ii,jj,nn] - u[ii,yylow,nn])/np.sqrt( (u[ii,jj,nn] - u[ii,yylow,nn])**2 + (minmod( (u[xxhigh,yylow,nn] - u[ii,yylow,nn]),(u[xxlow,yylow,nn] - u[ii,yylow,nn]) ))**2 )
+                dyterm0 = dyp/np.sqrt(
+                    eps + dyp**2 + minmod(dxp,-dxm)**2)
+                dyterm1 = dym/np.sqrt(eps + dym**2 + minmod(
+                    u[xxhigh,yylow,nn] - u[ii,yylow,nn],
+                    u[xxlow,yylow,nn] - u[ii,yylow,nn])**2)
                 dyterm = dyterm0 - dyterm1
 
                 # Fidelity term from u - u0
@@ -64,7 +83,10 @@ def update_all_for_loop(u0,dt,h,sigma,niters):
                     for jj0 in range(u0.shape[1]):
                         xxhigh0,xxlow0,yyhigh0,yylow0 = getbounds(ii0,jj0,u0)
 
-                        lambdaterm0 = np.sqrt( (u[xxhigh0,jj0,nn] - u[ii0,jj0,nn])**2 + (u[ii0,yyhigh0,nn] - u[ii0,jj0,nn])**2 )
+                        lambdaterm0 = np.sqrt(
+                            eps
+                            + (u[xxhigh0,jj0,nn] - u[ii0,jj0,nn])**2
+                            + (u[ii0,yyhigh0,nn] - u[ii0,jj0,nn])**2)
                         lambdaterm1 = (u[xxhigh0,jj0,0] - u[ii0,jj0,0])*(u[xxhigh0,jj0,nn] - u[ii0,jj0,nn])
                         lambdaterm2 = (u[ii0,yyhigh0,0] - u[ii0,jj0,0])*(u[ii0,yyhigh0,nn] - u[ii0,jj0,nn])
                         lambdacumsum += lambdaterm0 - lambdaterm1/lambdaterm0 - lambdaterm2/lambdaterm0
@@ -74,8 +96,192 @@ def update_all_for_loop(u0,dt,h,sigma,niters):
                 # Update next time step using all the update terms
                 u[ii,jj,nn+1] = u[ii,jj,nn] + (dt/h)*(dxterm + dyterm) - dt*lambdaterm*(u[ii,jj,nn] - u[ii,jj,0])
 
-    print(u)
     return(u)
 
+def neighbors(shape,sort_order_x=None,sort_order_y=None):
+    '''Flat indices of each pixel's neighbors.
+
+    Pixels on an edge are their own neighbor.
+
+    shape -- image shape (nx,ny)
+    sort_order_x -- argsort of each column, pixels are neighbors in x
+                    if they're next to each other in this order
+    sort_order_y -- argsort of each row, neighbors in y
+
+    Returns xhigh,xlow,yhigh,ylow, each the same shape as the image.
+    Sort orders are laid out like sort_real_imag_parts_space() gives
+    them.
+    '''
+
+    idx = np.arange(np.prod(shape)).reshape(shape)
+    if sort_order_x is None:
+        sort_order_x = np.tile(
+            np.arange(shape[0])[:,None],(1,shape[1]))
+    if sort_order_y is None:
+        sort_order_y = np.tile(
+            np.arange(shape[1])[None,:],(shape[0],1))
+
+    # Pixels in sorted order, then the next/previous one in that order
+    xsorted = np.take_along_axis(idx,sort_order_x.astype(int),axis=0)
+    ysorted = np.take_along_axis(idx,sort_order_y.astype(int),axis=1)
+    xhigh,xlow,yhigh,ylow = [
+        np.empty(shape,dtype=int) for _ in range(4)]
+    xhigh.flat[xsorted] = np.concatenate(
+        (xsorted[1:],xsorted[-1:]),axis=0)
+    xlow.flat[xsorted] = np.concatenate(
+        (xsorted[:1],xsorted[:-1]),axis=0)
+    yhigh.flat[ysorted] = np.concatenate(
+        (ysorted[:,1:],ysorted[:,-1:]),axis=1)
+    ylow.flat[ysorted] = np.concatenate(
+        (ysorted[:,:1],ysorted[:,:-1]),axis=1)
+    return(xhigh,xlow,yhigh,ylow)
+
+def reordering_neighbors(prior,patch_size=None):
+    '''Neighbors from sorting the (real part of the) prior image.
+
+    prior -- prior image estimate to base reordering on
+    patch_size -- if given, sort by the mean of the patch around each
+                  pixel (see get_patches()) instead of pixel values
+    '''
+
+    prior = np.real(prior)
+    if patch_size is not None:
+        pad = [(p//2,p - 1 - p//2) for p in patch_size]
+        prior = np.mean(get_patches(np.pad(prior,pad,mode='edge'),
+                                    patch_size),axis=(-2,-1))
+    sort_order_x,_,sort_order_y,_ = sort_real_imag_parts_space(prior)
+    return(neighbors(prior.shape,sort_order_x,sort_order_y))
+
+def update_all(u0,dt,h,sigma,niters,eps=1e-12,nbrs=None,
+               history=False):
+    '''Explicit ROF time marching with all pixels updated at once.
+
+    u0 -- noisy image
+    dt -- time step
+    h -- grid spacing
+    sigma -- standard deviation of noise
+    niters -- number of time steps
+    eps -- keeps gradient magnitudes in denominators nonzero
+    nbrs -- neighbors of each pixel, see neighbors(),
+            reordering_neighbors()
+    history -- return every iterate, (nx,ny,niters+1), not just the
+               last
+
+    Same scheme as update_all_for_loop(): minmod limited TV terms come
+    from gathering neighbors and the Lagrange multiplier is found once
+    per time step.
+
+    Ref: Rudin, Leonid I., Stanley Osher, and Emad Fatemi. "Nonlinear
+    total variation based noise removal algorithms." Physica D:
+    nonlinear phenomena 60.1-4 (1992): 259-268.
+    '''
+
+    assert check_stability(dt,h),'Step size is unstable!'
+
+    if nbrs is None:
+        nbrs = neighbors(u0.shape)
+    xh,xl,yh,yl = [n.ravel() for n in nbrs]
+
+    def _minmod(a,b):
+        return(((np.sign(a) + np.sign(b))/2)*np.minimum(
+            np.abs(a),np.abs(b)))
+
+    U0 = np.asarray(u0,dtype=float).ravel()
+    U = U0.copy()
+    dx0,dy0 = U0[xh] - U0,U0[yh] - U0
+    if history:
+        u = np.zeros(u0.shape + (niters+1,))
+        u[...,0] = u0
+    for nn in range(niters):
+        # Total Variation terms from dx,dy
+        dxp,dxm = U[xh] - U,U - U[xl]
+        dyp,dym = U[yh] - U,U - U[yl]
+        dxterm = dxp/np.sqrt(eps + dxp**2 + _minmod(dyp,dym)**2)
+        dxterm -= dxm/np.sqrt(eps + dxm**2 + _minmod(
+            U[yh[xl]] - U[xl],U[xl] - U[yl[xl]])**2)
+        dyterm = dyp/np.sqrt(eps + dyp**2 + _minmod(dxp,-dxm)**2)
+        dyterm -= dym/np.sqrt(eps + dym**2 + _minmod(
+            U[xh[yl]] - U[yl],U[xl[yl]] - U[yl])**2)
+
+        # Fidelity term from u - u0, Lagrange multiplier is global
+        grad = np.sqrt(eps + dxp**2 + dyp**2)
+        lambdaterm = (-h/(2*sigma**2))*np.sum(
+            grad - (dx0*dxp + dy0*dyp)/grad)
+
+        # Update next time step using all the update terms
+        U = U + (dt/h)*(dxterm + dyterm) - dt*lambdaterm*(U - U0)
+        if history:
+            u[...,nn+1] = U.reshape(u0.shape)
+
+    if history:
+        return(u)
+    return(U.reshape(u0.shape))
+
+def rof_primal_dual(f,lam,niters=100,nbrs=None,tau=None,
+                    history=False):
+    '''Chambolle-Pock primal-dual solver for ROF denoising.
+
+    f -- noisy image
+    lam -- weight of TV term, solves min_u 1/2||u - f||^2 + lam*TV(u)
+    niters -- number of iterations
+    nbrs -- neighbors of each pixel, see neighbors(),
+            reordering_neighbors()
+    tau -- primal step size, dual step is 1/(8*tau)
+    history -- return every iterate, (nx,ny,niters+1), not just the
+               last
+
+    Finite differences are taken between neighbors, so TV can be
+    measured along a reordering of the pixels instead of the grid.
+
+    Ref: Chambolle, Antonin, and Thomas Pock. "A first-order
+    primal-dual algorithm for convex problems with applications to
+    imaging." Journal of mathematical imaging and vision 40.1 (2011):
+    120-145.
+    '''
+
+    if nbrs is None:
+        nbrs = neighbors(f.shape)
+    xh,yh = nbrs[0].ravel(),nbrs[2].ravel()
+    if tau is None:
+        tau = 1/np.sqrt(8)
+    sigma = 1/(8*tau)
+
+    def _grad(U):
+        return(np.stack((U[xh] - U,U[yh] - U)))
+
+    def _scatter(idx,p):
+        # Sum entries of p landing on the same pixel
+        out = np.bincount(idx,weights=p.real,minlength=p.size)
+        if np.iscomplexobj(p):
+            out = out + 1j*np.bincount(
+                idx,weights=p.imag,minlength=p.size)
+        return(out)
+
+    def _grad_adj(p):
+        return(_scatter(xh,p[0]) - p[0] + _scatter(yh,p[1]) - p[1])
+
+    F = np.asarray(f).ravel()
+    U = F.copy()
+    Ubar = U.copy()
+    p = np.zeros((2,) + U.shape,dtype=U.dtype)
+    if history:
+        u = np.zeros(f.shape + (niters+1,),dtype=U.dtype)
+        u[...,0] = f
+    for nn in range(niters):
+        # Dual ascent, project onto ball of radius lam
+        p += sigma*_grad(Ubar)
+        p /= np.maximum(1,np.sqrt(np.sum(np.abs(p)**2,axis=0))/lam)
+
+        # Primal descent, prox of the fidelity term
+        Unew = (U - tau*_grad_adj(p) + tau*F)/(1 + tau)
+        Ubar = 2*Unew - U
+        U = Unew
+        if history:
+            u[...,nn+1] = U.reshape(f.shape)
+
+    if history:
+        return(u)
+    return(U.reshape(f.shape))
+
 if __name__ == '__main__':
     pass
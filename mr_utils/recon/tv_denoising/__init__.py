@@ -1 +1 @@
-from .tv_denoising import tv_l1_denoise
+from .tv_denoising import tv_l1_denoise, tv_l1_denoise_batch
@@ -26,7 +26,10 @@ References
 '''
 # pylint: enable=C0301
 
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
+from tqdm import tqdm
 
 def tv_l1_denoise(im, lam, disp=False, niter=100):
     '''TV-L1 image denoising with the primal-dual algorithm.
@@ -133,5 +136,171 @@ def tv_l1_denoise(im, lam, disp=False, niter=100):
     newim = u
     return newim
 
+def _tv_l1_chunk(nim, lam, niter, energy=None):
+    '''Run TV-L1 primal-dual iterations on a chunk in place.
+
+    nim is (batch, ...) and is overwritten with the denoised images.
+    If energy is given, the energy summed over the chunk is stored
+    there for each iteration.
+    '''
+
+    L2 = 4.0*(nim.ndim - 1)
+    tau = 0.02
+    sigma = 1.0/(L2*tau)
+    theta = 1.0
+    lt = lam*tau
+
+    # All work buffers are allocated once per chunk
+    u = nim.copy()
+    p = np.empty((nim.ndim - 1,) + nim.shape, dtype=nim.dtype)
+    g = np.empty_like(nim)
+    div = np.empty_like(nim)
+    if energy is not None:
+        gn = np.empty_like(nim)
+
+    # forward differences along each spatial axis, zero at the far
+    # edge
+    full = (slice(None),)*nim.ndim
+    hi, lo, last = [], [], []
+    for ax in range(1, nim.ndim):
+        hi.append(full[:ax] + (slice(1, None),))
+        lo.append(full[:ax] + (slice(None, -1),))
+        last.append(full[:ax] + (slice(-1, None),))
+    for k in range(p.shape[0]):
+        p[k][last[k]] = 0
+        np.subtract(u[hi[k]], u[lo[k]], out=p[k][lo[k]])
+
+    for kk in range(niter):
+        # projection
+        if energy is not None:
+            gn.fill(0)
+        for k in range(p.shape[0]):
+            g[last[k]] = 0
+            np.subtract(u[hi[k]], u[lo[k]], out=g[lo[k]])
+            if energy is not None:
+                gn += g*g
+            g *= sigma
+            p[k] += g
+        np.square(p[0], out=g)
+        for k in range(1, p.shape[0]):
+            np.square(p[k], out=div)
+            g += div
+        np.sqrt(g, out=g)
+        np.maximum(g, 1, out=g)
+        p /= g
+
+        # divergence is the negative adjoint of the forward
+        # differences
+        div.fill(0)
+        for k in range(p.shape[0]):
+            div[lo[k]] += p[k][lo[k]]
+            div[hi[k]] -= p[k][lo[k]]
+
+        # TV-L1 model: unew = nim + soft(v - nim, lt) where
+        # v = u + tau*div
+        div *= tau
+        div += u
+        div -= nim
+        np.clip(div, -lt, lt, out=g)
+        div -= g
+        div += nim
+
+        # extragradient step
+        u -= div
+        u *= -theta
+        u += div
+
+        if energy is not None:
+            np.subtract(u, nim, out=g)
+            energy[kk] = np.sum(np.sqrt(gn)) + lam*np.sum(np.abs(g))
+
+    nim[...] = u
+
+def tv_l1_denoise_batch(
+        ims, lam, axes=(-2, -1), niter=100, disp=False,
+        chunk_size=None, n_jobs=1, dtype=np.float32):
+    '''Batched N-D TV-L1 denoising with the primal-dual algorithm.
+
+    Parameters
+    ==========
+    ims : array_like
+        Stack of images to be processed, e.g., slices, frames, or
+        coils.
+    lam : float
+        regularization parameter controlling the amount of denoising;
+        smaller values imply more aggressive denoising which tends to
+        produce more smoothed results
+    axes : tuple, optional
+        Spatial axes of ims, all other axes are batch axes.
+    niter : int, optional
+        number of iterations
+    disp : bool, optional
+        print energy (summed over the batch) for each iteration when
+        done.
+    chunk_size : int, optional
+        Number of images to process at a time.  Defaults to splitting
+        the batch evenly over n_jobs.
+    n_jobs : int, optional
+        Number of threads to process chunks with.
+    dtype : numpy.dtype, optional
+        Floating point type of work buffers and result.
+
+    Returns
+    =======
+    newim : array_like
+        l1 denoised images, same shape as ims.
+
+    Notes
+    =====
+    Each image is treated exactly as tv_l1_denoise() treats a 2D
+    image: images with max > 1 are normalized by their max and the
+    denoised images are returned normalized.  Gradients, divergence,
+    and thresholding are updated in place in buffers allocated once
+    per chunk, so memory is bounded by chunk_size.
+    '''
+
+    ims = np.asarray(ims)
+    axes = tuple(np.arange(ims.ndim)[list(axes)])
+    batch_axes = [ax for ax in range(ims.ndim) if ax not in axes]
+    x = np.transpose(ims, batch_axes + list(axes))
+    nbatch = len(batch_axes)
+    batch_shape, shape = x.shape[:nbatch], x.shape[nbatch:]
+    x = np.array(x.reshape((-1,) + shape), dtype=dtype, order='C')
+    nb = x.shape[0]
+
+    # normalize images with values > 1, like tv_l1_denoise
+    mx = np.max(x.reshape((nb, -1)), axis=1)
+    mx[mx <= 1] = 1
+    x /= mx.reshape((nb,) + (1,)*len(shape))
+
+    if chunk_size is None:
+        chunk_size = int(np.ceil(nb/n_jobs))
+    chunks = [slice(ii, ii + chunk_size)
+              for ii in range(0, nb, chunk_size)]
+    energy = np.zeros((len(chunks), niter)) if disp else None
+
+    def _chunk(ii):
+        _tv_l1_chunk(
+            x[chunks[ii]], lam, niter,
+            energy[ii] if energy is not None else None)
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        list(tqdm(executor.map(_chunk, range(len(chunks))),
+                  total=len(chunks), desc='TV Denoise', leave=False))
+
+    if disp:
+        from mr_utils.utils.printtable import Table
+        table = Table(
+            ['Iter', 'Energy'],
+            [len(repr(niter)), 8],
+            ['d', 'e'])
+        print(table.header())
+        for kk, E in enumerate(np.sum(energy, axis=0)):
+            print(table.row((kk, E)))
+
+    # Put the batch and spatial axes back where they were
+    x = x.reshape(batch_shape + shape)
+    return np.transpose(x, np.argsort(batch_axes + list(axes)))
+
 if __name__ == '__main__':
     pass
@@ -1,4 +1,11 @@
-'''Numerical bloch simulations using finite difference method.'''
+'''Numerical bloch simulations.
+
+sim(), sim_loop() and gre() integrate the Bloch equations using the
+finite difference method.  simulate() applies exact operators for
+each event of a sequence (RF, free precession, spoiling) to batches
+of voxels; sim_exact() and gre_exact() are its counterparts to sim()
+and gre().
+'''
 
 import numpy as np
 from tqdm import trange
@@ -277,5 +284,351 @@ def gre(T1, T2, M0, Nt, h, alpha, beta, gamma, TR, TE, Bx=0, By=0, Bz=3):
 
     return spins
 
+def _expm(A, order=12):
+    '''Matrix exponential of a stack of small matrices.
+
+    Taylor series with scaling and squaring, ||A/2**s|| <= 1/2 keeps
+    the truncation error of the series below double precision.
+    '''
+
+    norm = np.max(np.sum(np.abs(A), axis=-1), initial=0)
+    nsq = int(max(0, np.ceil(np.log2(max(norm, 1e-300)/.5))))
+    A = A/2**nsq
+    out = np.broadcast_to(np.eye(A.shape[-1]), A.shape).copy()
+    term = out.copy()
+    for k in range(1, order+1):
+        term = np.matmul(term, A)/k
+        out += term
+    for _ii in range(nsq):
+        out = np.matmul(out, out)
+    return out
+
+def relaxation(T, T1, T2, M0=1, Bx=0, By=0, Bz=0):
+    '''Exact free precession and relaxation operator over time T.
+
+    Parameters
+    ==========
+    T : float
+        Duration of free precession.
+    T1 : array_like
+        longitudinal relaxation constant.
+    T2 : array_like
+        transverse relaxation constant.
+    M0 : array_like, optional
+        value at thermal equilibrium.
+    Bx : array_like, optional
+        x component of magnetic field.
+    By : array_like, optional
+        y component of magnetic field.
+    Bz : array_like, optional
+        z component of magnetic field.
+
+    Returns
+    =======
+    op : array_like
+        Affine operator of shape (..., 4, 4) acting on
+        (Mx, My, Mz, 1).
+
+    Notes
+    =====
+    With no transverse field (Bx=By=0) the operator is a rotation
+    about z combined with exponential decay/recovery, otherwise it's
+    the matrix exponential of the Bloch equations.  T1, T2 of zero
+    relax instantly, as in gre_sim().
+    '''
+
+    T1, T2, M0, Bx, By, Bz = np.broadcast_arrays(*[
+        np.asarray(x, dtype=float) for x in (T1, T2, M0, Bx, By, Bz)])
+    R1 = np.divide(1, T1, out=np.zeros(T1.shape), where=T1 > 0)
+    R2 = np.divide(1, T2, out=np.zeros(T2.shape), where=T2 > 0)
+
+    op = np.zeros(T1.shape + (4, 4))
+    if not np.any(Bx) and not np.any(By):
+        E1 = np.where(T1 > 0, np.exp(-T*R1), 0)
+        E2 = np.where(T2 > 0, np.exp(-T*R2), 0)
+        c, s = np.cos(Bz*T), np.sin(Bz*T)
+        op[..., 0, 0] = E2*c
+        op[..., 0, 1] = E2*s
+        op[..., 1, 0] = -E2*s
+        op[..., 1, 1] = E2*c
+        op[..., 2, 2] = E1
+        op[..., 2, 3] = M0*(1 - E1)
+        op[..., 3, 3] = 1
+        return op
+
+    # Matrix form of the Bloch equations, augmented with the constant
+    # term
+    op[..., 0, 0] = -R2
+    op[..., 0, 1] = Bz
+    op[..., 0, 2] = -By
+    op[..., 1, 0] = -Bz
+    op[..., 1, 1] = -R2
+    op[..., 1, 2] = Bx
+    op[..., 2, 0] = By
+    op[..., 2, 1] = -Bx
+    op[..., 2, 2] = -R1
+    op[..., 2, 3] = M0*R1
+    op = _expm(op*T)
+
+    # Zero relaxation times relax instantly
+    op[T2 == 0, :2, :] = 0
+    op[T1 == 0, 2, :] = 0
+    op[T1 == 0, 2, 3] = M0[T1 == 0]
+    return op
+
+def excitation(alpha, beta, gamma):
+    '''Instantaneous RF pulse as an affine operator.
+
+    Parameters
+    ==========
+    alpha : float
+        Rotation angle about x in rad.
+    beta : float
+        Rotation angle about y in rad.
+    gamma : float
+        Rotation angle about z in rad.
+
+    Returns
+    =======
+    op : array_like
+        4x4 operator acting on (Mx, My, Mz, 1), see rotation().
+    '''
+    op = np.eye(4)
+    op[:3, :3] = rotation(alpha, beta, gamma)
+    return op
+
+def spoiler():
+    '''Perfect spoiling as an affine operator.'''
+    return np.diag([0., 0., 1., 1.])
+
+def _apply(op, spins):
+    '''Apply operator(s) to spins of shape (N, 4).'''
+    if op.ndim == 2:
+        return np.dot(spins, op.T)
+    return np.matmul(op, spins[..., None])[..., 0]
+
+def simulate(T1, T2, M0, events, nrep=1, store='all', Bx=0, By=0,
+             Bz=0, spins=None, dtype=np.float64, batch_size=2**16):
+    '''Bloch simulation of a sequence of events using exact operators.
+
+    Parameters
+    ==========
+    T1 : array_like
+        longitudinal relaxation constant.
+    T2 : array_like
+        transverse relaxation constant.
+    M0 : array_like
+        value at thermal equilibrium.
+    events : list of tuple
+        Sequence of events making up one repetition, one of
+        ('rf', alpha, beta, gamma), ('relax', T), ('spoil',), or
+        ('readout',).
+    nrep : int, optional
+        Number of times to play out events.
+    store : {'all', 'last'}, optional
+        Keep readouts of every repetition or only the last one.
+    Bx : array_like, optional
+        x component of magnetic field.
+    By : array_like, optional
+        y component of magnetic field.
+    Bz : array_like, optional
+        z component of magnetic field.
+    spins : array_like, optional
+        Initial spin vectors, shape (3,) + T1.shape.  Thermal
+        equilibrium by default.
+    dtype : numpy.dtype, optional
+        Float type for operators and spins, np.float32 halves memory.
+    batch_size : int, optional
+        Number of voxels simulated at a time, bounds memory use.
+
+    Returns
+    =======
+    spins : array_like
+        Spin vectors at each stored readout, shape (Nr, 3) + T1.shape.
+        When there are no readout events the final spin vectors are
+        returned with Nr=1.
+
+    Notes
+    =====
+    Operators are built once per batch of voxels and reused every
+    repetition.  When only the last repetition is stored, the first
+    nrep-1 repetitions are collapsed into a single operator.
+    '''
+
+    if store not in ('all', 'last'):
+        raise ValueError('store must be "all" or "last"!')
+
+    T1, T2, M0, Bx, By, Bz = np.broadcast_arrays(*[
+        np.asarray(x, dtype=float) for x in (T1, T2, M0, Bx, By, Bz)])
+    shape = T1.shape
+    T1, T2, M0, Bx, By, Bz = [
+        x.reshape(-1) for x in (T1, T2, M0, Bx, By, Bz)]
+    N = T1.size
+
+    nreadouts = sum(ev[0] == 'readout' for ev in events)
+    if nreadouts == 0:
+        nstored = 1
+    elif store == 'all':
+        nstored = nreadouts*nrep
+    else:
+        nstored = nreadouts
+    out = np.empty((nstored, 3, N), dtype=dtype)
+
+    if spins is not None:
+        spins = np.asarray(spins, dtype=dtype).reshape(3, -1)
+
+    for start in range(0, N, batch_size):
+        idx = slice(start, min(start + batch_size, N))
+        cache = {}
+
+        def _op(ev):
+            '''Operator for event, built once per batch.'''
+            # pylint: disable=W0640
+            if ev not in cache:
+                if ev[0] == 'rf':
+                    cache[ev] = excitation(*ev[1:]).astype(dtype)
+                elif ev[0] == 'relax':
+                    cache[ev] = relaxation(
+                        ev[1], T1[idx], T2[idx], M0[idx], Bx[idx],
+                        By[idx], Bz[idx]).astype(dtype)
+                elif ev[0] == 'spoil':
+                    cache[ev] = spoiler().astype(dtype)
+                else:
+                    raise ValueError('Unknown event "%s"!' % ev[0])
+            return cache[ev]
+
+        # Homogeneous coordinates (Mx, My, Mz, 1)
+        M = np.zeros((idx.stop - idx.start, 4), dtype=dtype)
+        if spins is None:
+            M[:, 2] = M0[idx]
+        else:
+            M[:, :3] = spins[:, idx].T
+        M[:, 3] = 1
+
+        reps = range(nrep)
+        if store == 'last' and nrep > 1:
+            rep_op = np.eye(4, dtype=dtype)
+            for ev in events:
+                if ev[0] != 'readout':
+                    rep_op = np.matmul(_op(ev), rep_op)
+            M = _apply(np.linalg.matrix_power(rep_op, nrep-1), M)
+            reps = range(1)
+
+        kk = 0
+        for _rep in reps:
+            for ev in events:
+                if ev[0] == 'readout':
+                    out[kk, :, idx] = M[:, :3].T
+                    kk += 1
+                else:
+                    M = _apply(_op(ev), M)
+        if nreadouts == 0:
+            out[0, :, idx] = M[:, :3].T
+
+    return out.reshape((nstored, 3) + shape)
+
+def sim_exact(T1, T2, M0, Nt, h, alpha, beta, gamma, Bx=0, By=0, Bz=3,
+              store=None, dtype=np.float64):
+    '''Exact solution to Bloch equations, counterpart to sim().
+
+    Parameters
+    ==========
+    T1 : array_like
+        longitudinal relaxation constant.
+    T2 : array_like
+        transverse relaxation constant.
+    M0 : array_like
+        value at thermal equilibrium.
+    Nt : int
+        number of time points.
+    h : float
+        time between time points.
+    alpha : float
+        RF pulse tip angle about x.
+    beta : float
+        RF pulse tip angle about y.
+    gamma : float
+        RF pulse tip angle about z.
+    Bx : float, optional
+        x component of magnetic field.
+    By : float, optional
+        y component of magnetic field.
+    Bz : float, optional
+        z component of magnetic field.
+    store : array_like, optional
+        Indices of time points to keep, all of them by default.
+    dtype : numpy.dtype, optional
+        Float type of simulation.
+
+    Returns
+    =======
+    spins : array_like
+        Simulated spin vectors at stored time points.
+    '''
+
+    if store is None:
+        store = range(int(Nt))
+    store = np.unique(store)
+
+    events = [('rf', alpha, beta, gamma)]
+    prev = 0
+    for tt in store:
+        if tt > prev:
+            events.append(('relax', (tt - prev)*h))
+        events.append(('readout',))
+        prev = tt
+    return simulate(
+        T1, T2, M0, events, Bx=Bx, By=By, Bz=Bz, dtype=dtype)
+
+def gre_exact(T1, T2, M0, alpha, beta, gamma, TR, TE, num_TRs, Bx=0,
+              By=0, Bz=3, dtype=np.float64):
+    '''Exact Bloch simulation of spoiled GRE, counterpart to gre().
+
+    Parameters
+    ==========
+    T1 : array_like
+        longitudinal relaxation constant.
+    T2 : array_like
+        transverse relaxation constant.
+    M0 : array_like
+        value at thermal equilibrium.
+    alpha : float
+        RF pulse tip angle about x.
+    beta : float
+        RF pulse tip angle about y.
+    gamma : float
+        RF pulse tip angle about z.
+    TR : float
+        repetition time.
+    TE : float
+        echo time.
+    num_TRs : int
+        Number of excitations, readout at TE after the last one.
+    Bx : float, optional
+        x component of magnetic field.
+    By : float, optional
+        y component of magnetic field.
+    Bz : float, optional
+        z component of magnetic field.
+    dtype : numpy.dtype, optional
+        Float type of simulation.
+
+    Returns
+    =======
+    spins : array_like
+        Simulated spin vectors.
+    '''
+
+    events = [
+        ('rf', alpha, beta, gamma),
+        ('relax', TE),
+        ('readout',),
+        ('relax', TR - TE),
+        ('spoil',),
+    ]
+    return simulate(
+        T1, T2, M0, events, nrep=num_TRs, store='last', Bx=Bx, By=By,
+        Bz=Bz, dtype=dtype)[0]
+
 if __name__ == '__main__':
     pass
@@ -317,8 +317,14 @@ def gre_sim_loop(T1, T2, TR=12e-3, TE=6e-3, alpha=np.pi/3, field_map=None,
     return Mxy
 
 
+def _precess(M, c_ra, s_ra):
+    '''Rotate transverse magnetization M (3, ...) in place.'''
+    M[0, ...], M[1, ...] = c_ra*M[0, ...] + s_ra*M[1, ...], \
+        -s_ra*M[0, ...] + c_ra*M[1, ...]
+
 def gre_sim(T1, T2, TR=12e-3, TE=6e-3, alpha=np.pi/3, field_map=None, phi=0,
-            dphi=0, M0=1, tol=1e-5, maxiter=None, spoil=True):
+            dphi=0, M0=1, tol=1e-5, maxiter=None, spoil=True,
+            closed_form=False):
     '''Simulate GRE pulse sequence.
 
     Parameters
@@ -345,6 +351,10 @@ def gre_sim(T1, T2, TR=12e-3, TE=6e-3, alpha=np.pi/3, field_map=None, phi=0,
         Maximum difference between voxel intensity iter to iter until stop.
     maxiter : int, optional
         number of excitations till steady state.
+    spoil : bool, optional
+        Delete transverse magnetization before each excitation.
+    closed_form : bool, optional
+        Solve for the steady state directly instead of iterating.
 
     Returns
     =======
@@ -355,6 +365,13 @@ def gre_sim(T1, T2, TR=12e-3, TE=6e-3, alpha=np.pi/3, field_map=None, phi=0,
     =====
     maxiter=None will run until difference between all voxel intensities
     iteration to iteration is within given tolerance, tol (default=1e-5).
+
+    closed_form=True ignores tol and maxiter.  Each TR is an affine
+    map of the magnetization, constant in the frame rotating with the
+    RF phase, so the steady state is the fixed point of that map,
+    found with one 3x3 solve per voxel.  The readout follows an
+    excitation with RF phase phi, i.e., it matches iterating when
+    maxiter*dphi is a multiple of 2*pi.
     '''
 
     if not isinstance(T1, np.ndarray):
@@ -410,14 +427,8 @@ def gre_sim(T1, T2, TR=12e-3, TE=6e-3, alpha=np.pi/3, field_map=None, phi=0,
         Mgre[1, 1, ...] = Mgre[1, 0, ...]*E2 # y
         Mgre[2, 1, ...] = 1 + (Mgre[2, 0, ...] - 1)*E1 # z
 
-        # Here's where we spend most of our time:
-        for idx, _fm in np.ndenumerate(field_map):
-            rzoffres = np.array([
-                [c_ra[idx], s_ra[idx], 0],
-                [-s_ra[idx], c_ra[idx], 0],
-                [0, 0, 1]])
-            Mgre[(slice(None), 1) + idx] = rzoffres.dot(
-                Mgre[(slice(None), 1) + idx])
+        # Off-resonance precession, all voxels at once
+        _precess(Mgre[:, 1, ...], c_ra, s_ra)
 
         # next tip - delete phase information! to make it gre
         if spoil:
@@ -444,8 +455,29 @@ def gre_sim(T1, T2, TR=12e-3, TE=6e-3, alpha=np.pi/3, field_map=None, phi=0,
 
         return(Mgre, phi)
 
-    # Do either fixed number of iter or until tolerance achieved
-    if maxiter is not None:
+    # Do either closed form, fixed number of iter, or until tolerance
+    # achieved
+    if closed_form:
+        # In the frame rotating with the RF phase each TR is the same
+        # affine map, M <- A M + b.  A = Rx Rspoil Roffres E Rz(-dphi)
+        # and b is the tipped longitudinal recovery.
+        A = np.zeros(T1.shape + (3, 3))
+        c_d, s_d = np.cos(dphi), np.sin(dphi)
+        if not spoil:
+            A[..., 0, 0] = E2*(c_ra*c_d + s_ra*s_d)
+            A[..., 0, 1] = E2*(s_ra*c_d - c_ra*s_d)
+            A[..., 1, 0] = E2*(c_ra*s_d - s_ra*c_d)
+            A[..., 1, 1] = E2*(c_ra*c_d + s_ra*s_d)
+        A[..., 2, 2] = E1
+        A = np.matmul(rxalpha, A)
+        b = np.multiply.outer(1 - E1, rxalpha[:, 2])
+        Mss = np.linalg.solve(np.eye(3) - A, b[..., None])[..., 0]
+        Mgre[:, -1, ...] = np.moveaxis(Mss, -1, 0)
+
+        # Back into the lab frame with the RF phase phi
+        c_phi, s_phi = np.cos(phi), np.sin(phi)
+        _precess(Mgre[:, -1, ...], c_phi, s_phi)
+    elif maxiter is not None:
         # assume steady state after iter flips
         for _n in trange(maxiter, leave=False, desc='GRE steady-state'):
             Mgre, phi = iter_fun(Mgre, phi)
@@ -470,11 +502,6 @@ def gre_sim(T1, T2, TR=12e-3, TE=6e-3, alpha=np.pi/3, field_map=None, phi=0,
     cycles = field_map*TE
     rotation_angle = np.fmod(cycles, 1)*2*np.pi
     c_ra, s_ra = np.cos(rotation_angle), np.sin(rotation_angle)
-    for idx, _fm in np.ndenumerate(field_map):
-        rzoffres = np.array([
-            [c_ra[idx], s_ra[idx], 0],
-            [-s_ra[idx], c_ra[idx], 0],
-            [0, 0, 1]])
-        Mss[(slice(None),) + idx] = rzoffres.dot(Mss[(slice(None),) + idx])
+    _precess(Mss, c_ra, s_ra)
 
     return(Mss[0, ...] + 1j*Mss[1, ...])
@@ -6,10 +6,13 @@ bSSFP scan each time point and solve for the off-resonance.  Thus we get a
 field map at time point.
 '''
 
+from collections import OrderedDict
+from threading import Lock
+
 import numpy as np
 
 from mr_utils.utils import find_nearest
-from mr_utils.sim.ssfp import ssfp
+from mr_utils.sim.ssfp import ssfp, ssfp_broadcast
 # from mr_utils import view
 
 def get_df_responses(T1, T2, PD, TR, alpha, phase_cyc, dfs):
@@ -84,7 +87,91 @@ def quantitative_fm_scalar(Mxy, dfs, T1, T2, PD, TR, alpha, phase_cyc):
     # Return the df's value, because that's really what the caller wanted
     return dfs[idx]
 
-def quantitative_fm(Mxys, dfs, T1s, T2s, PDs, TR, alpha, phase_cyc, mask=None):
+class ResponseCache(object):
+    '''Bounded LRU cache of bSSFP responses across off-resonances.
+
+    Parameters
+    ==========
+    maxsize : int, optional
+        Maximum number of responses to keep.
+
+    Notes
+    =====
+    Responses are keyed on (T1, T2, PD) together with the sequence
+    parameters and the dfs they were simulated over.  Missing
+    responses are simulated all at once.
+    '''
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def clear(self):
+        '''Forget all cached responses.'''
+        with self._lock:
+            self._cache.clear()
+
+    def responses(self, T1s, T2s, PDs, TR, alpha, phase_cyc, dfs):
+        '''Responses for each (T1, T2, PD), one row per T1s entry.
+
+        Parameters
+        ==========
+        T1s : array_like
+            (1D) T1 longitudinal recovery values in seconds.
+        T2s : array_like
+            (1D) T2 transverse decay values in seconds.
+        PDs : array_like
+            (1D) proton density values scaled the same as acquisiton.
+        TR : float
+            Repetition time in seconds.
+        alpha : float
+            Flip angle in radians.
+        phase_cyc : float
+            RF phase cycling in radians.
+        dfs : array_like
+            Off-resonance values to simulate over.
+
+        Returns
+        =======
+        resps : array_like
+            Frequency response of SSFP signal for each set of
+            parameters, shape (len(T1s), dfs.size).
+        '''
+
+        context = (
+            TR, alpha, phase_cyc, dfs.size, hash(dfs.tobytes()))
+        keys = [context + key for key in zip(T1s, T2s, PDs)]
+        resps = np.empty((len(keys), dfs.size), dtype='complex')
+
+        # Take what we have, simulate everything else at once
+        with self._lock:
+            missing = []
+            for ii, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    resps[ii] = self._cache[key]
+                else:
+                    missing.append(ii)
+        if missing:
+            resps[missing] = ssfp_broadcast(
+                T1s[missing, None], T2s[missing, None], TR, alpha,
+                dfs, phase_cyc=phase_cyc, M0=PDs[missing, None])
+            with self._lock:
+                for ii in missing[-self.maxsize:]:
+                    self._cache[keys[ii]] = resps[ii]
+                while len(self._cache) > self.maxsize:
+                    self._cache.popitem(last=False)
+        return resps
+
+_response_cache = ResponseCache()
+
+def quantitative_fm(Mxys, dfs, T1s, T2s, PDs, TR, alpha, phase_cyc,
+                    mask=None, grid=None, cache=None,
+                    chunk_size=None):
     '''Find field map given quantitative maps.
 
     Parameters
@@ -107,39 +194,65 @@ def quantitative_fm(Mxys, dfs, T1s, T2s, PDs, TR, alpha, phase_cyc, mask=None):
         RF phase cycling in radians.
     mask : array_like
         Boolean mask to tell which pixels we should compute df for.
+    grid : tuple, optional
+        Spacing (T1, T2, PD) to quantize the maps to before
+        simulating.  None uses values as they are.
+    cache : ResponseCache, optional
+        Cache of responses, a module-wide cache is used by default.
+    chunk_size : int, optional
+        Number of pixels to match at a time.  By default, such that
+        each chunk compares about 2**22 responses.
 
     Returns
     =======
     fm : array_like
         Field map.
-    '''
 
-    resps = {}
-    orig_size = np.asarray(T1s).shape
+    Notes
+    =====
+    Pixels are sorted by their (T1, T2, PD), so each chunk of pixels
+    needs only a few responses.  Those come from the cache, or else
+    are simulated in one broadcast.  The closest response for every
+    pixel in the chunk is then found at once.  Quantizing the maps
+    with grid makes many pixels share a response, trading precision
+    for speed.
+    '''
 
+    if cache is None:
+        cache = _response_cache
+    dfs = np.asarray(dfs)
     if mask is None:
-        mask = np.ones(Mxys.shape)
-
-    Mxys = np.asarray(Mxys).flatten()
-    T1s = np.asarray(T1s).flatten()
-    T2s = np.asarray(T2s).flatten()
-    PDs = np.asarray(PDs).flatten()
-    mask = np.asarray(mask).flatten()
-
-    fm = np.zeros(Mxys.size)
-    for ii in range(Mxys.size):
-
-        if mask[ii]:
-            # Cache results for later in case we come across the same T1,T2,PD
-            if (PDs[ii], T1s[ii], T2s[ii]) not in resps:
-                resps[(PDs[ii], T1s[ii], T2s[ii])] = get_df_responses(
-                    T1s[ii], T2s[ii], PDs[ii], TR, alpha, phase_cyc, dfs)
-
-            # Find the appropriate off-resonance value for this T1,T2,PD,Mxy
-            idx, _val = find_nearest(
-                resps[(PDs[ii], T1s[ii], T2s[ii])], Mxys[ii])
-            fm[ii] = dfs[idx]
-        else:
-            fm[ii] = 0
-
-    return fm.reshape(orig_size)
+        mask = True
+
+    Mxys, T1s, T2s, PDs, mask = np.broadcast_arrays(
+        Mxys, T1s, T2s, PDs, mask)
+    fm = np.zeros(Mxys.shape)
+    idx = mask.astype(bool)
+    Mxys = Mxys[idx]
+    params = np.stack(
+        (T1s[idx], T2s[idx], PDs[idx]), axis=1).astype(float)
+    if grid is not None:
+        params = np.round(params/grid)*grid
+
+    # Sort pixels by parameters, unique ids then come in runs
+    params, inverse = np.unique(params, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    order = np.argsort(inverse, kind='stable')
+    if chunk_size is None:
+        chunk_size = max(1, 2**22//max(dfs.size, 1))
+
+    found = np.empty(Mxys.size, dtype=int)
+    for start in range(0, order.size, chunk_size):
+        pix = order[start:start+chunk_size]
+        lo, hi = inverse[pix[0]], inverse[pix[-1]] + 1
+        resps = cache.responses(
+            params[lo:hi, 0], params[lo:hi, 1], params[lo:hi, 2], TR,
+            alpha, phase_cyc, dfs)
+
+        # Find the appropriate off-resonance value for all pixels in
+        # chunk
+        found[pix] = np.argmin(np.abs(
+            resps[inverse[pix] - lo] - Mxys[pix, None]), axis=1)
+
+    fm[idx] = dfs[found]
+    return fm
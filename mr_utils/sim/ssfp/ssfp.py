@@ -110,16 +110,6 @@ def ssfp(T1, T2, TR, alpha, field_map, phase_cyc=0, M0=1, delta_cs=0,
            fourier transform NMR. J Magn Reson 1971;4:366–383.
     '''
 
-    # We are assuming Freeman-Hill convention for off-resonance map,
-    # so we need to negate to make use with this Ernst-Anderson-
-    # based implementation from Hoff
-    field_map = -1*field_map
-
-    # We also assume that linear phase cycles will be added, but the
-    # formulation used by Hoff, PLANET assumes subtracted, so let's
-    # flip the signs
-    phase_cyc = -1*phase_cyc
-
     # Make sure we're working with arrays
     T1 = np.atleast_2d(T1)
     T2 = np.atleast_2d(T2)
@@ -129,39 +119,103 @@ def ssfp(T1, T2, TR, alpha, field_map, phase_cyc=0, M0=1, delta_cs=0,
 
     # If we have more than one phase-cycle, then add that dimension
     if phase_cyc.size > 1:
-        reps = (phase_cyc.size, 1, 1)
-        phase_cyc = np.tile(
-            phase_cyc, T1.shape[:] + (1,)).transpose((2, 0, 1))
-        T1 = np.tile(T1, reps)
-        T2 = np.tile(T2, reps)
-        alpha = np.tile(alpha, reps)
-        field_map = np.tile(field_map, reps)
+        phase_cyc = phase_cyc.reshape((-1, 1, 1))
+
+    Mxy = ssfp_broadcast(
+        T1, T2, TR, alpha, field_map, phase_cyc, M0, delta_cs, phi_rf,
+        phi_edd, phi_drift)
+    return Mxy.squeeze()
+
+def ssfp_broadcast(T1, T2, TR, alpha, field_map, phase_cyc=0, M0=1,
+                   delta_cs=0, phi_rf=0, phi_edd=0, phi_drift=0):
+    '''SSFP transverse signal with all parameters broadcast together.
+
+    Parameters
+    ----------
+    T1 : float or array_like
+        longitudinal exponential decay time constant (in seconds).
+    T2 : float or array_like
+        transverse exponential decay time constant (in seconds).
+    TR : float
+        repetition time (in seconds).
+    alpha : float or array_like
+        flip angle (in rad).
+    field_map : float or array_like
+        B0 field map (in Hz).
+    phase_cyc : float or array_like, optional
+        Linear phase-cycle increment (in rad).
+    M0 : float or array_like, optional
+        proton density.
+    delta_cs : float, optional
+        chemical shift of species w.r.t. the water peak (in Hz).
+    phi_rf : float, optional
+        RF phase offset, related to the combin. of Tx/Rx phases (in
+        rad).
+    phi_edd : float, optional
+        phase errors due to eddy current effects (in rad).
+    phi_drift : float, optional
+        phase errors due to B0 drift (in rad).
+
+    Returns
+    -------
+    Mxy : numpy.array
+        Transverse complex magnetization, shape of all arguments
+        broadcast together.
+
+    Notes
+    -----
+    Same signal and conventions as ssfp(), but arguments follow numpy
+    broadcasting rules instead of being tiled, e.g.,
+    T1[:, None, None], field_map[None, :, None], and
+    phase_cyc[None, None, :] give a (T1, df, phase_cyc) array.
+
+    Terms depending only on tissue parameters or only on theta are
+    computed on their own shapes before being combined, so only the
+    last few operations are done at the full output size.
+    '''
+
+    # We are assuming Freeman-Hill convention for off-resonance map,
+    # so we need to negate to make use with this Ernst-Anderson-
+    # based implementation from Hoff
+    field_map = -1*np.asarray(field_map)
+
+    # We also assume that linear phase cycles will be added, but the
+    # formulation used by Hoff, PLANET assumes subtracted, so let's
+    # flip the signs
+    phase_cyc = -1*np.asarray(phase_cyc)
 
     # All this nonsense so we don't divide by 0
+    T1 = np.asarray(T1)
+    T2 = np.asarray(T2)
     E1 = np.zeros(T1.shape)
     E1[T1 > 0] = np.exp(-TR/T1[T1 > 0])
     E2 = np.zeros(T2.shape)
     E2[T2 > 0] = np.exp(-TR/T2[T2 > 0])
 
-    # Precompute theta and some cos, sin
-    theta = get_theta(TR, field_map, phase_cyc, delta_cs)
+    # Tissue terms, the denominator is p + q*cos(theta)
     ca = np.cos(alpha)
     sa = np.sin(alpha)
+    a = 1 - E1*ca
+    b = E2*(E1 - ca)
+    p = a - b*E2
+    q = b - a*E2
+
+    # Additional phase factor for readout at TE = TR/2, see
+    # get_bssfp_phase().  Notice that phi_i are negated
+    TE = TR/2
+    decay = np.ones(T2.shape)
+    decay[T2 > 0] = np.exp(-TE/T2[T2 > 0])
+    scale = 1j*M0*(1 - E1)*sa*decay
+    phase = np.exp(1j*(2*np.pi*(delta_cs + field_map)*TE - phi_rf
+                       - phi_edd - phi_drift))
+
+    # Off-resonance terms
+    theta = get_theta(TR, field_map, phase_cyc, delta_cs)
     ct = np.cos(theta)
-    st = np.sin(theta)
+    etheta = np.exp(-1j*theta)
 
-    # Get to business
-    den = (1 - E1*ca)*(1 - E2*ct) - (E2*(E1 - ca))*(E2 - ct)
-    Mx = -M0*((1 - E1)*E2*sa*st)/den
-    My = M0*((1 - E1)*sa)*(1 - E2*ct)/den
-    Mxy = Mx + 1j*My
-
-    # Add additional phase factor for readout at TE = TR/2.
-    # Notice that phi_i are negated
-    Mxy *= get_bssfp_phase(
-        T2, TR, field_map, delta_cs, -phi_rf, -phi_edd, -phi_drift)
-
-    return Mxy.squeeze()
+    # Mx + 1j*My = 1j*M0*(1 - E1)*sa*(1 - E2*exp(-1j*theta))/den
+    return scale*phase*(1 - E2*etheta)/(p + q*ct)
 
 def elliptical_params(T1, T2, TR, alpha, M0=1):
     '''Return ellipse parameters M, a, b.
@@ -1,10 +1,12 @@
 '''Dictionary lookup of NMR parameters given bSSFP signal.
 '''
 
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 # import matplotlib.pyplot as plt
 
-from mr_utils.sim.ssfp import ssfp
+from mr_utils.sim.ssfp import ssfp, ssfp_broadcast
 
 def get_keys(T1s, T2s, alphas):
     '''Generate matrix of params [T1, T2, alpha] to generate a dictionary.
@@ -38,7 +40,8 @@ def get_keys(T1s, T2s, alphas):
     keys = np.vstack((T1_mesh, T2_mesh, alpha_mesh))
     return keys
 
-def ssfp_dictionary(T1s, T2s, TR, alphas, df):
+def ssfp_dictionary(T1s, T2s, TR, alphas, df, phase_cyc=0, out=None,
+                    dtype='complex', chunk_size=None):
     '''Generate a dicionary of bSSFP profiles given parameters.
 
     Parameters
@@ -53,6 +56,18 @@ def ssfp_dictionary(T1s, T2s, TR, alphas, df):
         (1D) all flip angle values to simulate.
     df : array_like
         (1D) off-resonance frequencies over which to simulate.
+    phase_cyc : array_like, optional
+        Phase-cycles to simulate for every atom (in rad).
+    out : array_like, optional
+        Preallocated array to write the dictionary into, e.g., a
+        numpy.memmap.  Shape must be
+        (N,) + phase_cyc.shape + (df.size,), where N is the number of
+        keys.
+    dtype : numpy.dtype, optional
+        Data type of dictionary if out is not given.
+    chunk_size : int, optional
+        Number of atoms to simulate at a time.  By default, chunks are
+        chosen to be about 2**20 samples.
 
     Returns
     =======
@@ -67,25 +82,37 @@ def ssfp_dictionary(T1s, T2s, TR, alphas, df):
     simulated (i.e., where T1 >= T2).  The dictionary and keys are returned.
     Each dictionary column is the simulation over frequencies df.  The keys are
     a list of tuples: (T1,T2,alpha).
+
+    Atoms are simulated chunk_size at a time and written straight into
+    D, so only D itself is ever of full size.  Use dtype=np.complex64
+    to halve its memory, or pass a memory-mapped out, e.g.,
+    np.lib.format.open_memmap(filename, mode='w+', dtype=np.complex64,
+    shape=shape), for dictionaries larger than RAM.
     '''
 
     # Get keys from supplied params
     keys = get_keys(T1s, T2s, alphas)
+    df = np.asarray(df).reshape(-1)
+    phase_cyc = np.asarray(phase_cyc)
 
-    # # Use more efficient matrix formulation
-    # D = ssfp_old(keys[0, :], keys[1, :], TR, keys[2, :], df)
-
-    # Right now we have to do it for every alpha because ssfp() can't handle
-    # more than one alpha at a time...
-    D = np.zeros((keys.shape[1], df.size), dtype='complex')
-    for ii, alpha in np.ndenumerate(keys[2, :]):
-        D[ii, :] = ssfp(keys[0, ii], keys[1, ii], TR, alpha, df)
+    shape = (keys.shape[1],) + phase_cyc.shape + (df.size,)
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    elif out.shape != shape:
+        raise ValueError('out must have shape %s!' % str(shape))
 
-    # D = np.zeros((keys.shape[1], df.size), dtype='complex')
-    # for ii, alpha in np.ndenumerate(keys[2, :]):
-    #     for jj, df0 in  np.ndenumerate(df):
-    #         D[ii, jj] = ssfp(keys[0, ii], keys[1, ii], TR, alpha, df0)
-    return(D, keys)
+    # All atoms at once if we can, df along last axis, phase_cyc
+    # before it
+    if chunk_size is None:
+        chunk_size = max(1, 2**20//(phase_cyc.size*df.size))
+    phase_cyc = phase_cyc[..., None]
+    newaxes = (1,)*phase_cyc.ndim
+    for start in range(0, keys.shape[1], chunk_size):
+        chunk = keys[:, start:start+chunk_size]
+        T1, T2, alpha = [k.reshape((-1,) + newaxes) for k in chunk]
+        out[start:start+chunk.shape[1]] = ssfp_broadcast(
+            T1, T2, TR, alpha, df, phase_cyc)
+    return(out, keys)
 
 def ssfp_dictionary_for_loop(T1s, T2s, TR, alphas, df):
     '''Verification for ssfp_dictionary generation.
@@ -122,6 +149,140 @@ def ssfp_dictionary_for_loop(T1s, T2s, TR, alphas, df):
             D[ii, jj] = ssfp(keys[0, ii], keys[1, ii], TR, keys[2, ii], df[jj])
     return(D, keys)
 
+def _dictionary_basis(D, rank, atom_block_size):
+    '''First rank right singular vectors of dictionary D.
+
+    D is (atoms x samples).  Eigenvectors of the Gram matrix D^H D,
+    accumulated one block of atoms at a time so D can be a memmap.
+    '''
+    G = np.zeros(
+        (D.shape[1], D.shape[1]), dtype=np.result_type(D, 1j))
+    for start in range(0, D.shape[0], atom_block_size):
+        d = np.asarray(D[start:start+atom_block_size])
+        G += np.dot(d.conj().T, d)
+    _w, V = np.linalg.eigh(G)
+    return V[:, ::-1][:, :rank]
+
+def match_atoms(sigs, D, normalize=False, rank=None, block_size=1024,
+                atom_block_size=None, n_jobs=1):
+    '''Find indices of dictionary atoms closest to many signals.
+
+    Parameters
+    ==========
+    sigs : array_like
+        Signals, shape (...,) + D.shape[1:], e.g., (x, y, df) image.
+    D : array_like
+        Dictionary of signals, first axis are the atoms.  Can be a
+        numpy.memmap.
+    normalize : bool, optional
+        Match normalized atoms by largest magnitude inner product
+        (scale invariant) instead of smallest Euclidean distance.
+    rank : int, optional
+        Compress dictionary and signals to rank dimensions using the
+        SVD of the dictionary before matching.
+    block_size : int, optional
+        Number of signals matched at a time.
+    atom_block_size : int, optional
+        Number of atoms compared at a time.  By default, such that
+        each block of inner products has about 2**22 entries.
+    n_jobs : int, optional
+        Number of threads to match blocks of signals with.
+
+    Returns
+    =======
+    idx : array_like
+        Index of closest atom for each signal, shape sigs.shape[:-k]
+        where k = D.ndim - 1.
+
+    Notes
+    =====
+    Distances are never formed explicitly: with atom norms computed
+    once, ||d - s||^2 = ||d||^2 - 2 Re(s^H d) + ||s||^2, so each block
+    is a single complex matrix product.  Threads share the dictionary
+    and numpy releases the GIL during the products.
+    '''
+
+    atom_shape = D.shape[1:]
+    if sigs.shape[sigs.ndim-len(atom_shape):] != atom_shape:
+        raise ValueError('Signals must end with dimensions %s!' % str(
+            atom_shape))
+    im_shape = sigs.shape[:sigs.ndim-len(atom_shape)]
+    D = D.reshape((D.shape[0], -1))
+    sigs = sigs.reshape((-1, D.shape[1]))
+    if atom_block_size is None:
+        atom_block_size = max(1, 2**22//block_size)
+
+    # Compress dictionary and signals to the dominant subspace of
+    # atoms
+    if rank is not None:
+        V = _dictionary_basis(D, rank, atom_block_size)
+        D = np.concatenate([
+            np.dot(D[start:start+atom_block_size], V)
+            for start in range(0, D.shape[0], atom_block_size)])
+        sigs = np.dot(sigs, V)
+
+    # Norms of atoms once, for distances or normalization
+    norms = np.concatenate([
+        np.linalg.norm(D[start:start+atom_block_size], axis=1)
+        for start in range(0, D.shape[0], atom_block_size)])
+    if normalize:
+        weights = np.divide(
+            1, norms, out=np.zeros(norms.shape), where=norms > 0)
+    else:
+        weights = norms**2
+
+    idx = np.empty(sigs.shape[0], dtype=int)
+
+    def _match(start):
+        '''Match one block of signals against all atoms.'''
+        s = sigs[start:start+block_size]
+        best = np.full(s.shape[0], -np.inf)
+        best_idx = np.zeros(s.shape[0], dtype=int)
+        for astart in range(0, D.shape[0], atom_block_size):
+            P = np.dot(s, np.asarray(
+                D[astart:astart+atom_block_size]).conj().T)
+            w = weights[astart:astart+atom_block_size]
+            if normalize:
+                score = np.abs(P)*w
+            else:
+                score = 2*P.real - w
+            ii = np.argmax(score, axis=1)
+            val = score[np.arange(s.shape[0]), ii]
+            better = val > best
+            best[better] = val[better]
+            best_idx[better] = ii[better] + astart
+        idx[start:start+block_size] = best_idx
+
+    starts = range(0, sigs.shape[0], block_size)
+    if n_jobs > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            list(executor.map(_match, starts))
+    else:
+        for start in starts:
+            _match(start)
+    return idx.reshape(im_shape)
+
+def find_atoms(sigs, D, keys, **kwargs):
+    '''Find params of dictionary atoms closest to many signals.
+
+    Parameters
+    ==========
+    sigs : array_like
+        Signals, shape (...,) + D.shape[1:], e.g., (x, y, df) image.
+    D : array_like
+        Dictionary of signals with keys being the MR parameters.
+    keys : array_like
+        Keys of dictionary D, all (T1, T2, alpha) combinations.
+    kwargs : dict, optional
+        Options passed to match_atoms().
+
+    Returns
+    =======
+    param_est : array_like
+        T1, T2, alpha maps, shape (3,) + image shape.
+    '''
+    return keys[:, match_atoms(np.asarray(sigs), D, **kwargs)]
+
 def find_atom(sig, D, keys):
     '''Find params of dictionary atom closest to observed signal profile.
 
@@ -138,17 +299,13 @@ def find_atom(sig, D, keys):
     =======
     param_est : tuple
         T1, T2, alpha estimation based on closest dictionary atom.
-    '''
-
-    # Make sig and columns of D comparable
 
-
-    # Use MSE metric between each column of D and sig
-    res = np.sqrt(np.sum(np.abs(D - sig)**2, axis=1))
-
-    # Take the lowest MSE to be the correct atom and get the key
-    param_est = keys[:, np.argmin(res)]
-    return param_est
+    Notes
+    =====
+    Uses the smallest Euclidean distance, see find_atoms() to match
+    whole images at a time.
+    '''
+    return find_atoms(sig, D, keys)
 
 if __name__ == '__main__':
     pass
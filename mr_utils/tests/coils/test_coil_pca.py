@@ -1,12 +1,14 @@
 '''Coil combination using PCA unit tests.'''
 
 import unittest
+from os.path import join
+from tempfile import TemporaryDirectory
 
 from sklearn.decomposition import PCA
 from skimage.data import lfw_subset
 import numpy as np
 
-from mr_utils.coils.coil_combine import python_pca
+from mr_utils.coils.coil_combine import python_pca, CoilCompressor
 
 class TestPCA(unittest.TestCase):
     '''Test PCA implmentations.'''
@@ -23,5 +25,82 @@ class TestPCA(unittest.TestCase):
         self.assertTrue(np.allclose(np.abs(Y_py), np.abs(Y_ski)))
 
 
+class TestCoilCompressor(unittest.TestCase):
+    '''Test streaming complex coil compression.'''
+
+    def setUp(self):
+        np.random.seed(0)
+
+        # 8 coils that are combinations of 3 underlying signals
+        shape = (3, 16, 10, 4)
+        B = np.random.randn(*shape) + 1j*np.random.randn(*shape)
+        W = np.random.randn(8, 3) + 1j*np.random.randn(8, 3)
+        self.data = np.tensordot(W, B, axes=(1, 0))
+
+    def test_partial_fit(self):
+        '''Chunks give the same compression as all data at once.'''
+        cc0 = CoilCompressor(n_components=3, coil_dim=0)
+        cc0.fit(self.data)
+        cc1 = CoilCompressor(n_components=3, coil_dim=0)
+        for ii in range(self.data.shape[2]):
+            cc1.partial_fit(self.data[:, :, ii])
+        self.assertTrue(np.allclose(cc0.cov, cc1.cov))
+        self.assertTrue(np.allclose(cc0.matrix, cc1.matrix))
+        cc2 = CoilCompressor(.999, coil_dim=0).fit(self.data)
+        self.assertEqual(cc2.n_components_, 3)
+
+        # Rank 3 data is compressed without loss
+        y = cc0.transform(self.data)
+        x = np.tensordot(cc0.matrix.conj().T, y, axes=(1, 0))
+        self.assertTrue(np.allclose(x, self.data))
+
+    def test_transform_into_memmap(self):
+        '''Compress a chunk at a time straight to disk or lazily.'''
+        cc = CoilCompressor(n_components=3, coil_dim=0)
+        cc.fit(self.data, chunk_size=3)
+        y = cc.transform(self.data)
+        with TemporaryDirectory() as tmpdir:
+            out = np.lib.format.open_memmap(
+                join(tmpdir, 'y.npy'), mode='w+', dtype=y.dtype,
+                shape=y.shape)
+            cc.transform(self.data, out=out, chunk_size=3)
+            self.assertTrue(np.allclose(out, y))
+            del out
+        chunks = (
+            self.data[:, ii] for ii in range(self.data.shape[1]))
+        self.assertTrue(np.allclose(
+            np.stack(list(cc.transform_iter(chunks)), axis=1), y))
+        with self.assertRaises(ValueError):
+            cc.transform(self.data, out=np.empty(self.data.shape))
+
+    def test_geometric(self):
+        '''Coil subspace changing along readout is kept by GCC.'''
+
+        # Two virtual coils that change along x in hybrid space
+        nc, nx, ny = 8, 32, 20
+        x = np.linspace(-1, 1, nx)
+        W = np.stack([np.exp(1j*np.pi*np.outer(
+            np.arange(nc), [1 + xx, -xx])) for xx in x])
+        B = np.random.randn(2, nx, ny) + 1j*np.random.randn(2, nx, ny)
+        hybrid = np.einsum('xcr,rxy->xyc', W, B)
+        kspace = np.fft.fftshift(np.fft.fft(np.fft.ifftshift(
+            hybrid, axes=0), axis=0), axes=0)
+
+        energy = []
+        for readout_dim in [None, 0]:
+            cc = CoilCompressor(2, readout_dim=readout_dim)
+            cc.fit(kspace)
+            y = cc.transform(kspace, chunk_size=7)
+            self.assertEqual(y.shape, (nx, ny, 2))
+            energy.append(np.linalg.norm(y)/np.linalg.norm(kspace))
+        self.assertLess(energy[0], .9)
+        self.assertTrue(np.allclose(energy[1], 1))
+
+        # Aligned matrices change less along readout than eigenvectors
+        U = np.linalg.eigh(cc.cov)[1][..., ::-1][..., :2]
+        self.assertLess(
+            np.abs(np.diff(cc.matrix, axis=0)).max(),
+            np.abs(np.diff(U, axis=0)).max())
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,87 @@
+'''Walsh coil combination unit tests.'''
+
+import unittest
+
+import numpy as np
+from scipy.linalg import eigh
+from scipy.ndimage import uniform_filter
+
+from mr_utils.coils.coil_combine import walsh, walsh_gs
+
+class TestWalsh(unittest.TestCase):
+    '''Compare batched Walsh against per-pixel eigendecompositions.'''
+
+    def setUp(self):
+        np.random.seed(0)
+        self.nc, self.ny, self.nx = 6, 12, 10
+        shape = (self.nc, self.ny, self.nx)
+        self.img = (
+            np.random.randn(*shape) + 1j*np.random.randn(*shape))
+        self.noise = .3*(
+            np.random.randn(*shape) + 1j*np.random.randn(*shape))
+
+    def same(self, csm0, csm1):
+        '''Eigenvectors agree up to phase.'''
+        ip = np.abs(np.sum(csm0.conj()*csm1, axis=0))
+        ip /= np.linalg.norm(csm0, axis=0)
+        ip /= np.linalg.norm(csm1, axis=0)
+        return np.allclose(ip, 1) and np.allclose(
+            np.abs(csm0), np.abs(csm1))
+
+    def test_against_loop(self):
+        '''Same as solving each pixel with the noise covariance.'''
+        csm0 = np.zeros(self.img.shape, dtype=self.img.dtype)
+        for yy, xx in np.ndindex((self.ny, self.nx)):
+            x, n = self.img[:, yy, xx], self.noise[:, yy, xx]
+            Rs, Rn = np.outer(x, x.conj()), np.outer(n, n.conj())
+            np.fill_diagonal(Rs, 1)
+            np.fill_diagonal(Rn, 1)
+            Rni = np.linalg.inv(Rn)
+            _w, v = eigh(
+                Rni.dot(Rs), lower=False,
+                subset_by_index=(self.nc-1, self.nc-1))
+            v = v[:, 0]
+            csm0[:, yy, xx] = v/np.sqrt(v.conj().dot(Rni).dot(v))
+        csm1 = walsh(self.img, self.noise, tile_size=25)
+        self.assertTrue(self.same(csm0, csm1))
+
+        # Coil axis can be anywhere
+        csm2 = walsh(np.moveaxis(self.img, 0, -1),
+                     np.moveaxis(self.noise, 0, -1), coil_axis=-1)
+        self.assertTrue(np.allclose(np.moveaxis(csm2, -1, 0), csm1))
+
+    def test_smoothing_tiles(self):
+        '''Tiles give the same answer as smoothing the whole image.'''
+        R = self.img[:, None, ...]*self.img[None, ...].conj()
+        R = uniform_filter(R, size=(1, 1, 3, 3), mode='constant')
+        csm0 = np.zeros(self.img.shape, dtype=self.img.dtype)
+        for yy, xx in np.ndindex((self.ny, self.nx)):
+            _w, v = np.linalg.eigh(R[..., yy, xx])
+            csm0[:, yy, xx] = v[:, -1]
+        for tile_size in [1, 25, 1000]:
+            csm1 = walsh(self.img, kernel_size=3, tile_size=tile_size)
+            self.assertTrue(self.same(csm0, csm1))
+
+    def test_power(self):
+        '''Power iteration finds the same dominant eigenvector.'''
+        csm0 = walsh(self.img, kernel_size=5)
+        csm1 = walsh(
+            self.img, kernel_size=5, method='power', niter=1000)
+        self.assertTrue(np.allclose(csm0, csm1, atol=1e-6))
+
+    def test_walsh_gs(self):
+        '''Phase-cycles are averaged before taking eigenvectors.'''
+        pcs = np.stack([self.img, self.noise, self.img*1j], axis=-1)
+        R = np.mean(pcs[:, None, ...]*pcs[None, ...].conj(), axis=-1)
+        csm0 = np.zeros(self.img.shape, dtype=self.img.dtype)
+        for yy, xx in np.ndindex((self.ny, self.nx)):
+            np.fill_diagonal(R[..., yy, xx], 1)
+            _w, v = np.linalg.eigh(R[..., yy, xx])
+            csm0[:, yy, xx] = v[:, -1]
+        csm1 = walsh_gs(pcs, avg_method='cov', tile_size=7)
+        self.assertTrue(self.same(csm0, csm1))
+        with self.assertRaises(NotImplementedError):
+            walsh_gs(pcs)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+'''Proximal gradient descent unit tests.'''
+
+import unittest
+
+import numpy as np
+from pywt import threshold
+from scipy.fft import dctn, idctn
+
+from mr_utils.cs import proximal_GD
+from mr_utils.cs.convex.proximal_gd import _threshold
+from mr_utils.cs.models import UFT
+
+class TestProximalGD(unittest.TestCase):
+    '''Recover an image that is sparse in the DCT domain.'''
+
+    def setUp(self):
+        np.random.seed(0)
+        c = np.zeros((32, 32))
+        idx = np.random.permutation(c.size)[:30]
+        c.flat[idx] = np.random.randn(30)
+        self.sparsify = lambda x0: dctn(x0, norm='ortho')
+        self.unsparsify = lambda x0: idctn(x0, norm='ortho')
+        self.x = self.unsparsify(c) + 0j
+        self.uft = UFT(np.random.rand(*c.shape) < 0.5)
+        self.y = self.uft.forward_ortho(self.x)
+
+    def recon(self, **kwargs):
+        '''Run proximal_GD with defaults for this problem.'''
+        return proximal_GD(
+            self.y, self.uft.forward_ortho, self.uft.inverse_ortho,
+            self.sparsify, self.unsparsify, ignore_residual=True,
+            **kwargs)
+
+    def err(self, x_hat):
+        '''Relative error.'''
+        return np.linalg.norm(x_hat - self.x)/np.linalg.norm(self.x)
+
+    def test_threshold(self):
+        '''In place thresholding matches pywt.'''
+        bufs = {}
+        buf = lambda name, shape, dtype: bufs.setdefault(
+            (name, shape), np.empty(shape, dtype))
+        for mode in ['soft', 'hard', 'garotte']:
+            data = np.random.randn(10, 10)
+            ref = threshold(data, value=0.5, mode=mode)
+            self.assertTrue(
+                np.allclose(_threshold(data, 0.5, mode, buf), ref))
+
+    def test_reordering(self):
+        '''Reordering by the identity doesn't change anything.'''
+        idx = np.arange(self.x.size)*(1 + 1j)
+        x0 = self.recon(alpha=0.01, maxiter=20)
+        x1 = self.recon(
+            alpha=0.01, maxiter=20, reorder_fun=lambda x0: idx)
+        self.assertTrue(np.allclose(x0, x1))
+
+    def test_fista(self):
+        '''Momentum gets closer in the same number of iterations.'''
+        x0 = self.recon(alpha=0.001, maxiter=50)
+        x1 = self.recon(alpha=0.001, maxiter=50, fista=True)
+        self.assertLess(self.err(x1), self.err(x0))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+'''Sparse recovery with matrices, operators, and batches.'''
+
+import unittest
+
+import numpy as np
+
+from mr_utils.cs import IHT, nIHT, IST, cosamp, LinearOperator
+from mr_utils.cs.models import UFT
+from mr_utils.cs.operators import top_k
+from mr_utils.cs.greedy.cosamp import SupportLstsq
+
+class TestSparseRecovery(unittest.TestCase):
+    '''Solvers agree for matrices, operators, and batches.'''
+
+    def setUp(self):
+        np.random.seed(0)
+        self.N, self.n, self.k = 400, 150, 10
+        self.A = np.random.randn(self.n, self.N)
+        self.A /= np.sqrt(np.sum(self.A**2, axis=0))
+        self.x = np.zeros((self.N, 3))
+        for ii in range(3):
+            idx = np.random.permutation(self.N)[:self.k]
+            self.x[idx, ii] = np.sign(np.random.rand(self.k) - 0.5)
+        self.y = self.A.dot(self.x)
+        self.solvers = [
+            lambda A, y: IHT(A, y, self.k, mu=0.7),
+            lambda A, y: IST(A, y, k=self.k),
+            lambda A, y: cosamp(A, y, self.k),
+            lambda A, y: cosamp(A, y, self.k, lstsq='exact')]
+
+    def test_top_k(self):
+        '''Same coefficients as a full sort.'''
+        x = np.random.randn(50, 4)
+        mask = top_k(x, 7, batched=True)
+        for ii in range(4):
+            idx = np.argsort(np.abs(x[:, ii]))[-7:]
+            self.assertTrue(np.array_equal(
+                np.nonzero(mask[:, ii])[0], np.sort(idx)))
+        mask = top_k(x, 7)
+        self.assertTrue(np.array_equal(
+            np.nonzero(mask.ravel())[0],
+            np.sort(np.argsort(np.abs(x.ravel()))[-7:])))
+
+    def test_batch(self):
+        '''Columns of y are independent problems.'''
+        for solver in self.solvers:
+            x_hat = solver(self.A, self.y)
+            self.assertTrue(np.allclose(x_hat, self.x, atol=1e-6))
+            for ii in range(3):
+                self.assertTrue(np.allclose(
+                    solver(self.A, self.y[:, ii]), x_hat[:, ii]))
+
+    def test_operator(self):
+        '''Matrix-free operators give the same answer as a matrix.'''
+        A = LinearOperator(self.A.dot, self.A.T.dot)
+        y = self.y[:, 0]
+        for solver in self.solvers:
+            self.assertTrue(
+                np.allclose(solver(A, y), solver(self.A, y)))
+        A = LinearOperator(self.A.dot, self.A.T.dot, batched=True)
+        self.assertTrue(np.allclose(
+            nIHT(A, self.y, self.k), nIHT(self.A, self.y, self.k)))
+
+    def test_uft(self):
+        '''Recover a sparse complex image from undersampled data.'''
+        M = 32
+        x = np.zeros((M, M), dtype=complex)
+        idx = np.random.permutation(M**2)[:8]
+        x.flat[idx] = np.random.randn(8) + 1j*np.random.randn(8)
+        uft = UFT(np.random.rand(M, M) < 0.3)
+        A = LinearOperator(uft.forward_ortho, uft.inverse_ortho)
+        y = uft.forward_ortho(x)
+        self.assertTrue(np.allclose(cosamp(A, y, 8), x))
+        self.assertTrue(np.allclose(nIHT(A, y, 8), x, atol=1e-6))
+
+    def test_support_lstsq(self):
+        '''QR updates solve the same least squares problem.'''
+        y = self.y[:, 0]
+        lstsq = SupportLstsq(lambda T: self.A[:, T], y)
+        for _ii in range(5):
+            T = np.sort(np.random.permutation(self.N)[:30])
+            z0 = np.linalg.lstsq(self.A[:, T], y, rcond=None)[0]
+            self.assertTrue(np.allclose(lstsq(T), z0))
+            self.assertTrue(np.allclose(lstsq(T[5:]), np.linalg.lstsq(
+                self.A[:, T[5:]], y, rcond=None)[0]))
+
+if __name__ == '__main__':
+    unittest.main()
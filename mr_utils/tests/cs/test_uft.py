@@ -0,0 +1,85 @@
+'''Undersampled Fourier transform encoding model.'''
+
+import unittest
+
+import numpy as np
+
+from mr_utils.cs.models import UFT
+
+class TestUFT(unittest.TestCase):
+    '''Compare against numpy.fft with explicit shifts.'''
+
+    def setUp(self):
+        np.random.seed(0)
+        self.shape = (16, 15, 4)
+        self.samp = np.random.rand(*self.shape) < 0.4
+        self.x = np.random.randn(*self.shape) + 1j*np.random.randn(
+            *self.shape)
+        self.axes = (0, 1)
+
+    def test_ortho(self):
+        '''Centered, scaled, and masked transforms.'''
+        uft = UFT(self.samp, axes=self.axes)
+        ax = self.axes
+        ref = np.fft.fftshift(np.fft.fft2(np.fft.fftshift(
+            self.x, axes=ax), axes=ax), axes=ax)*self.samp/np.sqrt(
+                self.x.size)
+        self.assertTrue(np.allclose(uft.forward_ortho(self.x), ref))
+        ref = np.fft.ifftshift(np.fft.ifft2(np.fft.ifftshift(
+            self.x, axes=ax), axes=ax), axes=ax)*np.sqrt(self.x.size)
+        self.assertTrue(np.allclose(uft.inverse_ortho(self.x), ref))
+
+        # Unscaled ortho transforms are not masked either
+        uft = UFT(self.samp, axes=self.axes, scale=False)
+        ref = np.fft.fftshift(np.fft.fft2(np.fft.fftshift(
+            self.x, axes=ax), axes=ax), axes=ax)
+        self.assertTrue(np.allclose(uft.forward_ortho(self.x), ref))
+
+    def test_unshifted(self):
+        '''Plain and fftshifted transforms, mask applied once.'''
+        samp = self.samp*0.5
+        uft = UFT(samp, axes=self.axes)
+        scale = np.sqrt(self.x.size)
+        ref = np.fft.fftn(self.x, axes=self.axes)*samp/scale
+        self.assertTrue(np.allclose(uft.forward(self.x), ref))
+        ref = np.fft.ifftn(self.x, axes=self.axes)*scale
+        self.assertTrue(np.allclose(uft.inverse(self.x), ref))
+        ref = np.fft.fftshift(np.fft.fft2(
+            self.x, axes=self.axes), axes=self.axes)*samp
+        self.assertTrue(np.allclose(uft.forward_s(self.x), ref))
+        ref = np.fft.ifftshift(np.fft.ifft2(
+            self.x, axes=self.axes), axes=self.axes)
+        self.assertTrue(np.allclose(uft.inverse_s(self.x), ref))
+
+    def test_default_axes(self):
+        '''Without axes, all dimensions are transformed.'''
+        cases = [
+            (self.x[:, 0, 0], self.samp[:, 0, 0]),
+            (self.x, self.samp)]
+        for x, samp in cases:
+            uft = UFT(samp)
+            scale = np.sqrt(x.size)
+            ref = np.fft.fftshift(np.fft.fft2(
+                np.fft.fftshift(x, axes=None), axes=None),
+                                  axes=None)*samp/scale
+            self.assertTrue(np.allclose(uft.forward_ortho(x), ref))
+            ref = np.fft.ifftshift(np.fft.ifft2(
+                np.fft.ifftshift(x, axes=None), axes=None),
+                                   axes=None)*scale
+            self.assertTrue(np.allclose(uft.inverse_ortho(x), ref))
+            ref = np.fft.fftshift(np.fft.fft2(
+                x, axes=None), axes=None)*samp
+            self.assertTrue(np.allclose(uft.forward_s(x), ref))
+            ref = np.fft.ifftshift(np.fft.ifft2(
+                x, axes=None), axes=None)
+            self.assertTrue(np.allclose(uft.inverse_s(x), ref))
+
+    def test_out(self):
+        '''Results can be written to a preallocated array.'''
+        uft = UFT(self.samp, axes=self.axes, backend='numpy')
+        out = np.empty(self.shape, dtype=complex)
+        self.assertIs(uft.forward_ortho(self.x, out=out), out)
+        self.assertTrue(np.allclose(out, uft.forward_ortho(self.x)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+'''Unit tests for the asyncio Gadgetron connector.'''
+
+import unittest
+import asyncio
+import os
+import struct
+
+import numpy as np
+import ismrmrd
+
+from mr_utils.gadgetron.async_connector import session
+from mr_utils.gadgetron.fake_gadgetron import FakeGadgetron
+
+class AsyncConnectorTestCase(unittest.TestCase):
+    '''Run a few sessions on the same event loop.'''
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def acquisitions(self, nacq, nc, ns):
+        '''Make up some (head, traj, data) buffers.'''
+        acqs = []
+        for ii in range(nacq):
+            acq = ismrmrd.Acquisition()
+            acq.resize(ns, nc)
+            acq.scan_counter = ii
+            acq.data[:] = np.random.normal(size=acq.data.shape)
+            acqs.append(
+                (bytes(acq.getHead()), acq.traj, acq.data.copy()))
+        return acqs
+
+    def test_concurrent_sessions(self):
+        '''Each session gets its acquisitions and an image back.'''
+        nsessions, nacq, nc, ns = 4, 200, 4, 128
+        servers = [FakeGadgetron() for _ii in range(nsessions)]
+        acqs = [self.acquisitions(nacq, nc, ns)
+                for _ii in range(nsessions)]
+
+        async def _run():
+            return await asyncio.gather(*[
+                session(a, s.host, s.port,
+                        b'<ismrmrdHeader></ismrmrdHeader>')
+                for a, s in zip(acqs, servers)])
+        results = self.loop.run_until_complete(_run())
+
+        for a, s, images in zip(acqs, servers, results):
+            s.wait()
+            self.assertEqual(s.num_acquisitions, nacq)
+            self.assertEqual(len(images), 1)
+            self.assertTrue(np.array_equal(
+                images[0].data.squeeze(), a[-1][2]))
+
+    def test_dicom_withname(self):
+        '''Named DICOM blobs are kept and the session carries on.'''
+        sent = [(b'image_%d' % ii, os.urandom(100 + ii),
+                 b'<ismrmrdMeta>%d</ismrmrdMeta>' % ii)
+                for ii in range(3)]
+        server = FakeGadgetron(blobs=sent)
+        acqs = self.acquisitions(10, 2, 64)
+        blobs = {}
+        images = self.loop.run_until_complete(session(
+            acqs, server.host, server.port,
+            b'<ismrmrdHeader></ismrmrdHeader>', blobs=blobs))
+        server.wait()
+
+        self.assertEqual(len(images), 1)
+        self.assertEqual(len(blobs), 2*len(sent))
+        for filename, blob, attribs in sent:
+            name = filename.decode()
+            self.assertEqual(blobs['%s.dcm' % name], blob)
+            self.assertEqual(blobs['%s_attrib.xml' % name], attribs)
+
+    def test_reader_fails(self):
+        '''The sender is cancelled when reading fails.'''
+        state = {}
+
+        async def _serve(reader, writer):
+            # Answer with a message ID nobody knows and keep reading
+            writer.write(struct.pack('<H', 9999))
+            while await reader.read(1 << 16):
+                pass
+
+        async def _acqs():
+            try:
+                for acq in self.acquisitions(10, 2, 64):
+                    yield acq
+                # Block forever like a slow scanner would
+                await asyncio.Event().wait()
+            finally:
+                state['closed'] = True
+
+        async def _run():
+            server = await asyncio.start_server(
+                _serve, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                with self.assertRaises(ValueError):
+                    await asyncio.wait_for(session(
+                        _acqs(), '127.0.0.1', port,
+                        b'<ismrmrdHeader></ismrmrdHeader>'), 10)
+            finally:
+                server.close()
+                await server.wait_closed()
+            return asyncio.all_tasks() - {asyncio.current_task()}
+        tasks = self.loop.run_until_complete(_run())
+
+        self.assertTrue(state.get('closed'))
+        self.assertFalse([t for t in tasks if not t.done()])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+'''Unit tests for reading Gadgetron messages off of a socket.'''
+
+import unittest
+import socket
+import threading
+import time
+import os
+from tempfile import NamedTemporaryFile
+
+import numpy as np
+import ismrmrd
+
+from mr_utils.gadgetron import gtconnector as gt
+from mr_utils.gadgetron import client
+from mr_utils.gadgetron.client import (
+    read_acquisition_blocks, _prefetch)
+from mr_utils.gadgetron.fake_gadgetron import FakeGadgetron
+
+class GtConnectorReadTestCase(unittest.TestCase):
+    '''Reads go straight into the destination buffers.'''
+
+    def setUp(self):
+        self.rsock, self.wsock = socket.socketpair()
+
+    def tearDown(self):
+        self.rsock.close()
+        self.wsock.close()
+
+    def send(self, payload, chunk=1000):
+        '''Send payload in little pieces from another thread.'''
+        def _send():
+            for ii in range(0, len(payload), chunk):
+                self.wsock.sendall(payload[ii:ii+chunk])
+        thread = threading.Thread(target=_send)
+        thread.start()
+        return thread
+
+    def test_readsock_into(self):
+        '''Numpy array gets filled across many recv calls.'''
+        data = np.random.normal(size=(4, 3, 64)).astype(np.complex64)
+        out = np.zeros_like(data)
+        thread = self.send(data.tobytes())
+        gt.readsock_into(self.rsock, out)
+        thread.join()
+        self.assertTrue(np.array_equal(data, out))
+
+    def test_readsock_closed(self):
+        '''Closed connection raises instead of spinning.'''
+        self.wsock.sendall(b'abc')
+        self.wsock.close()
+        with self.assertRaises(RuntimeError):
+            gt.readsock(self.rsock, 10)
+
+    def test_image_reader(self):
+        '''Image message ends up in the dataset.'''
+        data = np.random.normal(
+            size=(2, 1, 16, 32)).astype(np.complex64)
+        img = ismrmrd.Image.from_array(data)
+        img.image_series_index = 3
+        payload = bytes(img.getHead()) + data.tobytes()
+
+        filename = NamedTemporaryFile(suffix='.h5').name
+        reader = gt.ImageMessageReader(filename, 'dataset')
+        thread = self.send(payload)
+        reader.read(self.rsock)
+        thread.join()
+        out = reader.sink.dataset.read_image('image_3', 0).data
+        reader.sink.dataset.close()
+        os.remove(filename)
+        self.assertTrue(np.array_equal(out.squeeze(), data.squeeze()))
+
+    def test_memory_sink(self):
+        '''Series are kept apart and grow past initial capacity.'''
+        sink = gt.MemorySink(capacity=2)
+        images = {0: [], 1: []}
+        for ii in range(7):
+            data = np.random.normal(
+                size=(1, 1, 4, 8)).astype(np.float32)
+            img = ismrmrd.Image.from_array(data)
+            img.image_series_index = ii % 2
+            img.image_index = ii
+            images[ii % 2].append(data)
+            sink.append_image(img)
+
+        self.assertEqual(sink.series(), [0, 1])
+        for series, data in images.items():
+            self.assertTrue(np.array_equal(
+                sink.data(series), np.stack(data)))
+            self.assertTrue(np.all(
+                sink.header(series)['image_series_index'] == series))
+
+    def test_reader_error(self):
+        '''Errors on the reader thread are raised by wait().'''
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        con = gt.Connector()
+        sink = gt.MemorySink()
+        con.register_reader(
+            gt.GADGET_MESSAGE_ISMRMRD_IMAGE,
+            gt.ImageMessageReader(sink=sink))
+        con.connect(*server.getsockname())
+        conn, _addr = server.accept()
+
+        # Same series, different shapes
+        for shape in [(1, 1, 4, 8), (1, 1, 4, 4)]:
+            img = ismrmrd.Image.from_array(
+                np.zeros(shape, dtype=np.float32))
+            gt.sendmsg_all(conn, [
+                gt.GadgetMessageIdentifier.pack(
+                    gt.GADGET_MESSAGE_ISMRMRD_IMAGE),
+                bytes(img.getHead()), img.data])
+        conn.sendall(
+            gt.GadgetMessageIdentifier.pack(gt.GADGET_MESSAGE_CLOSE))
+        with self.assertRaises(ValueError):
+            con.wait()
+        conn.close()
+        server.close()
+
+class FakeGadgetronTestCase(unittest.TestCase):
+    '''Send acquisitions to a stand-in server.'''
+
+    def setUp(self):
+        self.nacq, self.nc, self.ns = 300, 4, 128
+        self.filename = NamedTemporaryFile(suffix='.h5').name
+        dset = ismrmrd.Dataset(self.filename, 'dataset', True)
+        dset.write_xml_header(b'<ismrmrdHeader></ismrmrdHeader>')
+        for ii in range(self.nacq):
+            acq = ismrmrd.Acquisition()
+            acq.resize(self.ns, self.nc)
+            acq.scan_counter = ii
+            acq.data[:] = np.random.normal(size=acq.data.shape)
+            dset.append_acquisition(acq)
+        self.last = acq.data.copy()
+        dset.close()
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_client(self):
+        '''Every acquisition makes it, coalesced into large sends.'''
+        server = FakeGadgetron()
+        data, _header = client(
+            self.filename, address=server.host, port=server.port,
+            block_size=64)
+        server.wait()
+
+        self.assertEqual(server.num_acquisitions, self.nacq)
+        self.assertTrue(np.array_equal(server.last, self.last))
+        self.assertTrue(np.array_equal(data.squeeze(), self.last))
+
+    def test_read_blocks(self):
+        '''Blocks read with h5py match the ismrmrd fallback.'''
+        dset = ismrmrd.Dataset(self.filename, 'dataset', False)
+        blocks = list(read_acquisition_blocks(dset, 64))
+        blocks_h5 = list(read_acquisition_blocks(
+            dset, 64, filename=self.filename))
+        dset.close()
+        self.assertEqual(
+            [len(b) for b in blocks], [len(b) for b in blocks_h5])
+        for b0, b1 in zip(blocks, blocks_h5):
+            for acq0, acq1 in zip(b0, b1):
+                for buf0, buf1 in zip(acq0, acq1):
+                    self.assertEqual(
+                        np.ascontiguousarray(buf0).tobytes(),
+                        np.ascontiguousarray(buf1).tobytes())
+
+    def test_prefetch_stop(self):
+        '''Producer thread quits when the consumer stops early.'''
+        items = _prefetch(iter(range(1000)), 2)
+        self.assertEqual(next(items), 0)
+        items.close()
+        for _ii in range(50):
+            if not any(t.name == '_prefetch'
+                       for t in threading.enumerate()):
+                break
+            time.sleep(.05)
+        self.assertFalse(any(
+            t.name == '_prefetch' for t in threading.enumerate()))
+
+    def test_partial_sends(self):
+        '''Tiny socket buffers make sendmsg send partial messages.'''
+        rsock, wsock = socket.socketpair()
+        wsock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        bufs = [np.arange(ii*1000, dtype=np.float32)
+                for ii in range(20)]
+        payload = b''.join(b.tobytes() for b in bufs)
+        out = bytearray(len(payload))
+        thread = threading.Thread(
+            target=gt.readsock_into, args=(rsock, out))
+        thread.start()
+        gt.sendmsg_all(wsock, bufs)
+        thread.join()
+        rsock.close()
+        wsock.close()
+        self.assertEqual(bytes(out), payload)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,7 @@
 import unittest
 
 import numpy as np
+from scipy.linalg import expm, fractional_matrix_power
 
 from mr_utils.test_data import load_test_data
 
@@ -59,5 +60,60 @@ class SCGrogTestCase(unittest.TestCase):
         self.assertTrue(np.allclose(kspace, kspacem))
         self.assertTrue(np.allclose(mask, maskm))
 
+    def test_grog_interp(self):
+        '''Batched eigenbasis shifts match fractional powers.'''
+        from mr_utils.gridding.scgrog.scgrog import grog_interp
+
+        np.random.seed(0)
+        nc, sx, nor, N = 4, 16, 6, 16
+        Gx = expm(.3*(np.random.randn(nc, nc)
+                      + 1j*np.random.randn(nc, nc)))
+        Gy = expm(.3*(np.random.randn(nc, nc)
+                      + 1j*np.random.randn(nc, nc)))
+        r = np.linspace(-.5, .5, sx, endpoint=False)
+        traj = r[:, None]*np.exp(
+            1j*np.linspace(0, np.pi, nor))[None, :]
+        kspace = np.random.randn(sx, nor, nc) + 1j*np.random.randn(
+            sx, nor, nc)
+
+        # Move every sample with its own fractional powers
+        kspace_out = np.zeros((N + 1, N + 1, nc), dtype='complex')
+        counts = np.zeros((N + 1, N + 1))
+        for ii, jj in np.ndindex((sx, nor)):
+            kx, ky = np.real(traj[ii, jj])*N, np.imag(traj[ii, jj])*N
+            xx, yy = int(np.round(kx) + N/2), int(np.round(ky) + N/2)
+            kspace_out[xx, yy] += fractional_matrix_power(
+                Gx, np.round(kx) - kx).dot(fractional_matrix_power(
+                    Gy, np.round(ky) - ky)).dot(kspace[ii, jj])
+            counts[xx, yy] += 1
+        kspace_out[counts > 0] /= counts[counts > 0, None]
+
+        kspace0 = grog_interp(kspace, Gx, Gy, traj, (N, N))
+        self.assertTrue(np.allclose(kspace0, kspace_out[1:, 1:]))
+        kspace1 = grog_interp(kspace, Gx, Gy, traj, (N, N), step=1e-3)
+        self.assertTrue(np.allclose(kspace1, kspace0, atol=1e-2))
+
+    def test_scgrog_threads(self):
+        '''Frames gridded in parallel are the same.'''
+        from mr_utils.gridding import scgrog
+
+        np.random.seed(0)
+        nc, sx, nor, nof, N = 4, 16, 6, 3, 16
+        Gx = expm(.3*(np.random.randn(nc, nc)
+                      + 1j*np.random.randn(nc, nc)))
+        Gy = expm(.3*(np.random.randn(nc, nc)
+                      + 1j*np.random.randn(nc, nc)))
+        r = np.linspace(-.5, .5, sx, endpoint=False)
+        traj = r[:, None, None]*np.exp(1j*np.linspace(
+            0, np.pi, nor*nof).reshape((1, nor, nof)))
+        shape = (sx, nor, nof, nc)
+        kspace = np.random.randn(*shape) + 1j*np.random.randn(*shape)
+        cart0, mask0 = scgrog(kspace, traj, Gx, Gy, (N, N, nof, nc))
+        cart1, mask1 = scgrog(
+            kspace, traj, Gx, Gy, (N, N, nof, nc), n_jobs=2)
+        self.assertEqual(cart0.shape, (N, N, nof, nc))
+        self.assertTrue(np.allclose(cart0, cart1))
+        self.assertTrue(np.all(mask0 == mask1))
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,90 @@
+'''Unit tests for indexing scans of a memory-mapped raw data file.'''
+
+import unittest
+
+import numpy as np
+
+from mr_utils.load_data.s2i import (
+    indexScans, scanData, channelHeaders, sScanHeader, sChannelHeader,
+    sMDH)
+
+class IndexScansTestCase(unittest.TestCase):
+    '''Build a fake measurement and make sure we find every scan.'''
+
+    def setUp(self):
+        self.nscans = 5
+        self.nch = 3
+        self.ns = 16
+        self.data = np.random.normal(size=(
+            self.nscans, self.nch, self.ns)).astype(np.complex64)
+        self.data += 1j*np.random.normal(size=self.data.shape)
+
+    def vd_buffer(self):
+        '''VD: scan header, then channel header + data per channel.'''
+        chunks = []
+        for ii in range(self.nscans + 1):
+            scanhead = np.zeros(1, dtype=sScanHeader)
+            scanhead['ushSamplesInScan'] = self.ns
+            scanhead['ushUsedChannels'] = self.nch
+            scanhead['ulScanCounter'] = ii
+            scanhead['sLC']['ushLine'] = ii
+            if ii == self.nscans:
+                # ACQEND
+                scanhead['aulEvalInfoMask'][0, 0] = 1
+            chunks.append(scanhead.tobytes())
+            for c in range(self.nch):
+                chanhead = np.zeros(1, dtype=sChannelHeader)
+                chanhead['ulChannelId'] = c
+                chunks.append(chanhead.tobytes())
+                if ii < self.nscans:
+                    chunks.append(self.data[ii, c, :].tobytes())
+                else:
+                    chunks.append(np.zeros(
+                        self.ns, dtype=np.complex64).tobytes())
+        return np.frombuffer(b''.join(chunks), dtype=np.uint8)
+
+    def vb_buffer(self):
+        '''VB: MDH + data for each channel.'''
+        chunks = []
+        for ii in range(self.nscans):
+            for c in range(self.nch):
+                mdh = np.zeros(1, dtype=sMDH)
+                mdh['ushSamplesInScan'] = self.ns
+                mdh['ushUsedChannels'] = self.nch
+                mdh['ushChannelId'] = c
+                mdh['sLC']['ushLine'] = ii
+                mdh['aushFreePara'][0, 0] = 7
+                chunks.append(mdh.tobytes())
+                chunks.append(self.data[ii, c, :].tobytes())
+        return np.frombuffer(b''.join(chunks), dtype=np.uint8)
+
+    def test_vd(self):
+        '''Headers, channel headers, and data come out of VD data.'''
+        buf = self.vd_buffer()
+        offsets, scanheads, end = indexScans(buf, 0, buf.size, False)
+        self.assertEqual(offsets.size, self.nscans)
+        self.assertEqual(end, buf.size)
+        self.assertTrue(np.all(
+            scanheads['sLC']['ushLine'] == np.arange(self.nscans)))
+        for ii, (off, scanhead) in enumerate(zip(offsets, scanheads)):
+            data = scanData(buf, off, scanhead, False)
+            self.assertTrue(np.array_equal(data, self.data[ii, ...]))
+            self.assertTrue(np.shares_memory(data, buf))
+            chanheads = channelHeaders(buf, off, scanhead)
+            self.assertTrue(np.all(
+                chanheads['ulChannelId'] == np.arange(self.nch)))
+
+    def test_vb(self):
+        '''MDHs get converted to scan headers for VB buffers.'''
+        buf = self.vb_buffer()
+        offsets, scanheads, _end = indexScans(buf, 0, buf.size, True)
+        self.assertEqual(offsets.size, self.nscans)
+        self.assertEqual(scanheads.dtype, sScanHeader)
+        self.assertTrue(np.all(
+            scanheads['aushIceProgramPara'][:, 4] == 7))
+        for ii, (off, scanhead) in enumerate(zip(offsets, scanheads)):
+            data = scanData(buf, off, scanhead, True)
+            self.assertTrue(np.array_equal(data, self.data[ii, ...]))
+
+if __name__ == '__main__':
+    unittest.main()
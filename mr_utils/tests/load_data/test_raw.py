@@ -0,0 +1,75 @@
+'''Unit tests for sorting siemens_to_ismrmrd output into arrays.'''
+
+import unittest
+import os
+from tempfile import NamedTemporaryFile
+import warnings
+
+import numpy as np
+with warnings.catch_warnings():
+    warnings.filterwarnings('ignore', category=FutureWarning)
+    import ismrmrd
+
+from mr_utils.load_data.raw import _assemble_s2i
+
+class AssembleS2ITestCase(unittest.TestCase):
+    '''Make sure batched path matches reading one acq at a time.'''
+
+    def setUp(self):
+        self.nc, self.eNx, self.rNx = 4, 64, 32
+        self.ny, self.nz = 8, 2
+        self.filename = NamedTemporaryFile(suffix='.h5').name
+        dset = ismrmrd.Dataset(self.filename, 'dataset', True)
+
+        # Noise scan first, that should be skipped
+        acq = ismrmrd.Acquisition()
+        acq.resize(self.eNx, self.nc)
+        acq.setFlag(ismrmrd.ACQ_IS_NOISE_MEASUREMENT)
+        dset.append_acquisition(acq)
+
+        self.ref = {}
+        for z in range(self.nz):
+            for y in range(self.ny):
+                acq = ismrmrd.Acquisition()
+                acq.resize(self.eNx, self.nc)
+                acq.idx.kspace_encode_step_1 = y
+                acq.idx.kspace_encode_step_2 = z
+                acq.data[:] = np.random.normal(
+                    size=acq.data.shape) + 1j*np.random.normal(
+                        size=acq.data.shape)
+                self.ref[(z, y)] = acq.data.copy()
+                dset.append_acquisition(acq)
+        dset.close()
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_no_ros(self):
+        '''Without oversampling removal, data goes straight in.'''
+        all_data = _assemble_s2i(
+            self.filename,
+            (1, 1, 1, self.nc, self.nz, self.ny, self.eNx),
+            self.eNx, self.rNx, False)
+        for (z, y), acq in self.ref.items():
+            self.assertTrue(np.array_equal(
+                all_data[0, 0, 0, :, z, y, :], acq))
+
+    def test_ros(self):
+        '''Compare to removing oversampling one readout at a time.'''
+        all_data = _assemble_s2i(
+            self.filename,
+            (1, 1, 1, self.nc, self.nz, self.ny, self.rNx),
+            self.eNx, self.rNx, True)
+        x0 = int((self.eNx - self.rNx) / 2)
+        x1 = x0 + self.rNx
+        for (z, y), acq in self.ref.items():
+            xline = np.fft.fftshift(np.fft.ifft(
+                np.fft.ifftshift(acq, axes=1), axis=1), axes=1)
+            xline = xline[:, x0:x1]*np.sqrt(self.eNx)
+            k = np.fft.fftshift(np.fft.fft(np.fft.ifftshift(
+                xline, axes=1), axis=1), axes=1)/np.sqrt(self.rNx)
+            self.assertTrue(np.allclose(
+                all_data[0, 0, 0, :, z, y, :], k, atol=1e-5))
+
+if __name__ == '__main__':
+    unittest.main()
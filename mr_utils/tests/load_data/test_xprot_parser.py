@@ -29,7 +29,44 @@ def leafPaths(nestedDicts, noDeeper=isAtomOrFlat):
 class XProtParserTestCase(unittest.TestCase):
 
     def setUp(self):
-        pass
+        self.sample = '''<XProtocol>
+        {
+          <Name> "PhoenixMetaProtocol"
+          <ID> 1000002
+          <Userversion> 2.0
+          <EVAStringTable>
+          {
+            34
+            400 "Multiple series"
+          }
+          <ParamMap."">
+          {
+            <ParamLong."NoOfFourierLines">
+            {
+              256
+            }
+          }
+          <ParamCardLayout."Inline Compose">
+          {
+            <Repr> "LAYOUT_10X2_WIDE_CONTROLS"
+          }
+        }
+        '''
+
+    def test_parse(self):
+        '''Make sure we can parse a small header.'''
+        structure = XProtParser().parse(self.sample)['XProtocol']
+        self.assertEqual(structure['Name'], '"PhoenixMetaProtocol"')
+        self.assertEqual(structure['ID'], '1000002')
+        self.assertIn('NoOfFourierLines', structure['Params'][''])
+
+    def test_parse_many(self):
+        '''Parsing many headers gives same answer as one at a time.'''
+        structure = XProtParser().parse(self.sample)
+        structures = XProtParser().parse_many([self.sample]*5)
+        self.assertEqual(len(structures), 5)
+        for s in structures:
+            self.assertEqual(s, structure)
 
     # def test_sample(self):
     #     sample = XProtParserTest.full_sample_xprot()
@@ -0,0 +1,101 @@
+'''Unit tests for looking up XProtocol values by string search.'''
+
+import unittest
+
+import numpy as np
+
+from mr_utils.load_data.s2i import xprot_get_val, XProtIndex
+
+XPROT = '''<XProtocol>
+{
+  <Name> "PhoenixMetaProtocol"
+}
+<ParamMap."HEADER">
+{
+  <Visible> "true"
+  <ParamString."tProtocolName">  { "gre_{test}"  }
+}
+<ParamMap."MEAS">
+{
+  <Visible> "true"
+  <ParamMap."sKSpace">
+  {
+    <Visible> "true"
+    <ParamLong."lPhaseEncodingLines">  { 128  }
+    <ParamLong."lPartitions">  { 1  }
+    <ParamMap."sSub">
+    {
+      <Visible> "true"
+      <ParamLong."lRadialViews">  { 64  }
+    }
+  }
+  <ParamMap."sWiPMemBlock">
+  {
+    <Visible> "true"
+    <ParamLong."alFree">  { 1 2 3 4  }
+    <ParamDouble."adFree">  { <Precision> 6  1.500000 2.250000  }
+  }
+  <ParamArray."asCoilSelectMeas">
+  {
+    <Visible> "true"
+    { <ParamLong."lRxChannelConnected">  { 7  } }
+  }
+}
+<ParamMap."YAPS">
+{
+  <Visible> "true"
+  <ParamLong."iMaxNoOfRxChannels">  { 32  }
+}
+'''
+
+class XProtIndexTestCase(unittest.TestCase):
+    '''Indexed lookups should agree with searching the buffer.'''
+
+    def setUp(self):
+        self.index = XProtIndex(XPROT)
+        self.paths = [
+            'HEADER.tProtocolName',
+            'MEAS.sKSpace.lPhaseEncodingLines',
+            'MEAS.sKSpace.lPartitions',
+            'MEAS.sKSpace.lRadialViews',
+            'MEAS.sWiPMemBlock.alFree',
+            'MEAS.sWiPMemBlock.adFree',
+            'YAPS.iMaxNoOfRxChannels',
+        ]
+
+    def test_same_as_search(self):
+        '''Every path matches the string search version.'''
+        for path in self.paths:
+            val0 = xprot_get_val(XPROT, path)
+            val1 = xprot_get_val(XPROT, path, self.index)
+            if isinstance(val0, np.ndarray):
+                self.assertTrue(np.array_equal(val0, val1), path)
+            else:
+                self.assertEqual(val0, val1, path)
+
+    def test_values(self):
+        '''Spot check a few values.'''
+        self.assertEqual(
+            xprot_get_val(XPROT, 'HEADER.tProtocolName', self.index),
+            'gre_{test}')
+        adfree = xprot_get_val(
+            XPROT, 'MEAS.sWiPMemBlock.adFree', self.index)
+        self.assertTrue(np.allclose(adfree, [1.5, 2.25]))
+
+        # String search grabs the wrong brace when a tag directly
+        # follows an opening brace, the index doesn't
+        self.assertTrue(np.array_equal(xprot_get_val(
+            XPROT, 'MEAS.asCoilSelectMeas.0.lRxChannelConnected',
+            self.index), [7]))
+
+    def test_not_found(self):
+        '''Missing paths raise KeyError, also on repeat lookups.'''
+        for _ii in range(2):
+            with self.assertRaises(KeyError):
+                xprot_get_val(
+                    XPROT, 'MEAS.sKSpace.lNotThere', self.index)
+        with self.assertRaises(KeyError):
+            xprot_get_val(XPROT, 'YAPS.lPartitions', self.index)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+'''Talk to the MATLAB server without MATLAB.'''
+
+import unittest
+import io
+import threading
+
+import numpy as np
+
+from mr_utils.matlab.contract import write_vars, read_vars
+from mr_utils.matlab.server import MATLAB, MATLABServer
+from mr_utils.matlab.stub import stub_cmd
+from mr_utils.matlab import client_get, client_put, MatlabSession
+
+class ContractTestCase(unittest.TestCase):
+    '''Framing should give back exactly what went in.'''
+
+    def test_roundtrip(self):
+        '''Arrays of all sorts survive the trip.'''
+        variables = {
+            'A': np.random.random((30, 20)),
+            'B': np.asfortranarray(np.random.random(
+                (4, 5, 6)) + 1j*np.random.random((4, 5, 6))),
+            'C': np.array(3),
+            'D': np.zeros((0, 3), dtype=np.int16),
+            'E': np.array(['hi', 'there']),
+        }
+        f = io.BytesIO()
+        write_vars(f, variables)
+        f.seek(0)
+        received = read_vars(f)
+        self.assertEqual(set(received), set(variables))
+        for key, val in variables.items():
+            self.assertEqual(received[key].dtype, val.dtype)
+            self.assertTrue(np.array_equal(received[key], val))
+
+    def test_truncated(self):
+        '''Short transfers raise instead of giving back garbage.'''
+        f = io.BytesIO()
+        write_vars(f, {'A': np.ones(100)})
+        with self.assertRaises(EOFError):
+            read_vars(io.BytesIO(f.getvalue()[:-1]))
+
+class ServerTestCase(unittest.TestCase):
+    '''Talk to the server over loopback, stub stands in for MATLAB.'''
+
+    @classmethod
+    def setUpClass(cls):
+        cls.matlab = MATLAB(cmd=stub_cmd())
+        cls.server = MATLABServer(('127.0.0.1', 0), cls.matlab)
+        cls.host, cls.port = cls.server.server_address
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+        cls.matlab.exit()
+
+    def session(self):
+        '''Open a session to the test server.'''
+        return MatlabSession(self.host, self.port, 1024)
+
+    def test_put_and_get(self):
+        '''Large array goes there and back.'''
+        pyArr = np.random.random((512, 512, 8))
+        client_put({'pyArr': pyArr}, self.host, self.port, 1024)
+        matArr = client_get(
+            ['pyArr'], self.host, self.port, 1024)['pyArr']
+        self.assertTrue(np.allclose(pyArr, matArr))
+
+    def test_get_missing(self):
+        '''Asking for something that isn't there is an error.'''
+        with self.assertRaises(ValueError):
+            client_get(['notThere'], self.host, self.port, 1024)
+
+    def test_pipelined(self):
+        '''Replies to pipelined requests come back in order.'''
+        with self.session() as session:
+            session.put({'x0': np.arange(3)})
+            replies = [
+                session.run('x%d = x%d + 1' % (ii+1, ii), wait=False)
+                for ii in range(20)]
+            reply = session.get(['x0', 'x20'], wait=False)
+            out = session.run("fprintf('hello\\n')")
+            self.assertEqual(out.splitlines()[-1], 'hello')
+            self.assertTrue(all(r.done for r in replies))
+            vals = reply.result()
+        self.assertTrue(np.array_equal(vals['x20'], vals['x0'] + 20))
+
+    def test_pipelined_large(self):
+        '''Large PUT after an unread large GET doesn't deadlock.'''
+        A = np.random.random((1000, 1000))
+        results = {}
+
+        def _work():
+            with self.session() as session:
+                session.put({'big': A})
+                reply = session.get(['big'], wait=False)
+                session.put({'big2': A}, wait=False)
+                results['big'] = reply.result()['big']
+                results['big2'] = session.get(['big2'])['big2']
+
+        thread = threading.Thread(target=_work, daemon=True)
+        thread.start()
+        thread.join(60)
+        self.assertFalse(thread.is_alive())
+        self.assertTrue(np.array_equal(results['big'], A))
+        self.assertTrue(np.array_equal(results['big2'], A))
+
+    def test_concurrent_sessions(self):
+        '''Sessions in different threads share the one MATLAB.'''
+        results = {}
+
+        def _work(ii):
+            with self.session() as session:
+                session.put({'t%d' % ii: np.ones(10)*ii})
+                results[ii] = session.get(['t%d' % ii])['t%d' % ii]
+
+        threads = [threading.Thread(target=_work, args=(ii,))
+                   for ii in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for ii in range(8):
+            self.assertTrue(np.all(results[ii] == ii))
+
+if __name__ == '__main__':
+    unittest.main()
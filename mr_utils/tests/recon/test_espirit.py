@@ -0,0 +1,90 @@
+'''Test ESPIRiT coil sensitivity estimation.'''
+
+import unittest
+
+import numpy as np
+
+from mr_utils.recon.espirit import (
+    espirit_2d, espirit_3d, dominant_eig, randomized_svd)
+from mr_utils.test_data.phantom import modified_shepp_logan
+
+class TestESPIRiT(unittest.TestCase):
+    '''Sanity checks for espirit.'''
+
+    def coils(self, N, nc=8):
+        '''Phantom, normalized coil sensitivities and k-space.'''
+        grid = np.meshgrid(
+            *[np.linspace(-1, 1, n) for n in N], indexing='ij')
+        angles = np.linspace(0, 2*np.pi, nc, endpoint=False)
+        centers = [
+            np.cos(angles), np.sin(angles), .8*np.cos(2*angles)]
+        sens = np.stack([np.exp(-sum(
+            (g - c[ii])**2 for g, c in zip(grid, centers))/1.5 + 1j*a)
+                         for ii, a in enumerate(angles)], axis=-1)
+        sens /= np.linalg.norm(sens, axis=-1, keepdims=True)
+        if len(N) == 2:
+            im = modified_shepp_logan(N + (16,))[..., 8]
+        else:
+            im = modified_shepp_logan(N)
+        axes = tuple(range(len(N)))
+        kspace = np.fft.fftshift(np.fft.fftn(np.fft.ifftshift(
+            sens*im[..., None], axes=axes), axes=axes), axes=axes)
+        return im, sens, kspace
+
+    def test_dominant_eig(self):
+        '''Batched eigenvectors match per pixel svd.'''
+        np.random.seed(0)
+        shape = (4, 5, 12, 6)
+        vpix = np.random.randn(*shape) + 1j*np.random.randn(*shape)
+        s0, V0 = dominant_eig(vpix)
+        s1, V1 = dominant_eig(
+            vpix, method='power', niter=200, chunk_size=7)
+        for ix in range(4):
+            for iy in range(5):
+                vvH = vpix[ix, iy].T.dot(vpix[ix, iy].conj())
+                _U, s, V = np.linalg.svd(vvH)
+                self.assertTrue(np.allclose(s[0], s0[ix, iy]))
+                self.assertTrue(np.allclose(
+                    np.abs(V[0].dot(V0[ix, iy])), 1))
+        self.assertTrue(np.allclose(s0, s1))
+        self.assertTrue(np.allclose(V0, V1, atol=1e-6))
+
+    def test_randomized_svd(self):
+        '''Leading singular values match the full svd.'''
+        np.random.seed(0)
+        A = np.random.randn(100, 5).dot(np.random.randn(5, 300)) + 0j
+        A += 1e-3*(
+            np.random.randn(100, 300) + 1j*np.random.randn(100, 300))
+        _U, s, V = randomized_svd(A, 5, random_state=0)
+        s0 = np.linalg.svd(A, compute_uv=False)
+        self.assertEqual(V.shape, (5, 300))
+        self.assertTrue(np.allclose(s, s0[:5]))
+
+    def test_espirit_2d(self):
+        '''Maps match coil sensitivities up to phase.'''
+        im, sens, kspace = self.coils((64, 64))
+        xcrop = kspace[20:44, 20:44]
+        mask = im > .05
+        for pad in [0, 1]:
+            V0, s0 = espirit_2d(
+                xcrop, kspace.shape, pad_before_espirit=pad)
+            self.assertTrue(np.all(
+                np.abs(np.sum(V0.conj()*sens, axis=-1))[mask] > .99))
+            V1, s1 = espirit_2d(
+                xcrop, kspace.shape, pad_before_espirit=pad,
+                svd='randomized', eig='power')
+            self.assertTrue(np.allclose(s0, s1))
+            self.assertTrue(np.allclose(V0, V1, atol=1e-6))
+
+    def test_espirit_3d(self):
+        '''Maps match coil sensitivities up to phase in 3D.'''
+        im, sens, kspace = self.coils((24, 24, 16))
+        xcrop = kspace[6:18, 6:18, 2:14]
+        V, _s = espirit_3d(xcrop, kspace.shape, hkwin_shape=(8, 8, 8),
+                           random_state=0)
+        self.assertEqual(V.shape, kspace.shape)
+        self.assertTrue(np.all(
+            np.abs(np.sum(V.conj()*sens, axis=-1))[im > .05] > .95))
+
+if __name__ == '__main__':
+    unittest.main()
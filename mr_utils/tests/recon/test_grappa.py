@@ -170,5 +170,85 @@ class GRAPPAUnitTest(unittest.TestCase):
         recon_mat = GRAPPA.Im_Recon()
         self.assertTrue(np.allclose(recon, recon_mat))
 
+class GRAPPABatchedUnitTest(unittest.TestCase):
+    '''Verify batched GRAPPA on synthetic coils.'''
+
+    def coils(self, N, nc=8):
+        '''Shepp-Logan phantom weighted by smooth complex coils.'''
+        from mr_utils.test_data.phantom import modified_shepp_logan
+        grid = np.meshgrid(
+            *[np.linspace(-1, 1, n) for n in N], indexing='ij')
+        angles = np.linspace(0, 2*np.pi, nc, endpoint=False)
+        centers = [
+            np.cos(angles), np.sin(angles), .8*np.cos(2*angles)]
+        shape = (-1,) + (1,)*len(N)
+        sens = np.exp(-sum(
+            (g[None, ...] - c.reshape(shape))**2
+            for g, c in zip(grid, centers))/1.5)
+        sens = sens*np.exp(1j*angles).reshape(shape)
+        if len(N) == 2:
+            im = modified_shepp_logan(N + (16,))[..., 8]
+        else:
+            im = modified_shepp_logan(N)
+        axes = tuple(range(1, len(N) + 1))
+        return np.fft.fftshift(np.fft.fftn(np.fft.ifftshift(
+            sens*im, axes=axes), axes=axes), axes=axes)
+
+    def test_batch_shared_calib(self):
+        '''Slices sharing calibration match slice-by-slice recon.'''
+        from mr_utils.recon.grappa import grappa
+
+        k = self.coils((64, 64))
+        kspace = np.stack((k, 2*k, 1j*k))
+        mask = np.zeros(kspace.shape[-2:], dtype=bool)
+        mask[:, ::2] = True
+        calib = k[:, 24:40, 24:40]
+        recon = grappa(kspace*mask, calib, kernel_size=(5, 5),
+                       lamda=1e-6, n_jobs=2)
+        err = np.linalg.norm(recon - kspace)/np.linalg.norm(kspace)
+        self.assertLess(err, .01)
+        recon0 = grappa(k*mask, calib, kernel_size=(5, 5), lamda=1e-6)
+        self.assertTrue(np.allclose(recon[1], 2*recon0))
+
+    def test_per_slice_calib(self):
+        '''Per-slice calibration is the same in parallel.'''
+        from mr_utils.recon.grappa import grappa
+
+        k = self.coils((64, 64))
+        kspace = np.stack((k, k.conj()))
+        mask = np.zeros(kspace.shape[-2:], dtype=bool)
+        mask[:, ::3] = True
+        calib = kspace[..., 24:40, 24:40]
+        recon0 = grappa(
+            kspace*mask, calib, kernel_size=(5, 7), lamda=1e-6)
+        recon1 = grappa(kspace*mask, calib, kernel_size=(5, 7),
+                        lamda=1e-6, n_jobs=2)
+        self.assertTrue(np.allclose(recon0, recon1))
+        err = np.linalg.norm(recon0 - kspace)/np.linalg.norm(kspace)
+        self.assertLess(err, .02)
+
+    def test_3d_caipi(self):
+        '''Fill in a shifted 2x2 pattern in 3D.'''
+        from mr_utils.recon.grappa import grappa
+
+        N = (32, 32, 16)
+        k = self.coils(N)
+        ky, kz = np.meshgrid(
+            *[np.arange(n) for n in N[1:]], indexing='ij')
+        mask = (kz % 2 == 0) & ((ky - (kz//2) % 2) % 2 == 0)
+        mask = np.broadcast_to(mask, N)
+        calib = k[:, :, 10:22, 4:12]
+        recon = grappa(
+            k*mask, calib, kernel_size=(3, 5, 5), lamda=1e-5)
+        self.assertTrue(np.allclose(recon[:, mask], k[:, mask]))
+        err = np.linalg.norm(recon - k)/np.linalg.norm(k)
+        self.assertLess(err, .1)
+
+    def test_even_kernel(self):
+        '''Kernels need a center point.'''
+        from mr_utils.recon.grappa import grappa
+        with self.assertRaises(ValueError):
+            grappa(np.zeros((2, 8, 8)), np.zeros((2, 4, 4)), (3, 4))
+
 if __name__ == '__main__':
     unittest.main()
@@ -17,5 +17,62 @@ class RudinEtAlTestCase(unittest.TestCase):
 
         u = update_all_for_loop(u0,dt,h,sigma,niters)
 
+    def test_algo_vectorized(self):
+        from mr_utils.recon.reordering import update_all_for_loop
+        from mr_utils.recon.reordering import update_all
+
+        np.random.seed(0)
+        u0 = np.random.rand(6,5)
+        dt = .01
+        h = 1
+        sigma = .1
+        niters = 20
+
+        u_loop = update_all_for_loop(u0,dt,h,sigma,niters)
+        u = update_all(u0,dt,h,sigma,niters,history=True)
+        self.assertTrue(np.allclose(u_loop,u))
+        self.assertTrue(np.allclose(
+            update_all(u0,dt,h,sigma,niters),u_loop[...,-1]))
+
+    def test_neighbors(self):
+        from mr_utils.recon.reordering import neighbors,getbounds
+
+        u0 = np.zeros((4,3))
+        xhigh,xlow,yhigh,ylow = neighbors(u0.shape)
+        for ii in range(u0.shape[0]):
+            for jj in range(u0.shape[1]):
+                xxhigh,xxlow,yyhigh,yylow = getbounds(ii,jj,u0)
+                self.assertEqual(xhigh[ii,jj],np.ravel_multi_index(
+                    (xxhigh,jj),u0.shape))
+                self.assertEqual(xlow[ii,jj],np.ravel_multi_index(
+                    (xxlow,jj),u0.shape))
+                self.assertEqual(yhigh[ii,jj],np.ravel_multi_index(
+                    (ii,yyhigh),u0.shape))
+                self.assertEqual(ylow[ii,jj],np.ravel_multi_index(
+                    (ii,yylow),u0.shape))
+
+    def test_primal_dual(self):
+        from mr_utils.recon.reordering import (
+            rof_primal_dual,reordering_neighbors)
+        from mr_utils.test_data.phantom import modified_shepp_logan
+
+        np.random.seed(0)
+        im = modified_shepp_logan((64,64,16))[...,8]
+        f = im + .05*np.random.randn(*im.shape)
+        err0 = np.linalg.norm(f - im)
+
+        u = rof_primal_dual(f,.05,niters=200)
+        self.assertLess(np.linalg.norm(u - im),.6*err0)
+
+        # Sorting the true image, TV along the reordering is sparser
+        nbrs = reordering_neighbors(im,patch_size=(3,3))
+        u_sort = rof_primal_dual(f,.05,niters=200,nbrs=nbrs)
+        self.assertLess(np.linalg.norm(u_sort - im),.6*err0)
+
+        u_hist = rof_primal_dual(f,.05,niters=10,history=True)
+        self.assertEqual(u_hist.shape,f.shape + (11,))
+        self.assertTrue(np.allclose(u_hist[...,-1],rof_primal_dual(
+            f,.05,niters=10)))
+
 if __name__ == '__main__':
     unittest.main()
@@ -24,6 +24,40 @@ class TestTVDenoisingTestCase(unittest.TestCase):
         plt.show()
 
 
+class TestTVDenoisingBatchTestCase(unittest.TestCase):
+
+    def setUp(self):
+        np.random.seed(0)
+        scale = np.array([.5, 1, 2, 4])[:, None, None]
+        self.ims = np.random.rand(4, 20, 15)*scale
+
+    def test_batch_matches_2d(self):
+        from mr_utils.recon.tv_denoising import (
+            tv_l1_denoise, tv_l1_denoise_batch)
+
+        ref = np.stack(
+            [tv_l1_denoise(im, 1, niter=30) for im in self.ims])
+        out = tv_l1_denoise_batch(
+            self.ims, 1, niter=30, dtype=np.float64)
+        self.assertTrue(np.allclose(ref, out))
+
+        # batch axis anywhere, float32 buffers, threaded chunks
+        out = tv_l1_denoise_batch(
+            np.moveaxis(self.ims, 0, -1), 1, axes=(0, 1), niter=30,
+            chunk_size=3, n_jobs=2)
+        self.assertEqual(out.dtype, np.float32)
+        self.assertTrue(np.allclose(
+            ref, np.moveaxis(out, -1, 0), atol=1e-5))
+
+    def test_batch_3d(self):
+        from mr_utils.recon.tv_denoising import tv_l1_denoise_batch
+
+        vol = self.ims[..., :4].reshape((2, 2, 20, 4))
+        out = tv_l1_denoise_batch(vol, 1, axes=(1, 2, 3), niter=10)
+        self.assertEqual(out.shape, vol.shape)
+        self.assertTrue(np.allclose(out[1], tv_l1_denoise_batch(
+            vol[1:], 1, axes=(1, 2, 3), niter=10)[0]))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -57,5 +57,42 @@ class TestBloch(unittest.TestCase):
         # view(np.stack((spins0, spins1)))
         self.assertTrue(np.allclose(spins0, spins1))
 
+    def test_exact_against_finite_difference(self):
+        '''Exact operators agree with finite differences to O(h).'''
+        args = (self.T1, self.T2, self.M0, self.Nt, self.h) + self.RF
+        for B in [(0, 0, 3), (2, 1, 3)]:
+            spins0 = bloch.sim(*args, *B)
+            spins1 = bloch.sim_exact(*args, *B)
+            self.assertTrue(np.allclose(spins0, spins1, atol=1e-3))
+
+    def test_exact_store_and_dtype(self):
+        '''Stored time points match the full simulation.'''
+        store = [0, 10, 5000, self.Nt-1]
+        args = (self.T1, self.T2, self.M0, self.Nt, self.h) + self.RF
+        spins0 = bloch.sim_exact(*args, Bx=2)
+        spins1 = bloch.sim_exact(
+            *args, Bx=2, store=store, dtype=np.float32)
+        self.assertEqual(spins1.dtype, np.float32)
+        self.assertTrue(np.allclose(spins0[store], spins1, atol=1e-6))
+
+    def test_exact_against_gre(self):
+        '''Exact spoiled GRE matches GRE simulation.'''
+        TR = 15e-3
+        TE = 6e-3
+        alpha = np.pi/3
+        num_TRs = 100
+
+        # Tip about x like gre_sim, excite voxel with no tissue too
+        T1 = np.concatenate((self.T1, np.zeros((1, 1, 1))))
+        T2 = np.concatenate((self.T2, np.zeros((1, 1, 1))))
+        M0 = np.ones(T1.shape)
+        spins0 = bloch.gre_exact(
+            T1, T2, M0, np.pi/2, alpha, 0, TR, TE, num_TRs+1, Bz=0)
+        spins0 = spins0[0, ...] + 1j*spins0[1, ...]
+
+        spins1 = gre_sim(T1, T2, TR, TE, alpha=alpha, M0=M0,
+                         maxiter=num_TRs, spoil=True)
+        self.assertTrue(np.allclose(spins0, spins1))
+
 if __name__ == '__main__':
     unittest.main()
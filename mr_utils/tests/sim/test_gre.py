@@ -34,6 +34,28 @@ class TestGRE(unittest.TestCase):
                       field_map=None, dphi=dphi, M0=PD, maxiter=50)
         self.assertTrue(np.allclose(np.abs(im1), np.abs(im2)))
 
+    def test_gre_sim_field_map_against_gre_sim_loop(self):
+        '''Vectorized off-resonance matches loop implementation.'''
+        T1s, T2s, PD = cylinder_2d(dims=(16, 16))
+        field_map = np.random.uniform(-100, 100, T1s.shape)
+        seq = dict(TR=self.TR, TE=self.TE, alpha=self.alpha,
+                   field_map=field_map, dphi=np.pi, M0=PD)
+        im1 = gre_sim_loop(T1s, T2s, maxiter=50, **seq)
+        im2 = gre_sim(T1s, T2s, maxiter=49, **seq)
+        self.assertTrue(np.allclose(im1, im2))
+
+    def test_gre_sim_closed_form_against_iterative(self):
+        '''Closed form steady state is where iterating ends up.'''
+        T1s, T2s, PD = cylinder_2d(dims=(16, 16))
+        field_map = np.random.uniform(-100, 100, T1s.shape)
+        seq = dict(TR=self.TR, TE=self.TE, alpha=self.alpha,
+                   field_map=field_map, dphi=np.pi, M0=PD)
+        for spoil in [True, False]:
+            im1 = gre_sim(T1s, T2s, maxiter=10000, spoil=spoil, **seq)
+            im2 = gre_sim(T1s, T2s, closed_form=True, spoil=spoil,
+                          **seq)
+            self.assertTrue(np.allclose(im1, im2))
+
     def test_gre_sim_against_closed_form_solution(self):
         '''Verify iterative solution against closed form solution.
 
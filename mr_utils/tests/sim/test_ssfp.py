@@ -1,11 +1,14 @@
 '''Test cases for SSFP simulation.'''
 
 import unittest
+from os.path import join
+from tempfile import TemporaryDirectory
 
 import numpy as np
 # import matplotlib.pyplot as plt
 
 from mr_utils.sim.ssfp import ssfp, ssfp_dictionary, make_cart_ellipse, \
+    ssfp_broadcast, get_keys, find_atoms, \
     ssfp_dictionary_for_loop, find_atom, ssfp_from_ellipse, \
     elliptical_params, get_cart_elliptical_params, get_center_of_mass, \
     get_center_of_mass_nmr, spectrum, get_cross_point, \
@@ -44,6 +47,43 @@ class DictionaryTestCase(unittest.TestCase):
         # plt.plot(np.abs(D1.T), '--')
         # plt.show()
 
+    def test_dictionary_phase_cycles_into_memmap(self):
+        '''Chunked dictionary with phase-cycles written to disk.'''
+
+        pcs = np.linspace(0, 2*np.pi, 4, endpoint=False)
+        keys = get_keys(self.T1s, self.T2s, self.alphas)
+        shape = (keys.shape[1], pcs.size, self.df.size)
+        with TemporaryDirectory() as tmpdir:
+            out = np.lib.format.open_memmap(
+                join(tmpdir, 'D.npy'), mode='w+', dtype=np.complex64,
+                shape=shape)
+            D, _keys = ssfp_dictionary(
+                self.T1s, self.T2s, self.TR, self.alphas, self.df,
+                phase_cyc=pcs, out=out, chunk_size=37)
+            self.assertIs(D, out)
+            del D, out
+            D = np.load(join(tmpdir, 'D.npy'))
+
+        for ii in [0, 100, keys.shape[1]-1]:
+            atom = ssfp(keys[0, ii], keys[1, ii], self.TR,
+                        keys[2, ii], self.df, phase_cyc=pcs)
+            self.assertTrue(
+                np.allclose(D[ii], atom, rtol=1e-5, atol=1e-6))
+
+    def test_broadcast(self):
+        '''Broadcasting kernel agrees with ssfp() atom by atom.'''
+        pcs = np.linspace(0, 2*np.pi, 4, endpoint=False)
+        D = ssfp_broadcast(
+            self.T1s[:, None, None, None, None],
+            self.T2s[None, :, None, None, None], self.TR,
+            self.alphas[None, None, :, None, None], self.df,
+            pcs[:, None])
+        self.assertEqual(D.shape, (10, 10, 10, 4, self.df.size))
+        for ii, jj, kk in [(0, 0, 0), (6, 3, 5), (9, 2, 7)]:
+            atom = ssfp(self.T1s[ii], self.T2s[jj], self.TR,
+                        self.alphas[kk], self.df, phase_cyc=pcs)
+            self.assertTrue(np.allclose(D[ii, jj, kk], atom))
+
     def test_find_atom(self):
         '''Test method that finds atom in a given dictionary.'''
 
@@ -55,6 +95,43 @@ class DictionaryTestCase(unittest.TestCase):
 
         self.assertTrue(np.allclose(actual_params, found_params))
 
+    def test_find_atoms(self):
+        '''Match a whole image of signals at once.'''
+
+        D, keys = ssfp_dictionary(
+            self.T1s, self.T2s, self.TR, self.alphas, self.df)
+        rng = np.random.RandomState(0)
+        true_idx = rng.randint(0, keys.shape[1], (5, 7))
+        scale = rng.uniform(.5, 2, true_idx.shape)
+        sigs = D[true_idx]
+
+        # Atoms find themselves
+        found = find_atoms(
+            sigs, D, keys, block_size=8, atom_block_size=100)
+        self.assertEqual(found.shape, (3, 5, 7))
+        self.assertTrue(np.allclose(found, keys[:, true_idx]))
+
+        # Noisy signals agree with a brute-force Euclidean search
+        shape = sigs.shape
+        noisy = sigs + 0.05*(
+            rng.normal(size=shape) + 1j*rng.normal(size=shape))
+        found = find_atoms(
+            noisy, D, keys, block_size=8, atom_block_size=100)
+        for ii, jj in np.ndindex(true_idx.shape):
+            idx = np.argmin(
+                np.sum(np.abs(D - noisy[ii, jj])**2, axis=1))
+            self.assertTrue(
+                np.allclose(found[:, ii, jj], keys[:, idx]))
+
+        # Normalized atoms don't care about proton density, neither
+        # does the compressed dictionary or running in threads
+        sigs = sigs*scale[..., None]
+        for kwargs in [
+                {}, {'rank': 10}, {'n_jobs': 3, 'block_size': 4}]:
+            found = find_atoms(
+                sigs, D, keys, normalize=True, **kwargs)
+            self.assertTrue(np.allclose(found, keys[:, true_idx]))
+
 class EllipticalSignalTestCase(unittest.TestCase):
     '''Test elliptical signal model functions against cartesian, NMR funcs.'''
 
@@ -7,6 +7,8 @@ from tqdm import trange
 
 from mr_utils.sim.ssfp import ssfp
 from mr_utils.sim.ssfp import quantitative_fm
+from mr_utils.sim.ssfp import quantitative_fm_scalar
+from mr_utils.sim.ssfp import ResponseCache
 
 class TestQuantitativeFieldMap(unittest.TestCase):
     '''Test quantitative field mapping functions.'''
@@ -45,6 +47,45 @@ class TestQuantitativeFieldMap(unittest.TestCase):
 
         self.assertFalse(err)
 
+    def test_field_map_256(self):
+        '''Field map of a 256x256 map against per-pixel solution.'''
+
+        TR = 6e-3
+        alpha = np.deg2rad(10)
+        phase_cyc = 0
+        dfs = np.arange(-1/TR, 1/TR, 1)
+
+        # Smooth quantitative maps and field map (on dfs), background
+        # outside circle
+        N = 256
+        x = np.linspace(-1, 1, N)
+        X, Y = np.meshgrid(x, x)
+        mask = X**2 + Y**2 < .9
+        T1s = (1 + .5*X)*mask
+        T2s = (.5 + .2*Y)*mask
+        PDs = (1 + .1*X*Y)*mask
+        fm_true = dfs[np.round(150*X*Y - dfs[0]).astype(int)]
+        Mxys = ssfp(T1s, T2s, TR, alpha, fm_true, phase_cyc=phase_cyc,
+                    M0=PDs)*mask
+
+        cache = ResponseCache()
+        fm = quantitative_fm(
+            Mxys, dfs, T1s, T2s, PDs, TR, alpha, phase_cyc, mask=mask,
+            cache=cache)
+        fm_grid = quantitative_fm(
+            Mxys, dfs, T1s, T2s, PDs, TR, alpha, phase_cyc, mask=mask,
+            grid=(1e-2, 1e-2, 1e-2), cache=cache)
+
+        # Per-pixel solution on a few pixels
+        for ii, jj in np.argwhere(mask)[::500]:
+            df0 = quantitative_fm_scalar(
+                Mxys[ii, jj], dfs, T1s[ii, jj], T2s[ii, jj],
+                PDs[ii, jj], TR, alpha, phase_cyc)
+            self.assertEqual(fm[ii, jj], df0)
+
+        self.assertTrue(np.all(fm[~mask] == 0))
+        self.assertTrue(np.allclose(fm[mask], fm_true[mask]))
+        self.assertLess(np.median(np.abs(fm_grid - fm_true)[mask]), 1)
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+'''Tests for FFT backends and shifted FFTs.'''
+
+import unittest
+
+import numpy as np
+
+from mr_utils.utils.fft_backend import FFTBackend, CenteredFFT, \
+    available_fft_backends
+
+SHIFTS = {
+    None: lambda x, axes: x,
+    'fftshift': np.fft.fftshift,
+    'ifftshift': np.fft.ifftshift}
+
+class TestFFTBackend(unittest.TestCase):
+    '''Compare against numpy.fft with explicit shifts.'''
+
+    def setUp(self):
+        np.random.seed(0)
+        self.xs = [np.random.randn(*s) + 1j*np.random.randn(*s)
+                   for s in [(8, 6, 3), (7, 5, 4)]]
+
+    def test_backends(self):
+        '''All backends agree with numpy.'''
+        for backend in available_fft_backends():
+            fft = FFTBackend(backend)
+            for x in self.xs:
+                for axes in [None, (0, 1), (-1,)]:
+                    self.assertTrue(np.allclose(
+                        fft.fftn(x, axes=axes),
+                        np.fft.fftn(x, axes=axes)))
+                    out = np.empty_like(x)
+                    fft.ifftn(x, axes=axes, out=out)
+                    self.assertTrue(np.allclose(
+                        out, np.fft.ifftn(x, axes=axes)))
+
+    def test_centered(self):
+        '''Phase modulation does the same thing as shifting.'''
+        for x in self.xs:
+            for axes in [(0, 1), (0, 1, 2), (-1,)]:
+                for pre in SHIFTS:
+                    for post in SHIFTS:
+                        for inverse in [False, True]:
+                            fun = np.fft.fftn
+                            if inverse:
+                                fun = np.fft.ifftn
+                            ref = SHIFTS[post](fun(SHIFTS[pre](
+                                x, axes=axes), axes=axes), axes=axes)
+                            ft = CenteredFFT(axes, pre, post, inverse)
+                            self.assertTrue(np.allclose(ft(x), ref))
+
+    def test_weight(self):
+        '''Weight multiplies the result and can be written to out.'''
+        x = self.xs[0]
+        w = np.random.rand(*x.shape)
+        ft = CenteredFFT((0, 1), 'ifftshift', 'fftshift', weight=w)
+        ref = np.fft.fftshift(np.fft.fftn(np.fft.ifftshift(
+            x, axes=(0, 1)), axes=(0, 1)), axes=(0, 1))*w
+        out = np.empty_like(x)
+        self.assertIs(ft(x, out=out), out)
+        self.assertTrue(np.allclose(out, ref))
+        self.assertTrue(np.allclose(ft(x), ref))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,3 +12,5 @@ from .sparsify import Sparsify
 from .gini import gini
 from .piecewise_constant import piecewise
 from .patch import *
+from .fft_backend import (
+    FFTBackend, CenteredFFT, set_fft_backend, available_fft_backends)
@@ -0,0 +1,316 @@
+'''Pluggable FFT backends and shifted FFTs by phase modulation.
+
+Iterative reconstructions apply the same size FFT hundreds of times,
+so transforms go through an FFTBackend that can use planned transforms
+(pyFFTW), multithreaded transforms (scipy.fft), or numpy.fft,
+whichever is available.  CenteredFFT replaces fftshift/ifftshift
+copies around a transform with multiplications by precomputed phases.
+'''
+
+import numpy as np
+
+try:
+    import scipy.fft as scipy_fft
+except ImportError:
+    scipy_fft = None
+
+try:
+    import pyfftw
+    import pyfftw.builders
+except ImportError:
+    pyfftw = None
+
+# Used when FFTBackend is not told otherwise, see set_fft_backend()
+_DEFAULTS = {'backend': None, 'workers': 1}
+
+def available_fft_backends():
+    '''Names of FFT backends that can be used, best first.
+
+    Returns
+    -------
+    list
+        Some of 'pyfftw', 'scipy', 'numpy'.
+    '''
+    backends = []
+    if pyfftw is not None:
+        backends.append('pyfftw')
+    if scipy_fft is not None:
+        backends.append('scipy')
+    backends.append('numpy')
+    return backends
+
+def set_fft_backend(backend=None, workers=None):
+    '''Set default FFT backend and number of threads.
+
+    Parameters
+    ----------
+    backend : {None, 'pyfftw', 'scipy', 'numpy'}, optional
+        Default backend, None chooses the best available.
+    workers : int, optional
+        Default number of threads, -1 uses all of them.
+    '''
+    if backend is not None and (
+            backend not in available_fft_backends()):
+        raise ValueError(
+            'FFT backend "%s" is not available!' % backend)
+    _DEFAULTS['backend'] = backend
+    if workers is not None:
+        _DEFAULTS['workers'] = workers
+
+class FFTBackend(object):
+    '''N-D FFTs with a choice of library.
+
+    Attributes
+    ----------
+    backend : str
+        One of 'pyfftw', 'scipy', 'numpy'.
+    workers : int
+        Number of threads (numpy only ever uses one).
+    '''
+
+    def __init__(self, backend=None, workers=None):
+        '''Choose backend.
+
+        Parameters
+        ----------
+        backend : {None, 'pyfftw', 'scipy', 'numpy'}, optional
+            FFT library, None uses the default (see
+            set_fft_backend()).
+        workers : int, optional
+            Number of threads, None uses the default.
+        '''
+        if backend is None:
+            backend = _DEFAULTS['backend']
+        if backend is None:
+            backend = available_fft_backends()[0]
+        if backend not in available_fft_backends():
+            raise ValueError(
+                'FFT backend "%s" is not available!' % backend)
+        self.backend = backend
+        if workers is None:
+            workers = _DEFAULTS['workers']
+        self.workers = workers
+        if self.workers == -1 and backend == 'pyfftw':
+            import os
+            self.workers = os.cpu_count()
+        self._plans = {}
+
+    def _transform(self, x, axes, out, overwrite_x, inverse):
+        if self.backend == 'pyfftw':
+            key = (x.shape, x.dtype.str, axes, inverse)
+            if key not in self._plans:
+                builder = pyfftw.builders.ifftn if inverse else \
+                    pyfftw.builders.fftn
+                self._plans[key] = builder(
+                    np.empty(x.shape, dtype=x.dtype), axes=axes,
+                    threads=self.workers,
+                    planner_effort='FFTW_MEASURE', avoid_copy=False)
+            # The plan owns its output array, don't hand it out
+            res = self._plans[key](x)
+            if out is None:
+                return res.copy()
+        elif self.backend == 'scipy':
+            fun = scipy_fft.ifftn if inverse else scipy_fft.fftn
+            res = fun(x, axes=axes, workers=self.workers,
+                      overwrite_x=overwrite_x)
+            if out is None:
+                return res
+        else:
+            fun = np.fft.ifftn if inverse else np.fft.fftn
+            res = fun(x, axes=axes)
+            if out is None:
+                return res
+        out[...] = res
+        return out
+
+    def fftn(self, x, axes=None, out=None, overwrite_x=False):
+        '''N-D FFT, same as np.fft.fftn.
+
+        Parameters
+        ----------
+        x : array_like
+            Array to transform.
+        axes : tuple, optional
+            Axes to transform, None transforms all of them.
+        out : array_like, optional
+            Array to put the result in.
+        overwrite_x : bool, optional
+            Whether x can be used as scratch space.
+
+        Returns
+        -------
+        array_like
+            Fourier transform of x.
+        '''
+        if axes is not None:
+            axes = tuple(axes)
+        return self._transform(x, axes, out, overwrite_x, False)
+
+    def ifftn(self, x, axes=None, out=None, overwrite_x=False):
+        '''N-D inverse FFT, same as np.fft.ifftn.
+
+        Parameters
+        ----------
+        x : array_like
+            Array to transform.
+        axes : tuple, optional
+            Axes to transform, None transforms all of them.
+        out : array_like, optional
+            Array to put the result in.
+        overwrite_x : bool, optional
+            Whether x can be used as scratch space.
+
+        Returns
+        -------
+        array_like
+            Inverse Fourier transform of x.
+        '''
+        if axes is not None:
+            axes = tuple(axes)
+        return self._transform(x, axes, out, overwrite_x, True)
+
+def _shift(shift, n):
+    '''Number of samples shift rolls an axis of length n by.'''
+    if shift is None:
+        return 0
+    if shift == 'fftshift':
+        return n//2
+    if shift == 'ifftshift':
+        return -(n//2)
+    raise ValueError(
+        'shift must be None, "fftshift", or "ifftshift"!')
+
+class CenteredFFT(object):
+    '''Shifted FFT, e.g., fftshift(fftn(ifftshift(x))).
+
+    Attributes
+    ----------
+    axes : tuple or None
+        Axes to transform, None transforms all of them.
+    pre_shift : {None, 'fftshift', 'ifftshift'}
+        Shift applied to x before the transform.
+    post_shift : {None, 'fftshift', 'ifftshift'}
+        Shift applied after the transform.
+    inverse : bool
+        Inverse transform instead of forward.
+    weight : array_like or float or None
+        Multiplies the result, e.g., sampling mask and scaling.
+    fft : FFTBackend
+        Does the unshifted transforms.
+
+    Notes
+    -----
+    Rolling the input by s1 and the output by s2 samples along an axis
+    of length N is the same as modulating the input by
+    exp(-+2j*pi*s2*n/N) and the output by exp(+-2j*pi*(k - s2)*s1/N),
+    so no shifted copies are made.  Phases (with the weight folded in)
+    are computed once for each input shape.
+    '''
+
+    def __init__(self, axes=None, pre_shift=None, post_shift=None,
+                 inverse=False, weight=None, backend=None,
+                 workers=None):
+        '''Set up transform.
+
+        Parameters
+        ----------
+        axes : tuple, optional
+            Axes to transform, None transforms all of them.
+        pre_shift : {None, 'fftshift', 'ifftshift'}, optional
+            Shift applied to x before the transform.
+        post_shift : {None, 'fftshift', 'ifftshift'}, optional
+            Shift applied after the transform.
+        inverse : bool, optional
+            Inverse transform instead of forward.
+        weight : array_like or float, optional
+            Multiplies the result, e.g., sampling mask and scaling.
+        backend : str or FFTBackend, optional
+            FFT library, see FFTBackend.
+        workers : int, optional
+            Number of threads, see FFTBackend.
+        '''
+        self.axes = None if axes is None else tuple(axes)
+        self.pre_shift = pre_shift
+        self.post_shift = post_shift
+        self.inverse = inverse
+        self.weight = weight
+        if isinstance(backend, FFTBackend):
+            self.fft = backend
+        else:
+            self.fft = FFTBackend(backend, workers)
+        self._phases = {}
+
+    def phases(self, shape):
+        '''Input and output modulation for arrays of this shape.
+
+        Parameters
+        ----------
+        shape : tuple
+            Shape of array to be transformed.
+
+        Returns
+        -------
+        pre : array_like or None
+            Multiplies x before the transform, None if there's no
+            shift.
+        post : array_like or float or None
+            Multiplies the transform, includes weight.
+        '''
+        shape = tuple(shape)
+        if shape in self._phases:
+            return self._phases[shape]
+
+        axes = range(len(shape)) if self.axes is None else self.axes
+        axes = [ax % len(shape) for ax in axes]
+        sgn = 1 if self.inverse else -1
+        pre, post = None, None
+        for ax in axes:
+            n = shape[ax]
+            s1 = _shift(self.pre_shift, n)
+            s2 = _shift(self.post_shift, n)
+            bshape = [1]*len(shape)
+            bshape[ax] = n
+            idx = np.arange(n)
+            if s2 % n:
+                ph = np.exp(-sgn*2j*np.pi*((s2*idx) % n)/n)
+                ph = ph.reshape(bshape)
+                pre = ph if pre is None else pre*ph
+            if s1 % n:
+                ph = np.exp(sgn*2j*np.pi*(((idx - s2)*s1) % n)/n)
+                ph = ph.reshape(bshape)
+                post = ph if post is None else post*ph
+
+        if self.weight is not None:
+            post = self.weight if post is None else post*self.weight
+        self._phases[shape] = (pre, post)
+        return pre, post
+
+    def __call__(self, x, out=None):
+        '''Apply shifted transform.
+
+        Parameters
+        ----------
+        x : array_like
+            Array to transform.
+        out : array_like, optional
+            Array to put the result in.
+
+        Returns
+        -------
+        array_like
+            Transform of x.
+        '''
+        pre, post = self.phases(x.shape)
+        fun = self.fft.ifftn if self.inverse else self.fft.fftn
+        if pre is None:
+            tmp = fun(x, axes=self.axes)
+        else:
+            tmp = fun(x*pre, axes=self.axes, overwrite_x=True)
+        if post is None:
+            if out is None:
+                return tmp
+            out[...] = tmp
+            return out
+        if out is None and np.broadcast(tmp, post).shape != tmp.shape:
+            return tmp*post
+        return np.multiply(tmp, post, out=tmp if out is None else out)